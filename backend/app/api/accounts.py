@@ -4,19 +4,23 @@ Account management APIs
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse, Response
+from sqlalchemy.orm import Session, joinedload, defer, undefer
 from sqlalchemy import desc, or_, and_
 from datetime import datetime, timezone
 from typing import List, Optional
 from pydantic import BaseModel
 import logging
+import mimetypes
 
 from ..database import get_db
-from ..models.account import Account
+from ..models.account import Account, inline_image_url
 from ..models.device import Device
 from ..models.user import User
 from ..api.auth import get_current_user
 from ..services.image_storage import image_storage
+from ..services.image_catalog import image_catalog, filename_from_url
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -103,9 +107,11 @@ async def create_account(
             import re
             clean_account_name = re.sub(r'\s+', '_', account_data.account_name.strip())
             
-            saved_path = image_storage.save_base64_image(
+            saved_path = await run_in_threadpool(
+                image_storage.save_base64_image,
                 account_data.image_url, 
-                f"account_{clean_account_name}"
+                f"account_{clean_account_name}",
+                db=db
             )
             if saved_path:
                 # 使用相对路径，让前端自动拼接正确的域名
@@ -113,6 +119,9 @@ async def create_account(
                 logger.info(f"Base64图片已转换为文件存储: {processed_image_url}")
             else:
                 logger.warning("Base64图片转换失败，使用原始数据")
+        elif filename_from_url(processed_image_url):
+            # 直接使用已上传的图片, 认领上传时登记的引用
+            image_storage.retain_for_account(db, filename_from_url(processed_image_url))
         
         # 创建新账号
         new_account = Account(
@@ -127,6 +136,8 @@ async def create_account(
         )
         
         db.add(new_account)
+        db.flush()
+        image_catalog.sync_account(db, new_account.id, new_account.image_url)
         db.commit()
         db.refresh(new_account)
         
@@ -189,13 +200,17 @@ async def get_accounts_list(
         # 计算总数
         total = query.count()
         
-        # 分页查询
-        accounts = query.order_by(desc(Account.created_at)).offset((page - 1) * page_size).limit(page_size).all()
+        # 分页查询 (主设备随账号一次性加载, 避免逐行查询; 不读取大字段 image_url)
+        accounts = query.options(
+            joinedload(Account.primary_device),
+            defer(Account.image_url),
+            undefer(Account.image_ref)
+        ).order_by(desc(Account.created_at)).offset((page - 1) * page_size).limit(page_size).all()
         
         return {
             "success": True,
             "data": {
-                "accounts": [account.to_dict() for account in accounts],
+                "accounts": [account.to_dict(list_view=True) for account in accounts],
                 "pagination": {
                     "page": page,
                     "page_size": page_size,
@@ -253,17 +268,24 @@ async def get_available_devices(
         # 获取所有设备（不再过滤已绑定的设备）
         all_devices = db.query(Device).order_by(desc(Device.created_at)).all()
         
+        # 一次查询所有已绑定账号，按设备分组
+        bound_accounts_map = {}
+        bound_rows = db.query(Account.id, Account.account_name, Account.primary_device_id).filter(
+            Account.primary_device_id.isnot(None)
+        ).order_by(Account.id).all()
+        for account_id, account_name, primary_device_id in bound_rows:
+            bound_accounts_map.setdefault(primary_device_id, []).append(
+                {"id": account_id, "account_name": account_name}
+            )
+        
         devices_data = []
         for device in all_devices:
             device_dict = device.to_dict()
             
-            # 计算绑定到此设备的账号数量
-            bound_accounts_count = db.query(Account).filter(Account.primary_device_id == device.id).count()
-            device_dict["bound_accounts_count"] = bound_accounts_count
-            
-            # 获取绑定到此设备的账号列表（用于显示详细信息）
-            bound_accounts = db.query(Account).filter(Account.primary_device_id == device.id).all()
-            device_dict["bound_accounts"] = [{"id": acc.id, "account_name": acc.account_name} for acc in bound_accounts]
+            # 绑定到此设备的账号列表及数量（用于显示详细信息）
+            bound_accounts = bound_accounts_map.get(device.id, [])
+            device_dict["bound_accounts_count"] = len(bound_accounts)
+            device_dict["bound_accounts"] = bound_accounts
             
             # 添加状态描述
             if device.is_online:
@@ -611,6 +633,51 @@ async def get_account_detail(
         )
 
 
+@router.get("/{account_id}/image")
+async def get_account_inline_image(
+    account_id: int,
+    db: Session = Depends(get_db)
+):
+    """
+    输出账号的内嵌图片
+    Serve an account image still stored inline as Base64 (list views reference it by this URL)
+    """
+    try:
+        image_url = db.query(Account.image_url).filter(Account.id == account_id).scalar()
+        if not image_url:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="账号图片不存在"
+            )
+        
+        # 已迁移为文件或本来就是URL, 跳转到当前地址
+        if image_url.startswith(("http", "/")):
+            return RedirectResponse(image_url, status_code=status.HTTP_307_TEMPORARY_REDIRECT)
+        
+        decoded = await run_in_threadpool(image_storage.decode_base64_image, image_url)
+        if not decoded:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="账号图片无法解析"
+            )
+        
+        data, extension = decoded
+        return Response(
+            content=data,
+            media_type=mimetypes.guess_type(f"image{extension}")[0] or "image/png",
+            headers={"Cache-Control": "private, max-age=60"}
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"获取账号图片失败: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="获取账号图片失败"
+        )
+
+
 @router.put("/{account_id}")
 async def update_account(
     account_id: int,
@@ -661,7 +728,8 @@ async def update_account(
             account.type = account_data.type
             update_fields.append("type")
         
-        if account_data.image_url is not None:
+        # 列表返回的内嵌图片地址原样提交时表示图片未修改
+        if account_data.image_url is not None and account_data.image_url != inline_image_url(account.id):
             # 处理图片数据
             processed_image_url = account_data.image_url
             if account_data.image_url and image_storage.is_base64_image(account_data.image_url):
@@ -670,24 +738,33 @@ async def update_account(
                 import re
                 clean_account_name = re.sub(r'\s+', '_', account.account_name.strip())
                 
-                saved_path = image_storage.save_base64_image(
+                saved_path = await run_in_threadpool(
+                    image_storage.save_base64_image,
                     account_data.image_url, 
-                    f"account_{clean_account_name}"
+                    f"account_{clean_account_name}",
+                    db=db
                 )
                 if saved_path:
-                    # 删除旧的图片文件（如果存在）
+                    # 释放旧图片的引用（没有其他引用时随事务提交删除文件）
                     if account.image_url and account.image_url.startswith('/api/images/'):
                         old_filename = account.image_url.split('/')[-1]
-                        image_storage.delete_image(f"uploads/images/{old_filename}")
+                        await run_in_threadpool(image_storage.release, db, old_filename)
                     
                     # 使用相对路径，让前端自动拼接正确的域名
                     processed_image_url = f"/api/images/{saved_path.split('/')[-1]}"
                     logger.info(f"Base64图片已转换为文件存储: {processed_image_url}")
                 else:
                     logger.warning("Base64图片转换失败，使用原始数据")
+            elif processed_image_url != account.image_url:
+                # 改为使用已上传的图片: 登记新引用, 释放旧图片的引用
+                if filename_from_url(processed_image_url):
+                    image_storage.retain_for_account(db, filename_from_url(processed_image_url))
+                if account.image_url and account.image_url.startswith('/api/images/'):
+                    await run_in_threadpool(image_storage.release, db, account.image_url.split('/')[-1])
             
             account.image_url = processed_image_url
             update_fields.append("image_url")
+            image_catalog.sync_account(db, account.id, processed_image_url)
         
         if account_data.description is not None:
             account.description = account_data.description
@@ -773,6 +850,11 @@ async def delete_account(
             db.query(AccountLink).filter(AccountLink.account_id == account.id).delete()
             logger.info(f"成功删除 {linked_count} 个关联链接")
         
+        # 释放账号图片的引用（没有其他引用时随事务提交删除文件）
+        image_catalog.sync_account(db, account.id, None)
+        if account.image_url and account.image_url.startswith('/api/images/'):
+            await run_in_threadpool(image_storage.release, db, account.image_url.split('/')[-1])
+        
         # 删除账号
         db.delete(account)
         db.commit()
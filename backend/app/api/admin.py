@@ -3,14 +3,20 @@
 Admin-only APIs for database migration and maintenance
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from datetime import datetime, timezone
+from typing import Optional
 import logging
 
-from ..database import get_db
+from ..database import get_db, is_sms_partitioning_enabled
 from ..models.user import User
+from ..api.auth import get_current_user
+from ..services.partition_manager import partition_manager
+from ..services.image_migration import image_migration_job
+from ..services.image_catalog import image_catalog
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -228,3 +234,177 @@ async def get_database_info(db: Session = Depends(get_db)):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"获取数据库信息失败: {str(e)}"
         )
+
+
+@router.get("/partitions")
+async def get_sms_partitions(current_user: User = Depends(get_current_user)):
+    """
+    获取短信分区列表
+    Get SMS table partitions
+    """
+    try:
+        return {
+            "success": True,
+            "data": {
+                "enabled": is_sms_partitioning_enabled(),
+                "partitions": partition_manager.list_partitions() if is_sms_partitioning_enabled() else {}
+            }
+        }
+    except Exception as e:
+        logger.error(f"获取短信分区列表失败: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"获取短信分区列表失败: {str(e)}"
+        )
+
+
+@router.post("/partitions/maintain")
+async def maintain_sms_partitions(
+    months_ahead: Optional[int] = Query(None, ge=0, le=24, description="预建未来月份数"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    立即预建未来月份的短信分区
+    Create upcoming monthly SMS partitions now
+    """
+    if not is_sms_partitioning_enabled():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="未启用短信分区")
+
+    try:
+        created = partition_manager.ensure_partitions(months_ahead)
+        return {
+            "success": True,
+            "message": f"新建 {len(created)} 个分区",
+            "data": {"created": created}
+        }
+    except Exception as e:
+        logger.error(f"短信分区维护失败: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"短信分区维护失败: {str(e)}"
+        )
+
+
+@router.post("/partitions/migrate")
+async def migrate_sms_partitions(current_user: User = Depends(get_current_user)):
+    """
+    将现有短信表迁移为按月分区表
+    Convert existing sms / sms_forward_logs tables into monthly partitioned tables
+    """
+    if not is_sms_partitioning_enabled():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="未启用短信分区")
+
+    try:
+        logger.info("🔧 开始迁移短信表为分区表...")
+        migrated = partition_manager.migrate_to_partitioned()
+        return {
+            "success": True,
+            "message": "短信表分区迁移完成",
+            "data": {"migrated_rows": migrated}
+        }
+    except Exception as e:
+        logger.error(f"短信表分区迁移失败: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"短信表分区迁移失败: {str(e)}"
+        )
+
+
+@router.post("/partitions/drop-before")
+async def drop_sms_partitions_before(
+    before: datetime = Query(..., description="删除整月早于该时间的分区"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    删除过期的短信分区 (整表删除, 不逐行DELETE)
+    Drop expired SMS partitions
+    """
+    if not is_sms_partitioning_enabled():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="未启用短信分区")
+
+    try:
+        dropped = partition_manager.drop_partitions_before(before)
+        logger.info(f"用户 {current_user.username} 删除了 {len(dropped)} 个过期短信分区")
+        return {
+            "success": True,
+            "message": f"已删除 {len(dropped)} 个分区",
+            "data": {"dropped": dropped}
+        }
+    except Exception as e:
+        logger.error(f"删除短信分区失败: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"删除短信分区失败: {str(e)}"
+        )
+
+
+@router.post("/images/migrate-base64")
+async def start_image_migration(current_user: User = Depends(get_current_user)):
+    """
+    启动账号Base64图片迁移 (后台执行, 可重复调用以续跑)
+    Start migrating base64 account images to content-addressed files
+    """
+    try:
+        pending = image_migration_job.count_pending()
+        started = image_migration_job.start() if pending else False
+        return {
+            "success": True,
+            "message": "图片迁移任务已启动" if started else ("没有待迁移的图片" if not pending else "图片迁移任务正在运行"),
+            "data": {
+                "pending": pending,
+                "status": image_migration_job.status
+            }
+        }
+    except Exception as e:
+        logger.error(f"启动图片迁移失败: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"启动图片迁移失败: {str(e)}"
+        )
+
+
+@router.get("/images/migrate-base64")
+async def get_image_migration_status(current_user: User = Depends(get_current_user)):
+    """
+    获取账号图片迁移进度
+    Get base64 account image migration progress
+    """
+    try:
+        return {
+            "success": True,
+            "data": {
+                "pending": image_migration_job.count_pending(),
+                "status": image_migration_job.status
+            }
+        }
+    except Exception as e:
+        logger.error(f"获取图片迁移进度失败: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"获取图片迁移进度失败: {str(e)}"
+        )
+
+
+@router.post("/images/reconcile")
+async def reconcile_images(
+    fix: bool = Query(False, description="是否修复 (登记孤立文件、删除缺失文件的记录、重建账号引用)"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    核对图片目录与磁盘文件、账号引用
+    Reconcile the image catalog with files on disk and account references
+    """
+    try:
+        summary = await run_in_threadpool(image_catalog.reconcile, fix)
+        logger.info(f"用户 {current_user.username} 执行图片目录检查, 修复={fix}")
+        return {
+            "success": True,
+            "message": "图片目录检查完成",
+            "data": summary
+        }
+    except Exception as e:
+        logger.error(f"图片目录检查失败: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"图片目录检查失败: {str(e)}"
+        )
@@ -13,6 +13,7 @@ import logging
 from ..database import get_db
 from ..models.device import Device
 from ..models.sms import SMS
+from ..services.metrics import SMS_INGESTED
 
 logger = logging.getLogger(__name__)
 
@@ -394,6 +395,9 @@ async def batch_upload_sms(
             except Exception as ws_error:
                 logger.warning(f"发送WebSocket短信更新通知失败: {ws_error}")
         
+        SMS_INGESTED.labels("android", "saved").inc(saved_count)
+        SMS_INGESTED.labels("android", "duplicate").inc(duplicate_count)
+        SMS_INGESTED.labels("android", "error").inc(error_count)
         logger.info(f"批量短信上传完成: 设备 {device_id}, 保存 {saved_count} 条, 重复 {duplicate_count} 条, 错误 {error_count} 条")
         
         return ApiResponse(
@@ -16,7 +16,7 @@ import random
 import string
 from io import BytesIO
 import base64
-from PIL import Image, ImageDraw, ImageFont
+import importlib.util
 
 from ..database import get_db
 from ..models.device import Device
@@ -27,14 +27,12 @@ from ..services.settings_service import SettingsService
 
 logger = logging.getLogger(__name__)
 
-# 🚨 临时修复：优雅处理TOTP服务导入失败
-try:
+# TOTP服务: pyotp/qrcode 在首次使用时才导入 (见 totp_service), 这里只检查依赖是否已安装
+TOTP_AVAILABLE = all(importlib.util.find_spec(name) is not None for name in ("pyotp", "qrcode"))
+if TOTP_AVAILABLE:
     from ..services.totp_service import TOTPService
-    TOTP_AVAILABLE = True
-    logger.info("🔐 TOTP服务导入成功")
-except ImportError as e:
-    logger.warning(f"🔐 TOTP服务导入失败，2FA功能将被禁用: {e}")
-    TOTP_AVAILABLE = False
+else:
+    logger.warning("🔐 未安装 pyotp/qrcode 依赖，2FA功能将被禁用")
     
     # 创建一个临时的TOTPService类以避免错误
     class TOTPService:
@@ -722,6 +720,9 @@ def reset_captcha_attempts(username: str) -> None:
 def create_captcha_image(code: str, difficulty: str = "medium") -> str:
     """创建验证码图片并返回base64编码"""
     try:
+        # Pillow 只在生成验证码图片时使用, 不在启动时导入
+        from PIL import Image, ImageDraw, ImageFont
+        
         # 图片尺寸
         width, height = 120, 40
         
@@ -845,8 +846,6 @@ async def login_admin_with_captcha(request: LoginWithCaptchaRequest, db: Session
     """
     try:
         logger.info(f"🔐 带验证码登录尝试: {request.username}")
-        logger.info(f"🔐 收到的验证码ID: {request.captcha_id}")
-        logger.info(f"🔐 收到的验证码: {request.captcha_code}")
         
         # 🚨 新增：检查验证码错误次数限制
         if not check_captcha_attempts(request.username, db):
@@ -867,7 +866,6 @@ async def login_admin_with_captcha(request: LoginWithCaptchaRequest, db: Session
         
         # 🚨 安全修复：检查是否启用验证码
         enable_captcha = SettingsService.get_setting(db, "enableLoginCaptcha", False)
-        logger.info(f"🔐 验证码启用状态: {enable_captcha}")
         
         if not enable_captcha:
             logger.error("🔐 验证码未启用，拒绝带验证码的登录请求")
@@ -877,8 +875,6 @@ async def login_admin_with_captcha(request: LoginWithCaptchaRequest, db: Session
             )
         
         # 🚨 安全修复：强制验证验证码，不允许绕过
-        logger.info(f"🔐 当前验证码存储: {list(captcha_store.keys())}")
-        
         if request.captcha_id not in captcha_store:
             logger.error(f"🔐 验证码ID不存在: {request.captcha_id}")
             raise HTTPException(
@@ -889,11 +885,6 @@ async def login_admin_with_captcha(request: LoginWithCaptchaRequest, db: Session
         stored_captcha = captcha_store[request.captcha_id]
         current_time = datetime.now(timezone.utc)
         
-        logger.info(f"🔐 存储的验证码: {stored_captcha['code']}")
-        logger.info(f"🔐 输入的验证码: {request.captcha_code.upper()}")
-        logger.info(f"🔐 验证码过期时间: {stored_captcha['expires_at']}")
-        logger.info(f"🔐 当前时间: {current_time}")
-        
         # 🚨 安全修复：检查验证码是否过期
         if current_time > stored_captcha["expires_at"]:
             logger.error(f"🔐 验证码已过期")
@@ -903,22 +894,12 @@ async def login_admin_with_captcha(request: LoginWithCaptchaRequest, db: Session
                 detail="验证码已过期"
             )
         
-        # 🚨 关键修复：改进验证码比较逻辑，添加详细调试信息
+        # 🚨 关键修复：改进验证码比较逻辑 (日志中不输出验证码内容)
         input_code = request.captcha_code.upper().strip()
         stored_code = stored_captcha["code"].strip()
         
-        logger.info(f"🔐 详细验证码比较:")
-        logger.info(f"🔐   输入原始: '{request.captcha_code}'")
-        logger.info(f"🔐   输入处理后: '{input_code}' (长度:{len(input_code)})")
-        logger.info(f"🔐   存储原始: '{stored_captcha['code']}'")
-        logger.info(f"🔐   存储处理后: '{stored_code}' (长度:{len(stored_code)})")
-        logger.info(f"🔐   字符对比: {[ord(c) for c in input_code]} vs {[ord(c) for c in stored_code]}")
-        
-        # 🚨 临时调试：检查验证码存储是否正常
-        logger.info(f"🔐 验证码存储详情: {stored_captcha}")
-        
         if input_code != stored_code:
-            logger.error(f"🔐 验证码错误: 输入'{input_code}' != 存储'{stored_code}'")
+            logger.warning(f"🔐 验证码错误: {request.username}")
             
             # 🚨 新增：处理验证码错误，增加错误计数
             handle_captcha_error(request.username, db)
@@ -942,7 +923,6 @@ async def login_admin_with_captcha(request: LoginWithCaptchaRequest, db: Session
                     detail=f"验证码错误，剩余尝试次数: {remaining_attempts}"
                 )
         
-        logger.info("🔐 验证码验证成功！")
         # 验证码正确，删除已使用的验证码
         del captcha_store[request.captcha_id]
         
@@ -14,102 +14,17 @@ from ..database import get_db
 from ..models.account_link import AccountLink
 from ..models.account import Account
 from ..models.sms import SMS
+from ..services.link_quota import link_quota, is_new_access_session
+from ..services.rate_limiter import rate_limiter
+from ..services.rule_predicates import latest_matching_sms
+from ..logging_config import LogSampler
 
 logger = logging.getLogger(__name__)
+# 客户页面轮询接口的日志按接口采样输出
+log_sampler = LogSampler()
 router = APIRouter()
 
 
-def match_sms_with_rule(sms, rule):
-    """
-    检查短信是否匹配规则
-    """
-    import re
-    
-    # 检查发送方匹配
-    if rule.sender_pattern and rule.sender_pattern.strip() and rule.sender_pattern != "*":
-        sender_match = False
-        
-        if rule.sender_match_type == 'exact':
-            sender_match = sms.sender == rule.sender_pattern
-        elif rule.sender_match_type == 'fuzzy':
-            # 🔥 重大修复：正确处理所有类型的模糊匹配和通配符
-            if '*' in rule.sender_pattern:
-                # 处理包含通配符的模式
-                if rule.sender_pattern.startswith('*') and rule.sender_pattern.endswith('*'):
-                    # 两端都有通配符，如 "*191*" 匹配 "+8619162317587"
-                    middle_part = rule.sender_pattern[1:-1]
-                    sender_match = middle_part.lower() in sms.sender.lower()
-                elif rule.sender_pattern.endswith('*'):
-                    # 前缀匹配，如 "+86191*" 匹配 "+8619162317587"
-                    prefix = rule.sender_pattern[:-1]
-                    sender_match = sms.sender.startswith(prefix)
-                elif rule.sender_pattern.startswith('*'):
-                    # 后缀匹配，如 "*123"
-                    suffix = rule.sender_pattern[1:]
-                    sender_match = sms.sender.endswith(suffix)
-                else:
-                    # 中间有通配符的复杂情况，转换为正则表达式
-                    pattern_regex = rule.sender_pattern.replace('*', '.*')
-                    try:
-                        sender_match = bool(re.search(pattern_regex, sms.sender, re.IGNORECASE))
-                    except re.error:
-                        sender_match = False
-            else:
-                # 没有通配符，直接包含匹配
-                sender_match = rule.sender_pattern.lower() in sms.sender.lower()
-        elif rule.sender_match_type == 'regex':
-            try:
-                sender_match = bool(re.search(rule.sender_pattern, sms.sender))
-            except re.error:
-                sender_match = False
-        
-        if not sender_match:
-            return False
-    
-    # 检查内容匹配
-    if rule.content_pattern and rule.content_pattern.strip() and rule.content_pattern != "*":
-        content_match = False
-        
-        if rule.content_match_type == 'exact':
-            content_match = sms.content == rule.content_pattern
-        elif rule.content_match_type == 'fuzzy':
-            # 🔥 重大修复：正确处理所有类型的内容模糊匹配和通配符
-            if '*' in rule.content_pattern:
-                # 处理包含通配符的模式
-                if rule.content_pattern.startswith('*') and rule.content_pattern.endswith('*'):
-                    # 两端都有通配符，如 "*验证码*" 匹配包含"验证码"的内容
-                    middle_part = rule.content_pattern[1:-1]
-                    content_match = middle_part.lower() in sms.content.lower()
-                elif rule.content_pattern.endswith('*'):
-                    # 前缀匹配
-                    prefix = rule.content_pattern[:-1]
-                    content_match = prefix in sms.content
-                elif rule.content_pattern.startswith('*'):
-                    # 后缀匹配
-                    suffix = rule.content_pattern[1:]
-                    content_match = sms.content.endswith(suffix)
-                else:
-                    # 中间有通配符的复杂情况，转换为正则表达式
-                    pattern_regex = rule.content_pattern.replace('*', '.*')
-                    try:
-                        content_match = bool(re.search(pattern_regex, sms.content, re.IGNORECASE))
-                    except re.error:
-                        content_match = False
-            else:
-                # 没有通配符，直接包含匹配
-                content_match = rule.content_pattern.lower() in sms.content.lower()
-        elif rule.content_match_type == 'regex':
-            try:
-                content_match = bool(re.search(rule.content_pattern, sms.content))
-            except re.error:
-                content_match = False
-        
-        if not content_match:
-            return False
-    
-    return True
-
-
 @router.get("/get_account_info")
 async def get_account_info(
     link_id: str = Query(..., description="链接ID"),
@@ -136,11 +51,12 @@ async def get_account_info(
                 detail="链接已失效"
             )
         
-        # 检查访问次数限制
-        if link.access_count >= link.max_access_count:
+        # 检查访问次数限制和有效期 (快照已不可用时直接拒绝, 不执行写操作)
+        if not link.is_access_allowed():
+            quota_exceeded = link.max_access_count > 0 and link.access_count >= link.max_access_count
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
-                detail="访问次数已达上限"
+                detail="访问次数已达上限" if quota_exceeded else "链接已失效"
             )
         
         # 获取账号信息
@@ -152,26 +68,7 @@ async def get_account_info(
                 detail="关联账号不存在"
             )
         
-        # 🔥 重大修复：可配置的智能访问次数管理
-        # 使用数据库中配置的访问会话间隔，而不是硬编码的5分钟
-        should_increment_access = True
-        if link.last_access_time:
-            time_diff = (datetime.now(timezone.utc) - link.last_access_time).total_seconds()
-            # 使用可配置的访问会话间隔（分钟转换为秒）
-            session_interval_seconds = (link.access_session_interval or 5) * 60
-            if time_diff < session_interval_seconds:
-                should_increment_access = False
-        
-        if should_increment_access:
-            # 增加访问次数
-            link.access_count += 1
-            link.last_access_time = datetime.now(timezone.utc)
-            db.commit()
-            logger.info(f"客户端首次访问: Link ID {link_id}, 访问次数增加到 {link.access_count}/{link.max_access_count}")
-        else:
-            logger.info(f"客户端重复访问: Link ID {link_id}, 访问次数保持 {link.access_count}/{link.max_access_count}")
-        
-        # 构建响应数据
+        # 构建响应数据 (在提交前读取, 避免提交后重新加载对象)
         account_data = {
             "id": account.id,
             "account_name": account.account_name,
@@ -198,6 +95,25 @@ async def get_account_info(
             "created_at": link.created_at.isoformat() if link.created_at else None
         }
         
+        # 🔥 重大修复：可配置的智能访问次数管理
+        # 使用数据库中配置的访问会话间隔，间隔内的重复访问不计次、不写库
+        if is_new_access_session(link):
+            # 条件更新: 配额检查和计数递增在同一条语句中完成
+            counters = link_quota.consume_access(db, link.id, session_interval=link.access_session_interval or 5)
+            if counters is None:
+                db.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail="访问次数已达上限"
+                )
+            db.commit()
+            link_data["access_count"] = counters["access_count"]
+            link_data["last_access_time"] = counters["last_access_time"].isoformat() if counters["last_access_time"] else None
+            logger.info(f"客户端首次访问: Link ID {link_id}, 访问次数增加到 {counters['access_count']}/{counters['max_access_count']}")
+        else:
+            log_sampler.log(logger, logging.INFO, "get_account_info", "客户端重复访问: Link ID %s, 访问次数保持 %s/%s",
+                            link_id, link_data['access_count'], link_data['max_access_count'])
+        
         # 不返回短信数据，短信由前端状态管理
         sms_data = []
         
@@ -296,24 +212,10 @@ async def get_latest_verification_code(
             # 获取最大显示条数（取所有活跃规则中的最大值，用于客户端倍数倍计时）
             display_count = max((rule.display_count for rule in active_rules if hasattr(rule, 'display_count') and rule.display_count), default=5)
             
-            # 根据规则匹配所有短信，不限制category
-            all_sms = db.query(SMS).filter(
-                SMS.device_id == account.primary_device_id
-            ).order_by(desc(SMS.sms_timestamp)).all()
-            
-            # 对每条短信检查是否匹配任何规则
-            for sms in all_sms:
-                for rule in active_rules:
-                    if match_sms_with_rule(sms, rule):
-                        matched_sms_list.append(sms)
-                        break  # 匹配到一个规则就够了，避免重复
-                
-                # 如果已经达到显示条数，停止匹配
-                if len(matched_sms_list) >= display_count:
-                    break
-            
-            # 确保短信按时间倒序排列（最新的在最上面）
-            matched_sms_list = sorted(matched_sms_list, key=lambda x: x.sms_timestamp, reverse=True)
+            # 根据规则匹配短信，不限制category (规则条件下推到SQL, 只读取候选短信, 按时间倒序)
+            matched_sms_list = latest_matching_sms(
+                db, account.primary_device_id, active_rules, display_count
+            )
         else:
             # 如果没有活跃规则，使用默认显示条数
             display_count = 3
@@ -353,90 +255,103 @@ async def get_latest_verification_code(
                 verification_analysis = sms_analysis
                 verification_sms = sms  # 更新为包含最佳验证码的短信
                 
-                logger.info(f"🎯 发现更好的验证码: SMS ID={sms.id}, 代码={sms_best_code.code}, 置信度={sms_best_code.confidence:.2f}")
+                logger.debug("🎯 发现更好的验证码: SMS ID=%s, 置信度=%.2f", sms.id, sms_best_code.confidence)
         
         # 记录最终识别结果
         if best_code:
-            logger.info(f"🎯 最终智能验证码识别结果: 代码={best_code.code}, 类型={best_code.pattern_type}, 置信度={best_code.confidence:.2f}, 地区={verification_analysis['region']}")
+            logger.debug("🎯 最终智能验证码识别结果: 类型=%s, 置信度=%.2f, 地区=%s",
+                         best_code.pattern_type, best_code.confidence, verification_analysis['region'])
         else:
-            logger.info(f"❌ 未识别到验证码")
+            logger.debug("❌ 未识别到验证码")
         
         # 🔥 新功能：动态获取最新短信，支持实时更新
         # 不在这里等待，而是返回当前匹配的短信，让前端处理倒计时和动态获取
         import asyncio
         if link.verification_wait_time and link.verification_wait_time > 0:
-            logger.info(f"验证码等待时间: {link.verification_wait_time}秒，将在前端处理动态获取...")
+            logger.debug("验证码等待时间: %s秒，将在前端处理动态获取...", link.verification_wait_time)
         
         # 🔥 关键修复：即使没有找到验证码也要返回匹配的短信
-        # 更新验证码获取记录
-        link.verification_count += 1
-        link.last_verification_time = datetime.now(timezone.utc)
-        db.commit()
-        
-        # 记录日志
-        if verification_code:
-            logger.info(f"客户端获取验证码: Account ID {account.id}, Link ID {link_id}, Code: {verification_code}, 获取次数: {link.verification_count}/{link.max_verification_count}, 返回短信数: {len(matched_sms_list)}")
-        else:
-            logger.info(f"客户端获取匹配短信: Account ID {account.id}, Link ID {link_id}, 无验证码, 获取次数: {link.verification_count}/{link.max_verification_count}, 返回短信数: {len(matched_sms_list)}")
-        
-        # 🔥 关键修复：确保返回verification_count字段，解决前端次数不更新问题
-        logger.info(f"🔥 customer.py API返回数据: verification_count={link.verification_count}, max_verification_count={link.max_verification_count}")
-        
         # 🔥 新功能：返回所有匹配的短信，用于完全覆盖客户端显示
-        return {
-            "success": True,
-            "data": {
-                "verification_code": verification_code,  # 最佳验证码
-                "sender": verification_sms.sender,
-                "content": verification_sms.content,  # 返回完整的短信内容
-                "sms_timestamp": verification_sms.sms_timestamp.isoformat() if verification_sms.sms_timestamp else None,
-                "display_count": display_count,  # 🔥 新增：返回显示条数，用于客户端倍数倍计时
-                "verification_count": link.verification_count,  # 🔥 关键修复：返回更新后的验证码次数
-                "max_verification_count": link.max_verification_count,  # 🔥 关键修复：返回最大次数
-                
-                # 🎯 智能验证码识别结果
-                "smart_recognition": {
-                    "region": verification_analysis['region'],  # 识别的地区
-                    "best_code": {
-                        "code": best_code.code,
-                        "confidence": best_code.confidence,
-                        "pattern_type": best_code.pattern_type,
-                        "context": best_code.context
-                    } if best_code else None,
-                    "all_candidates": [
+        # (在提交前构建, 避免提交后逐条重新加载短信对象)
+        response_data = {
+            "verification_code": verification_code,  # 最佳验证码
+            "sender": verification_sms.sender,
+            "content": verification_sms.content,  # 返回完整的短信内容
+            "sms_timestamp": verification_sms.sms_timestamp.isoformat() if verification_sms.sms_timestamp else None,
+            "display_count": display_count,  # 🔥 新增：返回显示条数，用于客户端倍数倍计时
+            "verification_count": link.verification_count,  # 提交后替换为更新后的次数
+            "max_verification_count": link.max_verification_count,  # 🔥 关键修复：返回最大次数
+            
+            # 🎯 智能验证码识别结果
+            "smart_recognition": {
+                "region": verification_analysis['region'],  # 识别的地区
+                "best_code": {
+                    "code": best_code.code,
+                    "confidence": best_code.confidence,
+                    "pattern_type": best_code.pattern_type,
+                    "context": best_code.context
+                } if best_code else None,
+                "all_candidates": [
+                    {
+                        "code": result.code,
+                        "confidence": result.confidence,
+                        "pattern_type": result.pattern_type,
+                        "context": result.context
+                    }
+                    for result in (verification_analysis['high_confidence'] + 
+                                 verification_analysis['medium_confidence'] + 
+                                 verification_analysis['low_confidence'])
+                ]
+            },
+            
+            # 新增：返回所有匹配的短信列表，每条短信都包含智能识别结果
+            "all_matched_sms": [
+                {
+                    "id": sms.id,
+                    "sender": sms.sender,
+                    "content": sms.content,  # 这里返回完整的短信内容
+                    "sms_timestamp": sms.sms_timestamp.isoformat() if sms.sms_timestamp else None,
+                    "category": sms.category,
+                    # 🎯 为每条短信提供智能识别结果
+                    "verification_codes": [
                         {
                             "code": result.code,
                             "confidence": result.confidence,
-                            "pattern_type": result.pattern_type,
-                            "context": result.context
+                            "pattern_type": result.pattern_type
                         }
-                        for result in (verification_analysis['high_confidence'] + 
-                                     verification_analysis['medium_confidence'] + 
-                                     verification_analysis['low_confidence'])
+                        for result in verification_extractor.extract_verification_codes(sms.content, sms.sender)
                     ]
-                },
-                
-                # 新增：返回所有匹配的短信列表，每条短信都包含智能识别结果
-                "all_matched_sms": [
-                    {
-                        "id": sms.id,
-                        "sender": sms.sender,
-                        "content": sms.content,  # 这里返回完整的短信内容
-                        "sms_timestamp": sms.sms_timestamp.isoformat() if sms.sms_timestamp else None,
-                        "category": sms.category,
-                        # 🎯 为每条短信提供智能识别结果
-                        "verification_codes": [
-                            {
-                                "code": result.code,
-                                "confidence": result.confidence,
-                                "pattern_type": result.pattern_type
-                            }
-                            for result in verification_extractor.extract_verification_codes(sms.content, sms.sender)
-                        ]
-                    }
-                    for sms in matched_sms_list
-                ]
-            }
+                }
+                for sms in matched_sms_list
+            ]
+        }
+        
+        account_id = account.id
+        
+        # 记录链接的验证码间隔, 限流中间件按此补充令牌
+        rate_limiter.remember_link_interval(link.link_id, link.verification_interval)
+        # 更新验证码获取记录 (条件更新: 次数检查和递增在同一条语句中完成, 并发请求不会超出上限)
+        counters = link_quota.consume_verification(db, link.id)
+        if counters is None:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="验证码获取次数已达上限"
+            )
+        db.commit()
+        response_data["verification_count"] = counters["verification_count"]  # 🔥 关键修复：返回更新后的验证码次数
+        
+        # 记录日志
+        log_sampler.log(
+            logger, logging.INFO, "get_verification_code",
+            "客户端获取验证码: Account ID %s, Link ID %s, %s, 获取次数: %s/%s, 返回短信数: %d",
+            account_id, link_id, "已识别验证码" if verification_code else "无验证码",
+            counters['verification_count'], counters['max_verification_count'], len(matched_sms_list)
+        )
+        
+        return {
+            "success": True,
+            "data": response_data
         }
         
     except HTTPException:
@@ -501,24 +416,10 @@ async def get_existing_sms(
             # 获取最大显示条数
             display_count = max((rule.display_count for rule in active_rules if hasattr(rule, 'display_count') and rule.display_count), default=5)
             
-            # 根据规则匹配所有短信
-            all_sms = db.query(SMS).filter(
-                SMS.device_id == account.primary_device_id
-            ).order_by(desc(SMS.sms_timestamp)).all()
-            
-            # 对每条短信检查是否匹配任何规则
-            for sms in all_sms:
-                for rule in active_rules:
-                    if match_sms_with_rule(sms, rule):
-                        matched_sms_list.append(sms)
-                        break  # 匹配到一个规则就够了，避免重复
-                
-                # 如果已经达到显示条数，停止匹配
-                if len(matched_sms_list) >= display_count:
-                    break
-            
-            # 确保短信按时间倒序排列（最新的在最上面）
-            matched_sms_list = sorted(matched_sms_list, key=lambda x: x.sms_timestamp, reverse=True)
+            # 根据规则匹配短信 (规则条件下推到SQL, 只读取候选短信, 按时间倒序)
+            matched_sms_list = latest_matching_sms(
+                db, account.primary_device_id, active_rules, display_count
+            )
         else:
             # 如果没有活跃规则，使用默认显示条数
             display_count = 3
@@ -528,7 +429,8 @@ async def get_existing_sms(
             matched_sms_list = latest_sms_list
         
         # 🔥 关键：不增加验证码获取次数，只返回已有短信
-        logger.info(f"获取已有短信: Link ID {link_id}, 返回短信数: {len(matched_sms_list)}, 显示条数: {display_count}")
+        log_sampler.log(logger, logging.INFO, "get_existing_sms", "获取已有短信: Link ID %s, 返回短信数: %d, 显示条数: %s",
+                        link_id, len(matched_sms_list), display_count)
         
         # 返回已有短信和显示条数
         return {
@@ -626,9 +528,7 @@ async def get_latest_sms(
         
         if active_rules:
             # 构建查询条件
-            query_conditions = [
-                SMS.device_id == account.primary_device_id
-            ]
+            query_conditions = []
             
             # 排除已获取的短信
             if exclude_sms_ids:
@@ -638,24 +538,10 @@ async def get_latest_sms(
             if after_time:
                 query_conditions.append(SMS.sms_timestamp > after_time)
             
-            # 根据规则匹配所有短信
-            all_sms = db.query(SMS).filter(
-                and_(*query_conditions)
-            ).order_by(desc(SMS.sms_timestamp)).all()
-            
-            # 对每条短信检查是否匹配任何规则
-            for sms in all_sms:
-                for rule in active_rules:
-                    if match_sms_with_rule(sms, rule):
-                        matched_sms_list.append(sms)
-                        break  # 匹配到一个规则就够了，避免重复
-                
-                # 只获取一条最新的匹配短信
-                if len(matched_sms_list) >= 1:
-                    break
-            
-            # 确保短信按时间倒序排列（最新的在最上面）
-            matched_sms_list = sorted(matched_sms_list, key=lambda x: x.sms_timestamp, reverse=True)
+            # 只获取一条最新的匹配短信 (规则条件下推到SQL)
+            matched_sms_list = latest_matching_sms(
+                db, account.primary_device_id, active_rules, 1, query_conditions
+            )
         else:
             # 如果没有活跃规则，获取最新的短信（排除已获取的）
             query_conditions = [SMS.device_id == account.primary_device_id]
@@ -701,7 +587,8 @@ async def get_latest_sms(
                 verification_code = match.group(1)
                 break
         
-        logger.info(f"实时获取最新短信: Link ID {link_id}, SMS ID {latest_sms.id}, 排除ID: {exclude_sms_ids}, 时间过滤: {after_timestamp}")
+        log_sampler.log(logger, logging.INFO, "get_latest_sms", "实时获取最新短信: Link ID %s, SMS ID %s, 排除ID: %s, 时间过滤: %s",
+                        link_id, latest_sms.id, exclude_sms_ids, after_timestamp)
         
         # 返回最新的短信
         return {
@@ -10,6 +10,7 @@ from datetime import datetime, timezone, timedelta
 from typing import List, Optional
 from pydantic import BaseModel
 import logging
+import time
 
 from ..database import get_db
 from ..models.device import Device
@@ -18,6 +19,7 @@ from ..models.sms import SMS
 from ..api.auth import get_current_user, get_current_device
 from ..config import settings
 from ..websocket import manager
+from ..services.metrics import SMS_INGESTED
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -114,6 +116,7 @@ async def upload_device_data(
         
         # 处理短信数据
         sms_count = 0
+        duplicate_count = 0
         if data.sms_list:
             for sms_data in data.sms_list:
                 try:
@@ -128,7 +131,9 @@ async def upload_device_data(
                         SMS.sms_timestamp == sms_timestamp
                     ).first()
                     
-                    if not existing_sms:
+                    if existing_sms:
+                        duplicate_count += 1
+                    else:
                         new_sms = SMS(
                             device_id=current_device.id,
                             sender=sms_data.sender,
@@ -148,7 +153,7 @@ async def upload_device_data(
                             
                             # 创建异步任务处理转发
                             loop = asyncio.get_event_loop()
-                            loop.create_task(forward_sms(db, new_sms))
+                            loop.create_task(forward_sms(db, new_sms, queued_at=time.monotonic()))
                             
                         except Exception as forward_error:
                             # 转发失败不影响短信保存
@@ -169,6 +174,8 @@ async def upload_device_data(
         current_device.updated_at = datetime.now(timezone.utc)
         
         db.commit()
+        SMS_INGESTED.labels("upload", "saved").inc(sms_count)
+        SMS_INGESTED.labels("upload", "duplicate").inc(duplicate_count)
         
         # 发送WebSocket通知
         if sms_count > 0:
@@ -3,83 +3,159 @@
 Image access and upload APIs for serving and uploading images
 """
 
-from fastapi import APIRouter, HTTPException, status, Depends, UploadFile, File
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, status, Depends, UploadFile, File, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, Response, RedirectResponse, StreamingResponse
+from email.utils import formatdate
 from pathlib import Path
 import mimetypes
-import logging
-import uuid
 import os
-from typing import List
+import logging
+import base64
+from typing import List, Optional
+from sqlalchemy.orm import Session
 
 from ..api.auth import get_current_user
+from ..config import settings
+from ..database import get_db
 from ..models.user import User
+from ..services.image_delivery import image_delivery, snap_size, etag_matches, VARIANT_FORMATS
+from ..services.image_storage import image_storage, ImageTooLargeError
+from ..services.image_catalog import image_catalog
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-# 图片存储目录
-UPLOAD_DIR = Path("uploads/images")
-
-# 确保上传目录存在
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
-
 # 允许的图片格式
 ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp'}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 
+# 默认头像: 1x1像素的透明PNG图片
+DEFAULT_AVATAR = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChAI9jU77zgAAAABJRU5ErkJggg=="
+)
+
+def _default_avatar_response() -> Response:
+    """默认头像响应 (1x1像素的透明PNG图片)"""
+    return Response(
+        content=DEFAULT_AVATAR,
+        media_type="image/png",
+        headers={"Cache-Control": "public, max-age=3600"}
+    )
+
+
 @router.get("/images/{filename}")
-async def get_image(filename: str):
+async def get_image(
+    filename: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, le=4096, description="目标宽度 (向上取整到固定档位)"),
+    h: Optional[int] = Query(None, ge=1, le=4096, description="目标高度 (向上取整到固定档位)"),
+    format: Optional[str] = Query(None, pattern="^(webp|jpeg|png|auto)$", description="输出格式, auto 按 Accept 协商"),
+):
     """
     获取图片文件
     
+    支持 ETag / If-None-Match 条件请求; 传入 w/h/format 时返回缩放或转码后的变体
+    
     Args:
         filename: 图片文件名
+        w: 目标宽度
+        h: 目标高度
+        format: 输出格式
         
     Returns:
         图片文件响应
     """
     try:
-        # 构建文件路径
-        file_path = UPLOAD_DIR / filename
+        # 检查文件名（安全检查）, 在访问文件系统之前完成
+        if "/" in filename or "\\" in filename or filename.startswith("."):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="访问被拒绝"
+            )
         
-        # 检查文件是否存在
-        if not file_path.exists() or not file_path.is_file():
+        # 只 stat 一次, 结果同时用于存在性检查和响应头
+        # 本地文件 stat 开销很小, 对象存储需要网络请求, 放到线程池执行
+        backend = image_storage.backend
+        if backend.name == "local":
+            object_stat = backend.stat(filename)
+        else:
+            object_stat = await run_in_threadpool(backend.stat, filename)
+        
+        if object_stat is None:
             # 如果文件不存在，返回默认头像
             logger.warning(f"图片文件不存在: {filename}, 返回默认头像")
-            
-            # 创建一个简单的默认头像响应
-            from fastapi.responses import Response
-            import base64
-            
-            # 1x1像素的透明PNG图片的base64编码
-            default_avatar = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChAI9jU77zgAAAABJRU5ErkJggg=="
-            
-            return Response(
-                content=base64.b64decode(default_avatar),
-                media_type="image/png",
-                headers={"Cache-Control": "public, max-age=3600"}
-            )
+            return _default_avatar_response()
         
-        # 检查文件是否在允许的目录内（安全检查）
-        try:
-            file_path.resolve().relative_to(UPLOAD_DIR.resolve())
-        except ValueError:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="访问被拒绝"
+        content_hash = await run_in_threadpool(image_delivery.content_hash, backend, filename, object_stat)
+        width, height = snap_size(w), snap_size(h)
+        variant_format, vary_accept = image_delivery.resolve_variant_format(
+            Path(filename).suffix, width, height, format, request.headers.get("accept", "")
+        )
+        
+        headers = {"Cache-Control": image_delivery.cache_control(filename)}
+        if vary_accept:
+            headers["Vary"] = "Accept"
+        
+        if variant_format:
+            _, etag = image_delivery.variant_key(content_hash, width, height, variant_format)
+        else:
+            etag = f'"{content_hash}"'
+        headers["ETag"] = etag
+        
+        # 条件请求命中, 无需读取或生成图片
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        
+        if variant_format:
+            # 打开后再返回响应, 变体在发送过程中被淘汰也不影响已打开的文件
+            variant_file = await image_delivery.open_variant(
+                backend, filename, content_hash, width, height, variant_format
+            )
+            variant_stat = os.fstat(variant_file.fileno())
+            headers["Content-Length"] = str(variant_stat.st_size)
+            headers["Last-Modified"] = formatdate(variant_stat.st_mtime, usegmt=True)
+            return StreamingResponse(
+                image_delivery.iter_file(variant_file),
+                media_type=VARIANT_FORMATS[variant_format][1],
+                headers=headers
             )
         
         # 获取MIME类型
-        mime_type, _ = mimetypes.guess_type(str(file_path))
+        mime_type, _ = mimetypes.guess_type(filename)
         if not mime_type or not mime_type.startswith('image/'):
             mime_type = 'image/jpeg'  # 默认MIME类型
         
-        # 返回文件响应
-        return FileResponse(
-            path=str(file_path),
+        # 本地存储: 返回文件响应
+        local_path = backend.local_path(filename)
+        if local_path:
+            return FileResponse(
+                path=str(local_path),
+                media_type=mime_type,
+                filename=filename,
+                headers=headers,
+                stat_result=object_stat.raw
+            )
+        
+        # 对象存储: 重定向到签名URL, 图片流量不经过应用进程
+        if settings.image_signed_url_redirect:
+            signed_url = await run_in_threadpool(
+                backend.signed_url, filename, settings.image_signed_url_expires
+            )
+            if signed_url:
+                return RedirectResponse(
+                    signed_url,
+                    status_code=status.HTTP_307_TEMPORARY_REDIRECT,
+                    headers={"Cache-Control": f"private, max-age={settings.image_signed_url_expires // 2}"}
+                )
+        
+        # 对象存储: 分块转发对象内容
+        headers["Content-Length"] = str(object_stat.size)
+        headers["Last-Modified"] = formatdate(object_stat.mtime, usegmt=True)
+        return StreamingResponse(
+            backend.iter_chunks(filename),
             media_type=mime_type,
-            filename=filename
+            headers=headers
         )
         
     except HTTPException:
@@ -87,52 +163,54 @@ async def get_image(filename: str):
     except Exception as e:
         logger.error(f"获取图片文件失败: {str(e)}")
         # 返回默认头像而不是抛出异常
-        from fastapi.responses import Response
-        import base64
-        
-        default_avatar = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChAI9jU77zgAAAABJRU5ErkJggg=="
-        
-        return Response(
-            content=base64.b64decode(default_avatar),
-            media_type="image/png",
-            headers={"Cache-Control": "public, max-age=3600"}
-        )
+        return _default_avatar_response()
 
 
 @router.get("/images/{filename}/info")
-async def get_image_info(filename: str):
+async def get_image_info(
+    filename: str,
+    db: Session = Depends(get_db)
+):
     """
     获取图片文件信息
     
     Args:
         filename: 图片文件名
+        db: 数据库会话
         
     Returns:
         图片文件信息
     """
     try:
-        # 构建文件路径
-        file_path = UPLOAD_DIR / filename
+        # 优先查询图片目录
+        image = image_catalog.get_image(db, filename)
+        if image:
+            return {
+                "success": True,
+                "data": image.to_dict(include_accounts=True)
+            }
         
-        # 检查文件是否存在
-        if not file_path.exists() or not file_path.is_file():
+        # 未登记的历史文件, 回退到存储后端
+        object_stat = None
+        if "/" not in filename and "\\" not in filename:
+            object_stat = await run_in_threadpool(image_storage.backend.stat, filename)
+        if object_stat is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="图片文件不存在"
             )
         
         # 获取文件信息
-        stat = file_path.stat()
-        mime_type, _ = mimetypes.guess_type(str(file_path))
+        mime_type, _ = mimetypes.guess_type(filename)
         
         return {
             "success": True,
             "data": {
                 "filename": filename,
-                "size": stat.st_size,
+                "size": object_stat.size,
                 "mime_type": mime_type,
-                "created_at": stat.st_ctime,
-                "modified_at": stat.st_mtime
+                "created_at": object_stat.raw.st_ctime if object_stat.raw else object_stat.mtime,
+                "modified_at": object_stat.mtime
             }
         }
         
@@ -149,14 +227,18 @@ async def get_image_info(filename: str):
 @router.post("/images/upload")
 async def upload_image(
     image: UploadFile = File(...),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
 ):
     """
     上传图片文件
     
+    文件分块写入并按内容哈希存储, 重复上传相同内容不占用额外空间
+    
     Args:
         image: 上传的图片文件
         current_user: 当前用户
+        db: 数据库会话
         
     Returns:
         上传结果和图片URL
@@ -177,38 +259,35 @@ async def upload_image(
                 detail=f"不支持的文件格式。支持的格式: {', '.join(ALLOWED_EXTENSIONS)}"
             )
         
-        # 读取文件内容
-        content = await image.read()
-        
-        # 检查文件大小
-        if len(content) > MAX_FILE_SIZE:
+        # 流式保存, 写入过程中检查文件大小
+        try:
+            stored = await image_storage.save_upload(image, file_ext, MAX_FILE_SIZE, db)
+        except ImageTooLargeError:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"文件大小超过限制。最大允许: {MAX_FILE_SIZE // (1024*1024)}MB"
             )
-        
-        # 生成唯一文件名
-        unique_filename = f"{uuid.uuid4().hex}{file_ext}"
-        file_path = UPLOAD_DIR / unique_filename
-        
-        # 保存文件
-        with open(file_path, "wb") as f:
-            f.write(content)
+        db.commit()
         
         # 构建图片URL
-        image_url = f"/api/images/{unique_filename}"
+        image_url = f"/api/images/{stored['filename']}"
         
-        logger.info(f"用户 {current_user.username} 上传图片成功: {unique_filename}")
+        logger.info(
+            f"用户 {current_user.username} 上传图片成功: {stored['filename']}"
+            f"{' (复用已有文件)' if stored['deduplicated'] else ''}"
+        )
         
         return {
             "success": True,
             "message": "图片上传成功",
             "data": {
-                "filename": unique_filename,
+                "filename": stored["filename"],
                 "original_filename": image.filename,
                 "url": image_url,
-                "size": len(content),
-                "mime_type": image.content_type
+                "size": stored["size"],
+                "mime_type": image.content_type,
+                "content_hash": stored["content_hash"],
+                "deduplicated": stored["deduplicated"]
             }
         }
         
@@ -216,6 +295,7 @@ async def upload_image(
         raise
     except Exception as e:
         logger.error(f"上传图片失败: {str(e)}")
+        db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="图片上传失败"
@@ -225,40 +305,37 @@ async def upload_image(
 @router.delete("/images/{filename}")
 async def delete_image(
     filename: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
 ):
     """
     删除图片文件
     
+    释放一次引用, 没有其他引用时才删除文件
+    
     Args:
         filename: 图片文件名
         current_user: 当前用户
+        db: 数据库会话
         
     Returns:
         删除结果
     """
     try:
-        # 构建文件路径
-        file_path = UPLOAD_DIR / filename
-        
-        # 检查文件是否存在
-        if not file_path.exists() or not file_path.is_file():
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="图片文件不存在"
-            )
-        
-        # 检查文件是否在允许的目录内（安全检查）
-        try:
-            file_path.resolve().relative_to(UPLOAD_DIR.resolve())
-        except ValueError:
+        # 检查文件名（安全检查）
+        if "/" in filename or "\\" in filename or filename.startswith("."):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="访问被拒绝"
             )
         
-        # 删除文件
-        os.remove(file_path)
+        # 释放引用, 引用归零时提交后删除文件
+        if not await run_in_threadpool(image_storage.release, db, filename):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="图片文件不存在"
+            )
+        db.commit()
         
         logger.info(f"用户 {current_user.username} 删除图片: {filename}")
         
@@ -271,6 +348,7 @@ async def delete_image(
         raise
     except Exception as e:
         logger.error(f"删除图片失败: {str(e)}")
+        db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="删除图片失败"
@@ -279,42 +357,40 @@ async def delete_image(
 
 @router.get("/images")
 async def list_images(
-    current_user: User = Depends(get_current_user)
+    page: int = Query(1, ge=1, description="页码"),
+    page_size: int = Query(50, ge=1, le=200, description="每页数量"),
+    sort_by: str = Query("created_at", pattern="^(created_at|size|ref_count)$", description="排序字段"),
+    order: str = Query("desc", pattern="^(asc|desc)$", description="排序方向"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
 ):
     """
-    获取图片列表
+    获取图片列表 (从图片目录分页查询)
     
     Args:
+        page: 页码
+        page_size: 每页数量
+        sort_by: 排序字段
+        order: 排序方向
         current_user: 当前用户
+        db: 数据库会话
         
     Returns:
         图片列表
     """
     try:
-        images = []
-        
-        # 遍历上传目录
-        for file_path in UPLOAD_DIR.iterdir():
-            if file_path.is_file() and file_path.suffix.lower() in ALLOWED_EXTENSIONS:
-                stat = file_path.stat()
-                mime_type, _ = mimetypes.guess_type(str(file_path))
-                
-                images.append({
-                    "filename": file_path.name,
-                    "url": f"/api/images/{file_path.name}",
-                    "size": stat.st_size,
-                    "mime_type": mime_type,
-                    "created_at": stat.st_ctime,
-                    "modified_at": stat.st_mtime
-                })
-        
-        # 按创建时间倒序排列
-        images.sort(key=lambda x: x["created_at"], reverse=True)
+        images, total = image_catalog.list_images(db, page, page_size, sort_by, order)
         
         return {
             "success": True,
-            "data": images,
-            "total": len(images)
+            "data": [image.to_dict(include_accounts=True) for image in images],
+            "total": total,
+            "pagination": {
+                "page": page,
+                "page_size": page_size,
+                "total": total,
+                "pages": (total + page_size - 1) // page_size
+            }
         }
         
     except Exception as e:
@@ -4,8 +4,9 @@ Link management APIs
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, and_
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session, contains_eager, defer, undefer
+from sqlalchemy import desc, and_, or_, func
 from datetime import datetime, timezone, timedelta
 from typing import List, Optional
 from pydantic import BaseModel
@@ -19,6 +20,12 @@ from ..models.sms import SMS
 from ..models.user import User
 from ..api.auth import get_current_user
 from ..config import settings
+from ..services.data_export import export_response, encode_rows, stream_response
+from ..services.link_generator import LinkBatchParams, link_generator, link_generation_jobs, link_url
+from ..services.link_expiry import expired_pending_clause
+from ..services.link_quota import link_quota
+from ..services.rate_limiter import rate_limiter
+from ..services.rule_predicates import latest_matching_sms
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -37,6 +44,12 @@ class LinkCreateBatch(BaseModel):
     expires_days: Optional[int] = None
 
 
+class LinkBulkCreate(LinkCreateBatch):
+    """大批量生成链接请求模型"""
+    count: int = 1000
+    run_async: bool = False  # 强制作为后台任务执行 (超过同步上限时自动使用)
+
+
 class LinkUpdate(BaseModel):
     """更新链接请求模型"""
     max_access_count: Optional[int] = None
@@ -64,61 +77,22 @@ async def create_links_batch(
     Batch create links
     """
     try:
-        # 验证账号是否存在
-        account = db.query(Account).filter(Account.id == request_data.account_id).first()
-        if not account:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="账号不存在"
-            )
-        
-        # 验证设备是否存在
-        device = db.query(Device).filter(Device.id == request_data.device_id).first()
-        if not device:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="设备不存在"
-            )
-        
-        # 计算过期时间
-        expires_at = None
-        if request_data.expires_days:
-            expires_at = datetime.now(timezone.utc) + timedelta(days=request_data.expires_days)
-        
-        # 批量创建链接
-        created_links = []
-        for i in range(request_data.count):
-            new_link = AccountLink(
-                account_id=request_data.account_id,
-                device_id=request_data.device_id,
-                max_access_count=request_data.max_access_count,
-                max_verification_count=request_data.max_verification_count,
-                verification_interval=10,  # 使用固定的防滥用间隔（10秒）
-                access_session_interval=request_data.access_session_interval,  # 新增：访问会话间隔
-                verification_wait_time=request_data.verification_wait_time,    # 新增：验证码等待时间
-                expires_at=expires_at
-            )
-            
-            # 生成完整链接URL - 使用相对路径，让前端处理域名
-            new_link.link_url = f"/customer/{new_link.link_id}"
-            
-            db.add(new_link)
-            created_links.append(new_link)
+        params = _batch_params(db, request_data)
         
+        # 批量创建链接 (多行 INSERT ... RETURNING, 一次写入并取回完整数据)
+        created_links = link_generator.create_links(db, params, request_data.count)
+        # 在提交前转换, 避免提交后逐个重新加载链接
+        links_data = [link.to_dict() for link in created_links]
         db.commit()
         
-        # 刷新所有创建的链接以获取完整数据
-        for link in created_links:
-            db.refresh(link)
-        
         logger.info(f"批量创建链接成功: 账号ID {request_data.account_id}, 设备ID {request_data.device_id}, 数量 {request_data.count}")
         
         return {
             "success": True,
             "message": f"成功创建 {request_data.count} 个链接",
             "data": {
-                "links": [link.to_dict() for link in created_links],
-                "count": len(created_links)
+                "links": links_data,
+                "count": len(links_data)
             }
         }
         
@@ -133,6 +107,136 @@ async def create_links_batch(
         )
 
 
+def _batch_params(db: Session, request_data: LinkCreateBatch) -> LinkBatchParams:
+    """校验账号和设备, 构建批量生成参数"""
+    # 验证账号是否存在
+    if not db.query(Account.id).filter(Account.id == request_data.account_id).first():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="账号不存在"
+        )
+    
+    # 验证设备是否存在
+    if not db.query(Device.id).filter(Device.id == request_data.device_id).first():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="设备不存在"
+        )
+    
+    # 计算过期时间
+    expires_at = None
+    if request_data.expires_days:
+        expires_at = datetime.now(timezone.utc) + timedelta(days=request_data.expires_days)
+    
+    return LinkBatchParams(
+        account_id=request_data.account_id,
+        device_id=request_data.device_id,
+        max_access_count=request_data.max_access_count,
+        max_verification_count=request_data.max_verification_count,
+        access_session_interval=request_data.access_session_interval,
+        verification_wait_time=request_data.verification_wait_time,
+        expires_at=expires_at
+    )
+
+
+def _generated_links_response(link_ids: List[str], export_format: str, compress: bool):
+    """以 CSV/NDJSON 下载返回生成的链接"""
+    rows = ((link_id, link_url(link_id)) for link_id in link_ids)
+    return stream_response(
+        encode_rows(rows, ["link_id", "link_url"], export_format, compress),
+        filename="links",
+        export_format=export_format,
+        compress=compress
+    )
+
+
+@router.post("/bulk_create")
+async def bulk_create_links(
+    request_data: LinkBulkCreate,
+    format: str = Query("csv", pattern="^(csv|ndjson)$", description="下载格式 (csv/ndjson)"),
+    compress: bool = Query(False, description="是否gzip压缩"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    大批量生成链接
+    Bulk generate links: small counts stream the links back as CSV/NDJSON,
+    large counts run as a background job with progress over the admin WebSocket
+    """
+    try:
+        if request_data.count <= 0 or request_data.count > settings.link_bulk_max_count:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"生成数量必须在 1 到 {settings.link_bulk_max_count} 之间"
+            )
+        
+        params = _batch_params(db, request_data)
+        
+        if request_data.run_async or request_data.count > settings.link_bulk_sync_max_count:
+            job = link_generation_jobs.start(params, request_data.count)
+            return {
+                "success": True,
+                "message": f"批量生成任务已启动, 共 {request_data.count} 个链接",
+                "data": job
+            }
+        
+        def _generate() -> List[str]:
+            link_ids = link_generator.insert_links(db, params, request_data.count)
+            db.commit()
+            return link_ids
+        
+        link_ids = await run_in_threadpool(_generate)
+        logger.info(f"大批量生成链接成功: 账号ID {params.account_id}, 设备ID {params.device_id}, 数量 {len(link_ids)}")
+        return _generated_links_response(link_ids, format, compress)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"大批量生成链接失败: {str(e)}")
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="大批量生成链接失败"
+        )
+
+
+@router.get("/bulk_jobs/{job_id}")
+async def get_bulk_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    获取批量生成任务进度
+    Get bulk link generation job progress
+    """
+    job = link_generation_jobs.get(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="任务不存在"
+        )
+    return {"success": True, "data": job}
+
+
+@router.get("/bulk_jobs/{job_id}/download")
+async def download_bulk_job_links(
+    job_id: str,
+    format: str = Query("csv", pattern="^(csv|ndjson)$", description="下载格式 (csv/ndjson)"),
+    compress: bool = Query(False, description="是否gzip压缩"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    下载批量生成任务已生成的链接
+    Download the links generated by a bulk job
+    """
+    if not link_generation_jobs.get(job_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="任务不存在"
+        )
+    return _generated_links_response(link_generation_jobs.get_link_ids(job_id), format, compress)
+
+
 @router.get("/list")
 async def get_links_list(
     page: int = Query(1, ge=1, description="页码"),
@@ -149,7 +253,9 @@ async def get_links_list(
     """
     try:
         # 构建查询
-        query = db.query(AccountLink).join(Account).join(Device)
+        query = db.query(AccountLink).join(Account, AccountLink.account_id == Account.id).join(
+            Device, AccountLink.device_id == Device.id
+        )
         
         # 账号筛选
         if account_id:
@@ -171,8 +277,11 @@ async def get_links_list(
         # 计算总数
         total = query.count()
         
-        # 分页查询
-        links = query.order_by(desc(AccountLink.created_at)).offset((page - 1) * page_size).limit(page_size).all()
+        # 分页查询 (复用已JOIN的账号和设备, 避免逐行查询)
+        links = query.options(
+            contains_eager(AccountLink.account).options(defer(Account.image_url), undefer(Account.image_ref)),
+            contains_eager(AccountLink.device)
+        ).order_by(desc(AccountLink.created_at)).offset((page - 1) * page_size).limit(page_size).all()
         
         # 构建响应数据
         links_data = []
@@ -183,7 +292,7 @@ async def get_links_list(
                 'account_name': link.account.account_name,
                 'username': link.account.username,
                 'type': link.account.type,
-                'image_url': link.account.image_url
+                'image_url': link.account.image_ref
             }
             link_dict['device_info'] = {
                 'id': link.device.id,
@@ -216,6 +325,52 @@ async def get_links_list(
         )
 
 
+@router.get("/export")
+async def export_links_usage(
+    format: str = Query("csv", pattern="^(csv|ndjson)$", description="导出格式 (csv/ndjson)"),
+    compress: bool = Query(False, description="是否gzip压缩"),
+    account_id: Optional[int] = Query(None, description="账号ID筛选"),
+    device_id: Optional[int] = Query(None, description="设备ID筛选"),
+    status_filter: Optional[str] = Query(None, description="状态筛选"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    流式导出链接使用情况
+    Stream link usage export as CSV/NDJSON
+    """
+    def build_query(db: Session):
+        query = db.query(
+            AccountLink.link_id, AccountLink.account_id, Account.account_name,
+            AccountLink.device_id, Device.device_id, AccountLink.status, AccountLink.is_active,
+            AccountLink.access_count, AccountLink.max_access_count,
+            AccountLink.verification_count, AccountLink.max_verification_count,
+            AccountLink.last_access_time, AccountLink.last_verification_time, AccountLink.last_ip,
+            AccountLink.expires_at, AccountLink.created_at
+        ).join(Account, AccountLink.account_id == Account.id).join(Device, AccountLink.device_id == Device.id)
+        if account_id:
+            query = query.filter(AccountLink.account_id == account_id)
+        if device_id:
+            query = query.filter(AccountLink.device_id == device_id)
+        if status_filter == "active":
+            query = query.filter(AccountLink.is_active == True)
+        elif status_filter == "inactive":
+            query = query.filter(AccountLink.is_active == False)
+        elif status_filter in ["unused", "used", "expired"]:
+            query = query.filter(AccountLink.status == status_filter)
+        return query.order_by(AccountLink.id)
+
+    logger.info(f"用户 {current_user.username} 导出链接使用情况: format={format}, compress={compress}")
+    return export_response(
+        build_query,
+        ["link_id", "account_id", "account_name", "device_id", "device_serial", "status", "is_active",
+         "access_count", "max_access_count", "verification_count", "max_verification_count",
+         "last_access_time", "last_verification_time", "last_ip", "expires_at", "created_at"],
+        filename="link_usage",
+        export_format=format,
+        compress=compress
+    )
+
+
 @router.get("/{link_id}")
 async def get_link_detail(
     link_id: str,
@@ -404,16 +559,20 @@ async def get_account_info(
                 }
             }
         
-        # 更新访问统计
-        link.access_count += 1
-        link.last_access_time = datetime.now(timezone.utc)
-        link.last_ip = request.client.host if request.client else "unknown"
-        link.last_user_agent = request.headers.get("user-agent", "")
-        
-        # 更新链接状态
-        if link.status == "unused":
-            link.status = "used"
-        
+        # 更新访问统计和链接状态 (条件更新: 并发访问不会超出次数上限)
+        counters = link_quota.consume_access(
+            db, link.id,
+            client_ip=request.client.host if request.client else "unknown",
+            user_agent=request.headers.get("user-agent", ""),
+            mark_used=True
+        )
+        if counters is None:
+            db.rollback()
+            return {
+                "success": False,
+                "error": "access_limit_exceeded",
+                "message": "链接已过期或访问次数已达上限"
+            }
         db.commit()
         
         # 返回账号信息 - 按照前端期望的数据结构，绝不硬编码！
@@ -480,16 +639,19 @@ async def get_public_account_info(
                 detail="链接已过期或访问次数已达上限"
             )
         
-        # 更新访问统计
-        link.access_count += 1
-        link.last_access_time = datetime.now(timezone.utc)
-        link.last_ip = request.client.host
-        link.last_user_agent = request.headers.get("user-agent", "")
-        
-        # 更新链接状态
-        if link.status == "unused":
-            link.status = "used"
-        
+        # 更新访问统计和链接状态 (条件更新: 并发访问不会超出次数上限)
+        counters = link_quota.consume_access(
+            db, link.id,
+            client_ip=request.client.host,
+            user_agent=request.headers.get("user-agent", ""),
+            mark_used=True
+        )
+        if counters is None:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="链接已过期或访问次数已达上限"
+            )
         db.commit()
         
         # 返回账号信息
@@ -545,8 +707,8 @@ async def get_verification_codes(
             )
         
         # 🔥 修复：移除API级别的冷却限制，让前端倒计时控制请求频率
-        # 只检查次数限制，不检查冷却时间
-        if link.verification_count >= link.max_verification_count:
+        # 只检查次数限制，不检查冷却时间 (快照已超限时直接拒绝, 不执行写操作)
+        if not link.is_verification_allowed():
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="验证码获取次数已达上限"
@@ -556,29 +718,24 @@ async def get_verification_codes(
         from ..models.sms_rule import SMSRule
         from ..api.sms import match_sms_with_rules
         
-        # 获取该设备的所有激活短信规则
+        # 获取该链接账号的所有激活短信规则
         active_rules = db.query(SMSRule).filter(
             and_(
-                SMSRule.device_id == link.device_id,
+                SMSRule.account_id == link.account_id,
                 SMSRule.is_active == True
             )
         ).order_by(desc(SMSRule.priority)).all()
         
-        # 获取该设备的所有短信
-        all_sms = db.query(SMS).filter(
-            SMS.device_id == link.device_id
-        ).order_by(desc(SMS.sms_timestamp)).all()
-        
-        # 使用规则匹配短信，找出符合规则的短信
+        # 使用规则匹配短信，取最多5条最新的匹配短信 (规则条件下推到SQL, 只读取候选短信)
         matched_sms = []
-        for sms in all_sms:
-            matched_rules = match_sms_with_rules(sms, active_rules)
-            if matched_rules:
-                # 如果有匹配的规则，添加到结果中
-                matched_sms.append({
+        if active_rules:
+            matched_sms = [
+                {
                     "sms": sms,
-                    "matched_rules": matched_rules
-                })
+                    "matched_rules": match_sms_with_rules(sms, active_rules)
+                }
+                for sms in latest_matching_sms(db, link.device_id, active_rules, 5)
+            ]
         
         # 如果没有规则匹配的短信，使用默认的验证码检测逻辑
         if not matched_sms:
@@ -587,25 +744,13 @@ async def get_verification_codes(
                 "安全码", "登录码", "注册码", "找回密码", "身份验证"
             ]
             
-            for sms in all_sms:
-                content_lower = sms.content.lower()
-                for keyword in verification_keywords:
-                    if keyword in content_lower:
-                        matched_sms.append({
-                            "sms": sms,
-                            "matched_rules": []
-                        })
-                        break
-        
-        # 取最多5条最新的匹配短信
-        matched_sms = matched_sms[:5]
-        
-        # 更新验证码获取统计
-        link.verification_count += 1
-        link.last_verification_time = datetime.now(timezone.utc)
-        db.commit()
+            keyword_sms = db.query(SMS).filter(
+                SMS.device_id == link.device_id,
+                or_(*[SMS.content.icontains(keyword, autoescape=True) for keyword in verification_keywords])
+            ).order_by(desc(SMS.sms_timestamp)).limit(5).all()
+            matched_sms = [{"sms": sms, "matched_rules": []} for sms in keyword_sms]
         
-        # 构建响应数据
+        # 构建响应数据 (在提交前读取, 避免提交后逐条重新加载短信对象)
         sms_data = []
         for item in matched_sms:
             sms = item["sms"]
@@ -616,16 +761,29 @@ async def get_verification_codes(
                 "category": sms.category,
                 "matched_rules": [rule.rule_name for rule in item["matched_rules"]]
             })
+        rules_applied = len(active_rules) > 0
+        
+        # 记录链接的验证码间隔, 限流中间件按此补充令牌
+        rate_limiter.remember_link_interval(link.link_id, link.verification_interval)
+        # 更新验证码获取统计 (条件更新: 次数检查和递增在同一条语句中完成, 并发请求不会超出上限)
+        counters = link_quota.consume_verification(db, link.id)
+        if counters is None:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="验证码获取次数已达上限"
+            )
+        db.commit()
         
         return {
             "success": True,
             "data": {
                 "sms_list": sms_data,
                 "count": len(sms_data),
-                "verification_count": link.verification_count,  # 🔥 确保返回最新的验证码次数
-                "max_verification_count": link.max_verification_count,
+                "verification_count": counters["verification_count"],  # 🔥 确保返回最新的验证码次数
+                "max_verification_count": counters["max_verification_count"],
                 "next_allowed_time": None,  # 🔥 移除冷却时间限制，由前端控制
-                "rules_applied": len(active_rules) > 0,
+                "rules_applied": rules_applied,
                 "all_matched_sms": sms_data  # 🔥 确保前端能获取到短信数据
             }
         }
@@ -651,19 +809,25 @@ async def get_links_statistics(
     Get links statistics overview
     """
     try:
-        # 基础统计
-        total_links = db.query(AccountLink).count()
+        # 基础统计 (按状态分组计数, 使用 status 索引)
+        status_counts = dict(db.query(AccountLink.status, func.count(AccountLink.id)).group_by(AccountLink.status).all())
+        total_links = sum(status_counts.values())
         active_links = db.query(AccountLink).filter(AccountLink.is_active == True).count()
-        used_links = db.query(AccountLink).filter(AccountLink.status == "used").count()
-        unused_links = db.query(AccountLink).filter(AccountLink.status == "unused").count()
-        expired_links = db.query(AccountLink).filter(AccountLink.status == "expired").count()
+        
+        # 已过期但清理任务尚未标记的链接 (按 expires_at 索引范围扫描), 计入过期数
+        pending_expired = dict(db.query(AccountLink.status, func.count(AccountLink.id)).filter(
+            expired_pending_clause(datetime.now(timezone.utc))
+        ).group_by(AccountLink.status).all())
+        
+        used_links = status_counts.get("used", 0) - pending_expired.get("used", 0)
+        unused_links = status_counts.get("unused", 0) - pending_expired.get("unused", 0)
+        expired_links = status_counts.get("expired", 0) + sum(pending_expired.values())
         
         # 今日访问统计
         today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
         today_access = db.query(AccountLink).filter(AccountLink.last_access_time >= today).count()
         
         # 验证码获取统计
-        from sqlalchemy import func
         total_verifications = db.query(func.sum(AccountLink.verification_count)).scalar() or 0
         
         return {
@@ -0,0 +1,243 @@
+"""
+短信保留策略与归档API
+SMS retention policy and archive APIs
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Optional
+from pydantic import BaseModel, Field
+import logging
+
+from ..database import get_db
+from ..models.account import Account
+from ..models.device import Device
+from ..models.sms_retention_policy import SmsRetentionPolicy
+from ..models.user import User
+from ..api.auth import get_current_user
+from ..services.sms_archiver import sms_archiver
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+
+# Pydantic 模型
+class RetentionPolicyCreate(BaseModel):
+    """创建/更新保留策略请求模型"""
+    scope: str = Field(..., description="作用范围 (account/device)")
+    target_id: int = Field(..., description="账号ID或设备ID")
+    retention_days: int = Field(..., ge=1, le=3650, description="保留天数")
+    is_active: bool = True
+
+
+@router.get("/policies")
+async def get_retention_policies(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    获取短信保留策略列表
+    Get SMS retention policies
+    """
+    try:
+        policies = db.query(SmsRetentionPolicy).order_by(SmsRetentionPolicy.id).all()
+        return {
+            "success": True,
+            "data": {
+                "policies": [policy.to_dict() for policy in policies]
+            }
+        }
+    except Exception as e:
+        logger.error(f"获取保留策略失败: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="获取保留策略失败"
+        )
+
+
+@router.post("/policies")
+async def save_retention_policy(
+    policy_data: RetentionPolicyCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    创建或更新短信保留策略 (同一账号/设备只保留一条)
+    Create or update an SMS retention policy
+    """
+    try:
+        if policy_data.scope not in ["account", "device"]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="无效的作用范围"
+            )
+
+        target_model = Account if policy_data.scope == "account" else Device
+        if not db.query(target_model).filter(target_model.id == policy_data.target_id).first():
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="账号不存在" if policy_data.scope == "account" else "设备不存在"
+            )
+
+        policy = db.query(SmsRetentionPolicy).filter(
+            SmsRetentionPolicy.scope == policy_data.scope,
+            SmsRetentionPolicy.target_id == policy_data.target_id
+        ).first()
+
+        if policy:
+            policy.retention_days = policy_data.retention_days
+            policy.is_active = policy_data.is_active
+        else:
+            policy = SmsRetentionPolicy(**policy_data.dict())
+            db.add(policy)
+
+        db.commit()
+        db.refresh(policy)
+
+        logger.info(f"保留策略已保存: {policy.scope}={policy.target_id}, {policy.retention_days} 天")
+
+        return {
+            "success": True,
+            "message": "保留策略保存成功",
+            "data": policy.to_dict()
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"保存保留策略失败: {str(e)}")
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="保存保留策略失败"
+        )
+
+
+@router.delete("/policies/{policy_id}")
+async def delete_retention_policy(
+    policy_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    删除短信保留策略
+    Delete an SMS retention policy
+    """
+    try:
+        policy = db.query(SmsRetentionPolicy).filter(SmsRetentionPolicy.id == policy_id).first()
+        if not policy:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="保留策略不存在"
+            )
+
+        db.delete(policy)
+        db.commit()
+
+        return {
+            "success": True,
+            "message": "保留策略删除成功"
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"删除保留策略失败: {str(e)}")
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="删除保留策略失败"
+        )
+
+
+@router.post("/run")
+async def run_sms_archive(
+    device_id: Optional[int] = Query(None, description="仅归档指定设备"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    立即执行一次短信归档
+    Run SMS archival now
+    """
+    try:
+        summary = await run_in_threadpool(sms_archiver.run_once, device_id)
+        logger.info(f"用户 {current_user.username} 手动归档 {summary['archived']} 条短信")
+        return {
+            "success": True,
+            "message": f"已归档 {summary['archived']} 条短信",
+            "data": summary
+        }
+    except Exception as e:
+        logger.error(f"执行短信归档失败: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="执行短信归档失败"
+        )
+
+
+@router.get("/archive/segments")
+async def get_archive_segments(
+    device_id: int = Query(..., description="设备ID"),
+    start_time: Optional[datetime] = Query(None, description="开始时间"),
+    end_time: Optional[datetime] = Query(None, description="结束时间"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    获取设备的归档分段索引
+    Get archive segment indexes of a device
+    """
+    try:
+        segments = await run_in_threadpool(sms_archiver.list_segments, device_id, start_time, end_time)
+        return {
+            "success": True,
+            "data": {
+                "segments": segments,
+                "total_count": sum(segment["count"] for segment in segments)
+            }
+        }
+    except Exception as e:
+        logger.error(f"获取归档分段失败: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="获取归档分段失败"
+        )
+
+
+@router.get("/archive/sms")
+async def get_archived_sms(
+    device_id: int = Query(..., description="设备ID"),
+    start_time: Optional[datetime] = Query(None, description="开始时间"),
+    end_time: Optional[datetime] = Query(None, description="结束时间"),
+    limit: int = Query(100, ge=1, le=1000, description="最大返回条数"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    按设备和时间范围读取归档短信 (不恢复到数据库)
+    Read archived SMS by device and time range without restoring them
+    """
+    def _read():
+        rows = []
+        for row in sms_archiver.iter_archived_sms(device_id, start_time, end_time):
+            rows.append(row)
+            if len(rows) >= limit:
+                break
+        return rows
+
+    try:
+        sms_list = await run_in_threadpool(_read)
+        return {
+            "success": True,
+            "data": {
+                "sms_list": sms_list,
+                "count": len(sms_list),
+                "has_more": len(sms_list) >= limit
+            }
+        }
+    except Exception as e:
+        logger.error(f"读取归档短信失败: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="读取归档短信失败"
+        )
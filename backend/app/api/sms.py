@@ -4,6 +4,7 @@ SMS management APIs
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, or_, and_, func
 from datetime import datetime, timezone, timedelta
@@ -12,12 +13,19 @@ from pydantic import BaseModel
 import re
 import logging
 
-from ..database import get_db
+from ..database import get_db, is_sms_partitioning_enabled
 from ..models.sms import SMS
 from ..models.device import Device
+from ..models.account import Account
 from ..models.sms_rule import SMSRule, SmsForwardLog
 from ..models.user import User
 from ..api.auth import get_current_user
+from ..services.data_export import export_response
+from ..services.manual_forward import manual_forward_jobs
+from ..services.metrics import RULE_MATCH_DURATION, observe_duration
+from ..services.rule_backtest import rule_backtester
+from ..services.rule_predicates import RuleDraft, rule_matches, validate_rule_patterns
+from ..services.serialization import FastJSONResponse, RowSerializer
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -71,6 +79,21 @@ class SMSRuleUpdate(BaseModel):
     forward_config: Optional[ForwardConfig] = None
 
 
+class SMSRuleDryRun(BaseModel):
+    """规则试运行请求模型"""
+    account_id: Optional[int] = None
+    device_id: Optional[int] = None  # 不指定时使用账号的主设备
+    rule_id: Optional[int] = None  # 编辑已有规则时, 草稿条件覆盖该规则
+    rule_name: Optional[str] = None
+    sender_pattern: Optional[str] = None
+    sender_match_type: Optional[str] = None
+    content_pattern: Optional[str] = None
+    content_match_type: Optional[str] = None
+    include_account_rules: bool = False  # 同时评估账号的整套规则
+    since_days: Optional[int] = None  # 只评估最近N天的短信
+    sample_size: int = 5
+
+
 class SMSResponse(BaseModel):
     """短信响应模型"""
     id: int
@@ -84,59 +107,103 @@ class SMSResponse(BaseModel):
     created_at: str
 
 
+# 列表接口按列查询直接序列化 (字段与 to_dict 一致)
+SMS_LIST_SERIALIZER = RowSerializer(
+    {
+        "id": SMS.id,
+        "device_id": SMS.device_id,
+        "sender": SMS.sender,
+        "content": SMS.content,
+        "sms_timestamp": SMS.sms_timestamp,
+        "sms_type": SMS.sms_type,
+        "is_read": SMS.is_read,
+        "category": SMS.category,
+        "raw_data": SMS.raw_data,
+        "created_at": SMS.created_at,
+        "updated_at": SMS.updated_at,
+    },
+    nested={
+        "device_info": {
+            "device_id": Device.device_id,
+            "brand": Device.brand,
+            "model": Device.model,
+            "phone_number": Device.phone_number,
+            "is_online": Device.is_online,
+        }
+    }
+)
+
+FORWARD_LOG_LIST_SERIALIZER = RowSerializer(
+    {
+        "id": SmsForwardLog.id,
+        "sms_id": SmsForwardLog.sms_id,
+        "rule_id": SmsForwardLog.rule_id,
+        "target_type": SmsForwardLog.target_type,
+        "target_id": SmsForwardLog.target_id,
+        "status": SmsForwardLog.status,
+        "error_message": SmsForwardLog.error_message,
+        "forwarded_at": SmsForwardLog.forwarded_at,
+        "created_at": SmsForwardLog.created_at,
+        "updated_at": SmsForwardLog.updated_at,
+    },
+    nested={
+        "sms_info": {
+            "sender": SMS.sender,
+            "content": SMS.content,
+            "sms_timestamp": SMS.sms_timestamp,
+        },
+        "rule_info": {
+            "rule_name": SMSRule.rule_name,
+            "sender_match_type": SMSRule.sender_match_type,
+            "content_match_type": SMSRule.content_match_type,
+        }
+    }
+)
+
+RULE_LIST_SERIALIZER = RowSerializer(
+    {
+        "id": SMSRule.id,
+        "account_id": SMSRule.account_id,
+        "rule_name": SMSRule.rule_name,
+        "description": SMSRule.description,
+        "sender_pattern": SMSRule.sender_pattern,
+        "sender_match_type": SMSRule.sender_match_type,
+        "content_pattern": SMSRule.content_pattern,
+        "content_match_type": SMSRule.content_match_type,
+        "is_active": SMSRule.is_active,
+        "priority": SMSRule.priority,
+        "display_count": SMSRule.display_count,
+        "action_type": SMSRule.action_type,
+        "action_config": SMSRule.action_config,
+        "forward_target_type": SMSRule.forward_target_type,
+        "forward_target_id": SMSRule.forward_target_id,
+        "forward_config": SMSRule.forward_config,
+        "match_count": SMSRule.match_count,
+        "last_match_time": SMSRule.last_match_time,
+        "created_at": SMSRule.created_at,
+        "updated_at": SMSRule.updated_at,
+    },
+    nested={
+        "account_info": {
+            "account_id": Account.id,
+            "account_name": Account.account_name,
+            "type": Account.type,
+        }
+    }
+)
+
+
 # 工具函数
 def match_sms_with_rules(sms: SMS, rules: List[SMSRule]) -> List[SMSRule]:
     """
     匹配短信与规则
     Match SMS with rules
     """
-    matched_rules = []
-    
-    for rule in rules:
-        if not rule.is_active:
-            continue
-            
-        sender_match = True
-        content_match = True
-        
-        # 检查发送方匹配
-        if rule.sender_pattern and rule.sender_pattern.strip() and rule.sender_pattern != "*":
-            # 处理通配符模式（如 9555*）
-            if rule.sender_match_type == "fuzzy" and rule.sender_pattern.endswith("*"):
-                # 移除末尾的 * 进行前缀匹配
-                prefix = rule.sender_pattern[:-1]
-                sender_match = sms.sender.startswith(prefix)
-            elif rule.sender_match_type == "exact":
-                sender_match = sms.sender == rule.sender_pattern
-            elif rule.sender_match_type == "fuzzy":
-                sender_match = rule.sender_pattern.lower() in sms.sender.lower()
-            elif rule.sender_match_type == "regex":
-                try:
-                    sender_match = bool(re.search(rule.sender_pattern, sms.sender))
-                except re.error:
-                    sender_match = False
-        
-        # 检查内容匹配
-        if rule.content_pattern and rule.content_pattern.strip() and rule.content_pattern != "*":
-            # 处理通配符模式（如 100*）
-            if rule.content_match_type == "fuzzy" and rule.content_pattern.endswith("*"):
-                # 移除末尾的 * 进行前缀匹配
-                prefix = rule.content_pattern[:-1]
-                # 🔥 修复：检查短信内容是否包含以该前缀开头的数字序列
-                content_match = prefix in sms.content
-            elif rule.content_match_type == "exact":
-                content_match = sms.content == rule.content_pattern
-            elif rule.content_match_type == "fuzzy":
-                content_match = rule.content_pattern.lower() in sms.content.lower()
-            elif rule.content_match_type == "regex":
-                try:
-                    content_match = bool(re.search(rule.content_pattern, sms.content))
-                except re.error:
-                    content_match = False
-        
-        # 如果两个条件都匹配，则添加到匹配列表
-        if sender_match and content_match:
-            matched_rules.append(rule)
+    with observe_duration(RULE_MATCH_DURATION, operation="single"):
+        matched_rules = [
+            rule for rule in rules
+            if rule.is_active and rule_matches(rule, sms.sender, sms.content)
+        ]
     
     # 按优先级排序
     matched_rules.sort(key=lambda x: x.priority, reverse=True)
@@ -232,23 +299,15 @@ async def get_sms_list(
         # 计算总数
         total = query.count()
         
-        # 分页查询
-        sms_list = query.order_by(desc(SMS.sms_timestamp)).offset((page - 1) * page_size).limit(page_size).all()
-        
-        # 构建响应数据
-        sms_data = []
-        for sms in sms_list:
-            sms_dict = sms.to_dict()
-            sms_dict['device_info'] = {
-                'device_id': sms.device.device_id,
-                'brand': sms.device.brand,
-                'model': sms.device.model,
-                'phone_number': sms.device.phone_number,
-                'is_online': sms.device.is_online
-            }
-            sms_data.append(sms_dict)
+        # 分页查询 (按列读取, 不实例化ORM对象)
+        rows = query.with_entities(*SMS_LIST_SERIALIZER.entities).order_by(
+            desc(SMS.sms_timestamp)
+        ).offset((page - 1) * page_size).limit(page_size).all()
         
-        return {
+        # 构建响应数据 (直接序列化, 跳过 jsonable_encoder)
+        sms_data = SMS_LIST_SERIALIZER.serialize(rows)
+        
+        return FastJSONResponse({
             "success": True,
             "data": {
                 "sms_list": sms_data,
@@ -259,7 +318,7 @@ async def get_sms_list(
                     "pages": (total + page_size - 1) // page_size
                 }
             }
-        }
+        })
         
     except Exception as e:
         logger.error(f"获取短信列表失败: {str(e)}")
@@ -269,6 +328,57 @@ async def get_sms_list(
         )
 
 
+@router.get("/export")
+async def export_sms(
+    format: str = Query("csv", pattern="^(csv|ndjson)$", description="导出格式 (csv/ndjson)"),
+    compress: bool = Query(False, description="是否gzip压缩"),
+    device_id: Optional[int] = Query(None, description="设备ID筛选"),
+    category: Optional[str] = Query(None, description="分类筛选"),
+    start_date: Optional[str] = Query(None, description="开始日期 (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="结束日期 (YYYY-MM-DD)"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    流式导出短信
+    Stream SMS export as CSV/NDJSON
+    """
+    try:
+        start_datetime = datetime.fromisoformat(start_date).replace(tzinfo=timezone.utc) if start_date else None
+        end_datetime = datetime.fromisoformat(end_date).replace(
+            hour=23, minute=59, second=59, tzinfo=timezone.utc
+        ) if end_date else None
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="日期格式错误, 应为 YYYY-MM-DD"
+        )
+
+    def build_query(db: Session):
+        query = db.query(
+            SMS.id, SMS.device_id, Device.device_id, SMS.sender, SMS.content,
+            SMS.sms_timestamp, SMS.sms_type, SMS.category, SMS.is_read, SMS.created_at
+        ).join(Device, SMS.device_id == Device.id)
+        if device_id:
+            query = query.filter(SMS.device_id == device_id)
+        if category:
+            query = query.filter(SMS.category == category)
+        if start_datetime:
+            query = query.filter(SMS.sms_timestamp >= start_datetime)
+        if end_datetime:
+            query = query.filter(SMS.sms_timestamp <= end_datetime)
+        return query.order_by(SMS.id)
+
+    logger.info(f"用户 {current_user.username} 导出短信: format={format}, compress={compress}")
+    return export_response(
+        build_query,
+        ["id", "device_id", "device_serial", "sender", "content",
+         "sms_timestamp", "sms_type", "category", "is_read", "created_at"],
+        filename="sms",
+        export_format=format,
+        compress=compress
+    )
+
+
 @router.get("/{sms_id}")
 async def get_sms_detail(
     sms_id: int,
@@ -325,6 +435,8 @@ async def delete_sms(
                 detail="短信不存在"
             )
         
+        # 分区模式下没有外键级联, 显式删除转发日志
+        db.query(SmsForwardLog).filter(SmsForwardLog.sms_id == sms_id).delete(synchronize_session=False)
         db.delete(sms)
         db.commit()
         
@@ -506,21 +618,15 @@ async def get_sms_rules_list(
         # 计算总数
         total = query.count()
         
-        # 分页查询
-        rules = query.order_by(desc(SMSRule.priority), desc(SMSRule.created_at)).offset((page - 1) * page_size).limit(page_size).all()
-        
-        # 构建响应数据
-        rules_data = []
-        for rule in rules:
-            rule_dict = rule.to_dict()
-            rule_dict['account_info'] = {
-                'account_id': rule.account.id,
-                'account_name': rule.account.account_name,
-                'type': rule.account.type
-            }
-            rules_data.append(rule_dict)
+        # 分页查询 (按列读取, 不实例化ORM对象)
+        rows = query.with_entities(*RULE_LIST_SERIALIZER.entities).order_by(
+            desc(SMSRule.priority), desc(SMSRule.created_at)
+        ).offset((page - 1) * page_size).limit(page_size).all()
         
-        return {
+        # 构建响应数据 (直接序列化, 跳过 jsonable_encoder)
+        rules_data = RULE_LIST_SERIALIZER.serialize(rows)
+        
+        return FastJSONResponse({
             "success": True,
             "data": {
                 "rules": rules_data,
@@ -531,7 +637,7 @@ async def get_sms_rules_list(
                     "pages": (total + page_size - 1) // page_size
                 }
             }
-        }
+        })
         
     except Exception as e:
         logger.error(f"获取短信规则列表失败: {str(e)}")
@@ -541,6 +647,102 @@ async def get_sms_rules_list(
         )
 
 
+@router.post("/rules/dry_run")
+async def dry_run_sms_rules(
+    request: SMSRuleDryRun,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    在设备历史短信上试运行草稿规则或账号的整套规则 (不保存、不转发)
+    Dry-run a draft rule or an account rule set against device SMS history
+    """
+    try:
+        base_rule = None
+        if request.rule_id:
+            base_rule = db.query(SMSRule).filter(SMSRule.id == request.rule_id).first()
+            if not base_rule:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="短信规则不存在"
+                )
+
+        account_id = request.account_id or (base_rule.account_id if base_rule else None)
+        account = None
+        if account_id:
+            account = db.query(Account).filter(Account.id == account_id).first()
+            if not account:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="账号不存在"
+                )
+
+        device_id = request.device_id or (account.primary_device_id if account else None)
+        if not device_id:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="请指定账号或设备"
+            )
+
+        # 构建草稿规则: 以已有规则为基础, 请求中给出的条件覆盖原值
+        overrides = {
+            field: getattr(request, field)
+            for field in ("rule_name", "sender_pattern", "sender_match_type", "content_pattern", "content_match_type")
+            if getattr(request, field) is not None
+        }
+        draft = None
+        if base_rule or overrides:
+            fields = {}
+            if base_rule:
+                fields = {
+                    "rule_name": base_rule.rule_name,
+                    "sender_pattern": base_rule.sender_pattern,
+                    "sender_match_type": base_rule.sender_match_type,
+                    "content_pattern": base_rule.content_pattern,
+                    "content_match_type": base_rule.content_match_type,
+                    "priority": base_rule.priority,
+                    "display_count": base_rule.display_count,
+                    "id": base_rule.id
+                }
+            draft = RuleDraft(**{**fields, **overrides})
+            error = validate_rule_patterns(draft)
+            if error:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=error
+                )
+
+        # 未提供草稿时评估账号的整套规则; 草稿替换账号中的同一规则
+        rules = [draft] if draft else []
+        if account and (request.include_account_rules or not draft):
+            account_rules = db.query(SMSRule).filter(
+                SMSRule.account_id == account.id
+            ).order_by(SMSRule.priority.desc(), SMSRule.id).all()
+            rules += [rule for rule in account_rules if not draft or rule.id != draft.id]
+        if not rules:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="没有可试运行的规则"
+            )
+
+        since = None
+        if request.since_days:
+            since = datetime.now(timezone.utc) - timedelta(days=request.since_days)
+        sample_size = min(max(request.sample_size, 1), 20)
+
+        result = await run_in_threadpool(rule_backtester.run, device_id, rules, sample_size, since)
+        return {"success": True, "data": result}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"规则试运行失败: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="规则试运行失败"
+        )
+
+
 @router.put("/rules/{rule_id}")
 async def update_sms_rule(
     rule_id: int,
@@ -741,13 +943,16 @@ async def get_sms_statistics(
         promotion_count = db.query(SMS).filter(SMS.category == "promotion").count()
         normal_count = db.query(SMS).filter(SMS.category == "normal").count()
         
+        # 今日/最近7天按接收时间 created_at 统计; 启用分区时改按分区键 sms_timestamp 过滤以触发分区裁剪
+        time_column = SMS.sms_timestamp if is_sms_partitioning_enabled() else SMS.created_at
+        
         # 今日短信统计
         today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-        today_sms = db.query(SMS).filter(SMS.created_at >= today).count()
+        today_sms = db.query(SMS).filter(time_column >= today).count()
         
         # 最近7天短信统计
         week_ago = datetime.now(timezone.utc) - timedelta(days=7)
-        week_sms = db.query(SMS).filter(SMS.created_at >= week_ago).count()
+        week_sms = db.query(SMS).filter(time_column >= week_ago).count()
         
         # 规则统计
         total_rules = db.query(SMSRule).count()
@@ -808,7 +1013,7 @@ async def get_forward_logs_list(
     """
     try:
         # 构建查询
-        query = db.query(SmsForwardLog).join(SMS).join(SMSRule)
+        query = db.query(SmsForwardLog).join(SMS, SmsForwardLog.sms_id == SMS.id).join(SMSRule)
         
         # 筛选条件
         if sms_id:
@@ -826,26 +1031,18 @@ async def get_forward_logs_list(
         # 计算总数
         total = query.count()
         
-        # 分页查询
-        logs = query.order_by(desc(SmsForwardLog.created_at)).offset((page - 1) * page_size).limit(page_size).all()
-        
-        # 构建响应数据
-        logs_data = []
-        for log in logs:
-            log_dict = log.to_dict()
-            log_dict['sms_info'] = {
-                'sender': log.sms.sender,
-                'content': log.sms.content[:50] + '...' if len(log.sms.content) > 50 else log.sms.content,
-                'sms_timestamp': log.sms.sms_timestamp.isoformat() if log.sms.sms_timestamp else None
-            }
-            log_dict['rule_info'] = {
-                'rule_name': log.rule.rule_name,
-                'sender_match_type': log.rule.sender_match_type,
-                'content_match_type': log.rule.content_match_type
-            }
-            logs_data.append(log_dict)
+        # 分页查询 (复用已JOIN的短信和规则, 按列读取)
+        rows = query.with_entities(*FORWARD_LOG_LIST_SERIALIZER.entities).order_by(
+            desc(SmsForwardLog.created_at)
+        ).offset((page - 1) * page_size).limit(page_size).all()
         
-        return {
+        # 构建响应数据 (直接序列化, 跳过 jsonable_encoder)
+        logs_data = FORWARD_LOG_LIST_SERIALIZER.serialize(rows)
+        for log_dict in logs_data:
+            content = log_dict['sms_info']['content'] or ''
+            log_dict['sms_info']['content'] = content[:50] + '...' if len(content) > 50 else content
+        
+        return FastJSONResponse({
             "success": True,
             "data": {
                 "logs": logs_data,
@@ -856,7 +1053,7 @@ async def get_forward_logs_list(
                     "pages": (total + page_size - 1) // page_size
                 }
             }
-        }
+        })
         
     except Exception as e:
         logger.error(f"获取转发日志列表失败: {str(e)}")
@@ -866,6 +1063,44 @@ async def get_forward_logs_list(
         )
 
 
+@router.get("/forward_logs/export")
+async def export_forward_logs(
+    format: str = Query("csv", pattern="^(csv|ndjson)$", description="导出格式 (csv/ndjson)"),
+    compress: bool = Query(False, description="是否gzip压缩"),
+    rule_id: Optional[int] = Query(None, description="规则ID筛选"),
+    log_status: Optional[str] = Query(None, alias="status", description="状态筛选 (pending/success/failed)"),
+    target_type: Optional[str] = Query(None, description="目标类型筛选 (link/webhook/email)"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    流式导出短信转发日志
+    Stream SMS forward logs export as CSV/NDJSON
+    """
+    def build_query(db: Session):
+        query = db.query(
+            SmsForwardLog.id, SmsForwardLog.sms_id, SmsForwardLog.rule_id, SMSRule.rule_name,
+            SMS.sender, SmsForwardLog.target_type, SmsForwardLog.target_id, SmsForwardLog.status,
+            SmsForwardLog.error_message, SmsForwardLog.forwarded_at, SmsForwardLog.created_at
+        ).join(SMS, SmsForwardLog.sms_id == SMS.id).join(SMSRule, SmsForwardLog.rule_id == SMSRule.id)
+        if rule_id:
+            query = query.filter(SmsForwardLog.rule_id == rule_id)
+        if log_status:
+            query = query.filter(SmsForwardLog.status == log_status)
+        if target_type:
+            query = query.filter(SmsForwardLog.target_type == target_type)
+        return query.order_by(SmsForwardLog.id)
+
+    logger.info(f"用户 {current_user.username} 导出转发日志: format={format}, compress={compress}")
+    return export_response(
+        build_query,
+        ["id", "sms_id", "rule_id", "rule_name", "sender", "target_type", "target_id",
+         "status", "error_message", "forwarded_at", "created_at"],
+        filename="sms_forward_logs",
+        export_format=format,
+        compress=compress
+    )
+
+
 @router.get("/forward_logs/{log_id}")
 async def get_forward_log_detail(
     log_id: int,
@@ -947,11 +1182,11 @@ async def manual_forward_sms(
                 "message": "没有匹配的转发规则"
             }
         
-        # 获取该账号的所有客户链接
+        # 统计该账号的客户链接
         from ..models.account_link import AccountLink
-        account_links = db.query(AccountLink).filter(AccountLink.account_id == account.id).all()
+        links_count = db.query(func.count(AccountLink.id)).filter(AccountLink.account_id == account.id).scalar()
         
-        if not account_links:
+        if not links_count:
             return {
                 "success": False,
                 "message": "该账号没有客户访问链接"
@@ -968,43 +1203,19 @@ async def manual_forward_sms(
             "matched_rules": [rule.rule_name for rule in matched_rules]
         }
         
-        # 这里应该实现实际的转发逻辑
-        # 目前先记录转发日志
-        forward_logs = []
-        for rule in matched_rules:
-            for link in account_links:
-                log = SmsForwardLog(
-                    sms_id=sms.id,
-                    rule_id=rule.id,
-                    target_type="link",
-                    target_id=link.id,
-                    status="success",  # 假设转发成功
-                    forwarded_at=datetime.now(timezone.utc)
-                )
-                db.add(log)
-                forward_logs.append({
-                    "link_id": link.link_id,
-                    "rule_name": rule.rule_name,
-                    "status": "success"
-                })
-        
-        # 更新规则匹配统计
-        for rule in matched_rules:
-            rule.match_count += 1
-            rule.last_match_time = datetime.now(timezone.utc)
-        
-        db.commit()
-        
-        logger.info(f"手动转发短信成功: SMS ID {sms_id}, 匹配规则 {len(matched_rules)} 个, 转发链接 {len(account_links)} 个")
+        # 转发日志 (匹配规则 × 全部链接) 在后台任务中分块写入
+        job = manual_forward_jobs.start_sms_forward(
+            sms.id, account.id, [rule.id for rule in matched_rules], links_count
+        )
         
         return {
             "success": True,
-            "message": f"手动转发成功，匹配到 {len(matched_rules)} 个规则，转发到 {len(account_links)} 个客户链接",
+            "message": f"手动转发任务已启动，匹配到 {len(matched_rules)} 个规则，转发到 {links_count} 个客户链接",
             "data": {
                 "forward_content": forward_content,
                 "matched_rules_count": len(matched_rules),
-                "forwarded_links_count": len(account_links),
-                "forward_logs": forward_logs
+                "forwarded_links_count": links_count,
+                "job": job
             }
         }
         
@@ -1047,102 +1258,39 @@ async def manual_forward_by_rule(
                 detail="关联账号不存在"
             )
         
-        # 获取该账号设备的所有短信
-        device_sms = db.query(SMS).filter(SMS.device_id == account.primary_device_id).all()
+        # 统计该账号设备的短信 (短信在后台任务中按块读取和匹配)
+        total_sms = db.query(func.count(SMS.id)).filter(SMS.device_id == account.primary_device_id).scalar()
         
-        if not device_sms:
+        if not total_sms:
             return {
                 "success": False,
                 "message": "该设备没有短信记录"
             }
         
-        # 匹配短信
-        matched_sms = match_sms_with_rules_single(device_sms, rule)
-        
-        if not matched_sms:
+        if not rule.is_active:
             return {
                 "success": False,
                 "message": "没有匹配的短信"
             }
         
-        # 按时间排序，最新的在前面
-        matched_sms.sort(key=lambda x: x.sms_timestamp, reverse=True)
-        
-        # 获取该账号的所有客户链接
+        # 统计该账号的客户链接
         from ..models.account_link import AccountLink
-        account_links = db.query(AccountLink).filter(AccountLink.account_id == account.id).all()
+        links_count = db.query(func.count(AccountLink.id)).filter(AccountLink.account_id == account.id).scalar()
         
-        if not account_links:
+        if not links_count:
             return {
                 "success": False,
                 "message": "该账号没有客户访问链接"
             }
         
-        # 实际执行转发：将匹配的短信推送到客户端
-        success_count = 0
-        forward_logs = []
-        
-        for link in account_links:
-            try:
-                # 实际转发逻辑：将匹配的短信数据推送到对应的客户链接
-                await push_sms_to_client_link(link, matched_sms, account, rule, db)
-                success_count += 1
-                
-                # 记录每条短信的转发日志
-                for sms in matched_sms:
-                    log = SmsForwardLog(
-                        sms_id=sms.id,
-                        rule_id=rule.id,
-                        target_type="link",
-                        target_id=link.id,
-                        status="success",
-                        forwarded_at=datetime.now(timezone.utc)
-                    )
-                    db.add(log)
-                    forward_logs.append({
-                        "link_id": link.link_id,
-                        "sms_content": sms.content[:50] + "..." if len(sms.content) > 50 else sms.content,
-                        "status": "success"
-                    })
-                    
-            except Exception as e:
-                logger.error(f"转发到链接 {link.link_id} 失败: {str(e)}")
-                # 记录失败日志
-                for sms in matched_sms:
-                    log = SmsForwardLog(
-                        sms_id=sms.id,
-                        rule_id=rule.id,
-                        target_type="link",
-                        target_id=link.id,
-                        status="failed",
-                        error_message=str(e),
-                        forwarded_at=datetime.now(timezone.utc)
-                    )
-                    db.add(log)
-                    forward_logs.append({
-                        "link_id": link.link_id,
-                        "sms_content": sms.content[:50] + "..." if len(sms.content) > 50 else sms.content,
-                        "status": "failed",
-                        "error": str(e)
-                    })
-        
-        # 更新规则匹配统计
-        rule.match_count += len(matched_sms)
-        rule.last_match_time = datetime.now(timezone.utc)
-        
-        db.commit()
-        
-        logger.info(f"规则手动转发完成: Rule ID {rule_id}, 匹配短信 {len(matched_sms)} 条, 成功转发到 {success_count}/{len(account_links)} 个链接")
+        job = manual_forward_jobs.start_rule_forward(
+            rule.id, account.id, account.primary_device_id, total_sms, links_count
+        )
         
         return {
             "success": True,
-            "message": f"手动转发完成，匹配到 {len(matched_sms)} 条短信，成功转发到 {success_count}/{len(account_links)} 个客户链接",
-            "data": {
-                "matched_sms_count": len(matched_sms),
-                "forwarded_links_count": len(account_links),
-                "success_links_count": success_count,
-                "forward_logs": forward_logs
-            }
+            "message": f"手动转发任务已启动，共 {total_sms} 条短信待匹配，转发到 {links_count} 个客户链接",
+            "data": job
         }
         
     except HTTPException:
@@ -1156,6 +1304,24 @@ async def manual_forward_by_rule(
         )
 
 
+@router.get("/forward_jobs/{job_id}")
+async def get_forward_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    获取手动转发任务进度
+    Get manual forward job progress
+    """
+    job = manual_forward_jobs.get(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="任务不存在"
+        )
+    return {"success": True, "data": job}
+
+
 async def push_sms_to_client_link(link, matched_sms: List[SMS], account, rule, db: Session):
     """
     将匹配的短信推送到客户端链接
@@ -1221,52 +1387,7 @@ def match_sms_with_rules_single(sms_list: List[SMS], rule: SMSRule) -> List[SMS]
     使用单个规则匹配短信列表
     Match SMS list with a single rule
     """
-    matched_sms = []
-    
     if not rule.is_active:
-        return matched_sms
-    
-    for sms in sms_list:
-        sender_match = True
-        content_match = True
-        
-        # 检查发送方匹配
-        if rule.sender_pattern and rule.sender_pattern.strip() and rule.sender_pattern != "*":
-            # 处理通配符模式（如 9555*）
-            if rule.sender_match_type == "fuzzy" and rule.sender_pattern.endswith("*"):
-                # 移除末尾的 * 进行前缀匹配
-                prefix = rule.sender_pattern[:-1]
-                sender_match = sms.sender.startswith(prefix)
-            elif rule.sender_match_type == "exact":
-                sender_match = sms.sender == rule.sender_pattern
-            elif rule.sender_match_type == "fuzzy":
-                sender_match = rule.sender_pattern.lower() in sms.sender.lower()
-            elif rule.sender_match_type == "regex":
-                try:
-                    sender_match = bool(re.search(rule.sender_pattern, sms.sender))
-                except re.error:
-                    sender_match = False
-        
-        # 检查内容匹配
-        if rule.content_pattern and rule.content_pattern.strip() and rule.content_pattern != "*":
-            # 处理通配符模式（如 100*）
-            if rule.content_match_type == "fuzzy" and rule.content_pattern.endswith("*"):
-                # 移除末尾的 * 进行前缀匹配
-                prefix = rule.content_pattern[:-1]
-                # 🔥 修复：检查短信内容是否包含以该前缀开头的数字序列
-                content_match = prefix in sms.content
-            elif rule.content_match_type == "exact":
-                content_match = sms.content == rule.content_pattern
-            elif rule.content_match_type == "fuzzy":
-                content_match = rule.content_pattern.lower() in sms.content.lower()
-            elif rule.content_match_type == "regex":
-                try:
-                    content_match = bool(re.search(rule.content_pattern, sms.content))
-                except re.error:
-                    content_match = False
-        
-        # 如果两个条件都匹配，则添加到匹配列表
-        if sender_match and content_match:
-            matched_sms.append(sms)
+        return []
     
-    return matched_sms
+    return [sms for sms in sms_list if rule_matches(rule, sms.sender, sms.content)]
@@ -3,22 +3,54 @@
 Database connection and session management
 """
 
-from sqlalchemy import create_engine, text
+import ast
+import re
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Tuple
+
+from sqlalchemy import create_engine, text, event, inspect
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 from .config import settings
+from .services.metrics import instrument_engine
+from .services.sql_profiler import sql_profiler
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Alembic 迁移脚本目录
+MIGRATIONS_PATH = Path(__file__).resolve().parent.parent / "migrations"
+
+# 基线迁移版本 (引入 Alembic 之前创建的数据库补建后标记为该版本)
+BASELINE_REVISION = "0001"
+
+# 启动锁的 PostgreSQL advisory lock 键
+STARTUP_LOCK_KEY = 7270461001
+
 # 创建数据库引擎
-engine = create_engine(
-    settings.database_url,
-    poolclass=StaticPool,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {},
-    echo=settings.debug
-)
+# SQLite 使用单连接 StaticPool; 其他数据库使用连接池, 保证后台任务与请求的事务互不干扰
+if "sqlite" in settings.database_url:
+    engine = create_engine(
+        settings.database_url,
+        poolclass=StaticPool,
+        connect_args={"check_same_thread": False},
+        echo=settings.debug
+    )
+else:
+    engine = create_engine(
+        settings.database_url,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+        echo=settings.debug
+    )
+
+# 请求级SQL统计和连接池指标
+instrument_engine(engine)
+sql_profiler.install(engine)
 
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -27,6 +59,51 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+def is_sms_partitioning_enabled() -> bool:
+    """
+    是否启用短信按月分区 (仅PostgreSQL)
+    Whether monthly partitioning of sms tables is enabled (PostgreSQL only)
+    """
+    return settings.sms_partitioning_enabled and settings.database_url.startswith("postgres")
+
+
+class QueryCounter:
+    """
+    SQL查询计数器 (用于排查N+1查询)
+    Count SQL statements executed on the engine inside a with-block
+
+    用法:
+        with QueryCounter(max_queries=5) as counter:
+            client.get("/api/links/list?page_size=100")
+        print(counter.count, counter.statements)
+
+    指定 max_queries 时, 超出数量会在退出时抛出 AssertionError,
+    可用于验证接口查询次数不随分页大小增长。
+    """
+    
+    def __init__(self, bind=None, max_queries: int = None):
+        self.bind = bind or engine
+        self.max_queries = max_queries
+        self.count = 0
+        self.statements = []
+    
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        self.statements.append(statement)
+    
+    def __enter__(self):
+        event.listen(self.bind, "before_cursor_execute", self._before_cursor_execute)
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        event.remove(self.bind, "before_cursor_execute", self._before_cursor_execute)
+        if exc_type is None and self.max_queries is not None and self.count > self.max_queries:
+            raise AssertionError(
+                f"执行了 {self.count} 条SQL, 超过上限 {self.max_queries}:\n" + "\n".join(self.statements)
+            )
+        return False
+
+
 def get_db():
     """
     获取数据库会话
@@ -39,105 +116,39 @@ def get_db():
         db.close()
 
 
-def create_tables():
-    """
-    创建所有数据库表
-    Create all database tables
-    """
-    Base.metadata.create_all(bind=engine)
-
-
 def drop_tables():
     """
     删除所有数据库表 (仅用于开发和测试)
     Drop all database tables (for development and testing only)
     """
     Base.metadata.drop_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS alembic_version"))
 
 
 def init_default_data():
     """
-    初始化默认数据
+    初始化默认数据 (只补建缺失的数据, 不修改已有的管理员和服务类型)
     Initialize default data
     """
-    from passlib.context import CryptContext
     from .models.user import User
     
-    # 创建密码加密上下文
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-    
     db = SessionLocal()
     try:
         # 检查是否已有管理员用户
-        admin_user = db.query(User).filter(User.username == 'admin').first()
-        
-        if not admin_user:
-            logger.info("创建默认管理员用户...")
-            
-            # 生成admin123的正确哈希
-            password = "admin123"
-            hashed_password = pwd_context.hash(password)
-            
-            logger.info(f"生成的密码哈希: {hashed_password}")
-            logger.info(f"哈希长度: {len(hashed_password)}")
+        if db.query(User.id).filter(User.username == 'admin').first() is None:
+            from passlib.context import CryptContext
             
-            # 验证哈希是否正确
-            is_valid = pwd_context.verify(password, hashed_password)
-            logger.info(f"哈希验证结果: {is_valid}")
-            
-            if not is_valid:
-                logger.error("生成的哈希验证失败！")
-                raise Exception("密码哈希生成失败")
-            
-            # 创建默认管理员用户
-            admin_user = User(
+            logger.info("创建默认管理员用户...")
+            db.add(User(
                 username='admin',
                 email='admin@sms-forwarding.com',
-                hashed_password=hashed_password,
+                hashed_password=CryptContext(schemes=["bcrypt"], deprecated="auto").hash("admin123"),
                 is_active=True,
                 is_superuser=True,
                 full_name='系统管理员'
-            )
-            
-            db.add(admin_user)
-            db.flush()  # 刷新以获取ID
-            
-            logger.info(f"默认管理员用户创建成功 (ID: {admin_user.id})")
-            logger.info("登录凭据: 用户名=admin, 密码=admin123")
-            
-            # 验证数据库中的哈希
-            db.refresh(admin_user)
-            stored_hash = admin_user.hashed_password
-            logger.info(f"数据库中存储的哈希: {stored_hash}")
-            logger.info(f"存储哈希长度: {len(stored_hash)}")
-            
-            # 最终验证
-            final_check = pwd_context.verify(password, stored_hash)
-            logger.info(f"最终验证结果: {final_check}")
-            
-            if not final_check:
-                logger.error("数据库中的哈希验证失败！可能被截断了")
-                raise Exception("密码哈希存储验证失败")
-                
-        else:
-            logger.info(f"管理员用户已存在 (ID: {admin_user.id})")
-            # 验证现有用户的密码哈希
-            stored_hash = admin_user.hashed_password
-            logger.info(f"现有用户哈希长度: {len(stored_hash)}")
-            
-            # 测试现有密码
-            test_verify = pwd_context.verify("admin123", stored_hash)
-            logger.info(f"现有密码验证结果: {test_verify}")
-            
-            if not test_verify:
-                logger.warning("现有管理员密码验证失败，重置密码...")
-                new_hash = pwd_context.hash("admin123")
-                admin_user.hashed_password = new_hash
-                db.flush()
-                
-                # 重新验证
-                final_verify = pwd_context.verify("admin123", admin_user.hashed_password)
-                logger.info(f"密码重置后验证结果: {final_verify}")
+            ))
+            logger.info("默认管理员用户创建成功, 登录凭据: 用户名=admin, 密码=admin123 (请登录后修改密码)")
         
         # 检查是否已有服务类型数据
         result = db.execute(text("SELECT COUNT(*) FROM service_types"))
@@ -149,16 +160,14 @@ def init_default_data():
             db.execute(text("""
                 INSERT INTO service_types (name, description, icon, color, is_active, sort_order, created_at, updated_at)
                 VALUES 
-                    ('微信', '微信账号管理', 'wechat', '#07C160', true, 1, NOW(), NOW()),
-                    ('QQ', 'QQ账号管理', 'qq', '#12B7F5', true, 2, NOW(), NOW()),
-                    ('支付宝', '支付宝账号管理', 'alipay', '#1677FF', true, 3, NOW(), NOW()),
-                    ('淘宝', '淘宝账号管理', 'taobao', '#FF6A00', true, 4, NOW(), NOW()),
-                    ('京东', '京东账号管理', 'jd', '#E3101E', true, 5, NOW(), NOW()),
-                    ('其他', '其他类型账号', 'other', '#666666', true, 99, NOW(), NOW())
+                    ('微信', '微信账号管理', 'wechat', '#07C160', true, 1, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP),
+                    ('QQ', 'QQ账号管理', 'qq', '#12B7F5', true, 2, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP),
+                    ('支付宝', '支付宝账号管理', 'alipay', '#1677FF', true, 3, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP),
+                    ('淘宝', '淘宝账号管理', 'taobao', '#FF6A00', true, 4, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP),
+                    ('京东', '京东账号管理', 'jd', '#E3101E', true, 5, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP),
+                    ('其他', '其他类型账号', 'other', '#666666', true, 99, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
             """))
             logger.info("默认服务类型创建成功")
-        else:
-            logger.info("服务类型数据已存在，跳过创建")
         
         # 提交事务
         db.commit()
@@ -172,17 +181,153 @@ def init_default_data():
         db.close()
 
 
+def default_data_missing() -> bool:
+    """默认管理员或服务类型是否缺失 (启动时每个 worker 检查, 一次查询)"""
+    with engine.connect() as conn:
+        admin_count, service_type_count = conn.execute(text(
+            "SELECT (SELECT COUNT(*) FROM users WHERE username = 'admin'), (SELECT COUNT(*) FROM service_types)"
+        )).one()
+    return admin_count == 0 or service_type_count == 0
+
+
+def _alembic_config():
+    """Alembic 配置 (迁移脚本位于 backend/migrations)"""
+    from alembic.config import Config
+    
+    config = Config()
+    config.set_main_option("script_location", str(MIGRATIONS_PATH))
+    return config
+
+
+def get_head_revision() -> Optional[str]:
+    """
+    迁移脚本中的最新版本 (只读取各版本文件的 revision/down_revision, 不导入 Alembic)
+    Head revision of the migration scripts; None when there is no single head
+
+    启动时每个 worker 都要检查版本, 导入 Alembic 本身比查询版本慢得多, 执行迁移时才导入
+    """
+    revisions, parents = set(), set()
+    for path in (MIGRATIONS_PATH / "versions").glob("*.py"):
+        source = path.read_text(encoding="utf-8")
+        revision = re.search(r"^revision\s*=\s*(.+)$", source, re.M)
+        down_revision = re.search(r"^down_revision\s*=\s*(.+)$", source, re.M)
+        if revision is None:
+            continue
+        revisions.add(ast.literal_eval(revision.group(1).strip()))
+        down = ast.literal_eval(down_revision.group(1).strip()) if down_revision else None
+        if isinstance(down, (tuple, list)):
+            parents.update(down)
+        elif down:
+            parents.add(down)
+    heads = revisions - parents
+    return heads.pop() if len(heads) == 1 else None
+
+
+def get_schema_revisions() -> Tuple[Optional[str], Optional[str]]:
+    """
+    数据库当前的迁移版本和代码中的最新版本
+    Current database revision and the head revision of the migration scripts
+
+    Returns:
+        (当前版本, 最新版本); 数据库尚未迁移时当前版本为 None
+    """
+    with engine.connect() as conn:
+        if not inspect(conn).has_table("alembic_version"):
+            return None, get_head_revision()
+        versions = conn.execute(text("SELECT version_num FROM alembic_version")).scalars().all()
+    current = versions[0] if len(versions) == 1 else None
+    return current, get_head_revision()
+
+
+def upgrade_schema():
+    """
+    执行 Alembic 迁移到最新版本 (等价于 alembic upgrade head)
+    Upgrade the database schema to the head revision
+    """
+    from alembic import command
+    
+    command.upgrade(_alembic_config(), "head")
+
+
+def is_legacy_database() -> bool:
+    """数据库是否由引入 Alembic 之前的版本 (create_all) 创建: 已有表但没有迁移版本"""
+    inspector = inspect(engine)
+    return inspector.has_table("devices") and not inspector.has_table("alembic_version")
+
+
+def adopt_legacy_schema():
+    """
+    接管引入 Alembic 之前创建的数据库 (一次性)
+    Bring a pre-Alembic database to the baseline revision and stamp it
+
+    按基线版本中固定的定义补建缺失的表、列和索引, 然后标记为基线版本,
+    之后的版本由 upgrade_schema 正常执行
+    """
+    from alembic import command
+    from alembic.script import ScriptDirectory
+    
+    config = _alembic_config()
+    baseline = ScriptDirectory.from_config(config).get_revision(BASELINE_REVISION).module
+    with engine.begin() as conn:
+        baseline.adopt_existing_schema(conn)
+    command.stamp(config, BASELINE_REVISION)
+    logger.info(f"已接管旧数据库并标记为基线版本 {BASELINE_REVISION}")
+
+
+@contextmanager
+def startup_lock():
+    """
+    启动锁: 多个 worker 同时启动时只有一个执行迁移和默认数据初始化, 其余等待其完成
+    Startup lock (PostgreSQL session advisory lock; no-op on other databases)
+    """
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f"SET lock_timeout = '{int(settings.startup_lock_timeout)}s'"))
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": STARTUP_LOCK_KEY})
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": STARTUP_LOCK_KEY})
+            conn.execute(text("RESET lock_timeout"))
+
+
 def init_database():
     """
     完整的数据库初始化
     Complete database initialization
+
+    数据库版本已是最新且默认数据齐全时只做两次查询; 否则在启动锁内迁移和/或初始化默认数据,
+    其他同时启动的 worker 等待后重新检查, 不再重复执行。
+    默认数据与结构版本分开检查, 上次初始化失败时下次启动会重试
     """
-    logger.info("开始数据库初始化...")
+    current, head = get_schema_revisions()
+    schema_current = current is not None and current == head
+    if schema_current and not default_data_missing():
+        logger.info(f"数据库结构已是最新版本 ({head}), 跳过初始化")
+        return
     
-    # 创建表结构
-    create_tables()
-    logger.info("数据库表结构创建完成")
+    if not schema_current and not settings.schema_auto_migrate:
+        logger.error(f"数据库结构版本 {current} 不是最新版本 {head}, 请执行 alembic upgrade head")
+        return
     
-    # 初始化默认数据
-    init_default_data()
-    logger.info("数据库初始化完成")
+    with startup_lock():
+        current, head = get_schema_revisions()
+        if current is None or current != head:
+            logger.info(f"开始数据库迁移: {current or '未迁移'} -> {head}")
+            if current is None and is_legacy_database():
+                adopt_legacy_schema()
+            upgrade_schema()
+            logger.info("数据库表结构迁移完成")
+            
+            # 创建短信分区 (需在写入任何短信前完成)
+            if is_sms_partitioning_enabled():
+                from .services.partition_manager import partition_manager
+                partition_manager.ensure_partitions()
+        
+        # 初始化默认数据 (其他进程可能已完成)
+        if default_data_missing():
+            init_default_data()
+        logger.info("数据库初始化完成")
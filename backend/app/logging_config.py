@@ -0,0 +1,117 @@
+"""
+日志配置
+Logging setup: queue-based output, JSON records, per-module levels and sampled hot-path logging
+
+- LOG_ASYNC 为 true 时所有日志先进入内存队列 (QueueHandler), 由后台线程 (QueueListener)
+  格式化并写入标准输出, 事件循环中只做入队, 不阻塞在 I/O 上
+- LOG_FORMAT=json 时每条日志输出为一行 JSON, 通过 extra= 传入的字段一并输出
+- LOG_LEVELS 按模块设置级别, 如 "app.services.device_monitor=WARNING,sqlalchemy.engine=INFO"
+- 热点路径 (每条短信、每个请求) 的日志使用 LogSampler 按键采样, 间隔内只输出一条并附带被省略的条数
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from .config import settings
+from .services.serialization import dumps_text
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# LogRecord 的标准属性, 其余属性视为 extra 字段
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                payload[key] = value
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        try:
+            return dumps_text(payload)
+        except TypeError:
+            # extra 字段或第三方库的记录属性无法序列化时转为字符串, 不丢弃整条日志
+            return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class LogSampler:
+    """
+    按键采样的日志 (线程安全)
+
+    同一个键在 interval 秒内只输出第一条, 下一次输出时附带期间省略的条数:
+        sampler = LogSampler(60)
+        sampler.log(logger, logging.INFO, "heartbeat", "收到心跳: %s", device_id)
+    """
+
+    def __init__(self, interval: Optional[float] = None):
+        self.interval = settings.log_sample_interval if interval is None else interval
+        self._lock = threading.Lock()
+        self._state: Dict[str, list] = {}  # 键 -> [下次允许输出的时间, 省略的条数]
+
+    def log(self, logger: logging.Logger, level: int, key: str, message: str, *args, **kwargs):
+        if not logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.setdefault(key, [0.0, 0])
+            if now < state[0]:
+                state[1] += 1
+                return
+            suppressed = state[1]
+            state[0] = now + self.interval
+            state[1] = 0
+        if suppressed:
+            message = f"{message} (期间省略 {suppressed} 条)"
+        logger.log(level, message, *args, **kwargs)
+
+
+def setup_logging():
+    """配置根日志 (应用启动时调用一次)"""
+    global _listener
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if settings.log_format == "json" else logging.Formatter(TEXT_FORMAT))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.setLevel(settings.log_level.upper())
+
+    if settings.log_async:
+        log_queue = queue.SimpleQueue()
+        root.addHandler(logging.handlers.QueueHandler(log_queue))
+        _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    else:
+        root.addHandler(handler)
+
+    for name, level in settings.module_log_levels.items():
+        logging.getLogger(name).setLevel(level.upper())
+
+
+def shutdown_logging():
+    """输出队列中剩余的日志并停止后台线程 (应用退出时调用)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -5,24 +5,36 @@ Main FastAPI application - Full version with frontend routes and static files
 
 from fastapi import FastAPI, Request, Depends, HTTPException, Query, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, Response
 from contextlib import asynccontextmanager
 from sqlalchemy.orm import Session
+import asyncio
 import logging
 import os
 from pathlib import Path
 
 from .config import settings
+from .logging_config import setup_logging
 from .database import init_database, get_db
-from .api import auth, devices, accounts, sms, links, websocket_routes, service_types, customer, images, android_client, admin
+from .api import auth, devices, accounts, sms, links, websocket_routes, service_types, customer, images, android_client, admin, retention
 from .api import settings as settings_api
-
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+from .services.partition_manager import partition_manager
+from .services.sms_archiver import sms_archiver
+from .services.image_migration import image_migration_job
+from .services.background_jobs import background_jobs
+from .services.link_expiry import link_expiry_sweeper
+from .services.static_assets import static_assets, PrecompressedStaticFiles
+from .services.serialization import FastJSONResponse
+from .services.link_quota import link_quota
+from .services.rate_limiter import rate_limiter
+from .middleware.compression import CompressionMiddleware
+from .middleware.rate_limit import RateLimitMiddleware
+from .middleware.metrics import MetricsMiddleware
+from .middleware.sql_profiling import SqlProfilingMiddleware
+from .services import metrics
+
+# 配置日志 (队列异步输出, 格式和模块级别见 LOG_* 配置)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 
@@ -41,6 +53,24 @@ async def lifespan(app: FastAPI):
             logger.error(f"❌ 数据库初始化失败: {e}")
             # 不退出，让应用继续运行
         
+        # 预压缩静态资源并加载SPA入口页到内存
+        try:
+            await asyncio.to_thread(static_assets.prepare, {
+                "admin": static_admin_path,
+                "customer": static_customer_path
+            })
+        except Exception as e:
+            logger.error(f"❌ 静态资源准备失败: {e}")
+        
+        # 启动短信分区维护任务 (仅启用分区时)
+        await partition_manager.start()
+        
+        # 启动短信归档任务 (仅启用归档时)
+        await sms_archiver.start()
+        
+        # 启动链接过期清理任务
+        await link_expiry_sweeper.start()
+        
         logger.info("✅ 应用启动完成")
         
         yield
@@ -51,6 +81,12 @@ async def lifespan(app: FastAPI):
     finally:
         # 关闭时执行
         logger.info("🛑 正在关闭手机信息管理系统...")
+        await partition_manager.stop()
+        await sms_archiver.stop()
+        await link_expiry_sweeper.stop()
+        await image_migration_job.stop()
+        await background_jobs.stop()
+        metrics.mark_process_dead()
 
 
 # 创建FastAPI应用实例
@@ -58,9 +94,27 @@ app = FastAPI(
     title=settings.app_name,
     version=settings.app_version,
     description="手机信息管理系统 - 用于管理安卓设备信息、短信数据和会员账号",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
+# SQL性能分析中间件 (最内层, Server-Timing 不含压缩耗时)
+if settings.sql_profiling_enabled:
+    app.add_middleware(SqlProfilingMiddleware)
+
+# 响应压缩中间件 (已压缩的响应和小响应原样返回)
+if settings.response_compression_enabled:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.response_compress_min_size,
+        gzip_level=settings.response_gzip_level,
+        brotli_quality=settings.response_brotli_quality
+    )
+
+# 公开接口限流中间件 (在路由和数据库访问之前拒绝超限请求)
+if settings.rate_limit_enabled:
+    app.add_middleware(RateLimitMiddleware)
+
 # 配置CORS中间件
 app.add_middleware(
     CORSMiddleware,
@@ -70,6 +124,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 请求指标中间件 (最外层, 耗时包含其他中间件)
+if metrics.PROMETHEUS_AVAILABLE and settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+
 
 # 全局异常处理器
 @app.exception_handler(Exception)
@@ -99,6 +157,23 @@ async def health_check():
     }
 
 
+# Prometheus 指标端点
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    """Prometheus 指标 (多进程模式下合并所有 worker)"""
+    if not metrics.PROMETHEUS_AVAILABLE or not settings.metrics_enabled:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="指标未启用"
+        )
+    if settings.metrics_token and request.headers.get("authorization") != f"Bearer {settings.metrics_token}":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="无效的指标令牌"
+        )
+    return Response(content=metrics.render_latest(), headers={"Content-Type": metrics.CONTENT_TYPE_LATEST})
+
+
 # 配置静态文件服务
 static_admin_path = Path(__file__).parent.parent / "static" / "admin"
 static_customer_path = Path(__file__).parent.parent / "static" / "customer"
@@ -109,13 +184,13 @@ logger.info(f"客户端: {static_customer_path} - 存在: {static_customer_path.
 
 # 挂载静态文件服务
 if static_admin_path.exists():
-    app.mount("/static/admin", StaticFiles(directory=str(static_admin_path)), name="admin_static")
+    app.mount("/static/admin", PrecompressedStaticFiles(directory=str(static_admin_path)), name="admin_static")
     logger.info(f"✅ 管理端静态文件已挂载: /static/admin -> {static_admin_path}")
 else:
     logger.warning(f"⚠️ 管理端静态文件目录不存在: {static_admin_path}")
 
 if static_customer_path.exists():
-    app.mount("/static/customer", StaticFiles(directory=str(static_customer_path)), name="customer_static")
+    app.mount("/static/customer", PrecompressedStaticFiles(directory=str(static_customer_path)), name="customer_static")
     logger.info(f"✅ 客户端静态文件已挂载: /static/customer -> {static_customer_path}")
 else:
     logger.warning(f"⚠️ 客户端静态文件目录不存在: {static_customer_path}")
@@ -135,6 +210,7 @@ try:
     app.include_router(images.router, prefix="/api", tags=["图片管理"])
     app.include_router(android_client.router, prefix="/api/android", tags=["Android客户端"])
     app.include_router(admin.router, prefix="/api/admin", tags=["管理员工具"])
+    app.include_router(retention.router, prefix="/api/retention", tags=["短信归档"])
     logger.info("✅ 所有API路由注册完成")
 except Exception as e:
     logger.error(f"❌ API路由注册失败: {e}")
@@ -219,9 +295,8 @@ async def get_verification_code_alias(
         from .models.account_link import AccountLink
         from .models.sms import SMS
         from sqlalchemy import desc
-        from datetime import datetime, timezone
         
-        logger.info(f"🔍 获取验证码请求: link_id={link_id}")
+        logger.debug("🔍 获取验证码请求: link_id=%s", link_id)
         
         # 获取链接信息
         link = db.query(AccountLink).filter(AccountLink.link_id == link_id).first()
@@ -266,7 +341,7 @@ async def get_verification_code_alias(
             SMS.device_id == link.device_id
         ).order_by(desc(SMS.sms_timestamp)).limit(20).all()  # 增加到20条
         
-        logger.info(f"📱 找到 {len(all_sms)} 条短信")
+        logger.debug("📱 找到 %d 条短信", len(all_sms))
         
         # 🔥 扩展验证码检测逻辑，包含更多关键词
         verification_keywords = [
@@ -295,18 +370,9 @@ async def get_verification_code_alias(
         # 🔥 修复：返回更多匹配短信，确保有足够的选择
         matched_sms = matched_sms[:10]  # 增加到10条
         
-        logger.info(f"✅ 匹配到 {len(matched_sms)} 条验证码短信")
-        for i, sms in enumerate(matched_sms):
-            logger.info(f"📱 短信{i+1}: {sms.content[:50]}... (时间: {sms.sms_timestamp})")
-        
-        # 🔥 修复：更新验证码获取统计，确保次数正确递增
-        link.verification_count += 1
-        link.last_verification_time = datetime.now(timezone.utc)
-        db.commit()
-        
-        logger.info(f"📊 验证码获取次数已更新: {link.verification_count}/{link.max_verification_count}")
+        logger.debug("✅ 匹配到 %d 条验证码短信", len(matched_sms))
         
-        # 转换为前端期望的all_matched_sms格式
+        # 转换为前端期望的all_matched_sms格式 (在提交前读取, 避免提交后逐条重新加载短信对象)
         all_matched_sms = []
         for sms in matched_sms:
             all_matched_sms.append({
@@ -317,16 +383,33 @@ async def get_verification_code_alias(
                 "category": sms.category or "verification"
             })
         
+        # 记录链接的验证码间隔, 限流中间件按此补充令牌
+        rate_limiter.remember_link_interval(link.link_id, link.verification_interval)
+        # 🔥 修复：更新验证码获取统计 (条件更新: 次数检查和递增在同一条语句中完成, 并发请求不会超出上限)
+        counters = link_quota.consume_verification(db, link.id)
+        if counters is None:
+            db.rollback()
+            logger.warning(f"⚠️ 验证码获取次数已达上限: {link_id}")
+            return {
+                "success": False,
+                "message": "验证码获取次数已达上限",
+                "data": {
+                    "all_matched_sms": [],
+                    "count": 0
+                }
+            }
+        db.commit()
+        
         # 🔥 关键修复：确保返回更新后的验证码次数
-        logger.info(f"🔥 API返回数据: verification_count={link.verification_count}, max_verification_count={link.max_verification_count}")
+        logger.debug("📊 验证码获取次数已更新: %s/%s", counters['verification_count'], counters['max_verification_count'])
         
         return {
             "success": True,
             "data": {
                 "all_matched_sms": all_matched_sms,
                 "count": len(all_matched_sms),
-                "verification_count": link.verification_count,  # 🔥 返回更新后的次数
-                "max_verification_count": link.max_verification_count
+                "verification_count": counters["verification_count"],  # 🔥 返回更新后的次数
+                "max_verification_count": counters["max_verification_count"]
             }
         }
             
@@ -352,7 +435,7 @@ async def get_sms_rules_alias(
     获取短信规则信息 - 从数据库获取真实规则，绝不硬编码！
     """
     try:
-        logger.info(f"🔍 获取短信规则请求: account_id={account_id}")
+        logger.debug("🔍 获取短信规则请求: account_id=%s", account_id)
         
         # 🔥 彻底修复：从数据库获取真实的短信规则
         from .models.sms_rule import SMSRule
@@ -438,12 +521,13 @@ async def get_sms_rules_alias(
 
 # 🎯 关键：前端路由处理（这是修复404的核心）
 @app.get("/")
-async def serve_root():
+async def serve_root(request: Request):
     """根路径 - 重定向到管理端"""
     admin_index = static_admin_path / "index.html"
-    if admin_index.exists():
-        logger.info(f"📄 服务管理端首页: {admin_index}")
-        return FileResponse(str(admin_index))
+    admin_shell = static_assets.shell("admin", admin_index)
+    if admin_shell:
+        logger.debug(f"📄 服务管理端首页: {admin_index}")
+        return admin_shell.response(request)
     else:
         logger.error(f"❌ 管理端文件未找到: {admin_index}")
         return JSONResponse(
@@ -459,12 +543,13 @@ async def serve_root():
         )
 
 @app.get("/login")
-async def serve_login():
+async def serve_login(request: Request):
     """登录页面"""
     admin_index = static_admin_path / "index.html"
-    if admin_index.exists():
-        logger.info(f"📄 服务登录页面: {admin_index}")
-        return FileResponse(str(admin_index))
+    admin_shell = static_assets.shell("admin", admin_index)
+    if admin_shell:
+        logger.debug(f"📄 服务登录页面: {admin_index}")
+        return admin_shell.response(request)
     else:
         logger.error(f"❌ 登录页面文件未找到: {admin_index}")
         return JSONResponse(
@@ -479,12 +564,13 @@ async def serve_login():
 
 @app.get("/dashboard")
 @app.get("/dashboard/{path:path}")
-async def serve_dashboard(path: str = ""):
+async def serve_dashboard(request: Request, path: str = ""):
     """管理面板页面"""
     admin_index = static_admin_path / "index.html"
-    if admin_index.exists():
-        logger.info(f"📄 服务管理面板: {admin_index} (路径: {path})")
-        return FileResponse(str(admin_index))
+    admin_shell = static_assets.shell("admin", admin_index)
+    if admin_shell:
+        logger.debug(f"📄 服务管理面板: {admin_index} (路径: {path})")
+        return admin_shell.response(request)
     else:
         logger.error(f"❌ 管理面板文件未找到: {admin_index}")
         return JSONResponse(
@@ -498,12 +584,13 @@ async def serve_dashboard(path: str = ""):
         )
 
 @app.get("/customer/{link_id}")
-async def serve_customer_page(link_id: str):
-    """客户访问页面"""
+async def serve_customer_page(link_id: str, request: Request):
+    """客户访问页面 (入口页常驻内存)"""
     customer_index = static_customer_path / "index.html"
-    if customer_index.exists():
-        logger.info(f"📄 服务客户端页面: {customer_index} (链接: {link_id})")
-        return FileResponse(str(customer_index))
+    customer_shell = static_assets.shell("customer", customer_index)
+    if customer_shell:
+        logger.debug(f"📄 服务客户端页面: {customer_index} (链接: {link_id})")
+        return customer_shell.response(request)
     else:
         logger.error(f"❌ 客户端文件未找到: {customer_index}")
         return JSONResponse(
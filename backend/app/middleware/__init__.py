@@ -0,0 +1,4 @@
+"""
+中间件模块
+Middleware module
+"""
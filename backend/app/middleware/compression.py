@@ -0,0 +1,182 @@
+"""
+响应压缩中间件
+Negotiated gzip / brotli response compression
+
+- 按 Accept-Encoding 选择 br (需安装 brotli) 或 gzip
+- 只压缩文本类响应 (JSON / NDJSON / CSV / HTML 等), 小于阈值的响应原样返回
+- 已带 Content-Encoding 的响应 (预压缩静态文件、SPA 入口页等) 不重复压缩
+- 流式响应逐块压缩, 不缓冲整个响应
+"""
+
+import gzip
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..services.static_assets import choose_encoding
+
+try:
+    import brotli
+except ImportError:  # 可选依赖, 未安装时只使用 gzip
+    brotli = None
+
+# 可压缩的响应类型
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
+
+
+def _is_compressible(content_type: str) -> bool:
+    content_type = content_type.lower()
+    return any(content_type.startswith(prefix) for prefix in COMPRESSIBLE_TYPES)
+
+
+class _StreamCompressor:
+    """增量压缩器, gzip 和 brotli 统一接口"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+            self._compress = self._compressor.process
+            self._flush = self._compressor.flush
+            self._finish = self._compressor.finish
+        else:
+            # wbits=31 输出带 gzip 头的流
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+            self._compress = self._compressor.compress
+            self._flush = lambda: self._compressor.flush(zlib.Z_SYNC_FLUSH)
+            self._finish = self._compressor.flush
+
+    def chunk(self, data: bytes) -> bytes:
+        # 每块同步刷新, 保证流式响应的客户端能及时收到数据
+        return self._compress(data) + self._flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compress(data) + self._finish()
+
+
+class CompressionMiddleware:
+    """
+    响应压缩中间件 (纯ASGI实现)
+
+    Args:
+        minimum_size: 非流式响应小于该字节数时不压缩
+        gzip_level: gzip 压缩级别
+        brotli_quality: brotli 压缩质量 (动态响应使用较低质量, 兼顾速度)
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024,
+                 gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.available = ("br", "gzip") if brotli else ("gzip",)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""), self.available)
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    """单个请求的压缩状态"""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.downstream = send
+        self.start_message: Optional[Message] = None
+        self.compressor: Optional[_StreamCompressor] = None
+        # None: 尚未决定; True: 压缩; False: 原样透传
+        self.active: Optional[bool] = None
+
+    def _compress_whole(self, body: bytes) -> bytes:
+        if self.encoding == "br":
+            return brotli.compress(body, quality=self.middleware.brotli_quality)
+        return gzip.compress(body, compresslevel=self.middleware.gzip_level)
+
+    def _prepare_headers(self, content_length: Optional[int]) -> MutableHeaders:
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if content_length is None:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(content_length)
+        # 强 ETag 对应未压缩内容, 压缩后降为弱 ETag
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}"
+        self.start_message["headers"] = headers.raw
+        return headers
+
+    async def send(self, message: Message):
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            status_code = message["status"]
+            if (
+                "content-encoding" in headers
+                or status_code < 200 or status_code in (204, 304)
+                or not _is_compressible(headers.get("content-type", ""))
+            ):
+                self.active = False
+                await self.downstream(message)
+                return
+            # 等第一个响应体块到达后再决定是否压缩
+            self.start_message = message
+            return
+
+        if message_type != "http.response.body" or self.active is False:
+            await self.downstream(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.active is None:
+            if not more_body:
+                # 一次性响应: 小于阈值不压缩
+                if len(body) < self.middleware.minimum_size:
+                    self.active = False
+                    await self.downstream(self.start_message)
+                    await self.downstream(message)
+                    return
+                compressed = self._compress_whole(body)
+                self._prepare_headers(len(compressed))
+                self.active = True
+                await self.downstream(self.start_message)
+                await self.downstream({"type": "http.response.body", "body": compressed})
+                return
+
+            # 流式响应: 逐块压缩
+            self.active = True
+            self.compressor = _StreamCompressor(
+                self.encoding, self.middleware.gzip_level, self.middleware.brotli_quality
+            )
+            self._prepare_headers(None)
+            await self.downstream(self.start_message)
+
+        if more_body:
+            data = self.compressor.chunk(body) if body else b""
+            if data:
+                await self.downstream({"type": "http.response.body", "body": data, "more_body": True})
+        else:
+            await self.downstream({"type": "http.response.body", "body": self.compressor.finish(body)})
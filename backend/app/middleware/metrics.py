@@ -0,0 +1,68 @@
+"""
+请求指标中间件
+Per-route request latency and SQL metrics
+
+- 路由匹配后 scope 中带有 endpoint, 按 endpoint 查到路由模板 (如 /api/sms/{sms_id}) 作为标签,
+  未匹配到路由的请求统一记为 unmatched, 避免标签基数随路径增长
+- 请求期间通过上下文变量收集SQL数量和耗时
+"""
+
+import time
+from typing import Dict
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..services.metrics import (
+    DB_QUERIES_PER_REQUEST, DB_TIME_PER_REQUEST, HTTP_REQUEST_DURATION, RequestDbStats, current_db_stats
+)
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+class MetricsMiddleware:
+    """记录每个 HTTP 请求的耗时和SQL统计 (纯 ASGI 中间件)"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._route_templates: Dict[int, str] = {}
+
+    def _route_template(self, scope: Scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return UNMATCHED_ROUTE
+        template = self._route_templates.get(id(endpoint))
+        if template is None:
+            template = UNMATCHED_ROUTE
+            for route in scope["app"].routes:
+                if getattr(route, "endpoint", None) is endpoint or getattr(route, "app", None) is endpoint:
+                    template = route.path or "/"
+                    break
+            self._route_templates[id(endpoint)] = template
+        return template
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        stats = RequestDbStats()
+        token = current_db_stats.set(stats)
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_db_stats.reset(token)
+            route = self._route_template(scope)
+            HTTP_REQUEST_DURATION.labels(scope["method"], route, str(status_code)).observe(
+                time.perf_counter() - started
+            )
+            DB_QUERIES_PER_REQUEST.labels(route).observe(stats.count)
+            DB_TIME_PER_REQUEST.labels(route).observe(stats.duration)
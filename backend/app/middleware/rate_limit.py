@@ -0,0 +1,252 @@
+"""
+限流与过载保护中间件
+Rate limiting and load shedding for public customer and device endpoints
+
+在路由和数据库访问之前执行:
+- 按路由分组匹配限流规则, 以链接ID / 设备ID 为键取令牌, 可选对客户端IP做总量限制
+- 客户端IP只信任配置的反向代理追加的 X-Forwarded-For 地址
+- 令牌不足时直接返回 429 和 Retry-After
+- 公开接口同时处理中的请求数超过上限时返回 503 (过载保护)
+"""
+
+import ipaddress
+import logging
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+import orjson
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..config import settings
+from ..services.rate_limiter import BucketLimit, rate_limiter
+
+logger = logging.getLogger(__name__)
+
+# 从请求体中读取 device_id 时允许的最大请求体 (心跳、注册等小请求)
+DEVICE_BODY_PEEK_LIMIT = 16 * 1024
+
+
+@dataclass
+class RateLimitRule:
+    """
+    限流规则
+
+    Args:
+        name: 规则名 (用于限流键和日志)
+        pattern: 匹配请求路径的正则, 可包含 link_id / device_id 命名分组
+        key: 限流键来源 link / device
+        limit: 返回令牌桶参数的函数, 参数为限流键值 (可能为None)
+    """
+    name: str
+    pattern: "re.Pattern"
+    key: str
+    limit: Callable[[Optional[str]], BucketLimit]
+
+
+def _fixed(rate_setting: str, burst_setting: str) -> Callable[[Optional[str]], BucketLimit]:
+    """读取配置的固定令牌桶参数 (每次读取, 便于运行时调整配置)"""
+    return lambda _: BucketLimit(rate=getattr(settings, rate_setting), burst=getattr(settings, burst_setting))
+
+
+# 公开接口的限流规则, 按顺序匹配第一条
+RATE_LIMIT_RULES: List[RateLimitRule] = [
+    RateLimitRule(
+        name="verification",
+        pattern=re.compile(r"^/api/(?:get_verification_code|links/public/(?P<link_id>[^/]+)/verification)$"),
+        key="link",
+        limit=rate_limiter.verification_limit,
+    ),
+    RateLimitRule(
+        name="customer",
+        pattern=re.compile(
+            r"^/api/(?:get_account_info|get_existing_sms|get_latest_sms|links/public/(?P<link_id>[^/]+)/info)$"
+        ),
+        key="link",
+        limit=_fixed("rate_limit_customer_rate", "rate_limit_customer_burst"),
+    ),
+    RateLimitRule(
+        name="android",
+        pattern=re.compile(r"^/api/android/(?:device/(?P<device_id>[^/]+)/status|.*)$"),
+        key="device",
+        limit=_fixed("rate_limit_android_rate", "rate_limit_android_burst"),
+    ),
+]
+
+
+def match_rule(path: str) -> Tuple[Optional[RateLimitRule], Optional["re.Match"]]:
+    for rule in RATE_LIMIT_RULES:
+        match = rule.pattern.match(path)
+        if match:
+            return rule, match
+    return None, None
+
+
+@lru_cache(maxsize=8)
+def _trusted_proxies(value: str) -> Tuple[bool, Tuple[ipaddress._BaseNetwork, ...]]:
+    """解析 rate_limit_trusted_proxies, 返回 (是否信任任意直连地址, 代理网段)"""
+    trust_any = False
+    networks = []
+    for item in value.split(","):
+        item = item.strip()
+        if item == "*":
+            trust_any = True
+        elif item:
+            try:
+                networks.append(ipaddress.ip_network(item, strict=False))
+            except ValueError:
+                logger.warning(f"忽略无效的代理地址: {item}")
+    return trust_any, tuple(networks)
+
+
+def _in_networks(address: str, networks: Tuple[ipaddress._BaseNetwork, ...]) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in networks)
+
+
+def client_ip(scope: Scope) -> str:
+    """
+    客户端IP
+    直连地址是配置的反向代理时, 从 X-Forwarded-For 右侧起跳过代理地址, 取第一个非代理地址;
+    左侧的地址由客户端自行填写, 不可信
+    """
+    client = scope.get("client")
+    peer = client[0] if client else "unknown"
+    trust_any, networks = _trusted_proxies(settings.rate_limit_trusted_proxies)
+    if not (trust_any or _in_networks(peer, networks)):
+        return peer
+
+    forwarded = Headers(scope=scope).get("x-forwarded-for")
+    hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()] if forwarded else []
+    for hop in reversed(hops):
+        if not _in_networks(hop, networks):
+            return hop
+    return hops[0] if hops else peer
+
+
+class RateLimitMiddleware:
+    """令牌桶限流中间件 (纯ASGI实现, 只处理匹配限流规则的公开接口)"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.in_flight = 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        rule, match = match_rule(scope["path"])
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        # 过载保护: 公开接口处理中的请求过多时直接拒绝
+        max_in_flight = settings.rate_limit_max_in_flight
+        if max_in_flight and self.in_flight >= max_in_flight:
+            await self._reject(send, 503, 1, "服务繁忙，请稍后再试")
+            return
+
+        ip = client_ip(scope)
+        key_value, receive = await self._key_value(rule, match, scope, receive)
+
+        # 先检查单个链接/设备, 再检查客户端IP的总量 (防止用随机链接ID绕过)
+        wait = await rate_limiter.take(f"{rule.name}:{key_value or 'ip:' + ip}", rule.limit(key_value))
+        if not wait and settings.rate_limit_ip_enabled:
+            wait = await rate_limiter.take(
+                f"ip:{ip}", BucketLimit(rate=settings.rate_limit_ip_rate, burst=settings.rate_limit_ip_burst)
+            )
+        if wait:
+            logger.debug(f"请求被限流: {rule.name} key={key_value or ip}, 等待 {wait:.1f}s")
+            await self._reject(send, 429, rate_limiter.retry_after(wait), "请求过于频繁，请稍后再试")
+            return
+
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+
+    async def _key_value(self, rule: RateLimitRule, match: "re.Match", scope: Scope,
+                         receive: Receive) -> Tuple[Optional[str], Receive]:
+        """
+        提取限流键值: 路径参数 > 查询参数 > 请求头 > 小请求体中的 device_id
+
+        Returns:
+            (键值, receive); 读取过请求体时返回可重放的 receive
+        """
+        group = rule.key + "_id"
+        value = match.groupdict().get(group)
+        if value:
+            return value, receive
+
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        if query.get(group):
+            return query[group][0], receive
+
+        if rule.key != "device":
+            return None, receive
+
+        headers = Headers(scope=scope)
+        if headers.get("x-device-id"):
+            return headers["x-device-id"], receive
+
+        content_length = headers.get("content-length")
+        if (
+            scope["method"] != "POST"
+            or "json" not in headers.get("content-type", "")
+            or not content_length or not content_length.isdigit()
+            or int(content_length) > DEVICE_BODY_PEEK_LIMIT
+        ):
+            return None, receive
+
+        # 读取小请求体取出 device_id, 之后原样交给接口
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] != "http.request":
+                return None, _replay(body, message, receive)
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        try:
+            payload = orjson.loads(body)
+            value = payload.get("device_id") if isinstance(payload, dict) else None
+        except orjson.JSONDecodeError:
+            value = None
+        return (str(value) if value else None), _replay(body, None, receive)
+
+    @staticmethod
+    async def _reject(send: Send, status_code: int, retry_after: int, detail: str):
+        body = orjson.dumps({"detail": detail})
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def _replay(body: bytes, pending: Optional[Message], receive: Receive) -> Receive:
+    """返回先重放已读取请求体的 receive"""
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    if pending is not None:
+        messages.append(pending)
+
+    async def replay_receive() -> Message:
+        if messages:
+            return messages.pop(0)
+        return await receive()
+
+    return replay_receive
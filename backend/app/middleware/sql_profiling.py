@@ -0,0 +1,75 @@
+"""
+SQL 性能分析中间件
+Opt-in per-request SQL profiling exposed as Server-Timing headers
+
+- 管理员请求携带 X-SQL-Profile 请求头 (需有效的管理员令牌) 时分析该请求,
+  SQL_PROFILING_ALL_REQUESTS 为 true 时分析所有请求
+- 响应头返回 Server-Timing (db: SQL总耗时和条数, app: 请求总耗时) 和 X-SQL-Query-Count,
+  浏览器开发者工具的 Timing 面板可直接查看
+- 请求结束后输出分析日志, 同一语句重复执行达到阈值时记录 N+1 警告
+"""
+
+import time
+
+from jose import JWTError, jwt
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..config import settings
+from ..services.sql_profiler import RequestProfile, current_profile, sql_profiler
+
+
+def _is_admin_request(headers: Headers) -> bool:
+    """请求是否携带有效的管理员令牌 (只有管理员账号会签发 JWT)"""
+    authorization = headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+    except JWTError:
+        return False
+    return payload.get("sub") is not None
+
+
+class SqlProfilingMiddleware:
+    """按请求开启的SQL性能分析 (纯 ASGI 中间件)"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.header_name = settings.sql_profiling_header.lower()
+
+    def _should_profile(self, scope: Scope) -> bool:
+        if settings.sql_profiling_all_requests:
+            return True
+        headers = Headers(scope=scope)
+        return self.header_name in headers and _is_admin_request(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                # 响应头发出前的SQL都已执行完毕 (流式响应之后的查询只计入日志)
+                elapsed = (time.perf_counter() - started) * 1000
+                server_timing = (
+                    f'db;dur={profile.db_time * 1000:.2f};desc="{profile.query_count} queries", '
+                    f"app;dur={elapsed:.2f}"
+                )
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing.encode("latin-1")))
+                headers.append((b"x-sql-query-count", str(profile.query_count).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_profile.reset(token)
+            sql_profiler.report(scope["method"], scope["path"], profile, time.perf_counter() - started)
@@ -10,6 +10,8 @@ from .sms_rule import SMSRule, SmsForwardLog
 from .account_link import AccountLink
 from .user import User
 from .service_type import ServiceType
+from .sms_retention_policy import SmsRetentionPolicy
+from .stored_image import StoredImage, ImageReference
 
 __all__ = [
     "Device",
@@ -19,5 +21,8 @@ __all__ = [
     "SmsForwardLog",
     "AccountLink",
     "User",
-    "ServiceType"
+    "ServiceType",
+    "SmsRetentionPolicy",
+    "StoredImage",
+    "ImageReference"
 ]
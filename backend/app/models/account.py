@@ -3,11 +3,23 @@
 Account model for storing member account information
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, and_, case, cast, literal
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, column_property
 from ..database import Base
 
+# 超过该长度且不是URL的 image_url 视为内嵌Base64数据, 不随列表返回
+IMAGE_REF_MAX_LENGTH = 2048
+
+# 内嵌图片在列表中返回的地址, 由 GET /api/accounts/{id}/image 输出图片内容
+INLINE_IMAGE_URL_PREFIX = "/api/accounts/"
+INLINE_IMAGE_URL_SUFFIX = "/image"
+
+
+def inline_image_url(account_id: int) -> str:
+    """账号内嵌图片的访问地址"""
+    return f"{INLINE_IMAGE_URL_PREFIX}{account_id}{INLINE_IMAGE_URL_SUFFIX}"
+
 
 class Account(Base):
     """会员账号表"""
@@ -25,6 +37,23 @@ class Account(Base):
     type = Column(String(100), comment="服务类型")
     image_url = Column(Text, comment="账号图片URL或Base64数据")
     
+    # 列表查询用的轻量图片引用 (配合 defer(image_url) 使用)
+    # 待迁移的大段Base64数据返回 inline_image_url(), URL 无论长短原样返回
+    image_ref = column_property(
+        case(
+            (
+                and_(
+                    func.length(image_url) > IMAGE_REF_MAX_LENGTH,
+                    ~image_url.like("http%"),
+                    ~image_url.like("/%")
+                ),
+                literal(INLINE_IMAGE_URL_PREFIX) + cast(id, String) + literal(INLINE_IMAGE_URL_SUFFIX)
+            ),
+            else_=image_url
+        ),
+        deferred=True
+    )
+    
     # 账号描述
     description = Column(Text, comment="账号描述")
     
@@ -46,15 +75,20 @@ class Account(Base):
     def __repr__(self):
         return f"<Account(account_name='{self.account_name}', type='{self.type}')>"
     
-    def to_dict(self):
-        """转换为字典格式"""
+    def to_dict(self, list_view: bool = False):
+        """
+        转换为字典格式
+        
+        Args:
+            list_view: 列表模式, 使用 image_ref 代替完整的 image_url
+        """
         return {
             "id": self.id,
             "account_name": self.account_name,
             "username": self.username,
             "password": self.password,  # 添加缺失的password字段
             "type": self.type,
-            "image_url": self.image_url,
+            "image_url": self.image_ref if list_view else self.image_url,
             "description": self.description,
             "status": self.status,
             "primary_device_id": self.primary_device_id,
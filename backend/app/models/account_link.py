@@ -26,7 +26,7 @@ class AccountLink(Base):
     link_url = Column(String(500), comment="完整链接URL")
     
     # 状态信息
-    status = Column(String(20), default="unused", comment="链接状态 (unused/used/expired)")
+    status = Column(String(20), default="unused", index=True, comment="链接状态 (unused/used/expired)")
     is_active = Column(Boolean, default=True, comment="是否激活")
     
     # 访问限制配置
@@ -49,7 +49,7 @@ class AccountLink(Base):
     last_user_agent = Column(String(500), comment="最后访问用户代理")
     
     # 有效期
-    expires_at = Column(DateTime(timezone=True), comment="过期时间")
+    expires_at = Column(DateTime(timezone=True), index=True, comment="过期时间 (过期清理任务按此索引扫描)")
     
     # 时间戳
     created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
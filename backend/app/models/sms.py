@@ -3,26 +3,73 @@
 SMS model for storing SMS records
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey
+import re
+
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
-from ..database import Base
+from ..database import Base, is_sms_partitioning_enabled
+
+# 按月分区模式下, 分区键 sms_timestamp 必须包含在主键中
+SMS_PARTITIONED = is_sms_partitioning_enabled()
+
+# 电话号码形式的发送方 (数字、+ 和常见分隔符)
+_PHONE_SENDER = re.compile(r"\+?[\d\s\-().]+")
+_PHONE_SEPARATORS = re.compile(r"[\s\-().]")
+
+
+def normalize_sender(sender):
+    """
+    规范化发送方号码 (接近 E.164 形式)
+
+    电话号码去掉空格、横线、括号和点, 国际前缀 00 替换为 +;
+    短信服务号、字母发送方等保持原样
+    """
+    if not sender or not _PHONE_SENDER.fullmatch(sender):
+        return sender
+    normalized = _PHONE_SEPARATORS.sub("", sender)
+    if normalized.startswith("00"):
+        normalized = "+" + normalized[2:]
+    return normalized
+
+
+def _default_sender_normalized(context):
+    return normalize_sender(context.get_current_parameters().get("sender"))
 
 
 class SMS(Base):
     """短信记录表"""
     __tablename__ = "sms"
+    __table_args__ = (
+        Index("ix_sms_device_timestamp", "device_id", "sms_timestamp"),
+        # 规则的精确/前缀发送方条件按此索引查询 (pattern_ops 使 LIKE 'x%' 在任意排序规则下可用索引)
+        Index(
+            "ix_sms_device_sender_normalized", "device_id", "sender_normalized",
+            postgresql_ops={"sender_normalized": "varchar_pattern_ops"}
+        ),
+        {"postgresql_partition_by": "RANGE (sms_timestamp)"} if SMS_PARTITIONED else {},
+    )
     
     # 主键
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     
     # 关联设备
     device_id = Column(Integer, ForeignKey("devices.id"), nullable=False, comment="关联设备ID")
     
     # 短信基本信息
     sender = Column(String(50), comment="发送方号码")
+    sender_normalized = Column(
+        String(50),
+        default=_default_sender_normalized,
+        comment="规范化的发送方号码 (用于规则匹配)"
+    )
     content = Column(Text, comment="短信内容")
-    sms_timestamp = Column(DateTime(timezone=True), comment="短信时间戳")
+    sms_timestamp = Column(
+        DateTime(timezone=True),
+        primary_key=SMS_PARTITIONED,
+        server_default=func.now() if SMS_PARTITIONED else None,
+        comment="短信时间戳 (分区模式下为分区键)"
+    )
     
     # 短信类型
     sms_type = Column(String(20), default="received", comment="短信类型 (received/sent)")
@@ -0,0 +1,46 @@
+"""
+短信保留策略模型
+SMS retention policy model
+"""
+
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, UniqueConstraint
+from sqlalchemy.sql import func
+from ..database import Base
+
+
+class SmsRetentionPolicy(Base):
+    """短信保留策略表 (按账号/设备覆盖全局 dataRetentionDays)"""
+    __tablename__ = "sms_retention_policies"
+    __table_args__ = (
+        UniqueConstraint("scope", "target_id", name="uq_sms_retention_scope_target"),
+    )
+
+    # 主键
+    id = Column(Integer, primary_key=True, index=True)
+
+    # 作用范围
+    scope = Column(String(20), nullable=False, comment="作用范围 (account/device)")
+    target_id = Column(Integer, nullable=False, comment="账号ID或设备ID")
+
+    # 保留配置
+    retention_days = Column(Integer, nullable=False, comment="保留天数, 超期短信归档后删除")
+    is_active = Column(Boolean, default=True, comment="是否启用")
+
+    # 时间戳
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), comment="更新时间")
+
+    def __repr__(self):
+        return f"<SmsRetentionPolicy(scope='{self.scope}', target_id={self.target_id}, days={self.retention_days})>"
+
+    def to_dict(self):
+        """转换为字典格式"""
+        return {
+            "id": self.id,
+            "scope": self.scope,
+            "target_id": self.target_id,
+            "retention_days": self.retention_days,
+            "is_active": self.is_active,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
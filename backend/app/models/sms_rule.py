@@ -7,6 +7,7 @@ from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Bool
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from ..database import Base
+from .sms import SMS_PARTITIONED
 
 
 class SMSRule(Base):
@@ -87,20 +88,30 @@ class SMSRule(Base):
 class SmsForwardLog(Base):
     """短信转发日志表"""
     __tablename__ = "sms_forward_logs"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    sms_id = Column(Integer, ForeignKey("sms.id", ondelete="CASCADE"), nullable=False, comment="短信ID")
+    __table_args__ = (
+        {"postgresql_partition_by": "RANGE (created_at)"} if SMS_PARTITIONED else {}
+    )
+    
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    # 分区表无法引用 sms.id (非唯一), 分区模式下不建外键, 由应用层维护
+    if SMS_PARTITIONED:
+        sms_id = Column(Integer, nullable=False, index=True, comment="短信ID")
+    else:
+        sms_id = Column(Integer, ForeignKey("sms.id", ondelete="CASCADE"), nullable=False, comment="短信ID")
     rule_id = Column(Integer, ForeignKey("sms_rules.id", ondelete="CASCADE"), nullable=False, comment="规则ID")
     target_type = Column(String(20), nullable=False, default="link", comment="转发目标类型")
     target_id = Column(Integer, nullable=True, comment="转发目标ID")
     status = Column(String(20), nullable=False, default="pending", comment="转发状态 (pending/success/failed)")
     error_message = Column(Text, nullable=True, comment="错误信息")
     forwarded_at = Column(DateTime(timezone=True), nullable=True, comment="转发时间")
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), primary_key=SMS_PARTITIONED, comment="创建时间")
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), comment="更新时间")
     
     # 关联关系
-    sms = relationship("SMS", foreign_keys=[sms_id])
+    if SMS_PARTITIONED:
+        sms = relationship("SMS", primaryjoin="foreign(SmsForwardLog.sms_id) == SMS.id")
+    else:
+        sms = relationship("SMS", foreign_keys=[sms_id])
     rule = relationship("SMSRule", foreign_keys=[rule_id])
     
     def __repr__(self):
@@ -0,0 +1,81 @@
+"""
+图片存储记录模型
+Stored image catalog models (content-addressed files with reference counts)
+"""
+
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from ..database import Base
+
+
+class StoredImage(Base):
+    """按内容哈希存储的图片文件表, 相同内容只保存一份并记录引用计数"""
+    __tablename__ = "stored_images"
+
+    # 主键
+    id = Column(Integer, primary_key=True, index=True)
+
+    # 文件信息
+    content_hash = Column(String(64), unique=True, nullable=False, index=True, comment="文件内容SHA-256")
+    filename = Column(String(100), unique=True, nullable=False, comment="存储文件名 ({sha256}.ext)")
+    size = Column(BigInteger, nullable=False, index=True, comment="文件大小 (字节)")
+    mime_type = Column(String(50), comment="MIME类型")
+    width = Column(Integer, comment="图片宽度 (像素)")
+    height = Column(Integer, comment="图片高度 (像素)")
+
+    # 引用计数, 降为0时删除文件
+    ref_count = Column(Integer, nullable=False, default=0, comment="引用计数")
+
+    # 时间戳
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True, comment="创建时间")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), comment="更新时间")
+
+    # 引用该图片的账号
+    references = relationship("ImageReference", back_populates="image", cascade="all, delete-orphan", passive_deletes=True)
+
+    def __repr__(self):
+        return f"<StoredImage(filename='{self.filename}', ref_count={self.ref_count})>"
+
+    def to_dict(self, include_accounts: bool = False):
+        """转换为字典格式"""
+        data = {
+            "id": self.id,
+            "content_hash": self.content_hash,
+            "filename": self.filename,
+            "url": f"/api/images/{self.filename}",
+            "size": self.size,
+            "mime_type": self.mime_type,
+            "width": self.width,
+            "height": self.height,
+            "ref_count": self.ref_count,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
+        if include_accounts:
+            data["account_ids"] = [reference.account_id for reference in self.references]
+        return data
+
+
+class ImageReference(Base):
+    """图片被账号引用的记录"""
+    __tablename__ = "image_references"
+    __table_args__ = (
+        UniqueConstraint("image_id", "account_id", name="uq_image_reference_image_account"),
+    )
+
+    # 主键
+    id = Column(Integer, primary_key=True, index=True)
+
+    # 关联
+    image_id = Column(Integer, ForeignKey("stored_images.id", ondelete="CASCADE"), nullable=False, comment="图片ID")
+    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"), nullable=False, index=True, comment="账号ID")
+
+    # 时间戳
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
+
+    # 关系
+    image = relationship("StoredImage", back_populates="references")
+
+    def __repr__(self):
+        return f"<ImageReference(image_id={self.image_id}, account_id={self.account_id})>"
@@ -0,0 +1,105 @@
+"""
+后台任务登记服务
+Background job registry
+
+批量生成链接、手动转发等耗时操作作为后台任务执行:
+- 接口立即返回任务ID, 任务状态 (进度计数、开始/结束时间、错误) 保存在进程内存中
+- 进度变化通过管理端 WebSocket 推送 job_progress 消息
+- 只保留最近的若干个已结束任务
+"""
+
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 保留的已结束任务数 (超出时丢弃最早的任务及其结果)
+JOB_RETENTION = 20
+
+
+class JobRegistry:
+    """后台任务登记表"""
+
+    def __init__(self, retention: int = JOB_RETENTION):
+        self.retention = retention
+        self.jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.results: Dict[str, Any] = {}
+        self.tasks: Dict[str, asyncio.Task] = {}
+
+    def create(self, job_type: str, **fields) -> Dict[str, Any]:
+        """登记新任务, 返回任务状态"""
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "job_type": job_type,
+            "status": "running",
+            **fields,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "finished_at": None,
+            "error": None
+        }
+        self.jobs[job_id] = job
+        self._prune()
+        return job
+
+    def run(self, job: Dict[str, Any], runner: Callable[[Dict[str, Any]], Awaitable[None]]):
+        """在后台执行任务, runner 负责更新进度计数"""
+        self.tasks[job["job_id"]] = asyncio.create_task(self._run_async(job, runner))
+
+    async def _run_async(self, job: Dict[str, Any], runner: Callable[[Dict[str, Any]], Awaitable[None]]):
+        try:
+            await runner(job)
+            job["status"] = "completed"
+        except asyncio.CancelledError:
+            job["status"] = "cancelled"
+            raise
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            logger.error(f"后台任务失败: {job['job_type']} {job['job_id']}: {e}")
+        finally:
+            job["finished_at"] = datetime.now(timezone.utc).isoformat()
+            self.tasks.pop(job["job_id"], None)
+            await self.notify(job)
+
+    async def notify(self, job: Dict[str, Any]):
+        """推送任务进度到管理端"""
+        try:
+            from ..websocket import manager
+            await manager.send_job_progress(dict(job))
+        except Exception as e:
+            logger.debug(f"推送任务进度失败: {e}")
+
+    def _prune(self):
+        """丢弃最早的已结束任务"""
+        finished = [job_id for job_id, job in self.jobs.items() if job["status"] != "running"]
+        for job_id in finished[:max(0, len(finished) - self.retention)]:
+            self.jobs.pop(job_id, None)
+            self.results.pop(job_id, None)
+
+    def get(self, job_id: str, job_type: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        job = self.jobs.get(job_id)
+        if job and job_type and job["job_type"] != job_type:
+            return None
+        return job
+
+    def list(self, job_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """任务列表 (最新的在前)"""
+        return [job for job in reversed(self.jobs.values()) if not job_type or job["job_type"] == job_type]
+
+    async def stop(self):
+        """取消所有运行中的任务 (已提交的批次保留)"""
+        for task in list(self.tasks.values()):
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+
+# 全局后台任务登记表
+background_jobs = JobRegistry()
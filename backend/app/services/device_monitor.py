@@ -11,6 +11,7 @@ from ..database import get_db
 from ..models.device import Device
 from ..config import settings
 from ..websocket import manager
+from .metrics import SWEEP_DURATION, observe_duration
 
 logger = logging.getLogger(__name__)
 
@@ -45,7 +46,8 @@ class DeviceMonitor:
         """监控循环"""
         while self.running:
             try:
-                await self._check_device_status()
+                with observe_duration(SWEEP_DURATION, task="device_monitor"):
+                    await self._check_device_status()
                 # 每5秒检查一次，提高检测精度
                 await asyncio.sleep(5)
             except asyncio.CancelledError:
@@ -68,6 +70,7 @@ class DeviceMonitor:
                 offline_threshold = timedelta(seconds=settings.offline_threshold)
                 
                 offline_devices = []
+                debug = logger.isEnabledFor(logging.DEBUG)
                 
                 for device in online_devices:
                     if device.last_heartbeat:
@@ -79,8 +82,10 @@ class DeviceMonitor:
                         # 计算时间差
                         time_diff = now - last_heartbeat
                         
-                        # 调试日志
-                        logger.info(f"设备心跳检查: {device.device_id} - 最后心跳: {last_heartbeat}, 当前时间: {now}, 时间差: {time_diff.total_seconds()}秒, 阈值: {settings.offline_threshold}秒")
+                        # 调试日志 (每个在线设备每5秒一条, 仅 DEBUG 级别输出)
+                        if debug:
+                            logger.debug("设备心跳检查: %s - 最后心跳: %s, 时间差: %.1f秒, 阈值: %s秒",
+                                         device.device_id, last_heartbeat, time_diff.total_seconds(), settings.offline_threshold)
                         
                         # 检查是否超时
                         if time_diff > offline_threshold:
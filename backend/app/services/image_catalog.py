@@ -0,0 +1,291 @@
+"""
+图片目录服务
+Image catalog service
+
+stored_images 表记录每个图片文件的大小、MIME类型、尺寸、哈希和引用计数,
+image_references 表记录引用图片的账号。列表和详情直接查询目录,
+不再遍历存储; 目录与存储后端的差异由 reconcile 批量检查和修复。
+"""
+
+import hashlib
+import logging
+import mimetypes
+from collections import defaultdict
+from io import BytesIO
+from typing import Dict, Any, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session, selectinload
+
+from ..database import SessionLocal
+from ..models.account import Account, IMAGE_REF_MAX_LENGTH
+from ..models.stored_image import StoredImage, ImageReference
+from .image_delivery import HASHED_NAME_PATTERN
+from .image_storage import image_storage
+from .storage_backends import ObjectStat
+
+logger = logging.getLogger(__name__)
+
+# 账号图片地址前缀
+IMAGE_URL_PREFIX = "/api/images/"
+
+# 可排序字段
+SORT_FIELDS = {
+    "created_at": StoredImage.created_at,
+    "size": StoredImage.size,
+    "ref_count": StoredImage.ref_count,
+}
+
+# 目录检查结果中每类最多返回的样例数
+RECONCILE_SAMPLE_SIZE = 100
+
+# 目录检查时每批写入的行数
+RECONCILE_BATCH_SIZE = 500
+
+
+def filename_from_url(image_url: Optional[str]) -> Optional[str]:
+    """从 /api/images/{filename} 地址中取出文件名"""
+    if not image_url or not image_url.startswith(IMAGE_URL_PREFIX):
+        return None
+    filename = image_url[len(IMAGE_URL_PREFIX):].split("?", 1)[0]
+    return filename if filename and "/" not in filename else None
+
+
+class ImageCatalog:
+    """图片目录服务"""
+
+    def list_images(self, db: Session, page: int, page_size: int,
+                    sort_by: str = "created_at", order: str = "desc") -> Tuple[List[StoredImage], int]:
+        """
+        分页查询图片目录
+
+        Returns:
+            (当前页图片, 总数)
+        """
+        sort_column = SORT_FIELDS.get(sort_by, StoredImage.created_at)
+        sort_clause = sort_column.asc() if order == "asc" else sort_column.desc()
+
+        total = db.query(func.count(StoredImage.id)).scalar()
+        images = db.query(StoredImage).options(
+            selectinload(StoredImage.references)
+        ).order_by(sort_clause, StoredImage.id.desc()).offset(
+            (page - 1) * page_size
+        ).limit(page_size).all()
+        return images, total
+
+    def get_image(self, db: Session, filename: str) -> Optional[StoredImage]:
+        """按文件名查询图片目录记录"""
+        return db.query(StoredImage).options(
+            selectinload(StoredImage.references)
+        ).filter(StoredImage.filename == filename).first()
+
+    def sync_account(self, db: Session, account_id: int, image_url: Optional[str]):
+        """
+        更新账号的图片引用记录 (随调用方事务提交)
+
+        Args:
+            account_id: 账号ID
+            image_url: 账号当前的图片地址, 为空或非本地图片时只清除引用
+        """
+        db.query(ImageReference).filter(
+            ImageReference.account_id == account_id
+        ).delete(synchronize_session=False)
+
+        filename = filename_from_url(image_url)
+        if not filename:
+            return
+
+        image_id = db.query(StoredImage.id).filter(StoredImage.filename == filename).scalar()
+        if image_id:
+            db.add(ImageReference(image_id=image_id, account_id=account_id))
+
+    # ------------------------------------------------------------------
+    # 目录检查
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _scan_files() -> Dict[str, ObjectStat]:
+        """一次遍历存储后端, 返回 文件名 -> ObjectStat"""
+        files = {}
+        for filename, object_stat in image_storage.backend.list_objects():
+            mime_type, _ = mimetypes.guess_type(filename)
+            if mime_type and mime_type.startswith("image/"):
+                files[filename] = object_stat
+        return files
+
+    @staticmethod
+    def _account_references(db: Session) -> Dict[str, List[int]]:
+        """从账号表批量计算 文件名 -> 引用账号ID"""
+        references = defaultdict(list)
+        rows = db.query(Account.id, Account.image_url).filter(
+            Account.image_url.like(f"{IMAGE_URL_PREFIX}%"),
+            func.length(Account.image_url) <= IMAGE_REF_MAX_LENGTH
+        ).yield_per(RECONCILE_BATCH_SIZE)
+        for account_id, image_url in rows:
+            filename = filename_from_url(image_url)
+            if filename:
+                references[filename].append(account_id)
+        return references
+
+    @staticmethod
+    def _inspect_file(filename: str) -> Tuple[str, Optional[int], Optional[int]]:
+        """
+        读取文件的内容哈希和尺寸
+
+        Returns:
+            (SHA-256, 宽度, 高度); 内容寻址文件直接取文件名中的哈希
+        """
+        backend = image_storage.backend
+        match = HASHED_NAME_PATTERN.match(filename)
+        local_path = backend.local_path(filename)
+
+        if local_path:
+            if match:
+                content_hash = match.group(1)
+            else:
+                digest = hashlib.sha256()
+                for chunk in backend.iter_chunks(filename):
+                    digest.update(chunk)
+                content_hash = digest.hexdigest()
+            width, height = image_storage.probe_dimensions(local_path)
+            return content_hash, width, height
+
+        # 对象存储只读取一次, 同时用于计算哈希和识别尺寸
+        with backend.open(filename) as stream:
+            data = stream.read()
+        content_hash = match.group(1) if match else hashlib.sha256(data).hexdigest()
+        width, height = image_storage.probe_dimensions(BytesIO(data))
+        return content_hash, width, height
+
+    def reconcile(self, fix: bool = False) -> Dict[str, Any]:
+        """
+        批量核对图片目录、存储中的文件和账号引用
+
+        - orphans: 存储中存在但目录中没有记录的文件
+        - missing: 目录中有记录但存储中不存在的文件
+        - stale_references: 目录中的账号引用与账号表不一致的图片
+
+        Args:
+            fix: 是否修复 (登记孤立文件、删除缺失文件的记录、按账号表重建引用)
+
+        Returns:
+            检查结果汇总
+        """
+        db = SessionLocal()
+        try:
+            files = self._scan_files()
+            catalog = {
+                filename: (image_id, content_hash)
+                for image_id, filename, content_hash in db.query(
+                    StoredImage.id, StoredImage.filename, StoredImage.content_hash
+                )
+            }
+            recorded_references = defaultdict(set)
+            for image_id, account_id in db.query(ImageReference.image_id, ImageReference.account_id):
+                recorded_references[image_id].add(account_id)
+            account_references = self._account_references(db)
+
+            orphans = sorted(set(files) - set(catalog))
+            missing = sorted(set(catalog) - set(files))
+            stale = sorted(
+                filename for filename, (image_id, _) in catalog.items()
+                if filename in files and recorded_references[image_id] != set(account_references.get(filename, []))
+            )
+            missing_referenced_accounts = sorted(
+                account_id for filename in missing for account_id in account_references.get(filename, [])
+            )
+
+            summary = {
+                "files": len(files),
+                "catalog": len(catalog),
+                "orphans": len(orphans),
+                "missing": len(missing),
+                "stale_references": len(stale),
+                "orphan_samples": orphans[:RECONCILE_SAMPLE_SIZE],
+                "missing_samples": missing[:RECONCILE_SAMPLE_SIZE],
+                "missing_referenced_accounts": missing_referenced_accounts[:RECONCILE_SAMPLE_SIZE],
+                "fixed": False
+            }
+
+            if fix:
+                summary.update(self._fix(db, files, catalog, orphans, missing, stale, account_references))
+                summary["fixed"] = True
+
+            logger.info(
+                f"图片目录检查完成: 文件 {len(files)}, 目录 {len(catalog)}, 孤立 {len(orphans)}, "
+                f"缺失 {len(missing)}, 引用不一致 {len(stale)}, 修复={fix}"
+            )
+            return summary
+
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _fix(self, db: Session, files: Dict[str, ObjectStat], catalog: Dict[str, Tuple[int, str]],
+             orphans: List[str], missing: List[str], stale: List[str],
+             account_references: Dict[str, List[int]]) -> Dict[str, int]:
+        """修复目录检查发现的问题, 每批单独提交"""
+        known_hashes = {content_hash for _, content_hash in catalog.values()}
+        registered = 0
+        duplicates = 0
+
+        # 登记孤立文件; 内容与已登记文件相同的重复文件只统计, 不登记
+        for offset in range(0, len(orphans), RECONCILE_BATCH_SIZE):
+            for filename in orphans[offset:offset + RECONCILE_BATCH_SIZE]:
+                content_hash, width, height = self._inspect_file(filename)
+                if content_hash in known_hashes:
+                    duplicates += 1
+                    continue
+                known_hashes.add(content_hash)
+
+                account_ids = account_references.get(filename, [])
+                image = StoredImage(
+                    content_hash=content_hash,
+                    filename=filename,
+                    size=files[filename].size,
+                    mime_type=mimetypes.guess_type(filename)[0],
+                    width=width,
+                    height=height,
+                    # 未被账号引用的文件可能被站点设置等其他地方使用, 保留一次引用
+                    ref_count=max(len(account_ids), 1)
+                )
+                image.references = [ImageReference(account_id=account_id) for account_id in account_ids]
+                db.add(image)
+                registered += 1
+            db.commit()
+
+        # 删除缺失文件的目录记录 (引用记录级联删除)
+        for offset in range(0, len(missing), RECONCILE_BATCH_SIZE):
+            batch = missing[offset:offset + RECONCILE_BATCH_SIZE]
+            db.query(ImageReference).filter(
+                ImageReference.image_id.in_([catalog[filename][0] for filename in batch])
+            ).delete(synchronize_session=False)
+            db.query(StoredImage).filter(StoredImage.filename.in_(batch)).delete(synchronize_session=False)
+            db.commit()
+
+        # 按账号表重建引用不一致的图片的引用记录
+        for offset in range(0, len(stale), RECONCILE_BATCH_SIZE):
+            batch = stale[offset:offset + RECONCILE_BATCH_SIZE]
+            image_ids = [catalog[filename][0] for filename in batch]
+            db.query(ImageReference).filter(
+                ImageReference.image_id.in_(image_ids)
+            ).delete(synchronize_session=False)
+            db.bulk_insert_mappings(ImageReference, [
+                {"image_id": catalog[filename][0], "account_id": account_id}
+                for filename in batch
+                for account_id in account_references.get(filename, [])
+            ])
+            db.commit()
+
+        return {
+            "registered": registered,
+            "duplicates": duplicates,
+            "removed": len(missing),
+            "references_rebuilt": len(stale)
+        }
+
+
+# 全局图片目录实例
+image_catalog = ImageCatalog()
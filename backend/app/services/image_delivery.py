@@ -0,0 +1,363 @@
+"""
+图片分发服务
+Image delivery service
+
+- 基于内容哈希的 ETag, 支持 If-None-Match 条件请求 (304)
+- 内容寻址文件名 ({sha256}.ext) 使用长期 immutable 缓存
+- 按需生成缩放 / WebP 变体, 在线程池中处理, 不阻塞事件循环
+- 变体缓存在磁盘上, 按总大小做 LRU 淘汰
+- 原图通过存储后端读取, 本地存储和S3兼容对象存储均适用
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# 内容寻址文件名: 64位sha256 + 扩展名
+HASHED_NAME_PATTERN = re.compile(r"^([0-9a-f]{64})\.[A-Za-z0-9]+$")
+
+# 允许的变体宽高档位, 请求尺寸向上取整到最近档位, 避免缓存被任意尺寸撑爆
+VARIANT_SIZES = (32, 64, 96, 128, 160, 256, 320, 480, 640, 800, 1024, 1280, 1600, 2048)
+
+# 支持输出的变体格式
+VARIANT_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "png": ("PNG", "image/png"),
+}
+
+# 原图扩展名对应的变体格式 (未指定输出格式时保持原格式)
+SUFFIX_FORMATS = {
+    ".jpg": "jpeg",
+    ".jpeg": "jpeg",
+    ".png": "png",
+    ".webp": "webp",
+    ".bmp": "png",
+}
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DEFAULT_CACHE_CONTROL = "public, max-age=3600"
+
+# 文件哈希内存缓存条数上限
+HASH_CACHE_SIZE = 4096
+
+# 变体文件分块输出大小
+VARIANT_CHUNK_SIZE = 64 * 1024
+
+
+def snap_size(value: Optional[int]) -> Optional[int]:
+    """将请求尺寸向上取整到允许的档位"""
+    if not value:
+        return None
+    for size in VARIANT_SIZES:
+        if value <= size:
+            return size
+    return VARIANT_SIZES[-1]
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """判断 If-None-Match 是否命中 (支持多个值、弱校验和 *)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+class VariantCache:
+    """磁盘变体缓存 (按总大小LRU淘汰)"""
+
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, int]" = OrderedDict()
+        self.total_bytes = 0
+        self._loaded = False
+        # 事件循环与生成线程都会访问索引
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def load(self):
+        """扫描已有缓存文件 (目录遍历和 stat 为阻塞调用, 在线程池中执行)"""
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        """启动后首次使用时扫描已有缓存文件, 按最近访问时间排序 (需持有锁)"""
+        if self._loaded:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        files = []
+        for path in self.cache_dir.iterdir():
+            if path.is_file() and not path.name.startswith("."):
+                stat = path.stat()
+                files.append((stat.st_atime, path.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+            self.total_bytes += size
+        self._loaded = True
+        self._evict()
+
+    def path_for(self, name: str) -> Path:
+        return self.cache_dir / name
+
+    def open(self, name: str) -> Optional[BinaryIO]:
+        """
+        命中时打开缓存文件并刷新LRU顺序
+        在锁内打开, 之后即使变体被淘汰 (删除文件), 已打开的文件仍可完整读取
+        """
+        with self._lock:
+            self._load()
+            if name not in self.entries:
+                return None
+            try:
+                handle = open(self.path_for(name), "rb")
+            except FileNotFoundError:
+                self.total_bytes -= self.entries.pop(name)
+                return None
+            self.entries.move_to_end(name)
+            return handle
+
+    def put(self, name: str, data: bytes) -> Path:
+        """写入缓存文件 (先写临时文件再改名)"""
+        with self._lock:
+            self._load()
+        path = self.path_for(name)
+        tmp_path = self.cache_dir / f".{name}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if name in self.entries:
+                self.total_bytes -= self.entries.pop(name)
+            self.entries[name] = len(data)
+            self.total_bytes += len(data)
+            self._evict()
+        return path
+
+    def _evict(self):
+        """超出上限时淘汰最久未使用的变体 (需持有锁)"""
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            name, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                self.path_for(name).unlink()
+            except FileNotFoundError:
+                pass
+            logger.debug(f"淘汰图片变体缓存: {name}")
+
+
+class ImageDeliveryService:
+    """图片分发服务"""
+
+    def __init__(self, cache_dir: Optional[str] = None, max_cache_mb: Optional[int] = None):
+        self.variant_cache = VariantCache(
+            Path(cache_dir or settings.image_cache_dir),
+            (max_cache_mb or settings.image_cache_max_mb) * 1024 * 1024
+        )
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.image_variant_workers,
+            thread_name_prefix="image-variant"
+        )
+        self._hash_cache: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        # content_hash 在线程池中并发执行
+        self._hash_lock = threading.Lock()
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    # ------------------------------------------------------------------
+    # ETag / 缓存头
+    # ------------------------------------------------------------------
+
+    def content_hash(self, backend, filename: str, object_stat) -> str:
+        """
+        获取文件内容哈希
+        内容寻址文件直接取文件名, 其他文件按 (文件名, mtime, size) 缓存计算结果
+
+        Args:
+            backend: 存储后端
+            filename: 文件名
+            object_stat: 存储后端返回的 ObjectStat
+        """
+        match = HASHED_NAME_PATTERN.match(filename)
+        if match:
+            return match.group(1)
+
+        key = (filename, object_stat.mtime_ns, object_stat.size)
+        with self._hash_lock:
+            cached = self._hash_cache.get(key)
+            if cached:
+                self._hash_cache.move_to_end(key)
+                return cached
+
+        digest = hashlib.sha256()
+        for chunk in backend.iter_chunks(filename):
+            digest.update(chunk)
+        content_hash = digest.hexdigest()
+
+        with self._hash_lock:
+            self._hash_cache[key] = content_hash
+            self._hash_cache.move_to_end(key)
+            if len(self._hash_cache) > HASH_CACHE_SIZE:
+                self._hash_cache.popitem(last=False)
+        return content_hash
+
+    @staticmethod
+    def cache_control(filename: str) -> str:
+        """内容寻址文件名永不变化, 可长期缓存"""
+        return IMMUTABLE_CACHE_CONTROL if HASHED_NAME_PATTERN.match(filename) else DEFAULT_CACHE_CONTROL
+
+    # ------------------------------------------------------------------
+    # 变体生成
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def resolve_variant_format(suffix: str, width: Optional[int], height: Optional[int],
+                               requested_format: Optional[str], accept: str) -> Tuple[Optional[str], bool]:
+        """
+        确定变体输出格式
+
+        Args:
+            suffix: 原图扩展名
+            width/height: 已取整的目标尺寸
+            requested_format: webp / jpeg / png / auto
+            accept: 请求的 Accept 头
+
+        Returns:
+            (输出格式, 是否需要 Vary: Accept); 输出格式为None表示直接返回原图
+        """
+        suffix = suffix.lower()
+        vary = requested_format == "auto"
+        # GIF可能是动图, 不生成变体
+        if suffix not in SUFFIX_FORMATS:
+            return None, vary
+
+        fmt = requested_format
+        if fmt == "auto":
+            fmt = "webp" if "image/webp" in accept else None
+
+        if not (width or height) and (not fmt or fmt == SUFFIX_FORMATS[suffix]):
+            return None, vary
+        return fmt or SUFFIX_FORMATS[suffix], vary
+
+    @staticmethod
+    def variant_key(content_hash: str, width: Optional[int], height: Optional[int], fmt: str) -> Tuple[str, str]:
+        """
+        变体缓存文件名和ETag, 无需生成变体即可用于条件请求判断
+
+        Returns:
+            (缓存文件名, ETag)
+        """
+        size = f"{width or 0}x{height or 0}"
+        return f"{content_hash}_{size}.{fmt}", f'"{content_hash}-{size}-{fmt}"'
+
+    @staticmethod
+    def _render_variant(source, width: Optional[int], height: Optional[int], fmt: str) -> bytes:
+        """在线程池中执行: 缩放并转码 (source 为本地路径或可 seek 的文件对象)"""
+        from io import BytesIO
+        from PIL import Image, ImageOps
+
+        pil_format, _ = VARIANT_FORMATS[fmt]
+        with Image.open(source) as image:
+            image = ImageOps.exif_transpose(image)
+            if width or height:
+                image.thumbnail((width or VARIANT_SIZES[-1], height or VARIANT_SIZES[-1]), Image.LANCZOS)
+
+            if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            elif image.mode not in ("RGB", "RGBA", "L", "LA"):
+                image = image.convert("RGBA")
+
+            output = BytesIO()
+            save_options = {"optimize": True}
+            if pil_format in ("WEBP", "JPEG"):
+                save_options["quality"] = 82
+            if pil_format == "WEBP":
+                save_options["method"] = 4
+            image.save(output, format=pil_format, **save_options)
+            return output.getvalue()
+
+    def _render_and_store(self, name: str, backend, filename: str, width: Optional[int],
+                          height: Optional[int], fmt: str) -> Path:
+        """在线程池中执行: 生成变体并写入磁盘缓存"""
+        source = backend.local_path(filename)
+        if source is None:
+            # 对象存储的响应流不支持 seek, 读入内存后交给 PIL
+            from io import BytesIO
+            with backend.open(filename) as stream:
+                source = BytesIO(stream.read())
+        data = self._render_variant(source, width, height, fmt)
+        path = self.variant_cache.put(name, data)
+        logger.info(f"生成图片变体: {name} ({len(data)} 字节)")
+        return path
+
+    async def open_variant(self, backend, filename: str, content_hash: str,
+                           width: Optional[int], height: Optional[int], fmt: str) -> BinaryIO:
+        """
+        打开图片变体文件, 不存在时在线程池中生成并写入缓存
+        同一变体的并发请求只生成一次; 生成后到打开前被淘汰时重新生成
+        """
+        name, _ = self.variant_key(content_hash, width, height, fmt)
+
+        if not self.variant_cache.loaded:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.variant_cache.load)
+
+        for _ in range(2):
+            handle = self.variant_cache.open(name)
+            if handle:
+                return handle
+            await self._generate_variant(name, backend, filename, width, height, fmt)
+        raise RuntimeError(f"图片变体生成后被立即淘汰: {name}, 请调大 IMAGE_CACHE_MAX_MB")
+
+    async def _generate_variant(self, name: str, backend, filename: str, width: Optional[int],
+                                height: Optional[int], fmt: str) -> Path:
+        """
+        在线程池中生成变体并写入缓存
+        同一变体的并发请求共享同一个执行器 future; 任一请求被取消 (如客户端断开) 不影响生成和其他请求
+        """
+        pending = self._pending.get(name)
+        if pending is None:
+            pending = asyncio.get_running_loop().run_in_executor(
+                self.executor, self._render_and_store, name, backend, filename, width, height, fmt
+            )
+            self._pending[name] = pending
+            pending.add_done_callback(lambda future: self._finish_pending(name, future))
+        return await asyncio.shield(pending)
+
+    def _finish_pending(self, name: str, future: asyncio.Future):
+        """生成结束后移除登记"""
+        if self._pending.get(name) is future:
+            del self._pending[name]
+        # 所有请求都已取消时无人读取结果, 避免 "Future exception was never retrieved" 警告
+        if not future.cancelled():
+            future.exception()
+
+    @staticmethod
+    def iter_file(handle: BinaryIO) -> Iterator[bytes]:
+        """分块读取已打开的变体文件, 读完后关闭 (StreamingResponse 在线程池中迭代)"""
+        with handle:
+            while True:
+                chunk = handle.read(VARIANT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+
+# 全局图片分发服务实例
+image_delivery = ImageDeliveryService()
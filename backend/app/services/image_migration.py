@@ -0,0 +1,158 @@
+"""
+账号图片迁移服务
+Account image migration service
+
+将 accounts.image_url 中存量的Base64图片数据转存为按内容寻址的图片文件,
+并把字段改写为 /api/images/{sha256}.{ext} 地址。
+
+任务可随时中断重跑: 每批单独提交, 只会选中仍为Base64数据的行,
+已迁移的行不会被重复处理。
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+
+from sqlalchemy import or_, and_, func, update
+
+from ..database import SessionLocal
+from ..models.account import Account, IMAGE_REF_MAX_LENGTH
+from .image_storage import image_storage
+from .image_catalog import image_catalog
+
+logger = logging.getLogger(__name__)
+
+# 每批处理的账号数 (单行Base64可能有数MB, 批次不宜过大)
+MIGRATION_BATCH_SIZE = 20
+
+
+class ImageMigrationJob:
+    """账号Base64图片迁移任务"""
+
+    def __init__(self):
+        self.task = None
+        self.status: Dict[str, Any] = {
+            "running": False,
+            "migrated": 0,
+            "failed": 0,
+            "last_account_id": 0,
+            "started_at": None,
+            "finished_at": None,
+            "error": None
+        }
+
+    @staticmethod
+    def _pending_filter():
+        """仍为内嵌Base64数据的行"""
+        return or_(
+            Account.image_url.like("data:image/%"),
+            and_(
+                func.length(Account.image_url) > IMAGE_REF_MAX_LENGTH,
+                ~Account.image_url.like("http%"),
+                ~Account.image_url.like("/%")
+            )
+        )
+
+    def count_pending(self) -> int:
+        """统计待迁移的账号数"""
+        db = SessionLocal()
+        try:
+            return db.query(func.count(Account.id)).filter(self._pending_filter()).scalar()
+        finally:
+            db.close()
+
+    def _migrate_batch(self, after_id: int) -> Optional[int]:
+        """
+        迁移一批账号, 返回本批最后一个账号ID; 没有待迁移数据时返回None
+        """
+        db = SessionLocal()
+        try:
+            rows = db.query(Account.id, Account.image_url).filter(
+                Account.id > after_id,
+                self._pending_filter()
+            ).order_by(Account.id).limit(MIGRATION_BATCH_SIZE).all()
+
+            if not rows:
+                return None
+
+            for account_id, image_data in rows:
+                decoded = image_storage.decode_base64_image(image_data)
+                if not decoded:
+                    self.status["failed"] += 1
+                    logger.warning(f"账号 {account_id} 的图片数据无法解析, 跳过")
+                    continue
+
+                filename = image_storage.save_content_addressed(*decoded, db=db)
+                # 仅在字段未被并发修改时改写, 未改写则退回刚登记的引用
+                result = db.execute(
+                    update(Account)
+                    .where(Account.id == account_id, Account.image_url == image_data)
+                    .values(image_url=f"/api/images/{filename}")
+                )
+                if result.rowcount == 0:
+                    image_storage.release(db, filename)
+                    continue
+                image_catalog.sync_account(db, account_id, f"/api/images/{filename}")
+                self.status["migrated"] += 1
+
+            db.commit()
+            return rows[-1][0]
+
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def _run_async(self):
+        """后台执行迁移, 每批在线程池中运行, 不阻塞事件循环"""
+        last_id = 0
+        try:
+            while True:
+                batch_last_id = await asyncio.to_thread(self._migrate_batch, last_id)
+                if batch_last_id is None:
+                    break
+                last_id = batch_last_id
+                self.status["last_account_id"] = last_id
+            logger.info(f"账号图片迁移完成: 成功 {self.status['migrated']}, 失败 {self.status['failed']}")
+        except asyncio.CancelledError:
+            logger.info("账号图片迁移已取消")
+            raise
+        except Exception as e:
+            self.status["error"] = str(e)
+            logger.error(f"账号图片迁移失败: {e}")
+        finally:
+            self.status["running"] = False
+            self.status["finished_at"] = datetime.now(timezone.utc).isoformat()
+
+    def start(self) -> bool:
+        """启动后台迁移, 已在运行时返回False"""
+        if self.status["running"]:
+            return False
+
+        self.status.update({
+            "running": True,
+            "migrated": 0,
+            "failed": 0,
+            "last_account_id": 0,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "finished_at": None,
+            "error": None
+        })
+        self.task = asyncio.create_task(self._run_async())
+        logger.info("账号图片迁移任务已启动")
+        return True
+
+    async def stop(self):
+        """停止后台迁移"""
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+
+# 全局迁移任务实例
+image_migration_job = ImageMigrationJob()
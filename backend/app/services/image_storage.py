@@ -1,30 +1,130 @@
 """
 图片存储服务
 Image storage service for handling file uploads and Base64 conversion
+
+图片按内容哈希 ({sha256}.ext) 存储, 相同内容只保存一份,
+stored_images 表记录每个文件的引用计数, 计数降为0时才删除文件。
+上传和Base64数据都分块写入本地临时文件并同时计算哈希, 内存占用与文件大小无关,
+写完后交给存储后端 (本地目录或S3兼容对象存储) 保存。
 """
 
 import os
+import re
 import uuid
 import base64
+import hashlib
 import mimetypes
-from typing import Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple, Dict, Any, Iterator
 from pathlib import Path
 import logging
 
+import aiofiles
+import aiofiles.os
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event, func, text
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models.stored_image import StoredImage, ImageReference
+from .image_delivery import HASHED_NAME_PATTERN
+from .storage_backends import create_storage_backend
+
 logger = logging.getLogger(__name__)
 
+# 流式写入的分块大小
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Base64分块解码的字符数 (必须是4的倍数)
+BASE64_CHUNK_CHARS = STREAM_CHUNK_SIZE // 3 * 4
+
+# 同一格式的扩展名统一, 避免相同内容因扩展名不同保存两份
+EXTENSION_ALIASES = {'.jpeg': '.jpg'}
+
+# 会话中待提交后删除的文件
+PENDING_DELETES_KEY = "image_storage_pending_deletes"
+
+
+class ImageTooLargeError(ValueError):
+    """图片超过大小限制"""
+
+
+# 提交后删除文件的后台线程 (删除前的复查可能等待其他事务的锁, 不能在事件循环中执行)
+_delete_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image-delete")
+
+
+def _file_lock_key(filename: str) -> int:
+    """文件名对应的 advisory lock 键 (64位有符号整数)"""
+    return int.from_bytes(hashlib.sha256(f"stored_image:{filename}".encode()).digest()[:8], "big", signed=True)
+
+
+def _lock_file(db: Session, filename: str):
+    """
+    同一文件的放置与删除互斥, 事务提交或回滚时释放
+    PostgreSQL 使用事务级 advisory lock; SQLite 同时只有一个写事务, 执行一条空更新即取得写锁
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _file_lock_key(filename)})
+    else:
+        db.query(StoredImage).filter(StoredImage.filename == filename).update(
+            {StoredImage.ref_count: StoredImage.ref_count},
+            synchronize_session=False
+        )
+
+
+def _delete_if_unreferenced(backend, key: str):
+    """
+    在新事务中复查后删除文件
+    释放引用的事务提交后, 其他请求可能已重新上传相同内容并沿用了该文件 (上传时发现文件存在就不再写入),
+    持锁确认目录中没有该文件的记录后才删除
+    """
+    db = SessionLocal()
+    try:
+        _lock_file(db, key)
+        if db.query(StoredImage.id).filter(StoredImage.filename == key).first() is not None:
+            logger.info(f"图片已被重新引用, 保留文件: {key}")
+            return
+        backend.delete(key)
+        logger.info(f"图片文件已删除: {key}")
+    except Exception as e:
+        logger.error(f"删除图片文件失败: {key}, {str(e)}")
+    finally:
+        db.close()
+
+
+@event.listens_for(Session, "after_commit")
+def _delete_released_files(session):
+    """事务提交后删除引用计数已归零的文件 (回滚时保留)"""
+    for backend, key in session.info.pop(PENDING_DELETES_KEY, []):
+        _delete_executor.submit(_delete_if_unreferenced, backend, key)
+
+
+def wait_for_deletes():
+    """等待已提交的文件删除执行完成"""
+    _delete_executor.submit(lambda: None).result()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_released_files(session):
+    session.info.pop(PENDING_DELETES_KEY, None)
+
+
 class ImageStorageService:
     """图片存储服务类"""
     
-    def __init__(self, upload_dir: str = "/app/uploads/images"):
+    def __init__(self, upload_dir: Optional[str] = None):
         """
         初始化图片存储服务
         
         Args:
-            upload_dir: 图片上传目录
+            upload_dir: 图片上传目录, 默认使用配置 image_upload_dir;
+                        使用S3存储时仅作为上传临时目录
         """
-        self.upload_dir = Path(upload_dir)
+        self.upload_dir = Path(upload_dir or settings.image_upload_dir)
         self.upload_dir.mkdir(parents=True, exist_ok=True)
+        self.backend = create_storage_backend(self.upload_dir)
         
         # 支持的图片格式
         self.supported_formats = {
@@ -34,23 +134,20 @@ class ImageStorageService:
             'image/webp': '.webp'
         }
     
-    def save_base64_image(self, base64_data: str, filename_prefix: str = "image") -> Optional[str]:
+    def save_base64_image(self, base64_data: str, filename_prefix: str = "image",
+                          db: Optional[Session] = None) -> Optional[str]:
         """
-        保存Base64图片数据到文件
+        保存Base64图片数据到文件 (按内容哈希命名, 分块解码写入)
         
         Args:
             base64_data: Base64编码的图片数据
-            filename_prefix: 文件名前缀
+            filename_prefix: 来源标识, 仅用于日志
+            db: 数据库会话, 传入时记录一次引用 (由调用方提交)
             
         Returns:
             保存成功返回相对路径，失败返回None
         """
         try:
-            # 清理文件名前缀中的空白字符（修复根本问题）
-            import re
-            cleaned_prefix = re.sub(r'\s+', '_', filename_prefix.strip())
-            logger.info(f"文件名前缀清理: '{filename_prefix}' -> '{cleaned_prefix}'")
-            
             # 解析Base64数据
             if base64_data.startswith('data:image/'):
                 # 提取MIME类型和数据部分
@@ -66,31 +163,262 @@ class ImageStorageService:
                 logger.error(f"不支持的图片格式: {mime_type}")
                 return None
             
-            # 解码Base64数据
+            tmp_path = self._tmp_path()
+            digest = hashlib.sha256()
+            size = 0
             try:
-                image_data = base64.b64decode(data)
+                with open(tmp_path, 'wb') as f:
+                    for chunk in self._iter_base64_chunks(data):
+                        digest.update(chunk)
+                        size += len(chunk)
+                        f.write(chunk)
             except Exception as e:
+                tmp_path.unlink(missing_ok=True)
                 logger.error(f"Base64解码失败: {str(e)}")
                 return None
             
-            # 生成唯一文件名（使用清理后的前缀）
-            file_extension = self.supported_formats[mime_type]
-            filename = f"{cleaned_prefix}_{uuid.uuid4().hex}{file_extension}"
-            file_path = self.upload_dir / filename
-            
-            # 保存文件
-            with open(file_path, 'wb') as f:
-                f.write(image_data)
+            filename, deduplicated = self._store_tmp_file(
+                tmp_path, digest.hexdigest(), self.supported_formats[mime_type], size, db
+            )
             
             # 返回相对路径
             relative_path = f"uploads/images/{filename}"
-            logger.info(f"图片保存成功: {relative_path}")
+            logger.info(f"图片保存成功 ({filename_prefix}): {relative_path}{' (复用已有文件)' if deduplicated else ''}")
             return relative_path
             
         except Exception as e:
             logger.error(f"保存Base64图片失败: {str(e)}")
             return None
     
+    @staticmethod
+    def _iter_base64_chunks(data: str) -> Iterator[bytes]:
+        """分块解码Base64数据, 避免一次性生成完整的二进制副本"""
+        if any(whitespace in data for whitespace in (' ', '\n', '\r', '\t')):
+            data = re.sub(r'\s+', '', data)
+        for offset in range(0, len(data), BASE64_CHUNK_CHARS):
+            yield base64.b64decode(data[offset:offset + BASE64_CHUNK_CHARS], validate=True)
+    
+    def decode_base64_image(self, base64_data: str) -> Optional[Tuple[bytes, str]]:
+        """
+        解析Base64图片数据
+        
+        Args:
+            base64_data: Base64编码的图片数据 (可带 data:image/...;base64, 前缀)
+            
+        Returns:
+            (图片二进制数据, 文件扩展名)，失败返回None
+        """
+        if base64_data.startswith('data:image/'):
+            header, data = base64_data.split(',', 1)
+            mime_type = header.split(';')[0].split(':')[1]
+        else:
+            mime_type = 'image/png'
+            data = base64_data
+        
+        if mime_type not in self.supported_formats:
+            logger.error(f"不支持的图片格式: {mime_type}")
+            return None
+        
+        try:
+            return base64.b64decode(data), self.supported_formats[mime_type]
+        except Exception as e:
+            logger.error(f"Base64解码失败: {str(e)}")
+            return None
+    
+    def save_content_addressed(self, image_data: bytes, extension: str,
+                               db: Optional[Session] = None) -> str:
+        """
+        按内容哈希保存图片 (相同内容只保存一份)
+        
+        Args:
+            image_data: 图片二进制数据
+            extension: 文件扩展名 (如 .png)
+            db: 数据库会话, 传入时记录一次引用 (由调用方提交)
+            
+        Returns:
+            文件名 ({sha256}{extension})
+        """
+        tmp_path = self._tmp_path()
+        with open(tmp_path, 'wb') as f:
+            f.write(image_data)
+        
+        filename, _ = self._store_tmp_file(
+            tmp_path, hashlib.sha256(image_data).hexdigest(), extension, len(image_data), db
+        )
+        return filename
+    
+    async def save_upload(self, upload: UploadFile, extension: str, max_size: int,
+                          db: Optional[Session] = None) -> Dict[str, Any]:
+        """
+        流式保存上传文件: 分块写入临时文件, 同时计算哈希并检查大小
+        
+        Args:
+            upload: 上传文件
+            extension: 文件扩展名 (如 .png)
+            max_size: 最大允许字节数, 超出时抛出 ImageTooLargeError
+            db: 数据库会话, 传入时记录一次引用 (由调用方提交)
+            
+        Returns:
+            {"filename", "content_hash", "size", "deduplicated"}
+        """
+        tmp_path = self._tmp_path()
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(tmp_path, 'wb') as f:
+                while True:
+                    chunk = await upload.read(STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_size:
+                        raise ImageTooLargeError(f"文件大小超过限制: {max_size} 字节")
+                    digest.update(chunk)
+                    await f.write(chunk)
+        except BaseException:
+            await aiofiles.os.remove(tmp_path)
+            raise
+        
+        content_hash = digest.hexdigest()
+        # 对象存储的存在检查和上传是阻塞的网络请求, 放到线程池执行
+        filename, deduplicated = await run_in_threadpool(
+            self._store_tmp_file, tmp_path, content_hash, extension, size, db
+        )
+        return {
+            "filename": filename,
+            "content_hash": content_hash,
+            "size": size,
+            "deduplicated": deduplicated
+        }
+    
+    def _tmp_path(self) -> Path:
+        """上传目录内的临时文件 (本地存储时与目标同一文件系统, 保证原子改名)"""
+        self.upload_dir.mkdir(parents=True, exist_ok=True)
+        return self.upload_dir / f".upload.{uuid.uuid4().hex}.tmp"
+    
+    def _store_tmp_file(self, tmp_path: Path, content_hash: str, extension: str,
+                        size: int, db: Optional[Session]) -> Tuple[str, bool]:
+        """
+        将已写完的临时文件存为内容寻址文件
+        
+        Returns:
+            (文件名, 是否复用了已有文件)
+        """
+        extension = EXTENSION_ALIASES.get(extension.lower(), extension.lower())
+        filename = f"{content_hash}{extension}"
+        try:
+            if db is not None:
+                # 先登记引用, 再放置文件, 内容相同但扩展名不同时沿用已有文件名
+                width, height = self.probe_dimensions(tmp_path)
+                filename = self.acquire(
+                    db, content_hash, filename, size,
+                    mime_type=mimetypes.guess_type(filename)[0],
+                    width=width,
+                    height=height
+                )
+                # 与释放引用后的删除互斥: 删除方持锁复查时会看到本事务提交的记录而保留文件
+                _lock_file(db, filename)
+            
+            if self.backend.exists(filename):
+                tmp_path.unlink()
+                return filename, True
+            
+            # 先写临时文件再保存, 避免并发读取到半个文件
+            self.backend.put_file(filename, tmp_path, mimetypes.guess_type(filename)[0])
+            return filename, False
+        except Exception:
+            tmp_path.unlink(missing_ok=True)
+            raise
+    
+    @staticmethod
+    def probe_dimensions(file_path) -> Tuple[Optional[int], Optional[int]]:
+        """读取图片宽高 (只解析文件头, 支持路径或文件对象), 无法识别时返回 (None, None)"""
+        try:
+            from PIL import Image
+            with Image.open(file_path) as image:
+                return image.size
+        except Exception:
+            return None, None
+    
+    def acquire(self, db: Session, content_hash: str, filename: str, size: int,
+                mime_type: Optional[str] = None, width: Optional[int] = None,
+                height: Optional[int] = None) -> str:
+        """
+        增加一次图片引用 (不存在时创建目录记录), 不提交事务
+        
+        Returns:
+            实际存储的文件名
+        """
+        if db.get_bind().dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        
+        statement = insert(StoredImage).values(
+            content_hash=content_hash,
+            filename=filename,
+            size=size,
+            mime_type=mime_type,
+            width=width,
+            height=height,
+            ref_count=1
+        ).on_conflict_do_update(
+            index_elements=[StoredImage.content_hash],
+            set_={"ref_count": StoredImage.ref_count + 1, "updated_at": func.now()}
+        ).returning(StoredImage.filename)
+        return db.execute(statement).scalar_one()
+    
+    def retain_for_account(self, db: Session, filename: str) -> bool:
+        """
+        账号改用已登记的图片地址时登记引用, 不提交事务
+        上传接口已为每次上传登记一次引用: 引用计数多于账号引用记录时, 由该账号认领上传时的引用,
+        否则增加一次引用。须在 image_catalog.sync_account 之前调用。
+        
+        Returns:
+            图片已登记返回True
+        """
+        stored = db.query(StoredImage).filter(
+            StoredImage.filename == filename
+        ).with_for_update().first()
+        if stored is None:
+            return False
+        
+        account_references = db.query(func.count(ImageReference.id)).filter(
+            ImageReference.image_id == stored.id
+        ).scalar()
+        if stored.ref_count <= account_references:
+            stored.ref_count += 1
+        return True
+    
+    def release(self, db: Session, filename: str) -> bool:
+        """
+        释放一次图片引用, 计数归零时在事务提交后删除文件, 不提交事务
+        未登记的历史随机命名文件直接删除; 未登记的内容寻址文件可能被多处共用, 保留不删
+        未登记时会访问存储后端, 异步接口中通过 run_in_threadpool 调用
+        
+        Returns:
+            图片存在返回True
+        """
+        stored = db.query(StoredImage).filter(
+            StoredImage.filename == filename
+        ).with_for_update().first()
+        
+        if stored is None:
+            if not self.backend.exists(filename):
+                return False
+            if HASHED_NAME_PATTERN.match(filename):
+                logger.warning(f"图片未登记引用计数, 保留文件: {filename}")
+                return True
+        else:
+            stored.ref_count -= 1
+            if stored.ref_count > 0:
+                logger.info(f"图片引用已释放: {filename}, 剩余引用 {stored.ref_count}")
+                return True
+            db.delete(stored)
+        
+        db.info.setdefault(PENDING_DELETES_KEY, []).append((self.backend, filename))
+        return True
+    
     def save_uploaded_file(self, file_data: bytes, filename: str) -> Optional[str]:
         """
         保存上传的文件
@@ -110,11 +438,12 @@ class ImageStorageService:
             
             # 生成唯一文件名
             new_filename = f"upload_{uuid.uuid4().hex}{ext}"
-            file_path = self.upload_dir / new_filename
+            tmp_path = self._tmp_path()
             
             # 保存文件
-            with open(file_path, 'wb') as f:
+            with open(tmp_path, 'wb') as f:
                 f.write(file_data)
+            self.backend.put_file(new_filename, tmp_path, mimetypes.guess_type(new_filename)[0])
             
             # 返回相对路径
             relative_path = f"uploads/images/{new_filename}"
@@ -139,9 +468,14 @@ class ImageStorageService:
             # 构建完整路径
             if image_path.startswith('uploads/images/'):
                 filename = image_path.replace('uploads/images/', '')
-                file_path = self.upload_dir / filename
-            else:
-                file_path = Path(image_path)
+                if self.backend.exists(filename):
+                    self.backend.delete(filename)
+                    logger.info(f"图片删除成功: {image_path}")
+                    return True
+                logger.warning(f"图片文件不存在: {image_path}")
+                return False
+            
+            file_path = Path(image_path)
             
             # 检查文件是否存在
             if file_path.exists() and file_path.is_file():
@@ -170,23 +504,22 @@ class ImageStorageService:
             # 构建完整路径
             if image_path.startswith('uploads/images/'):
                 filename = image_path.replace('uploads/images/', '')
-                file_path = self.upload_dir / filename
             else:
-                file_path = Path(image_path)
+                filename = Path(image_path).name
             
-            if not file_path.exists():
+            object_stat = self.backend.stat(filename)
+            if not object_stat:
                 return None
             
             # 获取文件信息
-            stat = file_path.stat()
-            mime_type, _ = mimetypes.guess_type(str(file_path))
+            mime_type, _ = mimetypes.guess_type(filename)
             
             return {
                 'path': image_path,
-                'size': stat.st_size,
+                'size': object_stat.size,
                 'mime_type': mime_type,
-                'created_at': stat.st_ctime,
-                'modified_at': stat.st_mtime
+                'created_at': object_stat.raw.st_ctime if object_stat.raw else object_stat.mtime,
+                'modified_at': object_stat.mtime
             }
             
         except Exception as e:
@@ -0,0 +1,127 @@
+"""
+链接过期清理服务
+Background link expiry sweeper
+
+链接过期原本只在访问时由 AccountLink.is_access_allowed 判断, status 会一直保持
+unused/used。清理任务定期按 expires_at 索引分批找出已过期但未标记的链接,
+批量改为 expired, 并通知、断开这些链接的客户端 WebSocket 连接。
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import and_, or_, select, update
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models.account_link import AccountLink
+from .metrics import SWEEP_DURATION, observe_duration
+
+logger = logging.getLogger(__name__)
+
+
+def expired_pending_clause(now: datetime):
+    """已过期但尚未标记为 expired 的链接 (按 expires_at 索引范围扫描)"""
+    return and_(
+        AccountLink.expires_at < now,
+        or_(AccountLink.status.is_(None), AccountLink.status != "expired")
+    )
+
+
+class LinkExpirySweeper:
+    """链接过期清理器"""
+
+    def __init__(self):
+        self.running = False
+        self.task = None
+
+    async def start(self):
+        """启动清理任务"""
+        if self.running or not settings.link_expiry_sweep_enabled:
+            return
+
+        self.running = True
+        self.task = asyncio.create_task(self._sweep_loop())
+        logger.info("链接过期清理任务已启动")
+
+    async def stop(self):
+        """停止清理任务"""
+        self.running = False
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        logger.info("链接过期清理任务已停止")
+
+    async def _sweep_loop(self):
+        """清理循环"""
+        while self.running:
+            try:
+                await self.sweep()
+                await asyncio.sleep(settings.link_expiry_sweep_interval)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"链接过期清理异常: {e}")
+                await asyncio.sleep(60)
+
+    def _expire_batch(self, now: datetime, batch_size: int) -> List[str]:
+        """将一批已过期链接标记为 expired 并提交, 返回这批链接ID"""
+        db = SessionLocal()
+        try:
+            # 多实例同时清理时跳过已被锁定的行
+            batch = select(AccountLink.id).where(expired_pending_clause(now)).order_by(
+                AccountLink.expires_at
+            ).limit(batch_size).with_for_update(skip_locked=True)
+
+            link_ids = db.execute(
+                update(AccountLink)
+                .where(AccountLink.id.in_(batch.scalar_subquery()))
+                .values(status="expired")
+                .returning(AccountLink.link_id)
+                .execution_options(synchronize_session=False)
+            ).scalars().all()
+            db.commit()
+            return list(link_ids)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def run_once(self, batch_size: Optional[int] = None) -> List[str]:
+        """
+        标记所有已过期的链接 (每批单独提交)
+
+        Returns:
+            本次标记为过期的链接ID
+        """
+        batch_size = batch_size or settings.link_expiry_batch_size
+        now = datetime.now(timezone.utc)
+        expired: List[str] = []
+        while True:
+            link_ids = self._expire_batch(now, batch_size)
+            expired.extend(link_ids)
+            if len(link_ids) < batch_size:
+                break
+
+        if expired:
+            logger.info(f"链接过期清理完成: 标记 {len(expired)} 个过期链接")
+        return expired
+
+    async def sweep(self) -> List[str]:
+        """执行一次清理并断开过期链接的客户端连接"""
+        with observe_duration(SWEEP_DURATION, task="link_expiry"):
+            expired = await asyncio.to_thread(self.run_once)
+        if expired:
+            from ..websocket import manager
+            await manager.close_link_connections(expired)
+        return expired
+
+
+# 全局链接过期清理实例
+link_expiry_sweeper = LinkExpirySweeper()
@@ -0,0 +1,204 @@
+"""
+链接批量生成服务
+Bulk account link generation
+
+- 链接ID一次性批量生成: 一次读取 16*N 字节随机数, 按表设置 UUID4 版本位后整体转十六进制
+- PostgreSQL (psycopg2) 使用 COPY 写入, 其他数据库使用多行 INSERT
+- 数量较大时作为后台任务分批写入并提交, 进度通过管理端 WebSocket 推送,
+  完成后可下载生成的链接
+"""
+
+import asyncio
+import csv
+import io
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models.account_link import AccountLink
+from .background_jobs import background_jobs
+
+logger = logging.getLogger(__name__)
+
+# UUID4 版本位和变体位的转换表 (字节按位设置, 可对整段数据一次 translate)
+_UUID4_VERSION_TABLE = bytes((value & 0x0F) | 0x40 for value in range(256))
+_UUID4_VARIANT_TABLE = bytes((value & 0x3F) | 0x80 for value in range(256))
+
+# COPY 写入的列 (created_at / updated_at 使用数据库默认值)
+COPY_COLUMNS = (
+    "account_id", "device_id", "link_id", "link_url", "status", "is_active",
+    "max_access_count", "max_verification_count", "verification_interval",
+    "access_session_interval", "verification_wait_time",
+    "access_count", "verification_count", "expires_at",
+)
+
+
+def generate_link_ids(count: int) -> List[str]:
+    """
+    批量生成链接ID (与 str(uuid.uuid4()) 格式相同)
+
+    一次读取全部随机字节并整体设置版本位, 避免逐个创建 UUID 对象
+    """
+    raw = bytearray(os.urandom(16 * count))
+    raw[6::16] = raw[6::16].translate(_UUID4_VERSION_TABLE)
+    raw[8::16] = raw[8::16].translate(_UUID4_VARIANT_TABLE)
+    hexed = raw.hex()
+    return [
+        f"{hexed[i:i + 8]}-{hexed[i + 8:i + 12]}-{hexed[i + 12:i + 16]}-{hexed[i + 16:i + 20]}-{hexed[i + 20:i + 32]}"
+        for i in range(0, len(hexed), 32)
+    ]
+
+
+def link_url(link_id: str) -> str:
+    """链接地址 (相对路径, 由前端拼接域名)"""
+    return f"/customer/{link_id}"
+
+
+@dataclass
+class LinkBatchParams:
+    """批量生成链接的参数"""
+    account_id: int
+    device_id: int
+    max_access_count: int = 5
+    max_verification_count: int = 5
+    access_session_interval: int = 5
+    verification_wait_time: int = 0
+    expires_at: Optional[datetime] = None
+
+    def rows(self, link_ids: List[str]) -> List[Dict[str, Any]]:
+        """构建插入行"""
+        return [
+            {
+                "account_id": self.account_id,
+                "device_id": self.device_id,
+                "link_id": link_id,
+                "link_url": link_url(link_id),
+                "status": "unused",
+                "is_active": True,
+                "max_access_count": self.max_access_count,
+                "max_verification_count": self.max_verification_count,
+                "verification_interval": 10,  # 使用固定的防滥用间隔（10秒）
+                "access_session_interval": self.access_session_interval,
+                "verification_wait_time": self.verification_wait_time,
+                "access_count": 0,
+                "verification_count": 0,
+                "expires_at": self.expires_at,
+            }
+            for link_id in link_ids
+        ]
+
+
+class LinkGenerator:
+    """链接批量生成服务"""
+
+    @staticmethod
+    def _copy_rows(db: Session, rows: List[Dict[str, Any]]):
+        """使用 PostgreSQL COPY 写入 (在当前事务中执行)"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([
+                "" if row[column] is None
+                else ("t" if row[column] else "f") if isinstance(row[column], bool)
+                else row[column].isoformat() if isinstance(row[column], datetime)
+                else row[column]
+                for column in COPY_COLUMNS
+            ])
+        buffer.seek(0)
+
+        cursor = db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {AccountLink.__tablename__} ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+        finally:
+            cursor.close()
+
+    def insert_links(self, db: Session, params: LinkBatchParams, count: int) -> List[str]:
+        """
+        写入一批链接 (不提交事务)
+
+        Returns:
+            生成的链接ID列表
+        """
+        link_ids = generate_link_ids(count)
+        rows = params.rows(link_ids)
+        bind = db.get_bind()
+        if bind.dialect.name == "postgresql" and bind.dialect.driver == "psycopg2":
+            self._copy_rows(db, rows)
+        else:
+            db.execute(insert(AccountLink), rows)
+        return link_ids
+
+    def create_links(self, db: Session, params: LinkBatchParams, count: int) -> List[AccountLink]:
+        """
+        写入链接并返回完整的链接对象 (多行 INSERT ... RETURNING, 不提交事务)
+
+        用于需要返回链接详情的小批量创建
+        """
+        rows = params.rows(generate_link_ids(count))
+        return list(db.scalars(insert(AccountLink).returning(AccountLink), rows))
+
+
+class LinkGenerationJobs:
+    """大批量链接生成的后台任务"""
+
+    job_type = "link_generation"
+
+    def _insert_batch(self, params: LinkBatchParams, count: int) -> List[str]:
+        """在独立会话中写入并提交一批链接"""
+        db = SessionLocal()
+        try:
+            link_ids = link_generator.insert_links(db, params, count)
+            db.commit()
+            return link_ids
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def start(self, params: LinkBatchParams, count: int) -> Dict[str, Any]:
+        """启动后台生成任务 (每批单独提交), 返回任务状态"""
+        job = background_jobs.create(
+            self.job_type,
+            account_id=params.account_id,
+            device_id=params.device_id,
+            total=count,
+            created=0
+        )
+        link_ids: List[str] = []
+        background_jobs.results[job["job_id"]] = link_ids
+        batch_size = max(1, settings.link_bulk_batch_size)
+
+        async def runner(job: Dict[str, Any]):
+            while job["created"] < job["total"]:
+                batch = min(batch_size, job["total"] - job["created"])
+                link_ids.extend(await asyncio.to_thread(self._insert_batch, params, batch))
+                job["created"] = len(link_ids)
+                await background_jobs.notify(job)
+            logger.info(f"批量生成链接完成: 任务 {job['job_id']}, 账号ID {params.account_id}, 数量 {job['created']}")
+
+        background_jobs.run(job, runner)
+        logger.info(f"批量生成链接任务已启动: {job['job_id']}, 数量 {count}")
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return background_jobs.get(job_id, self.job_type)
+
+    def get_link_ids(self, job_id: str) -> List[str]:
+        """任务已生成的链接ID (任务运行中时为当前已提交的部分)"""
+        return list(background_jobs.results.get(job_id, []))
+
+
+# 全局链接生成服务和任务实例
+link_generator = LinkGenerator()
+link_generation_jobs = LinkGenerationJobs()
@@ -0,0 +1,133 @@
+"""
+链接配额服务
+Atomic link quota enforcement
+
+访问次数和验证码获取次数通过单条条件更新原子地检查并递增:
+    UPDATE account_links SET verification_count = verification_count + 1
+    WHERE id = :id AND <链接可用> AND verification_count < max_verification_count
+    RETURNING ...
+
+- 配额在数据库中判断, 并发请求不会超出上限 (不再先读后写)
+- 行锁只在这条语句到提交之间持有, 不再贯穿整个请求
+- 快照读取时已不可用的链接由调用方直接拒绝, 不执行任何写操作
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import and_, case, or_, update
+from sqlalchemy.engine import RowMapping
+from sqlalchemy.orm import Session
+
+from ..models.account_link import AccountLink
+
+# 条件更新后返回的最新计数
+RETURNING_COLUMNS = (
+    AccountLink.id,
+    AccountLink.access_count,
+    AccountLink.max_access_count,
+    AccountLink.verification_count,
+    AccountLink.max_verification_count,
+    AccountLink.last_access_time,
+    AccountLink.last_verification_time,
+    AccountLink.status,
+)
+
+
+def _within_quota(count, maximum):
+    """SQL条件: 未达上限 (上限为0表示不限制)"""
+    return or_(maximum <= 0, count < maximum)
+
+
+def access_allowed_clause(now: datetime):
+    """与 AccountLink.is_access_allowed 等价的SQL条件"""
+    return and_(
+        AccountLink.is_active.is_(True),
+        or_(AccountLink.status.is_(None), AccountLink.status != "expired"),
+        or_(AccountLink.expires_at.is_(None), AccountLink.expires_at >= now),
+        _within_quota(AccountLink.access_count, AccountLink.max_access_count),
+    )
+
+
+def verification_allowed_clause(now: datetime):
+    """与 AccountLink.is_verification_allowed 等价的SQL条件"""
+    return and_(
+        access_allowed_clause(now),
+        _within_quota(AccountLink.verification_count, AccountLink.max_verification_count),
+    )
+
+
+def is_new_access_session(link: AccountLink, now: Optional[datetime] = None) -> bool:
+    """距上次访问是否已超过访问会话间隔 (间隔内的重复访问不计次)"""
+    if not link.last_access_time:
+        return True
+    now = now or datetime.now(timezone.utc)
+    session_interval_seconds = (link.access_session_interval or 5) * 60
+    return (now - link.last_access_time).total_seconds() >= session_interval_seconds
+
+
+class LinkQuotaService:
+    """链接配额服务"""
+
+    @staticmethod
+    def _execute(db: Session, link_pk: int, condition, values: dict) -> Optional[RowMapping]:
+        statement = update(AccountLink).where(
+            AccountLink.id == link_pk, condition
+        ).values(**values).returning(*RETURNING_COLUMNS).execution_options(synchronize_session=False)
+        return db.execute(statement).mappings().first()
+
+    def consume_access(self, db: Session, link_pk: int, session_interval: Optional[int] = None,
+                       client_ip: Optional[str] = None, user_agent: Optional[str] = None,
+                       mark_used: bool = False) -> Optional[RowMapping]:
+        """
+        原子地检查访问配额并记录一次访问 (由调用方提交)
+
+        Args:
+            link_pk: 链接主键
+            session_interval: 访问会话间隔 (分钟); 指定时, 间隔内的重复访问不计次,
+                并发的首次访问只计一次
+            client_ip / user_agent: 同时记录的访问来源
+            mark_used: 是否将未使用的链接标记为已使用
+
+        Returns:
+            更新后的计数; 链接不可用或访问次数已达上限时返回None
+        """
+        now = datetime.now(timezone.utc)
+        values = {}
+
+        if session_interval:
+            new_session = or_(
+                AccountLink.last_access_time.is_(None),
+                AccountLink.last_access_time <= now - timedelta(minutes=session_interval)
+            )
+            values["access_count"] = AccountLink.access_count + case((new_session, 1), else_=0)
+            values["last_access_time"] = case((new_session, now), else_=AccountLink.last_access_time)
+        else:
+            values["access_count"] = AccountLink.access_count + 1
+            values["last_access_time"] = now
+
+        if client_ip is not None:
+            values["last_ip"] = client_ip[:45]
+        if user_agent is not None:
+            values["last_user_agent"] = user_agent[:500]
+        if mark_used:
+            values["status"] = case((AccountLink.status == "unused", "used"), else_=AccountLink.status)
+
+        return self._execute(db, link_pk, access_allowed_clause(now), values)
+
+    def consume_verification(self, db: Session, link_pk: int) -> Optional[RowMapping]:
+        """
+        原子地检查验证码配额并记录一次获取 (由调用方提交)
+
+        Returns:
+            更新后的计数; 链接不可用或验证码获取次数已达上限时返回None
+        """
+        now = datetime.now(timezone.utc)
+        return self._execute(db, link_pk, verification_allowed_clause(now), {
+            "verification_count": AccountLink.verification_count + 1,
+            "last_verification_time": now,
+        })
+
+
+# 全局链接配额服务实例
+link_quota = LinkQuotaService()
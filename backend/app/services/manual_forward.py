@@ -0,0 +1,256 @@
+"""
+手动转发任务服务
+Manual SMS forwarding as chunked background jobs
+
+手动转发 (按规则转发设备的全部短信 / 转发单条短信到所有客户链接) 作为后台任务执行:
+- 读取会话使用服务端游标 (yield_per) 按块读取短信或链接, 只取需要的列;
+  规则条件下推到SQL, 只读取候选短信
+- 每块在 Python 中匹配规则后, 批量插入转发日志并单独提交, 事务和内存占用与数据量无关
+- 进度通过管理端 WebSocket 推送, 接口立即返回任务ID
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+from sqlalchemy import func, insert, select, update
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models.account import Account
+from ..models.account_link import AccountLink
+from ..models.sms import SMS
+from ..models.sms_rule import SMSRule, SmsForwardLog
+from .background_jobs import background_jobs
+from .rule_predicates import compile_rules
+
+logger = logging.getLogger(__name__)
+
+# 每条 INSERT 写入的转发日志行数 (匹配短信数 × 链接数可能很大, 分段写入)
+LOG_INSERT_BATCH_SIZE = 5000
+
+
+def _insert_logs(db, logs: List[Dict[str, Any]]) -> int:
+    """分段批量插入转发日志 (不提交事务)"""
+    for start in range(0, len(logs), LOG_INSERT_BATCH_SIZE):
+        db.execute(insert(SmsForwardLog), logs[start:start + LOG_INSERT_BATCH_SIZE])
+    return len(logs)
+
+
+class ManualForwardJobs:
+    """手动转发后台任务"""
+
+    rule_job_type = "manual_forward_rule"
+    sms_job_type = "manual_forward_sms"
+
+    @staticmethod
+    def _notify_threadsafe(loop: asyncio.AbstractEventLoop, job: Dict[str, Any]):
+        """从工作线程推送进度 (不等待发送完成)"""
+        asyncio.run_coroutine_threadsafe(background_jobs.notify(job), loop)
+
+    # ------------------------------------------------------------------
+    # 按规则转发设备短信
+    # ------------------------------------------------------------------
+
+    def start_rule_forward(self, rule_id: int, account_id: int, device_id: int,
+                           total_sms: int, total_links: int) -> Dict[str, Any]:
+        """启动按规则转发任务, 返回任务状态"""
+        job = background_jobs.create(
+            self.rule_job_type,
+            rule_id=rule_id,
+            account_id=account_id,
+            total=total_sms,
+            processed=0,
+            matched_sms_count=0,
+            forwarded_links_count=total_links,
+            success_links_count=0,
+            logs_written=0
+        )
+
+        async def runner(job: Dict[str, Any]):
+            loop = asyncio.get_running_loop()
+            await asyncio.to_thread(self._forward_by_rule, job, loop, rule_id, account_id, device_id)
+
+        background_jobs.run(job, runner)
+        logger.info(f"规则手动转发任务已启动: {job['job_id']}, Rule ID {rule_id}, 短信 {total_sms} 条")
+        return job
+
+    def _forward_by_rule(self, job: Dict[str, Any], loop: asyncio.AbstractEventLoop,
+                         rule_id: int, account_id: int, device_id: int):
+        """在工作线程中执行按规则转发"""
+        from ..api.sms import match_sms_with_rules_single, push_sms_to_client_link
+
+        started_at = datetime.now(timezone.utc)
+        chunk_size = max(1, settings.manual_forward_chunk_size)
+        # 读取会话只读不提交, 服务端游标贯穿整个任务; 写入会话按块提交
+        reader = SessionLocal()
+        writer = SessionLocal()
+        try:
+            rule = reader.get(SMSRule, rule_id)
+            account = reader.get(Account, account_id)
+            links = reader.query(AccountLink).filter(AccountLink.account_id == account_id).all()
+            link_pks = [link.id for link in links]
+            display_count = rule.display_count if rule.display_count else 10
+            latest_matched = []
+
+            # 规则条件下推到SQL, 只读取候选短信 (进度总数改为候选短信数)
+            condition, exact = compile_rules([rule], reader.get_bind().dialect.name)
+            conditions = [SMS.device_id == device_id]
+            if condition is not None:
+                conditions.append(condition)
+                job["total"] = reader.scalar(select(func.count()).select_from(SMS).where(*conditions))
+
+            # 按时间倒序读取, 最先匹配到的即为推送给客户端的最新短信
+            statement = select(
+                SMS.id, SMS.sender, SMS.content, SMS.sms_timestamp, SMS.category
+            ).where(*conditions).order_by(
+                SMS.sms_timestamp.desc(), SMS.id.desc()
+            ).execution_options(yield_per=chunk_size)
+
+            for chunk in reader.execute(statement).partitions():
+                matched = list(chunk) if exact else match_sms_with_rules_single(chunk, rule)
+                if matched:
+                    now = datetime.now(timezone.utc)
+                    job["logs_written"] += _insert_logs(writer, [
+                        {
+                            "sms_id": sms.id,
+                            "rule_id": rule_id,
+                            "target_type": "link",
+                            "target_id": link_pk,
+                            "status": "success",
+                            "forwarded_at": now
+                        }
+                        for link_pk in link_pks
+                        for sms in matched
+                    ])
+                    # 更新规则匹配统计 (原子递增, 与块一起提交)
+                    writer.execute(update(SMSRule).where(SMSRule.id == rule_id).values(
+                        match_count=SMSRule.match_count + len(matched),
+                        last_match_time=now
+                    ))
+                    writer.commit()
+                    latest_matched.extend(matched[:display_count - len(latest_matched)])
+
+                job["processed"] += len(chunk)
+                job["matched_sms_count"] += len(matched)
+                self._notify_threadsafe(loop, job)
+
+            if not latest_matched:
+                logger.info(f"规则手动转发完成: Rule ID {rule_id}, 没有匹配的短信")
+                return
+
+            # 将最新的匹配短信推送到客户端链接
+            pushed_pks = []
+            for link in links:
+                try:
+                    asyncio.run_coroutine_threadsafe(
+                        push_sms_to_client_link(link, latest_matched, account, rule, reader), loop
+                    ).result()
+                    pushed_pks.append(link.id)
+                except Exception as e:
+                    logger.error(f"转发到链接 {link.link_id} 失败: {str(e)}")
+                    # 本任务写入的该链接日志改为失败
+                    writer.execute(update(SmsForwardLog).where(
+                        SmsForwardLog.rule_id == rule_id,
+                        SmsForwardLog.target_id == link.id,
+                        SmsForwardLog.forwarded_at >= started_at
+                    ).values(status="failed", error_message=str(e)).execution_options(synchronize_session=False))
+
+            now = datetime.now(timezone.utc)
+            for start in range(0, len(pushed_pks), LOG_INSERT_BATCH_SIZE):
+                writer.execute(update(AccountLink).where(
+                    AccountLink.id.in_(pushed_pks[start:start + LOG_INSERT_BATCH_SIZE])
+                ).values(last_access_time=now).execution_options(synchronize_session=False))
+            writer.commit()
+            job["success_links_count"] = len(pushed_pks)
+
+            logger.info(
+                f"规则手动转发完成: Rule ID {rule_id}, 匹配短信 {job['matched_sms_count']} 条, "
+                f"成功转发到 {len(pushed_pks)}/{len(links)} 个链接"
+            )
+        except Exception:
+            writer.rollback()
+            raise
+        finally:
+            reader.close()
+            writer.close()
+
+    # ------------------------------------------------------------------
+    # 单条短信转发到所有客户链接
+    # ------------------------------------------------------------------
+
+    def start_sms_forward(self, sms_id: int, account_id: int, rule_ids: List[int],
+                          total_links: int) -> Dict[str, Any]:
+        """启动单条短信转发任务 (已匹配的规则 × 账号的全部链接), 返回任务状态"""
+        job = background_jobs.create(
+            self.sms_job_type,
+            sms_id=sms_id,
+            account_id=account_id,
+            matched_rules_count=len(rule_ids),
+            total=total_links,
+            processed=0,
+            logs_written=0
+        )
+
+        async def runner(job: Dict[str, Any]):
+            loop = asyncio.get_running_loop()
+            await asyncio.to_thread(self._forward_sms, job, loop, sms_id, account_id, rule_ids)
+
+        background_jobs.run(job, runner)
+        logger.info(f"短信手动转发任务已启动: {job['job_id']}, SMS ID {sms_id}, 链接 {total_links} 个")
+        return job
+
+    def _forward_sms(self, job: Dict[str, Any], loop: asyncio.AbstractEventLoop,
+                     sms_id: int, account_id: int, rule_ids: List[int]):
+        """在工作线程中按块读取链接并写入转发日志"""
+        chunk_size = max(1, settings.manual_forward_chunk_size)
+        reader = SessionLocal()
+        writer = SessionLocal()
+        try:
+            # 更新规则匹配统计
+            writer.execute(update(SMSRule).where(SMSRule.id.in_(rule_ids)).values(
+                match_count=SMSRule.match_count + 1,
+                last_match_time=datetime.now(timezone.utc)
+            ))
+
+            statement = select(AccountLink.id).where(
+                AccountLink.account_id == account_id
+            ).order_by(AccountLink.id).execution_options(yield_per=chunk_size)
+
+            for chunk in reader.execute(statement).partitions():
+                now = datetime.now(timezone.utc)
+                job["logs_written"] += _insert_logs(writer, [
+                    {
+                        "sms_id": sms_id,
+                        "rule_id": rule_id,
+                        "target_type": "link",
+                        "target_id": link_pk,
+                        "status": "success",  # 假设转发成功
+                        "forwarded_at": now
+                    }
+                    for rule_id in rule_ids
+                    for (link_pk,) in chunk
+                ])
+                writer.commit()
+                job["processed"] += len(chunk)
+                self._notify_threadsafe(loop, job)
+
+            writer.commit()
+            logger.info(f"手动转发短信成功: SMS ID {sms_id}, 匹配规则 {len(rule_ids)} 个, 转发链接 {job['processed']} 个")
+        except Exception:
+            writer.rollback()
+            raise
+        finally:
+            reader.close()
+            writer.close()
+
+    def get(self, job_id: str):
+        job = background_jobs.get(job_id)
+        if job and job["job_type"] in (self.rule_job_type, self.sms_job_type):
+            return job
+        return None
+
+
+# 全局手动转发任务实例
+manual_forward_jobs = ManualForwardJobs()
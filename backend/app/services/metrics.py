@@ -0,0 +1,200 @@
+"""
+Prometheus 指标服务
+Prometheus-compatible metrics
+
+- 指标在热点路径上只做计数/观测 (微秒级), 导出格式由 prometheus_client 生成
+- 设置 METRICS_MULTIPROC_DIR 时使用多进程模式, 多个 worker 的指标在 /metrics 中合并
+- 未安装 prometheus_client 时所有指标操作为空操作, /metrics 返回 503
+"""
+
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# 多进程模式需在导入 prometheus_client 之前设置目录
+if settings.metrics_multiproc_dir:
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", settings.metrics_multiproc_dir)
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+    )
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+MULTIPROCESS = PROMETHEUS_AVAILABLE and bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+# 接口耗时分桶 (秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 后台/批量操作耗时分桶 (秒)
+TASK_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 120.0)
+# 每个请求的查询数分桶
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+
+class _NoopMetric:
+    """未安装 prometheus_client 时使用的空指标"""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount: float = 1):
+        pass
+
+    def dec(self, amount: float = 1):
+        pass
+
+    def set(self, value: float):
+        pass
+
+    def observe(self, value: float):
+        pass
+
+
+def _metric(kind: str, name: str, documentation: str, labelnames=(), **kwargs):
+    if not PROMETHEUS_AVAILABLE or not settings.metrics_enabled:
+        return _NoopMetric()
+    if kind == "counter":
+        return Counter(name, documentation, labelnames)
+    if kind == "histogram":
+        return Histogram(name, documentation, labelnames, **kwargs)
+    # 多进程模式下 Gauge 按存活进程求和
+    return Gauge(name, documentation, labelnames, multiprocess_mode="livesum", **kwargs)
+
+
+# ----------------------------------------------------------------------
+# 指标定义
+# ----------------------------------------------------------------------
+
+HTTP_REQUEST_DURATION = _metric(
+    "histogram", "http_request_duration_seconds", "HTTP请求耗时 (按路由模板)",
+    ("method", "route", "status"), buckets=LATENCY_BUCKETS
+)
+DB_QUERIES_PER_REQUEST = _metric(
+    "histogram", "db_queries_per_request", "每个请求执行的SQL数",
+    ("route",), buckets=QUERY_COUNT_BUCKETS
+)
+DB_TIME_PER_REQUEST = _metric(
+    "histogram", "db_time_per_request_seconds", "每个请求的SQL总耗时",
+    ("route",), buckets=LATENCY_BUCKETS
+)
+DB_POOL_CHECKED_OUT = _metric("gauge", "db_pool_checked_out_connections", "已借出的数据库连接数")
+DB_POOL_CAPACITY = _metric("gauge", "db_pool_capacity_connections", "数据库连接池容量 (pool_size + max_overflow)")
+
+WEBSOCKET_CONNECTIONS = _metric("gauge", "websocket_connections", "WebSocket连接数", ("user_type",))
+WEBSOCKET_PENDING_SENDS = _metric("gauge", "websocket_pending_sends", "正在发送中的WebSocket消息数 (发送队列深度)")
+WEBSOCKET_BROADCAST_DURATION = _metric(
+    "histogram", "websocket_broadcast_duration_seconds", "WebSocket广播耗时",
+    ("user_type",), buckets=TASK_BUCKETS
+)
+
+SMS_INGESTED = _metric("counter", "sms_ingested_total", "上传的短信数 (按来源和结果, 用于计算去重比例)", ("source", "result"))
+RULE_MATCH_DURATION = _metric(
+    "histogram", "sms_rule_match_duration_seconds", "短信规则匹配耗时",
+    ("operation",), buckets=TASK_BUCKETS
+)
+CODE_EXTRACTION_DURATION = _metric(
+    "histogram", "verification_code_extraction_duration_seconds", "验证码提取耗时",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1)
+)
+FORWARD_LAG = _metric(
+    "histogram", "sms_forward_lag_seconds", "短信入库到开始转发的延迟",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 120.0)
+)
+FORWARD_DURATION = _metric("histogram", "sms_forward_duration_seconds", "单条短信转发耗时", buckets=TASK_BUCKETS)
+SWEEP_DURATION = _metric(
+    "histogram", "background_sweep_duration_seconds", "后台巡检任务单次耗时",
+    ("task",), buckets=TASK_BUCKETS
+)
+
+
+@contextmanager
+def observe_duration(metric, **labels):
+    """记录代码块耗时"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        (metric.labels(**labels) if labels else metric).observe(time.perf_counter() - started)
+
+
+# ----------------------------------------------------------------------
+# 请求级SQL统计
+# ----------------------------------------------------------------------
+
+class RequestDbStats:
+    """一个请求内的SQL统计 (由引擎事件累加)"""
+
+    __slots__ = ("count", "duration")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+# 当前请求的SQL统计; 线程池中执行的同步代码会复制上下文, 累加到同一对象
+current_db_stats: ContextVar[Optional[RequestDbStats]] = ContextVar("current_db_stats", default=None)
+
+
+def instrument_engine(engine):
+    """注册引擎事件: 请求级SQL计数/耗时, 连接池借出数"""
+    if not PROMETHEUS_AVAILABLE or not settings.metrics_enabled:
+        return
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["metrics_query_start"].pop()
+        stats = current_db_stats.get()
+        if stats is not None:
+            stats.count += 1
+            stats.duration += time.perf_counter() - started
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("metrics_query_start"):
+            connection.info["metrics_query_start"].pop()
+
+    @event.listens_for(engine.pool, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_CHECKED_OUT.inc()
+
+    @event.listens_for(engine.pool, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        DB_POOL_CHECKED_OUT.dec()
+
+    if engine.dialect.name != "sqlite":
+        DB_POOL_CAPACITY.set(settings.db_pool_size + settings.db_max_overflow)
+
+
+# ----------------------------------------------------------------------
+# 导出
+# ----------------------------------------------------------------------
+
+def render_latest() -> bytes:
+    """生成 Prometheus 文本格式的指标 (多进程模式下合并所有 worker)"""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
+
+
+def mark_process_dead():
+    """worker 退出时清理多进程模式下该进程的 Gauge 数据"""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,334 @@
+"""
+短信表分区管理服务
+SMS table partition management service
+
+在 PostgreSQL 上将 sms / sms_forward_logs 按月声明式分区:
+- 自动预建未来月份分区, 并保留 DEFAULT 分区兜底
+- 按时间过滤的查询可触发分区裁剪
+- 过期数据通过 DETACH + DROP 整个分区以 O(1) 代价删除
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from ..config import settings
+from ..database import engine, is_sms_partitioning_enabled
+
+logger = logging.getLogger(__name__)
+
+# 分区表 -> 分区键
+PARTITIONED_TABLES = {
+    "sms": "sms_timestamp",
+    "sms_forward_logs": "created_at",
+}
+
+
+def _month_start(value: datetime) -> datetime:
+    """取所在月份的第一天 (UTC)"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    value = value.astimezone(timezone.utc)
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _add_months(value: datetime, months: int) -> datetime:
+    """月份加减"""
+    month_index = value.year * 12 + (value.month - 1) + months
+    return value.replace(year=month_index // 12, month=month_index % 12 + 1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    """分区命名: sms_p2024_01"""
+    return f"{table}_p{month.year:04d}_{month.month:02d}"
+
+
+class PartitionManager:
+    """短信分区管理器"""
+
+    def __init__(self):
+        self.running = False
+        self.task = None
+
+    async def start(self):
+        """启动分区维护"""
+        if self.running or not is_sms_partitioning_enabled():
+            return
+
+        self.running = True
+        self.task = asyncio.create_task(self._maintenance_loop())
+        logger.info("短信分区维护任务已启动")
+
+    async def stop(self):
+        """停止分区维护"""
+        self.running = False
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        logger.info("短信分区维护任务已停止")
+
+    async def _maintenance_loop(self):
+        """维护循环: 定期预建未来分区"""
+        while self.running:
+            try:
+                await asyncio.to_thread(self.ensure_partitions)
+                await asyncio.sleep(settings.partition_maintenance_interval)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"短信分区维护异常: {e}")
+                await asyncio.sleep(60)
+
+    # ------------------------------------------------------------------
+    # 分区查询
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def is_partitioned(conn: Connection, table: str) -> bool:
+        """检查表是否已是分区表"""
+        relkind = conn.execute(
+            text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"),
+            {"table": table}
+        ).scalar()
+        return relkind == "p"
+
+    @staticmethod
+    def _list_partitions(conn: Connection, table: str) -> List[Dict[str, Any]]:
+        """列出某张表的全部分区"""
+        rows = conn.execute(text("""
+            SELECT c.relname AS name,
+                   pg_get_expr(c.relpartbound, c.oid) AS bound,
+                   COALESCE(s.n_live_tup, 0) AS estimated_rows,
+                   pg_total_relation_size(c.oid) AS size_bytes
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+            WHERE i.inhparent = to_regclass(:table)
+            ORDER BY c.relname
+        """), {"table": table}).mappings().all()
+        return [dict(row) for row in rows]
+
+    def list_partitions(self) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        获取分区列表
+        Get partitions of all partitioned tables
+        """
+        with engine.connect() as conn:
+            return {
+                table: self._list_partitions(conn, table)
+                for table in PARTITIONED_TABLES
+                if self.is_partitioned(conn, table)
+            }
+
+    # ------------------------------------------------------------------
+    # 分区创建
+    # ------------------------------------------------------------------
+
+    def _create_month_partition(self, conn: Connection, table: str, key: str, month: datetime) -> bool:
+        """
+        创建单个月份分区, 已存在时跳过
+        若 DEFAULT 分区中已有该月数据, 先迁出再 ATTACH, 避免分区约束冲突
+        """
+        name = partition_name(table, month)
+        if conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar():
+            return False
+
+        lower = month.isoformat()
+        upper = _add_months(month, 1).isoformat()
+        default_name = f"{table}_default"
+
+        has_default_rows = False
+        if conn.execute(text("SELECT to_regclass(:name)"), {"name": default_name}).scalar():
+            has_default_rows = conn.execute(text(
+                f"SELECT EXISTS (SELECT 1 FROM {default_name} WHERE {key} >= :lower AND {key} < :upper)"
+            ), {"lower": lower, "upper": upper}).scalar()
+
+        if not has_default_rows:
+            conn.execute(text(
+                f"CREATE TABLE {name} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+            ))
+        else:
+            conn.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)"))
+            conn.execute(text(f"""
+                WITH moved AS (
+                    DELETE FROM {default_name}
+                    WHERE {key} >= :lower AND {key} < :upper
+                    RETURNING *
+                )
+                INSERT INTO {name} SELECT * FROM moved
+            """), {"lower": lower, "upper": upper})
+            conn.execute(text(
+                f"ALTER TABLE {table} ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+            ))
+            logger.info(f"已从 {default_name} 迁出数据到新分区 {name}")
+
+        logger.info(f"创建分区: {name} [{lower}, {upper})")
+        return True
+
+    def _ensure_table_partitions(self, conn: Connection, table: str, key: str,
+                                 start: datetime, end: datetime) -> List[str]:
+        """为 [start, end] 范围内的每个月份创建分区, 并确保 DEFAULT 分区存在"""
+        created = []
+
+        month = _month_start(start)
+        last = _month_start(end)
+        while month <= last:
+            if self._create_month_partition(conn, table, key, month):
+                created.append(partition_name(table, month))
+            month = _add_months(month, 1)
+
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"))
+        return created
+
+    def ensure_partitions(self, months_ahead: Optional[int] = None) -> List[str]:
+        """
+        预建当前月及未来若干月的分区
+        Create partitions for the current month and the next N months
+        """
+        if not is_sms_partitioning_enabled():
+            return []
+
+        months_ahead = settings.partition_premake_months if months_ahead is None else months_ahead
+        now = datetime.now(timezone.utc)
+        created = []
+
+        with engine.begin() as conn:
+            for table, key in PARTITIONED_TABLES.items():
+                if not self.is_partitioned(conn, table):
+                    logger.warning(f"表 {table} 尚未分区, 请调用 /api/admin/partitions/migrate 完成迁移")
+                    continue
+                created += self._ensure_table_partitions(
+                    conn, table, key, now, _add_months(_month_start(now), months_ahead)
+                )
+
+        if created:
+            logger.info(f"短信分区维护完成, 新建 {len(created)} 个分区")
+        return created
+
+    # ------------------------------------------------------------------
+    # 分区删除
+    # ------------------------------------------------------------------
+
+    def drop_partitions_before(self, cutoff: datetime) -> List[str]:
+        """
+        删除整月早于 cutoff 的分区 (DETACH + DROP, 不逐行删除)
+        Drop monthly partitions whose whole range is older than cutoff
+        """
+        if not is_sms_partitioning_enabled():
+            return []
+
+        cutoff_month = _month_start(cutoff)
+        dropped = []
+
+        with engine.begin() as conn:
+            for table in PARTITIONED_TABLES:
+                if not self.is_partitioned(conn, table):
+                    continue
+                for partition in self._list_partitions(conn, table):
+                    name = partition["name"]
+                    suffix = name[len(table) + 2:]
+                    if not name.startswith(f"{table}_p") or len(suffix) != 7:
+                        continue
+                    try:
+                        month = datetime.strptime(suffix, "%Y_%m").replace(tzinfo=timezone.utc)
+                    except ValueError:
+                        continue
+                    if _add_months(month, 1) <= cutoff_month:
+                        conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+                        conn.execute(text(f"DROP TABLE {name}"))
+                        dropped.append(name)
+                        logger.info(f"删除过期分区: {name}")
+
+        return dropped
+
+    # ------------------------------------------------------------------
+    # 存量表迁移
+    # ------------------------------------------------------------------
+
+    def _rename_legacy_table(self, conn: Connection, table: str) -> str:
+        """将普通表及其索引/序列改名, 为新分区表让出名称"""
+        legacy = f"{table}_legacy"
+
+        index_names = conn.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = :table"
+        ), {"table": table}).scalars().all()
+        sequence = conn.execute(text(
+            "SELECT pg_get_serial_sequence(:table, 'id')"
+        ), {"table": table}).scalar()
+
+        conn.execute(text(f"ALTER TABLE {table} RENAME TO {legacy}"))
+        for index_name in index_names:
+            conn.execute(text(f'ALTER INDEX "{index_name}" RENAME TO "{index_name}_legacy"'))
+        if sequence:
+            conn.execute(text(f"ALTER SEQUENCE {sequence} RENAME TO {legacy}_id_seq"))
+        return legacy
+
+    def _migrate_table(self, conn: Connection, table: str, key: str) -> int:
+        """将单张普通表迁移为分区表, 返回迁移行数"""
+        from ..database import Base
+
+        legacy = self._rename_legacy_table(conn, table)
+        Base.metadata.tables[table].create(bind=conn)
+
+        columns = [
+            row[0] for row in conn.execute(text("""
+                SELECT column_name FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = :table
+                ORDER BY ordinal_position
+            """), {"table": legacy})
+        ]
+        select_columns = [
+            f"COALESCE({column}, created_at, NOW())" if column == key else column
+            for column in columns
+        ]
+
+        bounds = conn.execute(text(
+            f"SELECT MIN(COALESCE({key}, created_at)), MAX(COALESCE({key}, created_at)) FROM {legacy}"
+        )).first()
+        now = datetime.now(timezone.utc)
+        start = bounds[0] or now
+        end = max(bounds[1] or now, _add_months(_month_start(now), settings.partition_premake_months))
+        self._ensure_table_partitions(conn, table, key, start, end)
+
+        migrated = conn.execute(text(
+            f"INSERT INTO {table} ({', '.join(columns)}) "
+            f"SELECT {', '.join(select_columns)} FROM {legacy}"
+        )).rowcount
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)"
+        ))
+        conn.execute(text(f"DROP TABLE {legacy} CASCADE"))
+
+        logger.info(f"表 {table} 已迁移为按月分区表, 迁移 {migrated} 行")
+        return migrated
+
+    def migrate_to_partitioned(self) -> Dict[str, int]:
+        """
+        将已有的普通 sms / sms_forward_logs 表在线迁移为分区表 (单事务)
+        Convert existing plain tables into monthly partitioned tables in one transaction
+        """
+        if not is_sms_partitioning_enabled():
+            raise RuntimeError("未启用短信分区 (SMS_PARTITIONING_ENABLED) 或数据库不是PostgreSQL")
+
+        result = {}
+        with engine.begin() as conn:
+            for table, key in PARTITIONED_TABLES.items():
+                if self.is_partitioned(conn, table):
+                    result[table] = 0
+                    continue
+                result[table] = self._migrate_table(conn, table, key)
+        return result
+
+
+# 全局分区管理器实例
+partition_manager = PartitionManager()
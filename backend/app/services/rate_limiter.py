@@ -0,0 +1,191 @@
+"""
+令牌桶限流服务
+Token-bucket rate limiter
+
+- 每个限流键 (链接ID / 设备ID / IP) 一个令牌桶: 容量 burst, 每秒补充 rate 个令牌
+- 默认保存在进程内存中; 多进程/多副本部署时可使用 Redis 共享令牌桶 (需安装 redis)
+- 验证码接口按链接自身的 verification_interval 补充令牌, 间隔由接口读取链接时记录,
+  限流判断本身不访问数据库
+"""
+
+import logging
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# 内存令牌桶最多保留的键数量, 超出时淘汰最久未使用的键
+MEMORY_BUCKET_LIMIT = 100_000
+
+# 链接验证码间隔缓存的有效期 (秒) 和条数上限
+LINK_INTERVAL_TTL = 600
+LINK_INTERVAL_CACHE_SIZE = 50_000
+
+# Redis 令牌桶脚本: 原子地补充并扣减令牌, 返回 {是否允许, 需等待毫秒数}
+REDIS_TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local wait_ms = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    wait_ms = math.ceil((1 - tokens) / rate * 1000)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {allowed, wait_ms}
+"""
+
+
+@dataclass
+class BucketLimit:
+    """令牌桶参数"""
+    rate: float   # 每秒补充的令牌数
+    burst: int    # 桶容量 (允许的突发请求数)
+
+
+class MemoryBucketStore:
+    """进程内令牌桶 (在事件循环中调用, 无需加锁)"""
+
+    name = "memory"
+
+    def __init__(self, max_keys: int = MEMORY_BUCKET_LIMIT):
+        self.max_keys = max_keys
+        self.buckets: "OrderedDict[str, tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, limit: BucketLimit) -> float:
+        """
+        尝试取一个令牌
+
+        Returns:
+            0 表示允许; 否则为需要等待的秒数
+        """
+        now = time.monotonic()
+        tokens, updated_at = self.buckets.pop(key, (float(limit.burst), now))
+        tokens = min(float(limit.burst), tokens + (now - updated_at) * limit.rate)
+
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / limit.rate
+
+        self.buckets[key] = (tokens, now)
+        if len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        return wait
+
+
+class RedisBucketStore:
+    """Redis 共享令牌桶, 多个工作进程共用同一份限流状态"""
+
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError:
+            raise RuntimeError("使用 Redis 限流需要安装 redis")
+
+        self.prefix = prefix
+        self.client = redis_asyncio.from_url(url)
+        self.script = self.client.register_script(REDIS_TOKEN_BUCKET_SCRIPT)
+
+    async def take(self, key: str, limit: BucketLimit) -> float:
+        allowed, wait_ms = await self.script(
+            keys=[f"{self.prefix}{key}"],
+            args=[limit.rate, limit.burst, time.time()]
+        )
+        return 0.0 if int(allowed) else int(wait_ms) / 1000
+
+
+class RateLimiter:
+    """限流服务"""
+
+    def __init__(self):
+        self._store = None
+        self._fallback = MemoryBucketStore()
+        self._link_intervals: "OrderedDict[str, tuple[int, float]]" = OrderedDict()
+        self._last_store_error = 0.0
+
+    @property
+    def store(self):
+        """按配置创建令牌桶存储, Redis 不可用时退回内存"""
+        if self._store is None:
+            if settings.rate_limit_backend == "redis" and settings.rate_limit_redis_url:
+                try:
+                    self._store = RedisBucketStore(settings.rate_limit_redis_url)
+                    logger.info("限流存储: Redis")
+                except Exception as e:
+                    logger.error(f"❌ Redis 限流存储初始化失败, 使用内存令牌桶: {e}")
+                    self._store = self._fallback
+            else:
+                self._store = self._fallback
+        return self._store
+
+    async def take(self, key: str, limit: BucketLimit) -> float:
+        """
+        对限流键取一个令牌
+
+        Returns:
+            0 表示允许; 否则为需要等待的秒数
+        """
+        store = self.store
+        try:
+            return await store.take(key, limit)
+        except Exception as e:
+            # 共享存储故障时退回进程内限流, 日志每分钟最多一条
+            now = time.monotonic()
+            if now - self._last_store_error > 60:
+                self._last_store_error = now
+                logger.warning(f"⚠️ 限流存储不可用, 暂用进程内令牌桶: {e}")
+            return await self._fallback.take(key, limit)
+
+    # ------------------------------------------------------------------
+    # 链接级限流参数
+    # ------------------------------------------------------------------
+
+    def remember_link_interval(self, link_id: str, interval: Optional[int]):
+        """记录链接的验证码间隔 (接口读取链接时调用, 限流判断时不再查询数据库)"""
+        if not link_id or not interval or interval <= 0:
+            return
+        self._link_intervals.pop(link_id, None)
+        self._link_intervals[link_id] = (interval, time.monotonic() + LINK_INTERVAL_TTL)
+        if len(self._link_intervals) > LINK_INTERVAL_CACHE_SIZE:
+            self._link_intervals.popitem(last=False)
+
+    def link_interval(self, link_id: str) -> Optional[int]:
+        cached = self._link_intervals.get(link_id)
+        if not cached:
+            return None
+        interval, expires_at = cached
+        if expires_at < time.monotonic():
+            self._link_intervals.pop(link_id, None)
+            return None
+        return interval
+
+    def verification_limit(self, link_id: Optional[str]) -> BucketLimit:
+        """验证码接口的令牌桶: 每个验证码间隔补充一个令牌, 允许少量突发 (渐进式获取多条短信)"""
+        interval = (link_id and self.link_interval(link_id)) or settings.verification_code_interval
+        return BucketLimit(rate=1 / max(1, interval), burst=settings.rate_limit_verification_burst)
+
+    @staticmethod
+    def retry_after(wait: float) -> int:
+        """Retry-After 头的秒数 (至少1秒)"""
+        return max(1, math.ceil(wait))
+
+
+# 全局限流服务实例
+rate_limiter = RateLimiter()
@@ -0,0 +1,249 @@
+"""
+规则试运行服务
+Rule dry-run / backtest over a device's SMS history
+
+在设备的历史短信上评估草稿规则或账号的整套规则, 返回匹配数、最新的样例短信和耗时:
+- 可下推的规则 (rule_predicates.compile_rule) 用一条聚合查询统计全部匹配数,
+  样例按 (device_id, sms_timestamp) 索引倒序取前几条
+- 含正则等无法下推条件的规则, 先用可下推部分过滤候选行, 再按时间切片
+  并行流式读取 (yield_per) 交给 Python 匹配
+"""
+
+import heapq
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_, select
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models.sms import SMS
+from .metrics import RULE_MATCH_DURATION
+from .rule_predicates import CompiledRule, compile_rule
+
+logger = logging.getLogger(__name__)
+
+# 样例短信返回的列
+SAMPLE_COLUMNS = (SMS.id, SMS.sender, SMS.content, SMS.sms_timestamp)
+
+
+def _sample(row) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "sender": row.sender,
+        "content": row.content,
+        "sms_timestamp": row.sms_timestamp.isoformat() if row.sms_timestamp else None,
+    }
+
+
+def _sort_key(row) -> Tuple[bool, Optional[datetime], int]:
+    """样例排序键: 时间越新越大, 无时间的最大 (与 PostgreSQL 倒序时 NULL 在前一致)"""
+    return (row.sms_timestamp is None, row.sms_timestamp, row.id)
+
+
+class _StreamResult:
+    """一个时间切片的流式匹配结果"""
+
+    def __init__(self, rule_count: int):
+        self.scanned = 0
+        self.counts = [0] * rule_count
+        self.samples: List[List] = [[] for _ in range(rule_count)]
+        self.combined_count = 0
+        self.combined_samples: List = []
+
+
+def _keep_newest(heap: List, row, sample_size: int):
+    """保留最新的 sample_size 条 (小顶堆)"""
+    key = (_sort_key(row), row)
+    if len(heap) < sample_size:
+        heapq.heappush(heap, key)
+    elif key[0] > heap[0][0]:
+        heapq.heapreplace(heap, key)
+
+
+class RuleBacktester:
+    """规则试运行"""
+
+    def run(self, device_id: int, rules: List[Any], sample_size: int = 5,
+            since: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        在设备历史短信上评估规则
+
+        Args:
+            device_id: 设备主键
+            rules: SMSRule 或 RuleDraft 列表
+            sample_size: 每个规则返回的样例条数
+            since: 只评估该时间之后的短信
+
+        Returns:
+            每个规则的匹配数、样例、下推方式, 以及启用规则合计的匹配结果和耗时
+        """
+        started = time.perf_counter()
+        db = SessionLocal()
+        try:
+            dialect = db.get_bind().dialect.name
+            compiled = [compile_rule(rule, dialect) for rule in rules]
+            base = [SMS.device_id == device_id]
+            if since:
+                base.append(SMS.sms_timestamp >= since)
+
+            active = [index for index, item in enumerate(compiled) if item.rule.is_active]
+            streamed = [index for index, item in enumerate(compiled) if not item.exact]
+            combine_in_sql = len(active) > 1 and all(compiled[index].exact for index in active)
+            combine_in_stream = len(active) > 1 and not combine_in_sql
+
+            # 一次聚合查询统计总数和全部可下推规则的匹配数
+            aggregates = [func.count()]
+            exact_indexes = [index for index, item in enumerate(compiled) if item.exact]
+            aggregates += [func.count().filter(compiled[index].condition) for index in exact_indexes]
+            combined_condition = None
+            if combine_in_sql:
+                combined_condition = or_(*[compiled[index].condition for index in active])
+                aggregates.append(func.count().filter(combined_condition))
+            totals = db.execute(select(*aggregates).where(*base)).one()
+
+            results = [{"match_count": 0, "samples": []} for _ in compiled]
+            for position, index in enumerate(exact_indexes, start=1):
+                results[index]["match_count"] = totals[position]
+                if totals[position]:
+                    results[index]["samples"] = self._sql_samples(
+                        db, base, compiled[index].condition, sample_size
+                    )
+
+            combined = None
+            if combine_in_sql:
+                combined = {"match_count": totals[-1], "samples": []}
+                if totals[-1]:
+                    combined["samples"] = self._sql_samples(db, base, combined_condition, sample_size)
+            sql_ms = (time.perf_counter() - started) * 1000
+
+            # 无法完全下推的规则并行流式匹配
+            scanned = 0
+            stream_ms = 0.0
+            if streamed or combine_in_stream:
+                stream_started = time.perf_counter()
+                stream_rules = [compiled[index] for index in streamed]
+                combined_rules = [compiled[index] for index in active] if combine_in_stream else []
+                merged = self._stream(device_id, base, stream_rules, combined_rules, sample_size, db)
+                scanned = merged.scanned
+                for position, index in enumerate(streamed):
+                    results[index] = {
+                        "match_count": merged.counts[position],
+                        "samples": [_sample(row) for _, row in sorted(merged.samples[position], reverse=True)]
+                    }
+                if combine_in_stream:
+                    combined = {
+                        "match_count": merged.combined_count,
+                        "samples": [_sample(row) for _, row in sorted(merged.combined_samples, reverse=True)]
+                    }
+                stream_ms = (time.perf_counter() - stream_started) * 1000
+            if len(active) == 1:
+                combined = results[active[0]]
+
+            RULE_MATCH_DURATION.labels("dry_run").observe(time.perf_counter() - started)
+            return {
+                "device_id": device_id,
+                "total_sms": totals[0],
+                "scanned_rows": scanned,
+                "rules": [
+                    {
+                        "rule_id": item.rule.id,
+                        "rule_name": item.rule.rule_name,
+                        "is_active": item.rule.is_active,
+                        "pushdown": item.pushdown,
+                        **results[index]
+                    }
+                    for index, item in enumerate(compiled)
+                ],
+                "combined": combined,
+                "timing": {
+                    "sql_ms": round(sql_ms, 1),
+                    "stream_ms": round(stream_ms, 1),
+                    "total_ms": round((time.perf_counter() - started) * 1000, 1)
+                }
+            }
+        finally:
+            db.close()
+
+    @staticmethod
+    def _sql_samples(db, base: List, condition, sample_size: int) -> List[Dict[str, Any]]:
+        """按时间倒序取匹配的样例 (使用 device_id + sms_timestamp 索引)"""
+        rows = db.execute(
+            select(*SAMPLE_COLUMNS).where(*base, condition)
+            .order_by(SMS.sms_timestamp.desc(), SMS.id.desc()).limit(sample_size)
+        ).all()
+        return [_sample(row) for row in rows]
+
+    def _slices(self, db, base: List, workers: int) -> List:
+        """按短信时间把设备历史切分为若干区间, 各区间并行读取"""
+        first, last = db.execute(select(func.min(SMS.sms_timestamp), func.max(SMS.sms_timestamp)).where(*base)).one()
+        slices = [SMS.sms_timestamp.is_(None)]
+        if first is None:
+            return slices
+        step = (last - first) / workers
+        if workers == 1 or step <= timedelta(0):
+            return slices + [SMS.sms_timestamp.isnot(None)]
+        bounds = [first + step * index for index in range(1, workers)]
+        lower = None
+        for bound in bounds:
+            slices.append(and_(SMS.sms_timestamp >= lower, SMS.sms_timestamp < bound) if lower else SMS.sms_timestamp < bound)
+            lower = bound
+        slices.append(SMS.sms_timestamp >= lower)
+        return slices
+
+    def _stream(self, device_id: int, base: List, stream_rules: List[CompiledRule],
+                combined_rules: List[CompiledRule], sample_size: int, db) -> _StreamResult:
+        """并行流式匹配, 合并各切片的计数和样例"""
+        candidates = stream_rules + combined_rules
+        prefilter = None
+        if all(item.condition is not None for item in candidates):
+            prefilter = or_(*[item.condition for item in candidates])
+
+        workers = max(1, settings.rule_backtest_workers)
+        slices = self._slices(db, base, workers)
+
+        def scan(time_slice) -> _StreamResult:
+            result = _StreamResult(len(stream_rules))
+            session = SessionLocal()
+            try:
+                conditions = base + [time_slice] + ([prefilter] if prefilter is not None else [])
+                statement = select(*SAMPLE_COLUMNS).where(*conditions).execution_options(
+                    yield_per=settings.rule_backtest_chunk_size
+                )
+                for chunk in session.execute(statement).partitions():
+                    result.scanned += len(chunk)
+                    for row in chunk:
+                        sender, content = row.sender or "", row.content or ""
+                        for position, item in enumerate(stream_rules):
+                            if item.matches(sender, content):
+                                result.counts[position] += 1
+                                _keep_newest(result.samples[position], row, sample_size)
+                        if combined_rules and any(item.matches(sender, content) for item in combined_rules):
+                            result.combined_count += 1
+                            _keep_newest(result.combined_samples, row, sample_size)
+                return result
+            finally:
+                session.close()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            parts = list(executor.map(scan, slices))
+
+        merged = _StreamResult(len(stream_rules))
+        for part in parts:
+            merged.scanned += part.scanned
+            merged.combined_count += part.combined_count
+            for position in range(len(stream_rules)):
+                merged.counts[position] += part.counts[position]
+                for _, row in part.samples[position]:
+                    _keep_newest(merged.samples[position], row, sample_size)
+            for _, row in part.combined_samples:
+                _keep_newest(merged.combined_samples, row, sample_size)
+        logger.debug(f"规则试运行流式匹配: 设备 {device_id}, {len(slices)} 个切片, 扫描 {merged.scanned} 行")
+        return merged
+
+
+# 全局规则试运行实例
+rule_backtester = RuleBacktester()
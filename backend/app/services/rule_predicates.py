@@ -0,0 +1,302 @@
+"""
+短信规则匹配与SQL下推
+SMS rule matching and SQL predicate pushdown
+
+规则的发送方/内容条件在 Python 中的匹配语义 (rule_matches) 与可下推到SQL的条件
+(compile_rule) 放在同一处, 保证两者一致:
+- exact               -> 发送方按规范化号码 sender_normalized = 'x' / 内容 content = 'x'
+- fuzzy 发送方 'x*'    -> sender_normalized LIKE 'x%' (使用 device_id + sender_normalized 索引)
+- fuzzy 'x' / '*x*'   -> ILIKE '%x%' (内容上可使用 pg_trgm 三元组索引)
+- fuzzy 内容 'x*'      -> LIKE '%x%';  '*x' -> LIKE '%x'
+- regex               -> PostgreSQL 上可移植的正则下推为 ~, 其余由 Python 匹配
+下推条件在 PostgreSQL 上与 Python 语义等价; 其他数据库 (LIKE 不区分大小写) 只作为候选过滤,
+候选行仍由 Python 复核。
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Any, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, false, or_, select, true
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import ColumnElement
+
+from ..models.sms import SMS, normalize_sender
+from .metrics import RULE_MATCH_DURATION, observe_duration
+
+MATCH_TYPES = ("exact", "fuzzy", "regex")
+
+# 需要 Python 复核时每次从游标读取的候选短信数
+CANDIDATE_CHUNK_SIZE = 500
+
+
+@dataclass
+class RuleDraft:
+    """未保存的规则 (用于试运行), 字段与 SMSRule 的匹配条件一致"""
+    rule_name: str = "草稿规则"
+    sender_pattern: Optional[str] = None
+    sender_match_type: str = "fuzzy"
+    content_pattern: Optional[str] = None
+    content_match_type: str = "fuzzy"
+    is_active: bool = True
+    priority: int = 0
+    display_count: int = 5
+    id: Optional[int] = None
+
+
+def _is_wildcard(pattern: Optional[str]) -> bool:
+    """空模式或 * 匹配全部"""
+    return not pattern or not pattern.strip() or pattern == "*"
+
+
+def _wildcard_regex(pattern: str) -> str:
+    """中间含通配符的模糊模式转换为正则表达式"""
+    return pattern.replace("*", ".*")
+
+
+def _sender_matches(pattern: Optional[str], match_type: str, sender: str) -> bool:
+    if _is_wildcard(pattern):
+        return True
+    if match_type == "exact":
+        return normalize_sender(sender) == normalize_sender(pattern)
+    if match_type == "fuzzy":
+        if "*" not in pattern:
+            # 没有通配符，直接包含匹配
+            return pattern.lower() in sender.lower()
+        if pattern.startswith("*") and pattern.endswith("*"):
+            # 两端都有通配符，如 "*191*" 匹配 "+8619162317587"
+            return pattern[1:-1].lower() in sender.lower()
+        if pattern.endswith("*"):
+            # 前缀匹配，如 "+86191*" 匹配 "+86 191 6231 7587" (按规范化号码比较)
+            return normalize_sender(sender).startswith(normalize_sender(pattern[:-1]))
+        if pattern.startswith("*"):
+            # 后缀匹配，如 "*123"
+            return sender.endswith(pattern[1:])
+        # 中间有通配符的复杂情况，转换为正则表达式
+        try:
+            return bool(re.search(_wildcard_regex(pattern), sender, re.IGNORECASE))
+        except re.error:
+            return False
+    if match_type == "regex":
+        try:
+            return bool(re.search(pattern, sender))
+        except re.error:
+            return False
+    return True
+
+
+def _content_matches(pattern: Optional[str], match_type: str, content: str) -> bool:
+    if _is_wildcard(pattern):
+        return True
+    if match_type == "exact":
+        return content == pattern
+    if match_type == "fuzzy":
+        if "*" not in pattern:
+            return pattern.lower() in content.lower()
+        if pattern.startswith("*") and pattern.endswith("*"):
+            # 两端都有通配符，如 "*验证码*" 匹配包含"验证码"的内容
+            return pattern[1:-1].lower() in content.lower()
+        if pattern.endswith("*"):
+            # 处理通配符模式（如 100*）: 检查短信内容是否包含该前缀
+            return pattern[:-1] in content
+        if pattern.startswith("*"):
+            return content.endswith(pattern[1:])
+        try:
+            return bool(re.search(_wildcard_regex(pattern), content, re.IGNORECASE))
+        except re.error:
+            return False
+    if match_type == "regex":
+        try:
+            return bool(re.search(pattern, content))
+        except re.error:
+            return False
+    return True
+
+
+def rule_matches(rule: Any, sender: str, content: str) -> bool:
+    """短信是否满足规则的发送方和内容条件 (不检查规则是否启用)"""
+    return (
+        _sender_matches(rule.sender_pattern, rule.sender_match_type, sender or "")
+        and _content_matches(rule.content_pattern, rule.content_match_type, content or "")
+    )
+
+
+# ----------------------------------------------------------------------
+# SQL 下推
+# ----------------------------------------------------------------------
+
+# Python re 与 PostgreSQL ARE 语义一致的正则子集:
+# 字面字符、\d \w \s、转义的标点、{n,m} 量词、非 [^ 的字符类、非 (? 的分组;
+# 排除 . $ [^ (在含换行的内容上与 Python 默认行为不同)、[: [= [. (PostgreSQL 的字符类名/等价类/排序元素,
+# 如 [[:alpha:]], Python 按普通字符处理) 以及其他反斜杠转义
+_PORTABLE_REGEX = re.compile(
+    r"(?:\\[dws]|\\[^A-Za-z0-9]|\{\d+(?:,\d*)?\}|\[(?![\^:=.])|\((?!\?)|[^\\{}\[(.$])*"
+)
+
+
+def _regex_condition(column, pattern: str, dialect: str) -> Tuple[Optional[ColumnElement], bool]:
+    """正则条件: PostgreSQL 上可移植的正则下推为 ~, 其余由 Python 匹配"""
+    try:
+        re.compile(pattern)
+    except re.error:
+        # 无效的正则不匹配任何短信
+        return false(), True
+    if dialect == "postgresql" and _PORTABLE_REGEX.fullmatch(pattern):
+        return column.regexp_match(pattern), True
+    return None, False
+
+
+def _compile_sender(pattern: Optional[str], match_type: str,
+                    dialect: str) -> Tuple[Optional[ColumnElement], bool]:
+    """
+    编译发送方条件
+
+    Returns:
+        (SQL条件, 是否与Python语义等价); 条件为None表示不过滤
+    """
+    if _is_wildcard(pattern):
+        return None, True
+
+    # LIKE 只在 PostgreSQL 上区分大小写 (ILIKE 与 Python lower 一致), 其他数据库仅作为候选过滤
+    like_exact = dialect == "postgresql"
+
+    if match_type == "exact":
+        return SMS.sender_normalized == normalize_sender(pattern), True
+    if match_type == "fuzzy":
+        if "*" not in pattern:
+            return SMS.sender.icontains(pattern, autoescape=True), like_exact
+        if pattern.startswith("*") and pattern.endswith("*"):
+            return SMS.sender.icontains(pattern[1:-1], autoescape=True), like_exact
+        if pattern.endswith("*"):
+            # 前缀匹配走 (device_id, sender_normalized) 索引
+            return SMS.sender_normalized.startswith(normalize_sender(pattern[:-1]), autoescape=True), like_exact
+        if pattern.startswith("*"):
+            return SMS.sender.endswith(pattern[1:], autoescape=True), like_exact
+        return None, False
+    if match_type == "regex":
+        return _regex_condition(SMS.sender, pattern, dialect)
+    return None, True
+
+
+def _compile_content(pattern: Optional[str], match_type: str,
+                     dialect: str) -> Tuple[Optional[ColumnElement], bool]:
+    """编译内容条件 (包含条件在 PostgreSQL 上可使用 pg_trgm 索引)"""
+    if _is_wildcard(pattern):
+        return None, True
+
+    like_exact = dialect == "postgresql"
+
+    if match_type == "exact":
+        return SMS.content == pattern, True
+    if match_type == "fuzzy":
+        if "*" not in pattern:
+            return SMS.content.icontains(pattern, autoescape=True), like_exact
+        if pattern.startswith("*") and pattern.endswith("*"):
+            return SMS.content.icontains(pattern[1:-1], autoescape=True), like_exact
+        if pattern.endswith("*"):
+            return SMS.content.contains(pattern[:-1], autoescape=True), like_exact
+        if pattern.startswith("*"):
+            return SMS.content.endswith(pattern[1:], autoescape=True), like_exact
+        return None, False
+    if match_type == "regex":
+        return _regex_condition(SMS.content, pattern, dialect)
+    return None, True
+
+
+@dataclass
+class CompiledRule:
+    """编译后的规则"""
+    rule: Any
+    condition: Optional[ColumnElement]  # 下推到SQL的条件 (None 表示需扫描全部短信)
+    exact: bool                         # SQL条件是否与Python语义完全等价
+
+    @property
+    def pushdown(self) -> str:
+        """下推方式: sql (仅SQL) / sql+python (SQL过滤候选 + Python复核) / python (全部由Python匹配)"""
+        if self.exact:
+            return "sql"
+        return "sql+python" if self.condition is not None else "python"
+
+    def matches(self, sender: str, content: str) -> bool:
+        return rule_matches(self.rule, sender, content)
+
+
+def compile_rule(rule: Any, dialect: str) -> CompiledRule:
+    """编译规则的发送方和内容条件"""
+    sender_condition, sender_exact = _compile_sender(rule.sender_pattern, rule.sender_match_type, dialect)
+    content_condition, content_exact = _compile_content(rule.content_pattern, rule.content_match_type, dialect)
+    conditions = [condition for condition in (sender_condition, content_condition) if condition is not None]
+    condition = None
+    if conditions:
+        condition = conditions[0] if len(conditions) == 1 else and_(*conditions)
+    elif sender_exact and content_exact:
+        # 两个条件都匹配全部
+        condition = true()
+    return CompiledRule(rule=rule, condition=condition, exact=sender_exact and content_exact)
+
+
+def compile_rules(rules: List[Any], dialect: str) -> Tuple[Optional[ColumnElement], bool]:
+    """
+    编译一组规则 (匹配任一规则即可)
+
+    Returns:
+        (候选行的SQL条件, 是否无需Python复核); 任一规则无法下推时条件为None
+    """
+    compiled = [compile_rule(rule, dialect) for rule in rules]
+    if not compiled or any(item.condition is None for item in compiled):
+        return None, False
+    condition = compiled[0].condition if len(compiled) == 1 else or_(*[item.condition for item in compiled])
+    return condition, all(item.exact for item in compiled)
+
+
+def latest_matching_sms(db: Session, device_id: int, rules: List[Any], limit: int,
+                        conditions: Sequence[ColumnElement] = ()) -> List[SMS]:
+    """
+    设备上匹配任一规则的最新短信 (按时间倒序)
+
+    可下推的规则直接在SQL中过滤并 LIMIT; 否则按可下推部分过滤候选行,
+    服务端游标分块读取并由 Python 复核, 取满 limit 条即停止
+    """
+    with observe_duration(RULE_MATCH_DURATION, operation="latest"):
+        return _latest_matching_sms(db, device_id, rules, limit, conditions)
+
+
+def _latest_matching_sms(db: Session, device_id: int, rules: List[Any], limit: int,
+                         conditions: Sequence[ColumnElement]) -> List[SMS]:
+    condition, exact = compile_rules(rules, db.get_bind().dialect.name)
+    statement = select(SMS).where(SMS.device_id == device_id, *conditions)
+    if condition is not None:
+        statement = statement.where(condition)
+    statement = statement.order_by(SMS.sms_timestamp.desc(), SMS.id.desc())
+    if exact:
+        return list(db.scalars(statement.limit(limit)))
+
+    matched = []
+    result = db.scalars(statement.execution_options(yield_per=CANDIDATE_CHUNK_SIZE))
+    try:
+        for sms in result:
+            if any(rule_matches(rule, sms.sender, sms.content) for rule in rules):
+                matched.append(sms)
+                if len(matched) >= limit:
+                    break
+    finally:
+        result.close()
+    return matched
+
+
+def validate_rule_patterns(rule: Any) -> Optional[str]:
+    """校验匹配类型和正则表达式, 返回错误信息 (无错误返回None)"""
+    if rule.sender_match_type not in MATCH_TYPES:
+        return "无效的发送方匹配类型"
+    if rule.content_match_type not in MATCH_TYPES:
+        return "无效的内容匹配类型"
+    for pattern, match_type, name in (
+        (rule.sender_pattern, rule.sender_match_type, "发送方"),
+        (rule.content_pattern, rule.content_match_type, "内容"),
+    ):
+        if match_type == "regex" and pattern:
+            try:
+                re.compile(pattern)
+            except re.error:
+                return f"无效的{name}正则表达式"
+    return None
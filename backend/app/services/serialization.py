@@ -0,0 +1,94 @@
+"""
+JSON 序列化
+Fast JSON serialization helpers
+
+- 基于 orjson 的默认响应类, 直接输出 UTF-8 字节
+- 列表接口按列查询, 查询结果元组直接组装为字典交给 orjson,
+  不实例化ORM对象, 时间字段由 orjson 原生序列化 (格式与 isoformat 一致)
+- WebSocket 消息使用同一套序列化
+"""
+
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+# 非字符串字典键 (如 ID -> 数据) 按字符串输出, 与标准库 json 行为一致
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(value: Any) -> Any:
+    """orjson 不能原生处理的类型 (datetime / date / UUID / Enum / dataclass 均为原生支持)"""
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    raise TypeError(f"无法序列化的类型: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """序列化为 UTF-8 JSON 字节"""
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+
+def dumps_text(content: Any) -> str:
+    """序列化为 JSON 字符串 (WebSocket 文本帧)"""
+    return dumps(content).decode("utf-8")
+
+
+def loads(data: Any) -> Any:
+    return orjson.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    orjson 响应类
+    作为应用默认响应类; 接口直接返回该响应时还可跳过 FastAPI 的 jsonable_encoder
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class RowSerializer:
+    """
+    按列查询结果的序列化器
+
+    Args:
+        columns: 字段名 -> 查询列
+        nested: 嵌套对象名 -> {字段名 -> 查询列}, 如 {"device_info": {...}}
+
+    用法:
+        rows = query.with_entities(*serializer.entities).all()
+        data = serializer.serialize(rows)
+    """
+
+    def __init__(self, columns: Dict[str, Any], nested: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.fields = tuple(columns)
+        self.nested = []
+        self.entities = list(columns.values())
+
+        offset = len(self.fields)
+        for name, nested_columns in (nested or {}).items():
+            self.nested.append((name, tuple(nested_columns), offset, offset + len(nested_columns)))
+            self.entities.extend(nested_columns.values())
+            offset += len(nested_columns)
+        self._width = len(self.fields)
+
+    def serialize_row(self, row: Iterable[Any]) -> Dict[str, Any]:
+        row = tuple(row)
+        item = dict(zip(self.fields, row[:self._width]))
+        for name, fields, start, end in self.nested:
+            item[name] = dict(zip(fields, row[start:end]))
+        return item
+
+    def serialize(self, rows: Iterable[Iterable[Any]]) -> List[Dict[str, Any]]:
+        return [self.serialize_row(row) for row in rows]
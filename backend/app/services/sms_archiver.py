@@ -0,0 +1,410 @@
+"""
+短信归档服务
+SMS retention and cold archival service
+
+超过保留期的短信按设备流式写入压缩的只追加分段文件 (NDJSON + gzip/zstd),
+每个分段附带一个小的索引文件, 写入完成后再分块删除数据库中的记录。
+归档数据可按设备和时间范围直接读取, 无需恢复到数据库。
+
+目录结构:
+    {sms_archive_dir}/device_{id}/{时间}_{起始ID}-{结束ID}.ndjson.gz
+    {sms_archive_dir}/device_{id}/{时间}_{起始ID}-{结束ID}.idx.json
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+from contextlib import contextmanager
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Iterator
+
+from sqlalchemy import and_, or_, text
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database import SessionLocal, engine
+from ..models.sms import SMS
+from ..models.sms_rule import SmsForwardLog
+from ..models.device import Device
+from ..models.account import Account
+from ..models.account_link import AccountLink
+from ..models.sms_retention_policy import SmsRetentionPolicy
+from .settings_service import SettingsService
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# 单个分段文件最多容纳的短信条数
+SEGMENT_MAX_ROWS = 50000
+
+# 未配置时的全局保留天数
+DEFAULT_RETENTION_DAYS = 90
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    """解析归档记录中的ISO时间"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _row_time(row: Dict[str, Any]) -> Optional[datetime]:
+    """归档记录的有效时间: 短信时间戳优先, 否则取创建时间"""
+    return _parse_time(row.get("sms_timestamp") or row.get("created_at"))
+
+
+# 设备归档锁的 PostgreSQL advisory lock 分类键 (与设备ID组成两个32位键)
+ARCHIVE_LOCK_CLASS = 72704027
+
+
+@contextmanager
+def device_archive_lock(device_id: int) -> Iterator[bool]:
+    """
+    设备归档锁: 每个 worker 都运行归档任务, 同一设备同时只由取得锁的一个处理, 避免重复写入分段
+    Per-device archive lock (non-blocking PostgreSQL session advisory lock; always acquired on other databases)
+    """
+    if engine.dialect.name != "postgresql":
+        yield True
+        return
+
+    params = {"lock_class": ARCHIVE_LOCK_CLASS, "device_id": device_id}
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        acquired = conn.execute(text("SELECT pg_try_advisory_lock(:lock_class, :device_id)"), params).scalar()
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                conn.execute(text("SELECT pg_advisory_unlock(:lock_class, :device_id)"), params)
+
+
+class SmsArchiver:
+    """短信归档器"""
+
+    def __init__(self, archive_dir: Optional[str] = None):
+        self.archive_dir = Path(archive_dir or settings.sms_archive_dir)
+        self.running = False
+        self.task = None
+
+    async def start(self):
+        """启动归档任务"""
+        if self.running or not settings.sms_archive_enabled:
+            return
+
+        self.running = True
+        self.task = asyncio.create_task(self._archive_loop())
+        logger.info("短信归档任务已启动")
+
+    async def stop(self):
+        """停止归档任务"""
+        self.running = False
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        logger.info("短信归档任务已停止")
+
+    async def _archive_loop(self):
+        """归档循环"""
+        while self.running:
+            try:
+                await asyncio.to_thread(self.run_once)
+                await asyncio.sleep(settings.sms_archive_interval)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"短信归档异常: {e}")
+                await asyncio.sleep(60)
+
+    # ------------------------------------------------------------------
+    # 压缩格式
+    # ------------------------------------------------------------------
+
+    @property
+    def compression(self) -> str:
+        """当前使用的压缩格式, zstd 不可用时回退到 gzip"""
+        if settings.sms_archive_compression == "zstd":
+            if ZSTD_AVAILABLE:
+                return "zstd"
+            logger.warning("未安装 zstandard, 短信归档回退到 gzip 压缩")
+        return "gzip"
+
+    @staticmethod
+    def _open_writer(path: Path, compression: str):
+        """打开压缩写入流"""
+        if compression == "zstd":
+            return zstandard.ZstdCompressor(level=10).stream_writer(open(path, "wb"), closefd=True)
+        return gzip.open(path, "wb", compresslevel=6)
+
+    @staticmethod
+    def _open_reader(path: Path, compression: str):
+        """打开解压读取流"""
+        if compression == "zstd":
+            if not ZSTD_AVAILABLE:
+                raise RuntimeError(f"读取归档 {path.name} 需要安装 zstandard")
+            return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        return gzip.open(path, "rb")
+
+    # ------------------------------------------------------------------
+    # 保留策略
+    # ------------------------------------------------------------------
+
+    def resolve_retention_days(self, db: Session) -> Dict[int, int]:
+        """
+        计算每个设备的保留天数
+        Resolve retention days per device
+
+        优先级: 设备策略 > 账号策略 (多个账号取最长) > 全局 dataRetentionDays
+        """
+        global_days = SettingsService.get_setting(db, "dataRetentionDays", DEFAULT_RETENTION_DAYS)
+
+        policies = db.query(SmsRetentionPolicy).filter(SmsRetentionPolicy.is_active == True).all()
+        device_policies = {p.target_id: p.retention_days for p in policies if p.scope == "device"}
+        account_policies = {p.target_id: p.retention_days for p in policies if p.scope == "account"}
+
+        # 账号 -> 设备: 主设备 + 链接绑定的设备
+        account_device_days: Dict[int, int] = {}
+        if account_policies:
+            pairs = db.query(Account.id, Account.primary_device_id).filter(
+                Account.id.in_(account_policies.keys()),
+                Account.primary_device_id.isnot(None)
+            ).all()
+            pairs += db.query(AccountLink.account_id, AccountLink.device_id).filter(
+                AccountLink.account_id.in_(account_policies.keys())
+            ).distinct().all()
+            for account_id, device_id in pairs:
+                days = account_policies[account_id]
+                account_device_days[device_id] = max(days, account_device_days.get(device_id, 0))
+
+        device_ids = [row[0] for row in db.query(Device.id).all()]
+        return {
+            device_id: device_policies.get(device_id) or account_device_days.get(device_id) or global_days
+            for device_id in device_ids
+        }
+
+    # ------------------------------------------------------------------
+    # 归档写入
+    # ------------------------------------------------------------------
+
+    def _device_dir(self, device_id: int) -> Path:
+        return self.archive_dir / f"device_{device_id}"
+
+    @staticmethod
+    def _expired_filter(device_id: int, cutoff: datetime):
+        return and_(
+            SMS.device_id == device_id,
+            or_(
+                SMS.sms_timestamp < cutoff,
+                and_(SMS.sms_timestamp.is_(None), SMS.created_at < cutoff)
+            )
+        )
+
+    def _write_segment(self, db: Session, device_id: int, cutoff: datetime) -> Optional[Dict[str, Any]]:
+        """
+        将一个设备的过期短信流式写入一个分段文件
+        返回分段索引; 没有过期短信时返回 None
+        """
+        compression = self.compression
+        extension = "zst" if compression == "zstd" else "gz"
+        device_dir = self._device_dir(device_id)
+        device_dir.mkdir(parents=True, exist_ok=True)
+
+        created_at = datetime.now(timezone.utc)
+        tmp_path = device_dir / f".{created_at.strftime('%Y%m%dT%H%M%S%f')}.tmp"
+
+        ids: List[int] = []
+        min_time = max_time = None
+        digest = hashlib.sha256()
+
+        query = db.query(SMS).filter(self._expired_filter(device_id, cutoff)).order_by(SMS.id)
+        rows = query.limit(SEGMENT_MAX_ROWS).yield_per(settings.sms_archive_batch_size)
+
+        with self._open_writer(tmp_path, compression) as writer:
+            for sms in rows:
+                line = (json.dumps(sms.to_dict(), ensure_ascii=False) + "\n").encode("utf-8")
+                writer.write(line)
+                digest.update(line)
+                ids.append(sms.id)
+
+                row_time = sms.sms_timestamp or sms.created_at
+                if row_time is not None:
+                    min_time = row_time if min_time is None else min(min_time, row_time)
+                    max_time = row_time if max_time is None else max(max_time, row_time)
+
+        if not ids:
+            tmp_path.unlink(missing_ok=True)
+            return None
+
+        # 落盘后再改名, 索引文件最后写入, 作为分段完成的标志
+        stem = f"{created_at.strftime('%Y%m%dT%H%M%S')}_{ids[0]}-{ids[-1]}"
+        segment_path = device_dir / f"{stem}.ndjson.{extension}"
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, segment_path)
+
+        index = {
+            "segment": segment_path.name,
+            "device_id": device_id,
+            "compression": compression,
+            "count": len(ids),
+            "min_id": ids[0],
+            "max_id": ids[-1],
+            "min_time": min_time.isoformat() if min_time else None,
+            "max_time": max_time.isoformat() if max_time else None,
+            "cutoff": cutoff.isoformat(),
+            "sha256": digest.hexdigest(),
+            "size_bytes": segment_path.stat().st_size,
+            "created_at": created_at.isoformat()
+        }
+        index_path = device_dir / f"{stem}.idx.json"
+        tmp_index = index_path.with_suffix(".tmp")
+        with open(tmp_index, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_index, index_path)
+
+        index["ids"] = ids
+        return index
+
+    def _delete_archived(self, db: Session, ids: List[int]) -> int:
+        """分块删除已归档的短信及其转发日志, 每块单独提交"""
+        batch_size = settings.sms_archive_batch_size
+        deleted = 0
+        for start in range(0, len(ids), batch_size):
+            chunk = ids[start:start + batch_size]
+            db.query(SmsForwardLog).filter(SmsForwardLog.sms_id.in_(chunk)).delete(synchronize_session=False)
+            deleted += db.query(SMS).filter(SMS.id.in_(chunk)).delete(synchronize_session=False)
+            db.commit()
+        return deleted
+
+    def archive_device(self, db: Session, device_id: int, retention_days: int) -> Dict[str, Any]:
+        """
+        归档单个设备的过期短信
+        Archive expired SMS of one device
+        """
+        cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+        result = {"device_id": device_id, "archived": 0, "segments": []}
+
+        while True:
+            index = self._write_segment(db, device_id, cutoff)
+            if not index:
+                break
+            result["archived"] += self._delete_archived(db, index.pop("ids"))
+            result["segments"].append(index["segment"])
+            if index["count"] < SEGMENT_MAX_ROWS:
+                break
+
+        if result["archived"]:
+            logger.info(f"设备 {device_id} 归档 {result['archived']} 条短信 (保留 {retention_days} 天)")
+        return result
+
+    def run_once(self, device_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        执行一次归档
+        Run one archival pass over all (or one) devices
+        """
+        db = SessionLocal()
+        try:
+            retention = self.resolve_retention_days(db)
+            if device_id is not None:
+                retention = {device_id: retention[device_id]} if device_id in retention else {}
+
+            summary = {"archived": 0, "segments": 0, "devices": []}
+            for current_device_id, days in retention.items():
+                try:
+                    with device_archive_lock(current_device_id) as acquired:
+                        if not acquired:
+                            logger.info(f"设备 {current_device_id} 正由其他进程归档, 跳过")
+                            continue
+                        result = self.archive_device(db, current_device_id, days)
+                except Exception as e:
+                    db.rollback()
+                    logger.error(f"设备 {current_device_id} 短信归档失败: {e}")
+                    continue
+                if result["archived"]:
+                    summary["archived"] += result["archived"]
+                    summary["segments"] += len(result["segments"])
+                    summary["devices"].append(result)
+            return summary
+        finally:
+            db.close()
+
+    # ------------------------------------------------------------------
+    # 归档读取
+    # ------------------------------------------------------------------
+
+    def list_segments(self, device_id: int,
+                      start_time: Optional[datetime] = None,
+                      end_time: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        列出设备的归档分段 (按索引过滤时间范围)
+        List archive segments of a device overlapping the time range
+        """
+        device_dir = self._device_dir(device_id)
+        if not device_dir.exists():
+            return []
+
+        segments = []
+        for index_path in sorted(device_dir.glob("*.idx.json")):
+            with open(index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            min_time = _parse_time(index.get("min_time"))
+            max_time = _parse_time(index.get("max_time"))
+            if start_time and max_time and max_time < start_time:
+                continue
+            if end_time and min_time and min_time > end_time:
+                continue
+            segments.append(index)
+        return segments
+
+    def iter_archived_sms(self, device_id: int,
+                          start_time: Optional[datetime] = None,
+                          end_time: Optional[datetime] = None) -> Iterator[Dict[str, Any]]:
+        """
+        流式读取设备在时间范围内的归档短信 (按ID去重)
+        Stream archived SMS of a device within the time range
+        """
+        seen_ids = set()
+        for index in self.list_segments(device_id, start_time, end_time):
+            segment_path = self._device_dir(device_id) / index["segment"]
+            with self._open_reader(segment_path, index.get("compression", "gzip")) as reader:
+                buffer = b""
+                while True:
+                    chunk = reader.read(65536)
+                    if not chunk:
+                        break
+                    buffer += chunk
+                    lines = buffer.split(b"\n")
+                    buffer = lines.pop()
+                    for line in lines:
+                        if not line:
+                            continue
+                        row = json.loads(line)
+                        if row["id"] in seen_ids:
+                            continue
+                        row_time = _row_time(row)
+                        if start_time and row_time and row_time < start_time:
+                            continue
+                        if end_time and row_time and row_time > end_time:
+                            continue
+                        seen_ids.add(row["id"])
+                        yield row
+
+
+# 全局归档器实例
+sms_archiver = SmsArchiver()
@@ -7,6 +7,7 @@ SMS Forwarding Service
 
 import logging
 import asyncio
+import time
 from datetime import datetime, timezone
 from typing import List, Optional, Dict, Any
 from sqlalchemy.orm import Session
@@ -17,6 +18,7 @@ from ..models.sms_rule import SMSRule, SmsForwardLog
 from ..models.account_link import AccountLink
 from ..models.device import Device
 from ..api.sms import match_sms_with_rules
+from .metrics import FORWARD_DURATION, FORWARD_LAG, observe_duration
 
 logger = logging.getLogger(__name__)
 
@@ -343,7 +345,7 @@ class SMSForwarder:
 
 
 # 工具函数
-async def forward_sms(db: Session, sms: SMS) -> List[Dict[str, Any]]:
+async def forward_sms(db: Session, sms: SMS, queued_at: Optional[float] = None) -> List[Dict[str, Any]]:
     """
     转发短信的便捷函数
     Convenience function for forwarding SMS
@@ -351,12 +353,16 @@ async def forward_sms(db: Session, sms: SMS) -> List[Dict[str, Any]]:
     Args:
         db: 数据库会话
         sms: 短信对象
+        queued_at: 创建转发任务时的 time.monotonic() (用于统计转发延迟)
         
     Returns:
         转发结果列表
     """
+    if queued_at is not None:
+        FORWARD_LAG.observe(time.monotonic() - queued_at)
     forwarder = SMSForwarder(db)
-    return await forwarder.process_sms_forwarding(sms)
+    with observe_duration(FORWARD_DURATION):
+        return await forwarder.process_sms_forwarding(sms)
 
 
 def get_sms_forward_logs(db: Session, sms_id: Optional[int] = None,
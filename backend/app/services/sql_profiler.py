@@ -0,0 +1,136 @@
+"""
+SQL 性能分析服务
+SQL profiling: per-request query stats, N+1 detection and slow-query log
+
+启用 SQL_PROFILING_ENABLED 后在引擎上注册游标事件:
+- 所有SQL: 超过 SQL_SLOW_QUERY_MS 的语句记录慢查询日志 (参数只保留类型, 不输出值)
+- 被分析的请求 (管理员请求头开启, 或 SQL_PROFILING_ALL_REQUESTS): 统计查询数、总耗时,
+  按语句指纹 (去掉参数和 IN 列表长度) 聚合, 同一指纹重复超过阈值判定为 N+1
+未启用时不注册任何事件, 没有额外开销
+"""
+
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# 语句指纹: 参数占位符、字面量和 IN 列表统一替换
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*(?:%\(\w+\)s|\?|:\w+|\$\d+|'[^']*'|-?\d+(?:\.\d+)?)\s*,?)+\)", re.IGNORECASE)
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\?|:\w+|\$\d+")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b-?\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+
+# 日志中语句的最大长度
+STATEMENT_LOG_LIMIT = 500
+
+
+def fingerprint(statement: str) -> str:
+    """SQL语句指纹 (相同结构、不同参数的语句指纹相同)"""
+    normalized = _WHITESPACE.sub(" ", statement).strip()
+    normalized = _IN_LIST.sub("IN (?)", normalized)
+    normalized = _PLACEHOLDER.sub("?", normalized)
+    return _LITERAL.sub("?", normalized)
+
+
+def redact_parameters(parameters: Any) -> Any:
+    """参数脱敏: 只保留参数名和类型"""
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            # executemany
+            return f"<{len(parameters)} 组参数>"
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+@dataclass
+class RequestProfile:
+    """一个请求的SQL统计"""
+    query_count: int = 0
+    db_time: float = 0.0
+    fingerprints: Counter = field(default_factory=Counter)
+    fingerprint_time: Dict[str, float] = field(default_factory=dict)
+
+    def record(self, statement: str, duration: float):
+        key = fingerprint(statement)
+        self.query_count += 1
+        self.db_time += duration
+        self.fingerprints[key] += 1
+        self.fingerprint_time[key] = self.fingerprint_time.get(key, 0.0) + duration
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """重复次数达到阈值的语句指纹 (疑似 N+1), 按次数倒序"""
+        return [(key, count) for key, count in self.fingerprints.most_common() if count >= threshold]
+
+
+# 当前被分析的请求; 线程池中执行的同步代码会复制上下文, 记录到同一对象
+current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_sql_profile", default=None)
+
+
+class SqlProfiler:
+    """SQL 性能分析器"""
+
+    def __init__(self):
+        self.installed = False
+
+    def install(self, engine):
+        """在引擎上注册游标事件 (仅启用分析时)"""
+        if self.installed or not settings.sql_profiling_enabled:
+            return
+        from sqlalchemy import event
+
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        event.listen(engine, "handle_error", self._handle_error)
+        self.installed = True
+        logger.info(f"SQL性能分析已启用: 慢查询阈值 {settings.sql_slow_query_ms}ms")
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("profiler_query_start", []).append(time.perf_counter())
+
+    @staticmethod
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["profiler_query_start"].pop()
+        profile = current_profile.get()
+        if profile is not None:
+            profile.record(statement, duration)
+        if duration * 1000 >= settings.sql_slow_query_ms:
+            logger.warning(
+                f"慢查询 {duration * 1000:.1f}ms: {_WHITESPACE.sub(' ', statement)[:STATEMENT_LOG_LIMIT]} "
+                f"参数: {redact_parameters(parameters)}"
+            )
+
+    @staticmethod
+    def _handle_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("profiler_query_start"):
+            connection.info["profiler_query_start"].pop()
+
+    def report(self, method: str, path: str, profile: RequestProfile, elapsed: float):
+        """记录请求的分析结果, 疑似 N+1 时输出警告"""
+        threshold = settings.sql_n_plus_one_threshold
+        repeated = profile.repeated(threshold)
+        if repeated:
+            key, count = repeated[0]
+            logger.warning(
+                f"疑似N+1查询: {method} {path} 共 {profile.query_count} 条SQL, "
+                f"同一语句执行 {count} 次: {key[:STATEMENT_LOG_LIMIT]}"
+            )
+        else:
+            logger.info(
+                f"SQL分析: {method} {path} {profile.query_count} 条SQL, "
+                f"数据库 {profile.db_time * 1000:.1f}ms / 总计 {elapsed * 1000:.1f}ms"
+            )
+
+
+# 全局SQL性能分析器
+sql_profiler = SqlProfiler()
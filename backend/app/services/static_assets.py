@@ -0,0 +1,277 @@
+"""
+静态资源服务
+Static asset and SPA shell serving
+
+启动时一次性完成:
+- 为可压缩的静态资源生成 .gz / .br 预压缩文件 (brotli 为可选依赖)
+- 计算每个文件的内容哈希作为强 ETag
+- 将管理端和客户端的 index.html 读入内存并预先压缩
+
+请求时按 Accept-Encoding 选择预压缩文件, 带指纹的构建产物 (main.3f2a9c1d.js)
+使用一年 immutable 缓存, 其他文件和 SPA 入口页使用 no-cache + ETag 协商。
+"""
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import Response as StarletteResponse
+from starlette.types import Scope
+
+from ..config import settings
+from .image_delivery import etag_matches
+
+try:
+    import brotli
+except ImportError:  # 可选依赖, 未安装时只生成 gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# 构建工具生成的带内容指纹的文件名, 如 main.3f2a9c1d.js / 787.1a2b3c4d.chunk.js
+FINGERPRINT_PATTERN = re.compile(r"\.[0-9a-f]{8,}\.(?:chunk\.)?[A-Za-z0-9]+$")
+
+# 需要预压缩的文件类型 (图片、字体等已压缩格式不处理)
+COMPRESSIBLE_SUFFIXES = {
+    ".js", ".mjs", ".css", ".html", ".json", ".map", ".svg",
+    ".txt", ".xml", ".ico", ".webmanifest",
+}
+
+# 预压缩文件扩展名, 按优先级排列
+ENCODING_SUFFIXES = (("br", ".br"), ("gzip", ".gz"))
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+def choose_encoding(accept_encoding: str, available: Tuple[str, ...]) -> Optional[str]:
+    """
+    按 Accept-Encoding 从可用编码中选择一种 (优先 br, 其次 gzip)
+
+    Returns:
+        编码名称, 不可用或客户端不接受时返回None
+    """
+    if not accept_encoding or not available:
+        return None
+
+    accepted = {}
+    for item in accept_encoding.lower().split(","):
+        parts = item.strip().split(";")
+        quality = 1.0
+        for param in parts[1:]:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[parts[0].strip()] = quality
+
+    for encoding, _ in ENCODING_SUFFIXES:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if encoding in available and quality > 0:
+            return encoding
+    return None
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    """离线预压缩使用最高压缩级别"""
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+@dataclass
+class AssetInfo:
+    """静态文件的缓存信息"""
+    etag: str
+    immutable: bool
+    encodings: Tuple[str, ...] = ()
+
+
+@dataclass
+class ShellDocument:
+    """内存中的 SPA 入口页"""
+    body: bytes
+    etag: str
+    encoded: Dict[str, bytes] = field(default_factory=dict)
+
+    def response(self, request: Request) -> StarletteResponse:
+        """按 Accept-Encoding 和 If-None-Match 返回入口页"""
+        encoding = choose_encoding(request.headers.get("accept-encoding", ""), tuple(self.encoded))
+        etag = f'"{self.etag}-{encoding}"' if encoding else f'"{self.etag}"'
+        headers = {
+            "ETag": etag,
+            "Cache-Control": REVALIDATE_CACHE_CONTROL,
+            "Vary": "Accept-Encoding",
+        }
+
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+
+        if encoding:
+            headers["Content-Encoding"] = encoding
+            return Response(content=self.encoded[encoding], media_type="text/html", headers=headers)
+        return Response(content=self.body, media_type="text/html", headers=headers)
+
+
+class StaticAssetService:
+    """静态资源索引与 SPA 入口页缓存"""
+
+    def __init__(self):
+        self.assets: Dict[str, AssetInfo] = {}
+        self.shells: Dict[str, ShellDocument] = {}
+
+    def _available_encodings(self) -> Tuple[str, ...]:
+        return tuple(encoding for encoding, _ in ENCODING_SUFFIXES if encoding != "br" or brotli)
+
+    def _write_sidecar(self, path: Path, data: bytes, encoding: str, suffix: str) -> bool:
+        """生成预压缩文件, 已是最新或压缩无收益时跳过; 返回是否可用"""
+        sidecar = path.with_name(path.name + suffix)
+        source_stat = path.stat()
+        if sidecar.exists() and sidecar.stat().st_mtime >= source_stat.st_mtime:
+            return True
+
+        compressed = _compress(data, encoding)
+        if len(compressed) >= len(data):
+            return False
+
+        tmp_path = sidecar.with_name(f".{sidecar.name}.{uuid.uuid4().hex}.tmp")
+        tmp_path.write_bytes(compressed)
+        os.replace(tmp_path, sidecar)
+        return True
+
+    def prepare_directory(self, root: Path) -> Dict[str, int]:
+        """
+        为静态目录建立索引并生成预压缩文件
+
+        Returns:
+            {"files": 文件数, "compressed": 生成/复用的预压缩文件数}
+        """
+        summary = {"files": 0, "compressed": 0}
+        if not root.exists():
+            return summary
+
+        encodings = self._available_encodings() if settings.static_precompress else ()
+        sidecar_suffixes = tuple(suffix for _, suffix in ENCODING_SUFFIXES)
+
+        for path in root.rglob("*"):
+            if not path.is_file() or path.name.endswith(sidecar_suffixes) or path.name.startswith("."):
+                continue
+
+            # StaticFiles.lookup_path 默认按 realpath 解析, 静态目录或文件是符号链接时也要与之一致
+            real_path = Path(os.path.realpath(path))
+            data = real_path.read_bytes()
+            available = []
+            if path.suffix.lower() in COMPRESSIBLE_SUFFIXES and len(data) >= settings.static_compress_min_size:
+                for encoding, suffix in ENCODING_SUFFIXES:
+                    if encoding not in encodings:
+                        continue
+                    try:
+                        if self._write_sidecar(real_path, data, encoding, suffix):
+                            available.append(encoding)
+                            summary["compressed"] += 1
+                    except OSError as e:
+                        # 只读文件系统等情况下直接提供原文件
+                        logger.warning(f"生成预压缩文件失败: {path.name}, {e}")
+
+            self.assets[str(real_path)] = AssetInfo(
+                etag=hashlib.sha256(data).hexdigest()[:32],
+                immutable=bool(FINGERPRINT_PATTERN.search(path.name)),
+                encodings=tuple(available)
+            )
+            summary["files"] += 1
+
+        return summary
+
+    def load_shell(self, name: str, index_path: Path) -> Optional[ShellDocument]:
+        """读取 SPA 入口页到内存并预先压缩"""
+        if not index_path.exists():
+            self.shells.pop(name, None)
+            return None
+
+        body = index_path.read_bytes()
+        shell = ShellDocument(body=body, etag=hashlib.sha256(body).hexdigest()[:32])
+        for encoding in self._available_encodings():
+            shell.encoded[encoding] = _compress(body, encoding)
+        self.shells[name] = shell
+        return shell
+
+    def prepare(self, roots: Dict[str, Path]) -> Dict[str, Dict[str, int]]:
+        """
+        启动时准备所有静态目录和入口页
+
+        Args:
+            roots: 名称 -> 静态目录 (目录下的 index.html 作为该名称的入口页)
+        """
+        summary = {}
+        for name, root in roots.items():
+            summary[name] = self.prepare_directory(root)
+            self.load_shell(name, root / "index.html")
+            logger.info(
+                f"静态资源已就绪: {name}, 文件 {summary[name]['files']}, "
+                f"预压缩 {summary[name]['compressed']}"
+            )
+        return summary
+
+    def shell(self, name: str, index_path: Path) -> Optional[ShellDocument]:
+        """获取入口页, 启动准备之前的请求按需加载"""
+        return self.shells.get(name) or self.load_shell(name, index_path)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """支持预压缩文件、强 ETag 和指纹文件长期缓存的静态文件服务"""
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope,
+                      status_code: int = 200) -> StarletteResponse:
+        info = static_assets.assets.get(os.fspath(full_path))
+        if info is None:
+            # 启动后新增的文件, 按默认方式提供
+            return super().file_response(full_path, stat_result, scope, status_code)
+
+        request_headers = Headers(scope=scope)
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""), info.encodings)
+        headers = {
+            "ETag": f'"{info.etag}-{encoding}"' if encoding else f'"{info.etag}"',
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL if info.immutable else REVALIDATE_CACHE_CONTROL,
+        }
+        if info.encodings:
+            headers["Vary"] = "Accept-Encoding"
+
+        if etag_matches(request_headers.get("if-none-match"), headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+
+        if encoding:
+            headers["Content-Encoding"] = encoding
+            suffix = dict(ENCODING_SUFFIXES)[encoding]
+            media_type = mimetypes.guess_type(str(full_path))[0] or "text/plain"
+            return FileResponse(
+                f"{full_path}{suffix}",
+                status_code=status_code,
+                headers=headers,
+                media_type=media_type,
+                method=scope["method"]
+            )
+
+        return FileResponse(
+            full_path,
+            status_code=status_code,
+            headers=headers,
+            stat_result=stat_result,
+            method=scope["method"]
+        )
+
+
+# 全局静态资源服务实例
+static_assets = StaticAssetService()
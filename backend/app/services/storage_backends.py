@@ -0,0 +1,235 @@
+"""
+图片存储后端
+Pluggable object storage backends for images
+
+- local: 本地文件系统 (默认, 单机部署)
+- s3: S3兼容对象存储 (AWS S3 / MinIO 等, 需安装 boto3), 多副本共享图片,
+  可选将客户端重定向到签名URL, 图片流量不再经过应用进程
+"""
+
+import logging
+import os
+from abc import ABC, abstractmethod
+import shutil
+import stat as stat_module
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# 流式读取的分块大小
+READ_CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class ObjectStat:
+    """存储对象的元信息"""
+    size: int
+    mtime: float
+    # 本地文件的原始 stat 结果, 可直接交给 FileResponse 避免重复 stat
+    raw: Optional[os.stat_result] = None
+
+    @property
+    def mtime_ns(self) -> int:
+        return self.raw.st_mtime_ns if self.raw else int(self.mtime * 1_000_000_000)
+
+
+class StorageBackend(ABC):
+    """存储后端接口 (缺少必需方法的子类在实例化时即报错)"""
+
+    name = "base"
+
+    @abstractmethod
+    def stat(self, key: str) -> Optional[ObjectStat]:
+        """获取对象元信息, 不存在时返回None"""
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        return self.stat(key) is not None
+
+    @abstractmethod
+    def put_file(self, key: str, source_path: Path, content_type: Optional[str] = None):
+        """将本地已写完的文件保存为对象 (完成后源文件被移走或删除)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        """打开对象用于流式读取, 调用方负责关闭"""
+        raise NotImplementedError
+
+    def iter_chunks(self, key: str, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+        """分块读取对象内容"""
+        stream = self.open(key)
+        try:
+            for chunk in iter(lambda: stream.read(chunk_size), b""):
+                yield chunk
+        finally:
+            stream.close()
+
+    @abstractmethod
+    def delete(self, key: str):
+        """删除对象, 不存在时忽略"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_objects(self) -> Iterator[Tuple[str, ObjectStat]]:
+        """遍历所有对象"""
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """对象对应的本地文件路径, 非本地存储返回None"""
+        return None
+
+    def signed_url(self, key: str, expires: int) -> Optional[str]:
+        """生成限时访问URL, 不支持时返回None"""
+        return None
+
+
+class LocalStorageBackend(StorageBackend):
+    """本地文件系统存储"""
+
+    name = "local"
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        # 键只允许单级文件名, 防止越出存储目录
+        if not key or "/" in key or "\\" in key or key.startswith("."):
+            raise ValueError(f"无效的存储键: {key}")
+        return self.root / key
+
+    def stat(self, key: str) -> Optional[ObjectStat]:
+        try:
+            file_stat = self._path(key).stat()
+        except (FileNotFoundError, NotADirectoryError, ValueError):
+            return None
+        if not stat_module.S_ISREG(file_stat.st_mode):
+            return None
+        return ObjectStat(size=file_stat.st_size, mtime=file_stat.st_mtime, raw=file_stat)
+
+    def put_file(self, key: str, source_path: Path, content_type: Optional[str] = None):
+        # 临时文件与存储目录在同一文件系统时为原子改名
+        shutil.move(str(source_path), str(self._path(key)))
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self._path(key), "rb")
+
+    def delete(self, key: str):
+        try:
+            self._path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    def list_objects(self) -> Iterator[Tuple[str, ObjectStat]]:
+        if not self.root.exists():
+            return
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                file_stat = entry.stat()
+                yield entry.name, ObjectStat(size=file_stat.st_size, mtime=file_stat.st_mtime, raw=file_stat)
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return self._path(key)
+
+
+class S3StorageBackend(StorageBackend):
+    """S3兼容对象存储 (AWS S3 / MinIO)"""
+
+    name = "s3"
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None, access_key: Optional[str] = None,
+                 secret_key: Optional[str] = None):
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError:
+            raise RuntimeError("使用 S3 图片存储需要安装 boto3")
+
+        if not bucket:
+            raise RuntimeError("使用 S3 图片存储需要配置 IMAGE_S3_BUCKET")
+
+        self.bucket = bucket
+        self.prefix = prefix
+        # 自建 MinIO 等服务通常不支持虚拟主机风格的桶地址
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url or None,
+            region_name=region or None,
+            aws_access_key_id=access_key or None,
+            aws_secret_access_key=secret_key or None,
+            config=Config(
+                signature_version="s3v4",
+                s3={"addressing_style": "path" if endpoint_url else "auto"}
+            )
+        )
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    @staticmethod
+    def _is_not_found(error) -> bool:
+        code = error.response.get("Error", {}).get("Code")
+        return code in ("404", "NoSuchKey", "NotFound")
+
+    def stat(self, key: str) -> Optional[ObjectStat]:
+        from botocore.exceptions import ClientError
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if self._is_not_found(e):
+                return None
+            raise
+        return ObjectStat(size=head["ContentLength"], mtime=head["LastModified"].timestamp())
+
+    def put_file(self, key: str, source_path: Path, content_type: Optional[str] = None):
+        extra_args = {"ContentType": content_type} if content_type else {}
+        # upload_file 按分片流式上传, 不会把文件整体读入内存
+        self.client.upload_file(str(source_path), self.bucket, self._key(key), ExtraArgs=extra_args)
+        Path(source_path).unlink(missing_ok=True)
+
+    def open(self, key: str) -> BinaryIO:
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"]
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def list_objects(self) -> Iterator[Tuple[str, ObjectStat]]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                name = item["Key"][len(self.prefix):]
+                if not name or "/" in name or name.startswith("."):
+                    continue
+                yield name, ObjectStat(size=item["Size"], mtime=item["LastModified"].timestamp())
+
+    def signed_url(self, key: str, expires: int) -> Optional[str]:
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._key(key)},
+            ExpiresIn=expires
+        )
+
+
+def create_storage_backend(upload_dir: Path) -> StorageBackend:
+    """根据配置创建图片存储后端"""
+    if settings.image_storage_backend == "s3":
+        backend = S3StorageBackend(
+            bucket=settings.image_s3_bucket,
+            prefix=settings.image_s3_prefix,
+            endpoint_url=settings.image_s3_endpoint_url,
+            region=settings.image_s3_region,
+            access_key=settings.image_s3_access_key,
+            secret_key=settings.image_s3_secret_key
+        )
+        logger.info(f"图片存储后端: S3 (bucket={settings.image_s3_bucket}, prefix={settings.image_s3_prefix})")
+        return backend
+
+    return LocalStorageBackend(upload_dir)
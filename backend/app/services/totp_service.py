@@ -3,8 +3,6 @@ TOTP (Time-based One-Time Password) 服务
 TOTP Service for Two-Factor Authentication
 """
 
-import pyotp
-import qrcode
 import io
 import base64
 import secrets
@@ -14,12 +12,15 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# pyotp 和 qrcode (依赖 Pillow) 在首次使用时导入, 不拖慢应用启动
+
 class TOTPService:
     """TOTP双因素认证服务"""
     
     @staticmethod
     def generate_secret() -> str:
         """生成TOTP密钥"""
+        import pyotp
         return pyotp.random_base32()
     
     @staticmethod
@@ -28,6 +29,9 @@ class TOTPService:
         生成QR码用于Google Authenticator等应用
         返回base64编码的PNG图片
         """
+        import pyotp
+        import qrcode
+        
         try:
             # 创建TOTP对象
             totp = pyotp.TOTP(secret)
@@ -68,6 +72,8 @@ class TOTPService:
         验证TOTP令牌
         window: 允许的时间窗口（默认1，允许前后30秒的误差）
         """
+        import pyotp
+        
         try:
             if not secret or not token:
                 return False
@@ -82,6 +88,8 @@ class TOTPService:
     @staticmethod
     def get_current_token(secret: str) -> str:
         """获取当前时间的TOTP令牌（用于测试）"""
+        import pyotp
+        
         try:
             totp = pyotp.TOTP(secret)
             return totp.now()
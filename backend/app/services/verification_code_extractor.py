@@ -8,6 +8,8 @@ from typing import List, Dict, Optional, Tuple
 from dataclasses import dataclass
 import logging
 
+from .metrics import CODE_EXTRACTION_DURATION, observe_duration
+
 logger = logging.getLogger(__name__)
 
 
@@ -216,21 +218,23 @@ class SmartVerificationCodeExtractor:
         智能提取验证码
         Smart verification code extraction
         """
+        with observe_duration(CODE_EXTRACTION_DURATION):
+            return self._extract_verification_codes(content, sender)
+    
+    def _extract_verification_codes(self, content: str, sender: str) -> List[VerificationCodeResult]:
         results = []
         region = self.detect_sms_region(sender, content)
+        # 每条短信都会调用, 明细日志仅在 DEBUG 级别输出
+        debug = logger.isEnabledFor(logging.DEBUG)
         
-        logger.info(f"🔍 验证码提取开始: 发送方={sender}, 地区={region}, 内容长度={len(content)}")
+        if debug:
+            logger.debug("🔍 验证码提取开始: 发送方=%s, 地区=%s, 内容长度=%d", sender, region, len(content))
         
-        # 根据地区选择优先模式
-        if region == 'domestic':
-            pattern_groups = [self.domestic_patterns, self.international_patterns, self.generic_patterns]
-            logger.info("🇨🇳 使用国内短信模式优先")
-        elif region == 'international':
+        # 根据地区选择优先模式 (地区未知时使用混合模式)
+        if region == 'international':
             pattern_groups = [self.international_patterns, self.domestic_patterns, self.generic_patterns]
-            logger.info("🌍 使用国际短信模式优先")
         else:
             pattern_groups = [self.domestic_patterns, self.international_patterns, self.generic_patterns]
-            logger.info("❓ 地区未知，使用混合模式")
         
         # 按优先级顺序匹配
         for pattern_group in pattern_groups:
@@ -243,7 +247,8 @@ class SmartVerificationCodeExtractor:
                     
                     # 排除不合理的代码
                     if self.is_excluded_code(code):
-                        logger.debug(f"❌ 排除代码: {code} (匹配排除模式)")
+                        if debug:
+                            logger.debug("❌ 排除代码: %s (匹配排除模式)", code)
                         continue
                     
                     # 检查是否已经找到相同的代码
@@ -259,12 +264,15 @@ class SmartVerificationCodeExtractor:
                     )
                     
                     results.append(result)
-                    logger.info(f"✅ 找到验证码: {code} (类型={pattern_info['type']}, 置信度={pattern_info['confidence']:.2f})")
+                    if debug:
+                        logger.debug("✅ 找到验证码: %s (类型=%s, 置信度=%.2f)",
+                                     code, pattern_info['type'], pattern_info['confidence'])
         
         # 按置信度排序
         results.sort(key=lambda x: x.confidence, reverse=True)
         
-        logger.info(f"🎯 验证码提取完成: 共找到 {len(results)} 个候选验证码")
+        if debug:
+            logger.debug("🎯 验证码提取完成: 共找到 %d 个候选验证码", len(results))
         return results
     
     def _get_context(self, content: str, position: Tuple[int, int], context_length: int = 20) -> str:
@@ -5,12 +5,19 @@ WebSocket real-time communication module
 
 from fastapi import WebSocket, WebSocketDisconnect
 from typing import List, Dict, Any
-import json
 import logging
 from datetime import datetime
 
+from .services.metrics import (
+    WEBSOCKET_BROADCAST_DURATION, WEBSOCKET_CONNECTIONS, WEBSOCKET_PENDING_SENDS, observe_duration
+)
+from .services.serialization import dumps_text
+
 logger = logging.getLogger(__name__)
 
+# 链接过期时关闭客户端连接使用的关闭码
+LINK_EXPIRED_CLOSE_CODE = 4410
+
 
 class ConnectionManager:
     """WebSocket连接管理器"""
@@ -30,6 +37,7 @@ class ConnectionManager:
             "user_type": user_type,
             "connected_at": datetime.utcnow(),
         }
+        WEBSOCKET_CONNECTIONS.labels(user_type).inc()
         logger.info(f"WebSocket连接已建立: user_id={user_id}, user_type={user_type}")
         
         # 发送连接成功消息
@@ -46,32 +54,43 @@ class ConnectionManager:
             self.active_connections.remove(websocket)
             if websocket in self.connection_info:
                 del self.connection_info[websocket]
+            WEBSOCKET_CONNECTIONS.labels(user_info.get("user_type")).dec()
             logger.info(f"WebSocket连接已断开: user_id={user_info.get('user_id')}")
     
     async def send_personal_message(self, message: dict, websocket: WebSocket):
         """发送个人消息"""
+        WEBSOCKET_PENDING_SENDS.inc()
         try:
-            await websocket.send_text(json.dumps(message, ensure_ascii=False))
+            await websocket.send_text(dumps_text(message))
         except Exception as e:
             logger.error(f"发送个人消息失败: {e}")
             self.disconnect(websocket)
+        finally:
+            WEBSOCKET_PENDING_SENDS.dec()
     
     async def broadcast(self, message: dict, user_type: str = None):
         """广播消息给所有连接或特定类型用户"""
         disconnected_connections = []
+        # 同一消息只序列化一次
+        text = dumps_text(message)
         
-        for connection in self.active_connections:
-            try:
-                # 如果指定了用户类型，只发送给该类型用户
-                if user_type:
-                    conn_info = self.connection_info.get(connection, {})
-                    if conn_info.get("user_type") != user_type:
-                        continue
-                
-                await connection.send_text(json.dumps(message, ensure_ascii=False))
-            except Exception as e:
-                logger.error(f"广播消息失败: {e}")
-                disconnected_connections.append(connection)
+        # 如果指定了用户类型，只发送给该类型用户
+        recipients = [
+            connection for connection in self.active_connections
+            if not user_type or self.connection_info.get(connection, {}).get("user_type") == user_type
+        ]
+        
+        # 待发送的消息数计入发送队列深度, 逐个发送后减少
+        WEBSOCKET_PENDING_SENDS.inc(len(recipients))
+        with observe_duration(WEBSOCKET_BROADCAST_DURATION, user_type=user_type or "all"):
+            for connection in recipients:
+                try:
+                    await connection.send_text(text)
+                except Exception as e:
+                    logger.error(f"广播消息失败: {e}")
+                    disconnected_connections.append(connection)
+                finally:
+                    WEBSOCKET_PENDING_SENDS.dec()
         
         # 清理断开的连接
         for connection in disconnected_connections:
@@ -117,6 +136,37 @@ class ConnectionManager:
         }
         await self.broadcast(message, user_type="admin")
     
+    async def send_job_progress(self, job_data: dict):
+        """发送后台任务进度"""
+        message = {
+            "type": "job_progress",
+            "data": job_data,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        await self.broadcast(message, user_type="admin")
+    
+    async def close_link_connections(self, link_ids: List[str]):
+        """通知并断开指定链接的客户端连接 (链接已过期)"""
+        expired = set(link_ids)
+        targets = [
+            connection for connection in self.active_connections
+            if self.connection_info.get(connection, {}).get("user_type") == "customer"
+            and self.connection_info.get(connection, {}).get("user_id") in expired
+        ]
+        for connection in targets:
+            await self.send_personal_message({
+                "type": "link_expired",
+                "message": "链接已过期",
+                "timestamp": datetime.utcnow().isoformat()
+            }, connection)
+            try:
+                await connection.close(code=LINK_EXPIRED_CLOSE_CODE)
+            except Exception as e:
+                logger.debug(f"关闭过期链接连接失败: {e}")
+            self.disconnect(connection)
+        if targets:
+            logger.info(f"已断开 {len(targets)} 个过期链接的客户端连接")
+    
     async def send_admin_push_sms(self, push_data: dict):
         """发送管理员推送的短信到客户端"""
         message = {
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+接口基准测试
+Query benchmark suite: time every list, statistics and customer endpoint against a seeded database
+
+先用 benchmarks.dataset 生成数据, 再在 backend 目录下运行:
+    python -m benchmarks.bench_endpoints --iterations 20 --save benchmarks/baselines/main.json
+    python -m benchmarks.bench_endpoints --baseline benchmarks/baselines/main.json
+
+- 进程内调用 ASGI 应用 (不经过网络), 关闭公开接口限流, 每个接口先预热再计时
+- 测试对象取自生成的数据: 短信最多的设备、规则最多的账号, 客户接口每次使用不同的链接
+- 指定 --baseline 时与基线比较 P50, 变慢超过 --threshold 的接口视为回归, 进程返回非零退出码
+- 任一接口返回 2xx/304 以外的状态码时视为失败: 不保存结果、不与基线比较, 进程返回非零退出码
+  (出错的请求往往很快, 计入耗时会被误认为性能提升)
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# 应用在导入时读取配置; 基准测试只测接口本身, 不受限流影响
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+os.environ.setdefault("LINK_EXPIRY_SWEEP_ENABLED", "false")
+
+import httpx
+from sqlalchemy import func, select
+
+from app.api.auth import create_access_token
+from app.database import SessionLocal, engine
+from app.main import app
+from app.models.account import Account
+from app.models.account_link import AccountLink
+from app.models.device import Device
+from app.models.sms import SMS
+from app.models.sms_rule import SMSRule
+from benchmarks.dataset import SEED_PREFIX, dataset_summary
+
+
+def load_fixtures(link_count: int) -> Dict[str, Any]:
+    """从生成的数据中选取测试对象"""
+    db = SessionLocal()
+    try:
+        heavy_device = db.execute(
+            select(SMS.device_id, func.count()).join(Device, Device.id == SMS.device_id)
+            .where(Device.device_id.like(f"{SEED_PREFIX}%"))
+            .group_by(SMS.device_id).order_by(func.count().desc()).limit(1)
+        ).first()
+        if heavy_device is None:
+            raise SystemExit("未找到生成的数据, 请先运行 python -m benchmarks.dataset")
+
+        # 绑定在最热设备上、规则最多的账号
+        account_id = db.scalar(
+            select(Account.id).join(SMSRule, SMSRule.account_id == Account.id)
+            .where(Account.primary_device_id == heavy_device[0])
+            .group_by(Account.id).order_by(func.count().desc()).limit(1)
+        ) or db.scalar(
+            select(Account.id).where(Account.account_name.like(f"{SEED_PREFIX}%")).limit(1)
+        )
+        link_ids = list(db.scalars(
+            select(AccountLink.link_id).join(Account, Account.id == AccountLink.account_id)
+            .where(Account.account_name.like(f"{SEED_PREFIX}%"), AccountLink.device_id == heavy_device[0])
+            .limit(link_count)
+        ))
+        if not link_ids:
+            link_ids = list(db.scalars(select(AccountLink.link_id).limit(link_count)))
+        sms_id = db.scalar(select(SMS.id).where(SMS.device_id == heavy_device[0]).limit(1))
+        return {
+            "device_id": heavy_device[0],
+            "device_sms": heavy_device[1],
+            "account_id": account_id,
+            "sms_id": sms_id,
+            "link_ids": link_ids,
+            "dataset": dataset_summary(db),
+        }
+    finally:
+        db.close()
+
+
+def build_cases(fixtures: Dict[str, Any]) -> List[Tuple[str, str, Dict[str, Any], bool]]:
+    """测试用例: (名称, 路径, 查询参数, 是否为客户接口)"""
+    device_id = fixtures["device_id"]
+    account_id = fixtures["account_id"]
+    return [
+        # 列表
+        ("devices.list", "/api/devices/list", {}, False),
+        ("devices.list.search", "/api/devices/list", {"search": "Xiaomi"}, False),
+        ("accounts.list", "/api/accounts/list", {}, False),
+        ("accounts.available_devices", "/api/accounts/available-devices", {}, False),
+        ("accounts.sms", f"/api/accounts/{account_id}/sms", {}, False),
+        ("accounts.latest_verification_code", f"/api/accounts/{account_id}/latest-verification-code", {}, False),
+        ("sms.list", "/api/sms/list", {}, False),
+        ("sms.list.device", "/api/sms/list", {"device_id": device_id}, False),
+        ("sms.list.category", "/api/sms/list", {"category": "verification"}, False),
+        ("sms.list.search", "/api/sms/list", {"search": "验证码"}, False),
+        ("sms.list.deep_page", "/api/sms/list", {"page": 200, "page_size": 100}, False),
+        ("sms.detail", f"/api/sms/{fixtures['sms_id']}", {}, False),
+        ("sms.rules.list", "/api/sms/rules/list", {}, False),
+        ("sms.rules.account", "/api/sms_rules", {"account_id": account_id}, False),
+        ("sms.forward_logs.list", "/api/sms/forward_logs/list", {}, False),
+        ("links.list", "/api/links/list", {}, False),
+        ("links.list.device", "/api/links/list", {"device_id": device_id}, False),
+        # 统计
+        ("devices.statistics", "/api/devices/statistics/overview", {}, False),
+        ("accounts.statistics", "/api/accounts/statistics/overview", {}, False),
+        ("sms.statistics", "/api/sms/statistics/overview", {}, False),
+        ("links.statistics", "/api/links/statistics/overview", {}, False),
+        # 客户接口 (链接ID每次轮换)
+        ("customer.get_account_info", "/api/get_account_info", {}, True),
+        ("customer.get_verification_code", "/api/get_verification_code", {}, True),
+        ("customer.get_existing_sms", "/api/get_existing_sms", {}, True),
+        ("customer.get_latest_sms", "/api/get_latest_sms", {}, True),
+        ("customer.public_info", "/api/links/public/{link_id}/info", {}, True),
+    ]
+
+
+def is_success(status_code: int) -> bool:
+    return 200 <= status_code < 300 or status_code == 304
+
+
+async def measure(client: httpx.AsyncClient, headers: Dict[str, str], path: str, params: Dict[str, Any],
+                  customer: bool, link_ids: List[str], iterations: int, warmup: int) -> Dict[str, Any]:
+    timings: List[float] = []
+    statuses: Dict[str, int] = {}
+    failures = 0
+    for index in range(warmup + iterations):
+        request_path, request_params = path, dict(params)
+        if customer:
+            link_id = link_ids[index % len(link_ids)]
+            if "{link_id}" in path:
+                request_path = path.format(link_id=link_id)
+            else:
+                request_params["link_id"] = link_id
+        started = time.perf_counter()
+        response = await client.get(request_path, params=request_params, headers=headers)
+        elapsed = (time.perf_counter() - started) * 1000
+        if index >= warmup:
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+            if is_success(response.status_code):
+                timings.append(elapsed)
+            else:
+                failures += 1
+    if not timings:
+        return {"failures": failures, "status_codes": statuses}
+    timings.sort()
+    return {
+        "mean_ms": round(statistics.mean(timings), 2),
+        "p50_ms": round(timings[len(timings) // 2], 2),
+        "p95_ms": round(timings[max(0, int(len(timings) * 0.95) - 1)], 2),
+        "min_ms": round(timings[0], 2),
+        "failures": failures,
+        "status_codes": statuses,
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    fixtures = load_fixtures(max(args.iterations + args.warmup, 1))
+    cases = [case for case in build_cases(fixtures) if not args.only or any(key in case[0] for key in args.only)]
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'admin'})}"}
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver", timeout=120) as client:
+            for name, path, params, customer in cases:
+                results[name] = await measure(
+                    client, {} if customer else headers, path, params, customer,
+                    fixtures["link_ids"], args.iterations, args.warmup
+                )
+                result = results[name]
+                if "p50_ms" in result:
+                    print(f"{name:<40}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}  {result['status_codes']}")
+                else:
+                    print(f"{name:<40}{'-':>10}{'-':>10}  {result['status_codes']}  ❌ 全部失败")
+
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "database": engine.dialect.name,
+            "dataset": fixtures["dataset"],
+            "hot_device_sms": fixtures["device_sms"],
+            "iterations": args.iterations,
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float, min_delta_ms: float) -> List[str]:
+    """与基线比较 P50, 返回回归的接口"""
+    regressions = []
+    print(f"\n与基线比较 (基线版本 {baseline['meta'].get('revision')}, 数据集 {baseline['meta'].get('dataset')})")
+    print(f"{'接口':<40}{'基线P50':>10}{'当前P50':>10}{'变化':>10}")
+    for name, result in current["results"].items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            print(f"{name:<40}{'-':>10}{result['p50_ms']:>10.2f}{'新增':>10}")
+            continue
+        ratio = result["p50_ms"] / previous["p50_ms"] if previous["p50_ms"] else 1.0
+        regressed = ratio > 1 + threshold and result["p50_ms"] - previous["p50_ms"] > min_delta_ms
+        marker = "  ⚠️ 回归" if regressed else ""
+        print(f"{name:<40}{previous['p50_ms']:>10.2f}{result['p50_ms']:>10.2f}{(ratio - 1) * 100:>9.1f}%{marker}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="接口基准测试")
+    parser.add_argument("--iterations", type=int, default=20, help="每个接口的计时次数")
+    parser.add_argument("--warmup", type=int, default=2, help="每个接口的预热次数")
+    parser.add_argument("--only", nargs="*", help="只测试名称包含这些关键字的接口")
+    parser.add_argument("--save", help="保存结果 (作为后续比较的基线)")
+    parser.add_argument("--baseline", help="与之比较的基线结果文件")
+    parser.add_argument("--threshold", type=float, default=0.2, help="P50 变慢超过该比例视为回归")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="P50 变慢少于该毫秒数时不视为回归")
+    args = parser.parse_args()
+
+    print(f"{'接口':<40}{'P50(ms)':>10}{'P95(ms)':>10}  状态码")
+    result = asyncio.run(run(args))
+
+    failed = [name for name, case in result["results"].items() if case["failures"]]
+    if failed:
+        print(f"\n{len(failed)} 个接口返回了错误状态码, 结果无效 (不保存、不比较): {', '.join(failed)}")
+        sys.exit(1)
+
+    if args.save:
+        path = Path(args.save)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"结果已保存: {path}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare(result, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} 个接口出现回归: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
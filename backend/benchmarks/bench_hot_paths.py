@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+热点函数微基准测试
+Micro-benchmarks for per-message hot paths: rule matching, verification code extraction and classification
+
+- 固定种子的短信样本 (与 benchmarks.dataset 使用相同模板) 和不同规模的规则集 (1/10/100 条)
+- 每项取多轮中最快的一轮计算 ops/sec (每条短信计一次操作)
+- 单独一轮在 tracemalloc 下运行, 统计每次操作的峰值分配字节数和调用后仍存活的字节数
+- --save 保存结果, --baseline 与之前的结果比较 ops/sec
+
+在 backend 目录下运行 (不访问数据库):
+    python -m benchmarks.bench_hot_paths --messages 2000 --repeat 5
+    python -m benchmarks.bench_hot_paths --save benchmarks/baselines/hot_paths.json
+    python -m benchmarks.bench_hot_paths --baseline benchmarks/baselines/hot_paths.json
+"""
+
+import argparse
+import gc
+import json
+import logging
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.api import android_client, sms as sms_api
+from app.models.sms import SMS
+from app.models.sms_rule import SMSRule
+from app.services.rule_predicates import rule_matches
+from app.services.verification_code_extractor import verification_extractor
+from benchmarks.dataset import sample_messages
+
+# 规则模板: (发送方模式, 发送方匹配, 内容模式, 内容匹配); {d} 为规则序号的末位数字
+RULE_KINDS: Sequence[Tuple[str, str, str, str]] = (
+    ("", "fuzzy", "*验证码*", "fuzzy"),              # 内容包含
+    ("106{d}*", "fuzzy", "", "fuzzy"),              # 发送方前缀
+    ("9558{d}", "exact", "", "fuzzy"),              # 发送方精确匹配
+    ("", "fuzzy", r"G-\d{{6}}", "regex"),           # 内容正则
+    ("", "fuzzy", "验证码*有效", "fuzzy"),          # 中间通配符 (按正则匹配)
+    (r"^\+44", "regex", "*code*", "fuzzy"),         # 发送方正则 + 内容包含
+    ("*555*", "fuzzy", "", "fuzzy"),                # 发送方包含
+    ("", "fuzzy", "*unsubscribe", "fuzzy"),         # 内容后缀
+)
+RULE_SET_SIZES = (1, 10, 100)
+
+
+def build_rules(count: int) -> List[SMSRule]:
+    rules = []
+    for index in range(count):
+        sender_pattern, sender_match, content_pattern, content_match = RULE_KINDS[index % len(RULE_KINDS)]
+        rules.append(SMSRule(
+            id=index + 1,
+            account_id=1,
+            rule_name=f"rule-{index}",
+            sender_pattern=sender_pattern.format(d=index % 10),
+            sender_match_type=sender_match,
+            content_pattern=content_pattern.format(d=index % 10),
+            content_match_type=content_match,
+            is_active=True,
+            priority=index,
+        ))
+    return rules
+
+
+def build_cases(messages: List[Tuple[str, str, str]]) -> List[Tuple[str, Callable[[Any], Any], List[Any]]]:
+    """测试用例: (名称, 函数, 每次调用的参数列表)"""
+    sms_objects = [SMS(sender=sender, content=content) for sender, content, _ in messages]
+    pairs = [(sender, content) for sender, content, _ in messages]
+    contents = [content for _, content, _ in messages]
+
+    cases = []
+    for size in RULE_SET_SIZES:
+        rules = build_rules(size)
+        cases.append((
+            f"match_sms_with_rules[rules={size}]",
+            lambda sms, rules=rules: sms_api.match_sms_with_rules(sms, rules),
+            sms_objects,
+        ))
+    # 单条规则的匹配 (原 customer.match_sms_with_rule, 现为 rule_predicates.rule_matches)
+    for rule in build_rules(len(RULE_KINDS)):
+        label = f"{rule.sender_match_type}:{rule.sender_pattern or '-'}|{rule.content_match_type}:{rule.content_pattern or '-'}"
+        cases.append((
+            f"rule_matches[{label}]",
+            lambda pair, rule=rule: rule_matches(rule, pair[0], pair[1]),
+            pairs,
+        ))
+    cases.append((
+        "extract_verification_codes",
+        lambda pair: verification_extractor.extract_verification_codes(pair[1], pair[0]),
+        pairs,
+    ))
+    cases.append(("sms.categorize_sms", sms_api.categorize_sms, contents))
+    cases.append(("android_client.categorize_sms", android_client.categorize_sms, contents))
+    return cases
+
+
+def time_case(function: Callable[[Any], Any], arguments: List[Any], repeat: int) -> float:
+    """多轮中最快一轮的耗时 (秒)"""
+    best = float("inf")
+    for _ in range(repeat):
+        gc.disable()
+        started = time.perf_counter()
+        for argument in arguments:
+            function(argument)
+        best = min(best, time.perf_counter() - started)
+        gc.enable()
+    return best
+
+
+def allocations(function: Callable[[Any], Any], arguments: List[Any]) -> Dict[str, float]:
+    """tracemalloc 下每次调用的平均峰值分配量和调用结束后仍存活的字节数 (缓存增长)"""
+    function(arguments[0])  # 预热 (编译正则、初始化缓存)
+    tracemalloc.start()
+    try:
+        peak_total = 0
+        started, _ = tracemalloc.get_traced_memory()
+        for argument in arguments:
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            function(argument)
+            _, peak = tracemalloc.get_traced_memory()
+            peak_total += peak - current
+        retained, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "alloc_peak_bytes": round(peak_total / len(arguments), 1),
+        "retained_bytes": retained - started,
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    messages = sample_messages(args.messages, args.seed)
+    results = {}
+    print(f"{'函数':<70}{'ops/sec':>12}{'ns/op':>10}{'峰值分配(B)':>14}")
+    for name, function, arguments in build_cases(messages):
+        if args.only and not any(key in name for key in args.only):
+            continue
+        function(arguments[0])
+        elapsed = time_case(function, arguments, args.repeat)
+        result = {
+            "ops_per_sec": round(len(arguments) / elapsed, 1),
+            "ns_per_op": round(elapsed / len(arguments) * 1e9, 1),
+            **allocations(function, arguments[:args.alloc_sample]),
+        }
+        results[name] = result
+        print(f"{name:<70}{result['ops_per_sec']:>12.0f}{result['ns_per_op']:>10.0f}{result['alloc_peak_bytes']:>14.0f}")
+    return {
+        "meta": {"messages": args.messages, "seed": args.seed, "repeat": args.repeat, "python": sys.version.split()[0]},
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """与基线比较 ops/sec, 返回变慢超过阈值的函数"""
+    regressions = []
+    print(f"\n{'函数':<70}{'基线':>12}{'当前':>12}{'变化':>10}")
+    for name, result in current["results"].items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            continue
+        change = result["ops_per_sec"] / previous["ops_per_sec"] - 1
+        marker = "  ⚠️ 回归" if change < -threshold else ""
+        print(f"{name:<70}{previous['ops_per_sec']:>12.0f}{result['ops_per_sec']:>12.0f}{change * 100:>9.1f}%{marker}")
+        if marker:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="热点函数微基准测试")
+    parser.add_argument("--messages", type=int, default=2000, help="短信样本条数")
+    parser.add_argument("--seed", type=int, default=42, help="样本随机数种子")
+    parser.add_argument("--repeat", type=int, default=5, help="计时轮数 (取最快一轮)")
+    parser.add_argument("--alloc-sample", type=int, default=200, help="统计内存分配的调用次数")
+    parser.add_argument("--only", nargs="*", help="只运行名称包含这些关键字的用例")
+    parser.add_argument("--save", help="保存结果 (作为后续比较的基线)")
+    parser.add_argument("--baseline", help="与之比较的基线结果文件")
+    parser.add_argument("--threshold", type=float, default=0.1, help="ops/sec 下降超过该比例视为回归")
+    args = parser.parse_args()
+
+    # 只测函数本身: 日志格式化仍计入耗时, 但不输出
+    logging.disable(logging.INFO)
+
+    result = run(args)
+    if args.save:
+        path = Path(args.save)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"结果已保存: {path}")
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare(result, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} 个函数出现回归: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
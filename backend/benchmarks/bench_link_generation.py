@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+链接批量生成基准测试
+Benchmark bulk link generation: per-object ORM inserts versus the bulk
+path (vectorized link ids + COPY / multi-row INSERT)
+
+在 backend 目录下运行 (使用 DATABASE_URL 指定的数据库):
+    python -m benchmarks.bench_link_generation --count 20000
+
+测试数据在同一事务中写入, 结束时回滚, 不会残留在数据库中。
+"""
+
+import argparse
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, init_database
+from app.models.account import Account
+from app.models.account_link import AccountLink
+from app.models.device import Device
+from app.services.link_generator import LinkBatchParams, generate_link_ids, link_generator
+
+
+def seed(db: Session) -> LinkBatchParams:
+    """写入测试设备和账号 (仅 flush, 由调用方回滚)"""
+    device = Device(device_id=f"linkgen-{uuid.uuid4().hex[:12]}", brand="Bench", model="LinkGen")
+    db.add(device)
+    db.flush()
+    account = Account(account_name="linkgen-bench", username="bench", password="bench",
+                      type="bench", primary_device_id=device.id)
+    db.add(account)
+    db.flush()
+    return LinkBatchParams(account_id=account.id, device_id=device.id)
+
+
+def legacy_create(db: Session, params: LinkBatchParams, count: int):
+    """原实现: 逐个构造ORM对象 (每个对象单独调用 uuid4), 统一flush"""
+    for _ in range(count):
+        link = AccountLink(
+            account_id=params.account_id,
+            device_id=params.device_id,
+            max_access_count=params.max_access_count,
+            max_verification_count=params.max_verification_count,
+            verification_interval=10,
+            access_session_interval=params.access_session_interval,
+            verification_wait_time=params.verification_wait_time,
+        )
+        link.link_url = f"/customer/{link.link_id}"
+        db.add(link)
+    db.flush()
+
+
+def timed(name: str, action, count: int):
+    started = time.perf_counter()
+    action()
+    elapsed = time.perf_counter() - started
+    print(f"{name:<32}{elapsed * 1000:>12.1f}{count / elapsed:>14.0f}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="链接批量生成基准测试")
+    parser.add_argument("--count", type=int, default=20000, help="生成的链接数量")
+    args = parser.parse_args()
+
+    init_database()
+    db = SessionLocal()
+    try:
+        params = seed(db)
+        bind = db.get_bind()
+        print(f"生成 {args.count} 个链接 ({bind.dialect.name}/{bind.dialect.driver})")
+        print(f"{'实现':<32}{'耗时(ms)':>12}{'链接/秒':>14}")
+
+        timed("uuid4() x N", lambda: [str(uuid.uuid4()) for _ in range(args.count)], args.count)
+        timed("generate_link_ids", lambda: generate_link_ids(args.count), args.count)
+
+        legacy = timed("ORM 逐个创建 (原实现)", lambda: legacy_create(db, params, args.count), args.count)
+        db.expunge_all()
+        bulk = timed("insert_links (COPY/多行INSERT)",
+                     lambda: link_generator.insert_links(db, params, args.count), args.count)
+        print(f"加速比: {legacy / bulk:.2f}x")
+    finally:
+        db.rollback()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+链接配额并发测试
+Concurrency check for link quotas: N parallel requests against a link with a
+small quota must be granted exactly max times
+
+每个线程使用独立的数据库会话和事件循环直接调用接口函数, 相当于多个工作进程
+同时处理同一链接的请求。同时给出旧的 "先读后写" 实现作为对照。
+
+在 backend 目录下运行 (需要 PostgreSQL, SQLite 单连接无法并发):
+    python -m benchmarks.bench_link_quota --requests 100 --max-count 10
+
+测试数据在结束时删除。
+"""
+
+import argparse
+import asyncio
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app.config import settings
+from app.database import SessionLocal, init_database
+from app.models.account import Account
+from app.models.account_link import AccountLink
+from app.models.device import Device
+from app.models.sms import SMS
+from app.api import customer, links
+
+
+def seed(max_count: int) -> Dict[str, int]:
+    """写入测试设备、账号和短信"""
+    db = SessionLocal()
+    try:
+        device = Device(device_id=f"quota-{uuid.uuid4().hex[:12]}", brand="Bench", model="Quota", is_online=True)
+        db.add(device)
+        db.flush()
+        account = Account(account_name="quota-bench", username="bench", password="bench",
+                          type="bench", primary_device_id=device.id)
+        db.add(account)
+        db.add(SMS(device_id=device.id, sender="10690000", content="您的验证码为 482913，5分钟内有效。",
+                   sms_timestamp=datetime.now(timezone.utc), category="verification"))
+        db.commit()
+        return {"device_id": device.id, "account_id": account.id, "max_count": max_count}
+    finally:
+        db.close()
+
+
+def new_link(fixture: Dict[str, int]) -> str:
+    db = SessionLocal()
+    try:
+        link = AccountLink(
+            account_id=fixture["account_id"],
+            device_id=fixture["device_id"],
+            max_access_count=fixture["max_count"],
+            max_verification_count=fixture["max_count"],
+            access_count=0,
+            verification_count=0
+        )
+        db.add(link)
+        db.commit()
+        return link.link_id
+    finally:
+        db.close()
+
+
+def cleanup(fixture: Dict[str, int]):
+    db = SessionLocal()
+    try:
+        db.query(AccountLink).filter(AccountLink.account_id == fixture["account_id"]).delete()
+        db.query(SMS).filter(SMS.device_id == fixture["device_id"]).delete()
+        db.query(Account).filter(Account.id == fixture["account_id"]).delete()
+        db.query(Device).filter(Device.id == fixture["device_id"]).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+def final_counts(link_id: str):
+    db = SessionLocal()
+    try:
+        link = db.query(AccountLink).filter(AccountLink.link_id == link_id).first()
+        return link.access_count, link.verification_count
+    finally:
+        db.close()
+
+
+def _request() -> Request:
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": [], "client": ("127.0.0.1", 0)})
+
+
+def call_endpoint(endpoint: Callable, link_id: str) -> bool:
+    """在独立会话和事件循环中调用一次接口, 返回是否被允许"""
+    db = SessionLocal()
+    try:
+        if endpoint in (links.get_verification_codes, links.get_public_account_info):
+            result = asyncio.run(endpoint(link_id, _request(), db))
+        else:
+            result = asyncio.run(endpoint(link_id=link_id, db=db))
+        return bool(result.get("success"))
+    except HTTPException as e:
+        if e.status_code in (403, 429):
+            return False
+        raise
+    finally:
+        db.close()
+
+
+def legacy_verification(link_id: str) -> bool:
+    """旧实现: 读取、Python中判断、递增后提交"""
+    db = SessionLocal()
+    try:
+        link = db.query(AccountLink).filter(AccountLink.link_id == link_id).first()
+        if link.verification_count >= link.max_verification_count:
+            return False
+        time.sleep(0.005)  # 模拟匹配短信等请求处理耗时
+        link.verification_count += 1
+        link.last_verification_time = datetime.now(timezone.utc)
+        db.commit()
+        return True
+    finally:
+        db.close()
+
+
+def run_parallel(name: str, worker: Callable[[str], bool], link_id: str, requests: int,
+                 counter_index: int, expected_granted: int, expected_count: int):
+    barrier = threading.Barrier(requests)
+
+    def task():
+        barrier.wait()
+        return worker(link_id)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=requests) as executor:
+        results = list(executor.map(lambda _: task(), range(requests)))
+    elapsed = (time.perf_counter() - started) * 1000
+
+    granted = sum(results)
+    stored = final_counts(link_id)[counter_index]
+    exact = granted == expected_granted and stored == expected_count
+    print(
+        f"{name:<40}{granted:>8}{expected_granted:>8}{stored:>8}{expected_count:>8}"
+        f"{elapsed:>10.0f}  {'✅' if exact else '❌'}"
+    )
+    return exact
+
+
+def main():
+    parser = argparse.ArgumentParser(description="链接配额并发测试")
+    parser.add_argument("--requests", type=int, default=100, help="并发请求数")
+    parser.add_argument("--max-count", type=int, default=10, help="链接的访问/验证码次数上限")
+    args = parser.parse_args()
+
+    if "sqlite" in settings.database_url:
+        print("⚠️ SQLite 使用单连接, 无法进行并发测试, 请使用 PostgreSQL")
+        return
+
+    init_database()
+    fixture = seed(args.max_count)
+    try:
+        print(f"{args.requests} 个并发请求, 上限 {args.max_count}")
+        print(f"{'场景':<40}{'允许':>8}{'期望':>8}{'计数':>8}{'期望':>8}{'耗时(ms)':>10}")
+        limit = args.max_count
+        cases = [
+            # (场景, 接口, 计数字段: 0=访问 1=验证码, 期望允许数, 期望计数)
+            ("links.get_public_account_info", links.get_public_account_info, 0, limit, limit),
+            # 同一会话间隔内的并发首次访问只计一次, 且都被允许
+            ("customer.get_account_info", customer.get_account_info, 0, args.requests, 1),
+            ("customer.get_latest_verification_code", customer.get_latest_verification_code, 1, limit, limit),
+            ("links.get_verification_codes", links.get_verification_codes, 1, limit, limit),
+        ]
+        all_exact = True
+        for name, endpoint, counter_index, expected_granted, expected_count in cases:
+            all_exact &= run_parallel(
+                name, lambda link_id, endpoint=endpoint: call_endpoint(endpoint, link_id),
+                new_link(fixture), args.requests, counter_index, expected_granted, expected_count
+            )
+
+        # 对照: 旧实现在并发下会超发或丢失更新
+        run_parallel("legacy read-modify-write (对照)", legacy_verification, new_link(fixture),
+                     args.requests, 1, limit, limit)
+
+        if not all_exact:
+            sys.exit(1)
+    finally:
+        cleanup(fixture)
+
+
+if __name__ == "__main__":
+    main()
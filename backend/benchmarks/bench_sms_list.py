@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+短信列表序列化基准测试
+Benchmark /api/sms/list serialization: ORM + to_dict + jsonable_encoder + json
+versus column rows + orjson, with payload sizes (raw / gzip / brotli)
+
+在 backend 目录下运行 (使用 DATABASE_URL 指定的数据库):
+    python -m benchmarks.bench_sms_list --rows 2000 --page-size 100 --iterations 200
+
+测试数据在同一事务中写入, 结束时回滚, 不会残留在数据库中。
+"""
+
+import argparse
+import gzip
+import json
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import desc
+from sqlalchemy.orm import Session, contains_eager
+
+from app.database import SessionLocal, init_database
+from app.models.device import Device
+from app.models.sms import SMS
+from app.api.sms import SMS_LIST_SERIALIZER
+from app.services.serialization import dumps
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+SAMPLE_CONTENTS = (
+    "【某某银行】您的验证码为{code}，5分钟内有效，请勿泄露给他人。",
+    "【快递通知】您的包裹已到达驿站，取件码 {code}，请及时领取。",
+    "Your verification code is {code}. It expires in 10 minutes.",
+    "【会员中心】尊敬的用户，本月积分即将过期，回复TD退订。",
+)
+
+
+def seed(db: Session, rows: int) -> Device:
+    """写入测试设备和短信 (仅 flush, 由调用方回滚)"""
+    device = Device(
+        device_id=f"bench-{int(time.time() * 1000)}",
+        brand="Bench",
+        model="Simulator",
+        phone_number="13800000000",
+        is_online=True
+    )
+    db.add(device)
+    db.flush()
+
+    now = datetime.now(timezone.utc)
+    db.bulk_insert_mappings(SMS, [
+        {
+            "device_id": device.id,
+            "sender": f"1069{index % 50:04d}",
+            "content": SAMPLE_CONTENTS[index % len(SAMPLE_CONTENTS)].format(code=f"{index % 1000000:06d}"),
+            "sms_timestamp": now - timedelta(seconds=index),
+            "sms_type": "received",
+            "is_read": "unread",
+            "category": "verification" if index % 2 == 0 else "normal",
+            "created_at": now - timedelta(seconds=index),
+            "updated_at": now - timedelta(seconds=index),
+        }
+        for index in range(rows)
+    ])
+    db.flush()
+    return device
+
+
+def legacy_payload(db: Session, device: Device, page_size: int) -> bytes:
+    """原实现: 实例化ORM对象, to_dict, jsonable_encoder, 标准库 json"""
+    sms_list = db.query(SMS).join(Device).filter(SMS.device_id == device.id).options(
+        contains_eager(SMS.device)
+    ).order_by(desc(SMS.sms_timestamp)).limit(page_size).all()
+
+    sms_data = []
+    for sms in sms_list:
+        sms_dict = sms.to_dict()
+        sms_dict["device_info"] = {
+            "device_id": sms.device.device_id,
+            "brand": sms.device.brand,
+            "model": sms.device.model,
+            "phone_number": sms.device.phone_number,
+            "is_online": sms.device.is_online
+        }
+        sms_data.append(sms_dict)
+
+    content = jsonable_encoder({"success": True, "data": {"sms_list": sms_data}})
+    # 与 starlette JSONResponse.render 相同的参数
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def fast_payload(db: Session, device: Device, page_size: int) -> bytes:
+    """新实现: 按列查询, 元组直接组装, orjson 序列化"""
+    rows = db.query(SMS).join(Device).filter(SMS.device_id == device.id).with_entities(
+        *SMS_LIST_SERIALIZER.entities
+    ).order_by(desc(SMS.sms_timestamp)).limit(page_size).all()
+    return dumps({"success": True, "data": {"sms_list": SMS_LIST_SERIALIZER.serialize(rows)}})
+
+
+def measure(build: Callable[[], bytes], iterations: int) -> Dict[str, float]:
+    """重复构建响应, 返回耗时统计 (毫秒) 和最后一次的响应体"""
+    timings: List[float] = []
+    payload = b""
+    for _ in range(iterations):
+        started = time.perf_counter()
+        payload = build()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "mean_ms": statistics.mean(timings),
+        "p50_ms": timings[len(timings) // 2],
+        "p95_ms": timings[int(len(timings) * 0.95) - 1],
+        "payload": payload,
+    }
+
+
+def payload_sizes(payload: bytes) -> Dict[str, int]:
+    sizes = {"raw": len(payload), "gzip": len(gzip.compress(payload, compresslevel=6))}
+    if brotli:
+        sizes["br"] = len(brotli.compress(payload, quality=4))
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="短信列表序列化基准测试")
+    parser.add_argument("--rows", type=int, default=2000, help="写入的测试短信条数")
+    parser.add_argument("--page-size", type=int, default=100, help="每页条数")
+    parser.add_argument("--iterations", type=int, default=200, help="每种实现的重复次数")
+    args = parser.parse_args()
+
+    init_database()
+    db = SessionLocal()
+    try:
+        device = seed(db, args.rows)
+
+        # 预热 (编译SQL、填充缓存)
+        legacy_payload(db, device, args.page_size)
+        fast_payload(db, device, args.page_size)
+
+        results = {
+            "legacy": measure(lambda: legacy_payload(db, device, args.page_size), args.iterations),
+            "orjson": measure(lambda: fast_payload(db, device, args.page_size), args.iterations),
+        }
+
+        # 两种实现的输出内容应一致
+        if json.loads(results["legacy"]["payload"]) != json.loads(results["orjson"]["payload"]):
+            print("⚠️ 两种实现的响应内容不一致")
+
+        print(f"短信列表: {args.page_size} 条/页, 重复 {args.iterations} 次")
+        print(f"{'实现':<8}{'平均(ms)':>10}{'P50(ms)':>10}{'P95(ms)':>10}{'原始':>10}{'gzip':>10}{'br':>10}")
+        for name, result in results.items():
+            sizes = payload_sizes(result["payload"])
+            print(
+                f"{name:<8}{result['mean_ms']:>10.2f}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}"
+                f"{sizes['raw']:>10}{sizes['gzip']:>10}{sizes.get('br', '-'):>10}"
+            )
+
+        speedup = results["legacy"]["mean_ms"] / results["orjson"]["mean_ms"]
+        print(f"加速比: {speedup:.2f}x")
+    finally:
+        db.rollback()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
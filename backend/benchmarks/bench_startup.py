@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+启动耗时基准测试
+Startup-time benchmark: how long a fresh worker takes before it can accept traffic
+
+每次在新的子进程中启动应用 (与 uvicorn worker 相同: 导入 app.main 后执行 lifespan 启动阶段), 分别计时:
+- import: 导入 app.main (路由、模型、依赖库)
+- init_database: 数据库版本检查 / 迁移 / 默认数据初始化
+- startup: lifespan 启动阶段总耗时 (含 init_database、静态资源准备、后台任务启动)
+- wall: 父进程观察到的总耗时 (含解释器启动)
+
+场景:
+- 默认 (warm): 数据库已是最新版本, 即日常重启和扩容时的情况
+- --cold: 每次运行前删除所有表, 测量首次部署 (迁移 + 默认数据)
+- --workers N: 同时启动 N 个进程, 验证只有一个进程执行迁移, 其余等待后直接就绪
+
+在 backend 目录下运行 (--cold 会删除所有表, 只能用于测试数据库):
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --cold --workers 4
+    python -m benchmarks.bench_startup --importtime 20
+    python -m benchmarks.bench_startup --save benchmarks/baselines/startup.json
+    python -m benchmarks.bench_startup --baseline benchmarks/baselines/startup.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+BACKEND_PATH = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_PATH))
+
+RESULT_PREFIX = "BENCH_STARTUP "
+
+# 子进程: 导入应用并执行 lifespan 启动阶段, 输出各阶段耗时
+CHILD_SCRIPT = f"""
+import asyncio, json, time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+
+init_timing = {{}}
+init_database = app.main.init_database
+def timed_init_database():
+    begin = time.perf_counter()
+    try:
+        init_database()
+    finally:
+        init_timing["init_database"] = time.perf_counter() - begin
+app.main.init_database = timed_init_database
+
+async def start():
+    begin = time.perf_counter()
+    async with app.main.app.router.lifespan_context(app.main.app):
+        return time.perf_counter() - begin
+
+startup = asyncio.run(start())
+print({RESULT_PREFIX!r} + json.dumps({{
+    "import": imported - started,
+    "init_database": init_timing.get("init_database", 0.0),
+    "startup": startup,
+}}), flush=True)
+"""
+
+PHASES = ("import", "init_database", "startup", "wall")
+
+
+def launch_workers(count: int) -> List[Dict[str, float]]:
+    """同时启动 count 个子进程, 返回每个进程的各阶段耗时 (秒)"""
+    env = dict(os.environ, LOG_LEVEL=os.environ.get("LOG_LEVEL", "WARNING"), LOG_ASYNC="false")
+    started = time.perf_counter()
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-c", CHILD_SCRIPT], cwd=BACKEND_PATH, env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+        )
+        for _ in range(count)
+    ]
+    results = []
+    for process in processes:
+        stdout, stderr = process.communicate()
+        wall = time.perf_counter() - started
+        line = next((line for line in stdout.splitlines() if line.startswith(RESULT_PREFIX)), None)
+        if process.returncode != 0 or line is None:
+            raise SystemExit(f"启动失败 (退出码 {process.returncode}):\n{stderr[-2000:]}")
+        result = json.loads(line[len(RESULT_PREFIX):])
+        result["wall"] = wall
+        results.append(result)
+    return results
+
+
+def summarize(samples: List[Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    """各阶段的中位数/最小值/最大值 (毫秒)"""
+    summary = {}
+    for phase in PHASES:
+        values = [sample[phase] * 1000 for sample in samples]
+        summary[phase] = {
+            "median_ms": round(statistics.median(values), 1),
+            "min_ms": round(min(values), 1),
+            "max_ms": round(max(values), 1),
+        }
+    return summary
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    if args.cold:
+        from app.database import drop_tables
+
+    samples = []
+    for run_index in range(args.runs):
+        if args.cold:
+            drop_tables()
+        results = launch_workers(args.workers)
+        samples.extend(results)
+        slowest = max(results, key=lambda result: result["wall"])
+        print(f"第 {run_index + 1} 轮: " + "  ".join(f"{phase}={slowest[phase] * 1000:.0f}ms" for phase in PHASES)
+              + (f"  (最慢的 {args.workers} 个进程之一)" if args.workers > 1 else ""))
+
+    summary = summarize(samples)
+    print(f"\n{'阶段':<16}{'中位数(ms)':>12}{'最小(ms)':>12}{'最大(ms)':>12}")
+    for phase, values in summary.items():
+        print(f"{phase:<16}{values['median_ms']:>12.1f}{values['min_ms']:>12.1f}{values['max_ms']:>12.1f}")
+    return {
+        "meta": {
+            "scenario": "cold" if args.cold else "warm",
+            "runs": args.runs,
+            "workers": args.workers,
+            "python": sys.version.split()[0],
+        },
+        "results": summary,
+    }
+
+
+def import_profile(limit: int):
+    """按累计导入耗时列出最慢的模块 (python -X importtime)"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"], cwd=BACKEND_PATH,
+        env=dict(os.environ, LOG_LEVEL="WARNING"), capture_output=True, text=True
+    )
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), module.strip()))
+    rows.sort(reverse=True)
+    print(f"{'累计(ms)':>10}{'自身(ms)':>10}  模块")
+    for cumulative_us, self_us, module in rows[:limit]:
+        print(f"{cumulative_us / 1000:>10.1f}{self_us / 1000:>10.1f}  {module}")
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """与基线比较各阶段中位数, 返回变慢超过阈值的阶段"""
+    regressions = []
+    print(f"\n{'阶段':<16}{'基线(ms)':>12}{'当前(ms)':>12}{'变化':>10}")
+    for phase, result in current["results"].items():
+        previous = baseline["results"].get(phase)
+        if previous is None or not previous["median_ms"]:
+            continue
+        change = result["median_ms"] / previous["median_ms"] - 1
+        marker = "  ⚠️ 回归" if change > threshold else ""
+        print(f"{phase:<16}{previous['median_ms']:>12.1f}{result['median_ms']:>12.1f}{change * 100:>9.1f}%{marker}")
+        if marker:
+            regressions.append(phase)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动耗时基准测试")
+    parser.add_argument("--runs", type=int, default=5, help="运行轮数")
+    parser.add_argument("--workers", type=int, default=1, help="每轮同时启动的进程数")
+    parser.add_argument("--cold", action="store_true", help="每轮前删除所有表 (测量首次部署, 仅用于测试数据库)")
+    parser.add_argument("--importtime", type=int, metavar="N", help="只列出导入最慢的 N 个模块")
+    parser.add_argument("--save", help="保存结果 (作为后续比较的基线)")
+    parser.add_argument("--baseline", help="与之比较的基线结果文件")
+    parser.add_argument("--threshold", type=float, default=0.2, help="中位数变慢超过该比例视为回归")
+    args = parser.parse_args()
+
+    if args.importtime:
+        import_profile(args.importtime)
+        return
+
+    result = run(args)
+    if args.save:
+        path = Path(args.save)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"结果已保存: {path}")
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare(result, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} 个阶段出现回归: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+列表接口查询次数检查
+N+1 query check: the number of SQL statements of each list endpoint must not grow with page size
+
+对每个列表接口分别以 page_size=10 和 page_size=50 请求一次, 用 app.database.QueryCounter 统计执行的SQL条数;
+两次条数不同 (说明存在按行加载的关联查询) 或返回条数不足时进程返回非零退出码。
+
+先用 benchmarks.dataset 生成数据 (转发日志不足时本脚本为生成的数据补建), 再在 backend 目录下运行:
+    python -m benchmarks.check_query_counts
+    python -m benchmarks.check_query_counts --verbose   # 输出每次请求执行的SQL
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# 应用在导入时读取配置; 检查只关心接口本身执行的SQL
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import httpx
+from sqlalchemy import func, select
+
+from app.api.auth import create_access_token
+from app.database import QueryCounter, SessionLocal
+from app.main import app
+from app.models.account import Account
+from app.models.device import Device
+from app.models.sms import SMS
+from app.models.sms_rule import SmsForwardLog, SMSRule
+from benchmarks.dataset import SEED_PREFIX
+
+PAGE_SIZES = (10, 50)
+
+# (名称, 路径, 响应 data 中的列表字段)
+CASES: List[Tuple[str, str, str]] = [
+    ("accounts.list", "/api/accounts/list", "accounts"),
+    ("links.list", "/api/links/list", "links"),
+    ("sms.list", "/api/sms/list", "sms_list"),
+    ("sms.forward_logs.list", "/api/sms/forward_logs/list", "logs"),
+]
+
+
+def ensure_forward_logs(count: int) -> int:
+    """数据集不生成转发日志; 不足时为生成的短信和规则补建 (benchmarks.dataset --clean 会一并删除)"""
+    db = SessionLocal()
+    try:
+        existing = db.scalar(select(func.count()).select_from(SmsForwardLog))
+        if existing >= count:
+            return 0
+        rule_ids = list(db.scalars(
+            select(SMSRule.id).join(Account, Account.id == SMSRule.account_id)
+            .where(Account.account_name.like(f"{SEED_PREFIX}%")).limit(count)
+        ))
+        sms_ids = list(db.scalars(
+            select(SMS.id).join(Device, Device.id == SMS.device_id)
+            .where(Device.device_id.like(f"{SEED_PREFIX}%")).limit(count)
+        ))
+        if not rule_ids or not sms_ids:
+            return 0
+        missing = count - existing
+        db.add_all(
+            SmsForwardLog(
+                sms_id=sms_ids[index % len(sms_ids)], rule_id=rule_ids[index % len(rule_ids)],
+                target_type="link", status="success"
+            )
+            for index in range(missing)
+        )
+        db.commit()
+        return missing
+    finally:
+        db.close()
+
+
+async def count_queries(client: httpx.AsyncClient, headers: Dict[str, str], path: str, field: str,
+                        page_size: int) -> Tuple[int, int, List[str], int]:
+    """请求一次列表接口, 返回 (SQL条数, 返回条数, SQL语句, 状态码)"""
+    with QueryCounter() as counter:
+        response = await client.get(path, params={"page": 1, "page_size": page_size}, headers=headers)
+    items = len(response.json()["data"][field]) if response.status_code == 200 else 0
+    return counter.count, items, counter.statements, response.status_code
+
+
+async def run(args: argparse.Namespace) -> List[str]:
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'admin'})}"}
+    failures = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver", timeout=120) as client:
+        print(f"{'接口':<28}" + "".join(f"{f'SQL@{size}':>10}{f'条数@{size}':>10}" for size in PAGE_SIZES))
+        for name, path, field in CASES:
+            # 预热一次, 排除首次请求的缓存加载 (设置、权限等)
+            await count_queries(client, headers, path, field, PAGE_SIZES[0])
+            results: Dict[int, Tuple[int, int, List[str], int]] = {}
+            for size in PAGE_SIZES:
+                results[size] = await count_queries(client, headers, path, field, size)
+
+            row = "".join(f"{results[size][0]:>10}{results[size][1]:>10}" for size in PAGE_SIZES)
+            problems = []
+            statuses = {results[size][3] for size in PAGE_SIZES}
+            if statuses != {200}:
+                problems.append(f"状态码 {sorted(statuses)}")
+            elif results[PAGE_SIZES[-1]][1] < PAGE_SIZES[-1]:
+                problems.append(f"数据不足 {PAGE_SIZES[-1]} 条, 无法比较")
+            elif len({results[size][0] for size in PAGE_SIZES}) > 1:
+                problems.append("SQL条数随分页大小变化")
+            print(f"{name:<28}{row}" + (f"  ❌ {'; '.join(problems)}" if problems else "  ✅"))
+
+            if problems:
+                failures.append(name)
+            if args.verbose or problems:
+                for size in PAGE_SIZES:
+                    print(f"    page_size={size}:")
+                    for statement in results[size][2]:
+                        print(f"      {' '.join(statement.split())[:160]}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="列表接口查询次数检查")
+    parser.add_argument("--verbose", action="store_true", help="输出每次请求执行的SQL")
+    args = parser.parse_args()
+
+    created = ensure_forward_logs(max(PAGE_SIZES))
+    if created:
+        print(f"已为生成的数据补建 {created} 条转发日志")
+
+    failures = asyncio.run(run(args))
+    if failures:
+        print(f"\n{len(failures)} 个接口未通过: {', '.join(failures)}")
+        sys.exit(1)
+    print("\n所有列表接口的SQL条数与分页大小无关")
+
+
+if __name__ == "__main__":
+    main()
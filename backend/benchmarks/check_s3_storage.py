@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+S3图片存储检查
+S3 image storage check: run the image endpoints against an in-process moto S3
+
+用 moto 在进程内模拟 S3, 以 IMAGE_STORAGE_BACKEND=s3 启动应用, 依次检查:
+- 上传去重: 相同内容上传两次只保存一个对象, 引用计数为2
+- 原图读取: 分块转发对象内容, ETag / If-None-Match 返回 304
+- 变体: 从对象存储读取原图生成缩放 / WebP 变体
+- 签名URL: 开启 IMAGE_SIGNED_URL_REDIRECT 时重定向到带签名的对象地址
+- 引用计数删除: 第一次删除只释放引用, 最后一次删除后对象被移除
+- 目录核对: reconcile 发现并修复孤立对象和缺失对象的记录
+任一检查失败时进程返回非零退出码。
+
+需要已初始化的测试数据库, 且 stored_images 表为空 (模拟的桶是空的, 已有记录都会被视为缺失文件,
+修复时会被删除)。在 backend 目录下运行:
+    python -m benchmarks.check_s3_storage
+"""
+
+import asyncio
+import io
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import List
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+try:
+    from moto import mock_aws
+except ImportError:
+    raise SystemExit("运行S3存储检查需要安装 moto: pip install moto")
+
+BUCKET = "check-images"
+WORK_DIR = tempfile.mkdtemp(prefix="check-s3-")
+
+# 应用在导入时读取配置并创建存储后端
+os.environ.update({
+    "IMAGE_STORAGE_BACKEND": "s3",
+    "IMAGE_S3_BUCKET": BUCKET,
+    "IMAGE_S3_PREFIX": "images/",
+    "IMAGE_S3_REGION": "us-east-1",
+    "IMAGE_S3_ACCESS_KEY": "testing",
+    "IMAGE_S3_SECRET_KEY": "testing",
+    "IMAGE_UPLOAD_DIR": os.path.join(WORK_DIR, "upload"),
+    "IMAGE_CACHE_DIR": os.path.join(WORK_DIR, "cache"),
+    "RATE_LIMIT_ENABLED": "false",
+})
+
+
+def make_png(color) -> bytes:
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new("RGB", (320, 240), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class Checker:
+    """记录每项检查的结果"""
+
+    def __init__(self):
+        self.failures: List[str] = []
+
+    def check(self, name: str, passed: bool, detail: str = ""):
+        print(f"{'✅' if passed else '❌'} {name}" + (f"  ({detail})" if detail and not passed else ""))
+        if not passed:
+            self.failures.append(name)
+
+
+async def run(checker: Checker):
+    import boto3
+    import httpx
+    from app.api.auth import create_access_token
+    from app.config import settings
+    from app.database import SessionLocal
+    from app.main import app
+    from app.models.stored_image import StoredImage
+    from app.services.image_storage import image_storage, wait_for_deletes
+
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket=BUCKET)
+
+    def object_keys() -> List[str]:
+        return [item["Key"] for item in s3.list_objects_v2(Bucket=BUCKET).get("Contents", [])]
+
+    def ref_count(filename: str):
+        db = SessionLocal()
+        try:
+            return db.query(StoredImage.ref_count).filter(StoredImage.filename == filename).scalar()
+        finally:
+            db.close()
+
+    db = SessionLocal()
+    try:
+        if db.query(StoredImage.id).first() is not None:
+            raise SystemExit("stored_images 表不为空, 请在测试数据库上运行")
+    finally:
+        db.close()
+
+    image = make_png((30, 120, 200))
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'admin'})}"}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver", timeout=60) as client:
+        async def upload(data: bytes, name: str):
+            response = await client.post(
+                "/api/images/upload", headers=headers, files={"image": (name, data, "image/png")}
+            )
+            return response.json()["data"] if response.status_code == 200 else None
+
+        # 上传去重
+        first = await upload(image, "a.png")
+        second = await upload(image, "b.png")
+        filename = first["filename"] if first else None
+        checker.check(
+            "上传去重",
+            bool(first and second) and second["filename"] == filename and second["deduplicated"]
+            and object_keys() == [f"images/{filename}"] and ref_count(filename) == 2,
+            f"objects={object_keys()}, ref_count={ref_count(filename) if filename else None}"
+        )
+        if not filename:
+            return
+
+        # 原图分块转发和条件请求
+        response = await client.get(f"/api/images/{filename}")
+        etag = response.headers.get("etag")
+        checker.check(
+            "原图读取",
+            response.status_code == 200 and response.content == image
+            and response.headers.get("content-length") == str(len(image)) and bool(etag),
+            f"status={response.status_code}, size={len(response.content)}"
+        )
+        response = await client.get(f"/api/images/{filename}", headers={"If-None-Match": etag or ""})
+        checker.check("条件请求 304", response.status_code == 304, f"status={response.status_code}")
+
+        # 变体
+        response = await client.get(f"/api/images/{filename}", params={"w": 64, "format": "webp"})
+        checker.check(
+            "WebP变体",
+            response.status_code == 200 and response.headers.get("content-type") == "image/webp"
+            and response.content[8:12] == b"WEBP",
+            f"status={response.status_code}, type={response.headers.get('content-type')}"
+        )
+
+        # 签名URL重定向
+        settings.image_signed_url_redirect = True
+        try:
+            response = await client.get(f"/api/images/{filename}")
+        finally:
+            settings.image_signed_url_redirect = False
+        location = urlsplit(response.headers.get("location", ""))
+        checker.check(
+            "签名URL重定向",
+            response.status_code == 307 and location.path.endswith(f"/images/{filename}")
+            and "X-Amz-Signature" in parse_qs(location.query),
+            f"status={response.status_code}, location={response.headers.get('location')}"
+        )
+
+        # 引用计数删除
+        response = await client.delete(f"/api/images/{filename}", headers=headers)
+        wait_for_deletes()
+        checker.check(
+            "释放一次引用后保留对象",
+            response.status_code == 200 and object_keys() == [f"images/{filename}"] and ref_count(filename) == 1,
+            f"status={response.status_code}, objects={object_keys()}, ref_count={ref_count(filename)}"
+        )
+        response = await client.delete(f"/api/images/{filename}", headers=headers)
+        wait_for_deletes()
+        checker.check(
+            "最后一次引用释放后删除对象",
+            response.status_code == 200 and object_keys() == [] and ref_count(filename) is None,
+            f"status={response.status_code}, objects={object_keys()}, ref_count={ref_count(filename)}"
+        )
+
+        # 目录核对: 孤立对象 (桶中有、目录中没有) 和缺失对象 (目录中有、桶中没有)
+        orphan_data = make_png((200, 60, 30))
+        orphan = image_storage.save_content_addressed(orphan_data, ".png")
+        missing = await upload(make_png((60, 200, 30)), "c.png")
+        s3.delete_object(Bucket=BUCKET, Key=f"images/{missing['filename']}")
+
+        async def reconcile(fix: bool):
+            response = await client.post("/api/admin/images/reconcile", params={"fix": fix}, headers=headers)
+            return response.json()["data"] if response.status_code == 200 else {}
+
+        summary = await reconcile(False)
+        checker.check(
+            "目录核对发现差异",
+            summary.get("orphan_samples") == [orphan] and summary.get("missing_samples") == [missing["filename"]],
+            f"summary={summary}"
+        )
+        await reconcile(True)
+        summary = await reconcile(False)
+        checker.check(
+            "目录核对修复差异",
+            summary.get("orphans") == 0 and summary.get("missing") == 0
+            and ref_count(orphan) == 1 and ref_count(missing["filename"]) is None,
+            f"summary={summary}"
+        )
+
+        # 清理修复时登记的记录
+        response = await client.delete(f"/api/images/{orphan}", headers=headers)
+        wait_for_deletes()
+        checker.check("清理检查数据", response.status_code == 200 and object_keys() == [], f"objects={object_keys()}")
+
+
+def main():
+    checker = Checker()
+    with mock_aws():
+        asyncio.run(run(checker))
+    if checker.failures:
+        print(f"\n{len(checker.failures)} 项检查未通过: {', '.join(checker.failures)}")
+        sys.exit(1)
+    print("\nS3图片存储检查全部通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+合成数据集生成
+Synthetic dataset generator: devices, accounts, links, SMS rules and millions of SMS
+
+- 短信为中英文混合的验证码、营销和普通短信, 发送方包含短号、106 通道号和国际号码
+- 每台设备的短信量按 Zipf 分布倾斜 (--skew), 少数设备拥有大部分短信, 与线上分布一致
+- PostgreSQL (psycopg2) 使用 COPY 写入, 其他数据库使用多行 INSERT; 每批单独提交
+- 设备ID和账号名称以 seed- 开头, 可用 --clean 删除之前生成的数据
+
+在 backend 目录下运行 (使用 DATABASE_URL 指定的数据库):
+    python -m benchmarks.dataset --devices 2000 --accounts 3000 --sms 2000000
+    python -m benchmarks.dataset --clean
+"""
+
+import argparse
+import csv
+import io
+import random
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, engine, init_database, is_sms_partitioning_enabled
+from app.models.account import Account
+from app.models.account_link import AccountLink
+from app.models.device import Device
+from app.models.sms import SMS, normalize_sender
+from app.models.sms_rule import SmsForwardLog, SMSRule
+from app.services.link_generator import LinkBatchParams, link_generator
+from app.services.partition_manager import partition_manager
+
+SEED_PREFIX = "seed-"
+
+# (发送方模板, 内容模板); {code} 验证码, {n} 随机数字, {brand} 平台名
+VERIFICATION_MESSAGES: Sequence[Tuple[str, str]] = (
+    ("95588", "【工商银行】您的验证码为{code}，5分钟内有效，请勿泄露给他人。"),
+    ("1069{n:04d}", "【{brand}】验证码 {code}，用于登录，10分钟内有效。如非本人操作请忽略。"),
+    ("1069{n:04d}", "【{brand}】您正在进行身份验证，验证码：{code}，切勿告知他人。"),
+    ("106{n:05d}", "您的{brand}账号正在异地登录，验证码 {code}，请勿转发。"),
+    ("+1 650-555-{n:04d}", "Your {brand} verification code is {code}. It expires in 10 minutes."),
+    ("+44 7700 9{n:05d}", "{code} is your {brand} security code. Don't share it with anyone."),
+    ("Google", "G-{code} is your Google verification code."),
+)
+PROMOTION_MESSAGES: Sequence[Tuple[str, str]] = (
+    ("1065{n:04d}", "【{brand}】双十一狂欢，全场满300减50，点击 t.cn/{n} 领券，回复TD退订。"),
+    ("10086", "【中国移动】尊敬的用户，您的积分即将过期，兑换请回复JF，回复TD退订。"),
+    ("1065{n:04d}", "【{brand}会员】本周专享8折优惠，限时3天，详情见App。拒收请回复R。"),
+    ("{brand}", "Special offer: 50% off your next month of {brand}. Reply STOP to unsubscribe."),
+)
+NORMAL_MESSAGES: Sequence[Tuple[str, str]] = (
+    ("138{n:08d}", "晚上一起吃饭吗？我七点到。"),
+    ("139{n:08d}", "文件已经发到你邮箱了，记得查收。"),
+    ("1065{n:04d}", "【快递通知】您的包裹已到达驿站，请凭取件码{code}领取。"),
+    ("95533", "【建设银行】您尾号{n:04d}的账户于今日消费{code}元。"),
+    ("+1 415-555-{n:04d}", "Running 10 minutes late, see you soon."),
+    ("+86 186 {n:04d} 0000", "Meeting moved to 3pm tomorrow."),
+)
+BRANDS = ("淘宝", "京东", "微信", "支付宝", "美团", "抖音", "Google", "Apple", "Netflix", "Steam")
+CATEGORY_WEIGHTS = (("verification", VERIFICATION_MESSAGES, 0.45),
+                    ("promotion", PROMOTION_MESSAGES, 0.25),
+                    ("normal", NORMAL_MESSAGES, 0.30))
+
+# 规则模板: (名称, 发送方模式, 发送方匹配, 内容模式, 内容匹配)
+RULE_TEMPLATES = (
+    ("验证码", "", "fuzzy", "*验证码*", "fuzzy"),
+    ("106通道", "1069*", "fuzzy", "", "fuzzy"),
+    ("银行", "95588", "exact", "", "fuzzy"),
+    ("English code", "", "fuzzy", "*code*", "fuzzy"),
+    ("Google", "", "fuzzy", r"G-\d{6}", "regex"),
+)
+
+# COPY 写入的短信列
+SMS_COPY_COLUMNS = ("device_id", "sender", "sender_normalized", "content", "sms_timestamp",
+                    "sms_type", "is_read", "category", "created_at", "updated_at")
+
+
+@dataclass
+class DatasetSpec:
+    """数据集规模"""
+    devices: int = 1000
+    accounts: int = 1000
+    links_per_account: int = 5
+    rules_per_account: int = 2
+    sms: int = 1000000
+    days: int = 90
+    skew: float = 1.1
+    chunk_size: int = 50000
+    seed: int = 42
+
+
+def _use_copy(db: Session) -> bool:
+    bind = db.get_bind()
+    return bind.dialect.name == "postgresql" and bind.dialect.driver == "psycopg2"
+
+
+def _copy(db: Session, table: str, columns: Sequence[str], rows: List[Sequence[Any]]):
+    """使用 PostgreSQL COPY 写入 (在当前事务中执行)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(["" if value is None else value.isoformat() if isinstance(value, datetime) else value
+                         for value in row])
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+def zipf_cum_weights(count: int, skew: float) -> List[float]:
+    """Zipf 分布的累计权重 (排名越靠前的设备短信越多)"""
+    return list(accumulate(1.0 / (rank ** skew) for rank in range(1, count + 1)))
+
+
+def random_message(rng: random.Random) -> Tuple[str, str, str]:
+    """生成一条短信: (发送方, 内容, 分类)"""
+    draw = rng.random()
+    for category, templates, weight in CATEGORY_WEIGHTS:
+        draw -= weight
+        if draw <= 0:
+            break
+    sender, content = rng.choice(templates)
+    values = {
+        "code": f"{rng.randint(0, 999999):06d}",
+        "n": rng.randint(0, 9999),
+        "brand": rng.choice(BRANDS),
+    }
+    return sender.format(**values), content.format(**values), category
+
+
+def sample_messages(count: int, seed: int = 42) -> List[Tuple[str, str, str]]:
+    """固定种子的短信样本 (用于微基准测试)"""
+    rng = random.Random(seed)
+    return [random_message(rng) for _ in range(count)]
+
+
+class DatasetGenerator:
+    """合成数据集生成器"""
+
+    def __init__(self, spec: DatasetSpec):
+        self.spec = spec
+        self.random = random.Random(spec.seed)
+        self.tag = f"{SEED_PREFIX}{int(time.time())}"
+
+    def seed_devices(self, db: Session) -> List[int]:
+        rows = [
+            {
+                "device_id": f"{self.tag}-{index:06d}",
+                "serial_number": f"SN{index:08d}",
+                "brand": self.random.choice(("Xiaomi", "Huawei", "OPPO", "vivo", "Samsung", "Google")),
+                "model": f"Model {self.random.randint(1, 20)}",
+                "os_version": f"Android {self.random.randint(9, 14)}",
+                "phone_number": f"1{self.random.randint(30, 99)}{self.random.randint(0, 10**8):08d}",
+                "network_type": self.random.choice(("Wi-Fi", "4G", "5G")),
+                "is_online": self.random.random() < 0.3,
+                "is_active": True,
+                "extra_info": {},
+            }
+            for index in range(self.spec.devices)
+        ]
+        device_ids = list(db.scalars(insert(Device).returning(Device.id), rows))
+        db.commit()
+        return device_ids
+
+    def seed_accounts(self, db: Session, device_ids: List[int], cum_weights: List[float]) -> List[Tuple[int, int]]:
+        """写入账号 (主设备按同样的倾斜分布选择), 返回 (账号ID, 设备ID)"""
+        primary = self.random.choices(device_ids, cum_weights=cum_weights, k=self.spec.accounts)
+        rows = [
+            {
+                "account_name": f"{self.tag}-account-{index:06d}",
+                "username": f"user{index}",
+                "password": f"pass{self.random.randint(0, 10**6)}",
+                "type": self.random.choice(BRANDS),
+                "status": "active",
+                "primary_device_id": device_id,
+            }
+            for index, device_id in enumerate(primary)
+        ]
+        account_ids = list(db.scalars(insert(Account).returning(Account.id), rows))
+        db.commit()
+        return list(zip(account_ids, primary))
+
+    def seed_links(self, db: Session, accounts: List[Tuple[int, int]]) -> int:
+        count = 0
+        for account_id, device_id in accounts:
+            if self.spec.links_per_account:
+                link_generator.insert_links(db, LinkBatchParams(
+                    account_id=account_id, device_id=device_id, max_access_count=0, max_verification_count=0
+                ), self.spec.links_per_account)
+                count += self.spec.links_per_account
+        db.commit()
+        return count
+
+    def seed_rules(self, db: Session, accounts: List[Tuple[int, int]]) -> int:
+        rows = []
+        for account_id, _ in accounts:
+            for priority, template in enumerate(self.random.sample(
+                RULE_TEMPLATES, min(self.spec.rules_per_account, len(RULE_TEMPLATES))
+            )):
+                name, sender_pattern, sender_match, content_pattern, content_match = template
+                rows.append({
+                    "account_id": account_id,
+                    "rule_name": name,
+                    "sender_pattern": sender_pattern,
+                    "sender_match_type": sender_match,
+                    "content_pattern": content_pattern,
+                    "content_match_type": content_match,
+                    "is_active": True,
+                    "priority": priority,
+                    "display_count": 5,
+                    "forward_target_type": "link",
+                    "forward_config": {},
+                })
+        if rows:
+            db.execute(insert(SMSRule), rows)
+        db.commit()
+        return len(rows)
+
+    def _ensure_partitions(self, start: datetime, end: datetime):
+        """分区模式下为短信时间范围预建月份分区 (否则全部落入 DEFAULT 分区)"""
+        if not is_sms_partitioning_enabled():
+            return
+        with engine.begin() as conn:
+            if partition_manager.is_partitioned(conn, SMS.__tablename__):
+                partition_manager._ensure_table_partitions(conn, SMS.__tablename__, "sms_timestamp", start, end)
+
+    def seed_sms(self, db: Session, device_ids: List[int], cum_weights: List[float]) -> int:
+        now = datetime.now(timezone.utc)
+        span = self.spec.days * 86400
+        self._ensure_partitions(now - timedelta(seconds=span), now)
+        use_copy = _use_copy(db)
+
+        written = 0
+        started = time.perf_counter()
+        while written < self.spec.sms:
+            size = min(self.spec.chunk_size, self.spec.sms - written)
+            devices = self.random.choices(device_ids, cum_weights=cum_weights, k=size)
+            rows = []
+            for device_id in devices:
+                sender, content, category = random_message(self.random)
+                timestamp = now - timedelta(seconds=self.random.random() * span)
+                rows.append((device_id, sender, normalize_sender(sender), content, timestamp,
+                             "received", self.random.choice(("read", "unread")), category, timestamp, timestamp))
+            if use_copy:
+                _copy(db, SMS.__tablename__, SMS_COPY_COLUMNS, rows)
+            else:
+                db.execute(insert(SMS), [dict(zip(SMS_COPY_COLUMNS, row)) for row in rows])
+            db.commit()
+            written += size
+            elapsed = time.perf_counter() - started
+            print(f"  短信 {written}/{self.spec.sms} ({written / elapsed:.0f} 条/秒)")
+        return written
+
+    def run(self) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            started = time.perf_counter()
+            device_ids = self.seed_devices(db)
+            cum_weights = zipf_cum_weights(len(device_ids), self.spec.skew)
+            # 打乱排名, 避免ID最小的设备总是最热
+            self.random.shuffle(device_ids)
+            print(f"设备: {len(device_ids)}")
+            accounts = self.seed_accounts(db, device_ids, cum_weights)
+            print(f"账号: {len(accounts)}")
+            links = self.seed_links(db, accounts)
+            print(f"链接: {links}")
+            rules = self.seed_rules(db, accounts)
+            print(f"规则: {rules}")
+            sms = self.seed_sms(db, device_ids, cum_weights)
+            return {
+                "tag": self.tag,
+                "devices": len(device_ids),
+                "accounts": len(accounts),
+                "links": links,
+                "rules": rules,
+                "sms": sms,
+                "seconds": round(time.perf_counter() - started, 1),
+            }
+        finally:
+            db.close()
+
+
+def clean() -> Dict[str, int]:
+    """删除之前生成的数据 (设备ID/账号名称以 seed- 开头)"""
+    db = SessionLocal()
+    try:
+        device_ids = select(Device.id).where(Device.device_id.like(f"{SEED_PREFIX}%")).scalar_subquery()
+        account_ids = select(Account.id).where(Account.account_name.like(f"{SEED_PREFIX}%")).scalar_subquery()
+        rule_ids = select(SMSRule.id).where(SMSRule.account_id.in_(account_ids)).scalar_subquery()
+        deleted = {}
+        for name, statement in (
+            ("forward_logs", delete(SmsForwardLog).where(SmsForwardLog.rule_id.in_(rule_ids))),
+            ("rules", delete(SMSRule).where(SMSRule.account_id.in_(account_ids))),
+            ("links", delete(AccountLink).where(AccountLink.account_id.in_(account_ids))),
+            ("accounts", delete(Account).where(Account.account_name.like(f"{SEED_PREFIX}%"))),
+            ("sms", delete(SMS).where(SMS.device_id.in_(device_ids))),
+            ("devices", delete(Device).where(Device.device_id.like(f"{SEED_PREFIX}%"))),
+        ):
+            deleted[name] = db.execute(statement, execution_options={"synchronize_session": False}).rowcount
+        db.commit()
+        return deleted
+    finally:
+        db.close()
+
+
+def dataset_summary(db: Session) -> Dict[str, int]:
+    """当前数据库中各表的行数 (记录到基准测试结果中)"""
+    return {
+        model.__tablename__: db.scalar(select(func.count()).select_from(model))
+        for model in (Device, Account, AccountLink, SMSRule, SMS)
+    }
+
+
+def main():
+    defaults = DatasetSpec()
+    parser = argparse.ArgumentParser(description="合成数据集生成")
+    parser.add_argument("--devices", type=int, default=defaults.devices, help="设备数")
+    parser.add_argument("--accounts", type=int, default=defaults.accounts, help="账号数")
+    parser.add_argument("--links-per-account", type=int, default=defaults.links_per_account, help="每个账号的链接数")
+    parser.add_argument("--rules-per-account", type=int, default=defaults.rules_per_account, help="每个账号的短信规则数")
+    parser.add_argument("--sms", type=int, default=defaults.sms, help="短信条数")
+    parser.add_argument("--days", type=int, default=defaults.days, help="短信时间分布的天数")
+    parser.add_argument("--skew", type=float, default=defaults.skew, help="设备短信量的 Zipf 指数 (0为均匀分布)")
+    parser.add_argument("--chunk-size", type=int, default=defaults.chunk_size, help="每批写入的短信条数")
+    parser.add_argument("--seed", type=int, default=defaults.seed, help="随机数种子")
+    parser.add_argument("--clean", action="store_true", help="删除之前生成的数据后退出")
+    args = parser.parse_args()
+
+    init_database()
+    if args.clean:
+        print(f"已删除: {clean()}")
+        return
+
+    spec = DatasetSpec(
+        devices=args.devices, accounts=args.accounts, links_per_account=args.links_per_account,
+        rules_per_account=args.rules_per_account, sms=args.sms, days=args.days, skew=args.skew,
+        chunk_size=args.chunk_size, seed=args.seed
+    )
+    result = DatasetGenerator(spec).run()
+    print(f"完成: {result}")
+
+
+if __name__ == "__main__":
+    main()
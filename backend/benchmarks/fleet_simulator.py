@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+"""
+设备群模拟与端到端压测
+Fleet simulator: drive devices, customer pages and admin dashboards against the real app
+
+模拟的负载:
+- N 台设备: 定时 POST /api/android/heartbeat, 定时 POST /api/android/sms/batch_upload (含验证码短信)
+- M 个客户页面: 一部分轮询 GET /api/get_verification_code, 其余保持 /api/ws/customer/{link_id} 连接并定时 ping
+- K 个管理后台: 保持 /api/ws/admin 连接, 统计收到的广播消息数
+
+在 backend 目录下运行:
+    # 进程内运行 (ASGI, 使用 DATABASE_URL 指定的数据库, 可用 --database-url 指定 SQLite/PostgreSQL)
+    python -m benchmarks.fleet_simulator --devices 50 --customers 200 --admins 2 --duration 60
+
+    # 压测本地 uvicorn (需与服务使用相同的 SECRET_KEY, 或通过 --admin-token 指定管理员令牌)
+    python -m benchmarks.fleet_simulator --target http://127.0.0.1:8000 --devices 50 --customers 200
+
+结果以 JSON 输出 (吞吐量、P50/P90/P99 延迟、错误率、状态码分布), 可用 --output 保存后对比不同版本。
+模拟数据 (设备ID前缀 sim-<运行ID>) 写入目标数据库, 不会自动清理。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlencode
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+SMS_TEMPLATES = (
+    ("95588", "【工商银行】您的验证码为{code}，5分钟内有效，请勿泄露给他人。"),
+    ("1069{n:04d}", "【某某平台】验证码 {code}，用于登录，10分钟内有效。"),
+    ("+1 650-555-{n:04d}", "Your verification code is {code}. It expires in 10 minutes."),
+    ("1065{n:04d}", "【快递通知】您的包裹已到达驿站，取件码 {code}，请及时领取。"),
+    ("10086", "【会员中心】尊敬的用户，本月积分即将过期，回复TD退订。"),
+    ("Netflix", "Special offer: 50% off your next month. Reply STOP to unsubscribe."),
+)
+
+
+# ----------------------------------------------------------------------
+# 统计
+# ----------------------------------------------------------------------
+
+def percentile(sorted_values: List[float], ratio: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * ratio))]
+
+
+class Recorder:
+    """按操作记录延迟和结果"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.ws_messages: Dict[str, int] = defaultdict(int)
+        self.ws_open: Dict[str, int] = defaultdict(int)
+
+    def record(self, operation: str, started: float, status: Any, ok: bool):
+        self.latencies[operation].append((time.perf_counter() - started) * 1000)
+        self.statuses[operation][str(status)] += 1
+        if not ok:
+            self.errors[operation] += 1
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        operations = {}
+        for operation, timings in sorted(self.latencies.items()):
+            timings.sort()
+            count = len(timings)
+            operations[operation] = {
+                "requests": count,
+                "errors": self.errors[operation],
+                "error_rate": round(self.errors[operation] / count, 4) if count else 0.0,
+                "throughput_rps": round(count / elapsed, 2) if elapsed else 0.0,
+                "p50_ms": round(percentile(timings, 0.50), 2),
+                "p90_ms": round(percentile(timings, 0.90), 2),
+                "p99_ms": round(percentile(timings, 0.99), 2),
+                "max_ms": round(timings[-1], 2) if timings else 0.0,
+                "status_codes": dict(self.statuses[operation]),
+            }
+        return {
+            "operations": operations,
+            "websockets": {
+                user_type: {"open": self.ws_open[user_type], "messages_received": self.ws_messages[user_type]}
+                for user_type in sorted(set(self.ws_open) | set(self.ws_messages))
+            },
+        }
+
+
+# ----------------------------------------------------------------------
+# 传输: 进程内 ASGI / 远程 HTTP
+# ----------------------------------------------------------------------
+
+class AsgiWebSocket:
+    """进程内 WebSocket 客户端 (直接调用 ASGI 应用)"""
+
+    def __init__(self, app, path: str, query: str = ""):
+        self.app = app
+        self.scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "scheme": "ws",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": [(b"host", b"testserver")],
+            "server": ("testserver", 80),
+            "client": ("127.0.0.1", random.randint(20000, 60000)),
+            "subprotocols": [],
+        }
+        self.inbound: asyncio.Queue = asyncio.Queue()
+        self.outbound: asyncio.Queue = asyncio.Queue()
+        self.accepted = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    async def connect(self):
+        await self.inbound.put({"type": "websocket.connect"})
+        self.task = asyncio.create_task(self.app(self.scope, self.inbound.get, self._send))
+        accepted = asyncio.create_task(self.accepted.wait())
+        await asyncio.wait({accepted, self.task}, return_when=asyncio.FIRST_COMPLETED)
+        if not self.accepted.is_set():
+            accepted.cancel()
+            raise ConnectionError("WebSocket连接被拒绝")
+
+    async def _send(self, message: Dict[str, Any]):
+        if message["type"] == "websocket.accept":
+            self.accepted.set()
+        elif message["type"] == "websocket.send":
+            await self.outbound.put(message.get("text") or message.get("bytes"))
+        elif message["type"] == "websocket.close":
+            await self.outbound.put(None)
+
+    async def send(self, text: str):
+        await self.inbound.put({"type": "websocket.receive", "text": text})
+
+    async def recv(self) -> str:
+        message = await self.outbound.get()
+        if message is None:
+            raise ConnectionError("WebSocket连接已关闭")
+        return message
+
+    async def close(self):
+        await self.inbound.put({"type": "websocket.disconnect", "code": 1000})
+        if self.task:
+            try:
+                await asyncio.wait_for(self.task, timeout=5)
+            except Exception:
+                self.task.cancel()
+
+
+class RemoteWebSocket:
+    """远程 WebSocket 客户端 (websockets 库)"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.connection = None
+
+    async def connect(self):
+        self.connection = await websockets.connect(self.url, open_timeout=10)
+
+    async def send(self, text: str):
+        await self.connection.send(text)
+
+    async def recv(self) -> str:
+        return await self.connection.recv()
+
+    async def close(self):
+        await self.connection.close()
+
+
+class Target:
+    """压测目标: HTTP 客户端和 WebSocket 工厂"""
+
+    def __init__(self, base_url: Optional[str], app=None, timeout: float = 30.0):
+        self.app = app
+        self.base_url = base_url
+        if app is not None:
+            transport = httpx.ASGITransport(app=app)
+            self.http = httpx.AsyncClient(transport=transport, base_url="http://testserver", timeout=timeout)
+        else:
+            limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+            self.http = httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits)
+
+    def websocket(self, path: str, params: Optional[Dict[str, str]] = None):
+        query = urlencode(params or {})
+        if self.app is not None:
+            return AsgiWebSocket(self.app, path, query)
+        if websockets is None:
+            raise RuntimeError("压测远程 WebSocket 需要安装 websockets")
+        url = self.base_url.replace("http", "ws", 1) + path + (f"?{query}" if query else "")
+        return RemoteWebSocket(url)
+
+
+# ----------------------------------------------------------------------
+# 模拟场景
+# ----------------------------------------------------------------------
+
+class FleetSimulator:
+    """设备群模拟器"""
+
+    def __init__(self, target: Target, args: argparse.Namespace, admin_token: str):
+        self.target = target
+        self.args = args
+        self.admin_headers = {"Authorization": f"Bearer {admin_token}"}
+        self.admin_token = admin_token
+        self.run_id = uuid.uuid4().hex[:8]
+        self.recorder = Recorder()
+        self.deadline = 0.0
+        self.device_ids: List[str] = []
+        self.link_ids: List[str] = []
+
+    async def request(self, operation: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await self.target.http.request(method, url, **kwargs)
+        except Exception as e:
+            self.recorder.record(operation, started, type(e).__name__, False)
+            return None
+        self.recorder.record(operation, started, response.status_code, response.status_code < 400)
+        return response
+
+    # ---------------- 准备数据 ----------------
+
+    async def setup(self):
+        """通过公开接口注册设备, 通过管理接口创建账号和客户链接"""
+        self.device_ids = [f"sim-{self.run_id}-{index:05d}" for index in range(self.args.devices)]
+        semaphore = asyncio.Semaphore(20)
+
+        async def register(device_id: str):
+            async with semaphore:
+                await self.target.http.post("/api/android/auth/token", json={
+                    "device_id": device_id,
+                    "device_info": {"brand": "Simulator", "model": "Fleet", "phone_number": f"138{random.randint(0, 10**8):08d}"}
+                })
+
+        await asyncio.gather(*(register(device_id) for device_id in self.device_ids))
+        if not self.args.customers:
+            return
+
+        # 设备数据库ID (账号必须绑定设备)
+        device_pks: List[int] = []
+        page = 1
+        while len(device_pks) < min(self.args.accounts, len(self.device_ids)):
+            response = await self.target.http.get("/api/devices/list", headers=self.admin_headers, params={
+                "search": f"sim-{self.run_id}", "page": page, "page_size": 100
+            })
+            response.raise_for_status()
+            devices = response.json()["data"]["devices"]
+            if not devices:
+                break
+            device_pks.extend(device["id"] for device in devices)
+            page += 1
+        if not device_pks:
+            raise RuntimeError("未找到模拟设备, 无法创建客户链接")
+
+        accounts = device_pks[:self.args.accounts]
+        per_account = -(-self.args.customers // len(accounts))
+        for index, device_pk in enumerate(accounts):
+            response = await self.target.http.post("/api/accounts/", headers=self.admin_headers, json={
+                "account_name": f"sim-{self.run_id}-{index}",
+                "username": f"user{index}",
+                "password": "secret",
+                "primary_device_id": device_pk
+            })
+            response.raise_for_status()
+            account_id = response.json()["data"]["id"]
+            remaining = self.args.customers - len(self.link_ids)
+            response = await self.target.http.post("/api/links/batch_create", headers=self.admin_headers, json={
+                "account_id": account_id,
+                "device_id": device_pk,
+                "count": min(per_account, remaining),
+                "max_access_count": 0,
+                "max_verification_count": 0,
+                "verification_wait_time": 0
+            })
+            response.raise_for_status()
+            self.link_ids.extend(link["link_id"] for link in response.json()["data"]["links"])
+            if len(self.link_ids) >= self.args.customers:
+                break
+
+    # ---------------- 负载 ----------------
+
+    async def _sleep(self, seconds: float):
+        """休眠, 不超过负载截止时间"""
+        await asyncio.sleep(max(0.0, min(seconds, self.deadline - time.monotonic())))
+
+    async def _sleep_jitter(self, interval: float):
+        await self._sleep(interval * random.uniform(0.5, 1.5))
+
+    async def heartbeat_loop(self, device_id: str):
+        await self._sleep(random.uniform(0, self.args.heartbeat_interval))
+        while time.monotonic() < self.deadline:
+            await self.request("heartbeat", "POST", "/api/android/heartbeat", json={
+                "device_id": device_id, "timestamp": int(time.time() * 1000), "status": "online"
+            })
+            await self._sleep_jitter(self.args.heartbeat_interval)
+
+    async def upload_loop(self, device_id: str):
+        await self._sleep(random.uniform(0, self.args.upload_interval))
+        sequence = 0
+        while time.monotonic() < self.deadline:
+            sms_list = []
+            for _ in range(self.args.batch_size):
+                sequence += 1
+                sender, template = random.choice(SMS_TEMPLATES)
+                sms_list.append({
+                    "id": sequence,
+                    "sender": sender.format(n=random.randint(0, 9999)),
+                    "content": template.format(code=f"{random.randint(0, 999999):06d}") + f" #{sequence}",
+                    "smsTimestamp": int(time.time() * 1000),
+                    "smsType": "received",
+                    "isRead": "0",
+                })
+            await self.request("sms_batch_upload", "POST", "/api/android/sms/batch_upload", json={
+                "device_id": device_id, "sms_list": sms_list
+            })
+            await self._sleep_jitter(self.args.upload_interval)
+
+    async def poll_loop(self, link_id: str):
+        await self._sleep(random.uniform(0, self.args.poll_interval))
+        while time.monotonic() < self.deadline:
+            await self.request("get_verification_code", "GET", "/api/get_verification_code", params={"link_id": link_id})
+            await self._sleep_jitter(self.args.poll_interval)
+
+    async def websocket_loop(self, operation: str, user_type: str, path: str, params: Optional[Dict[str, str]] = None):
+        """保持 WebSocket 连接, 定时 ping, 统计收到的消息"""
+        await self._sleep(random.uniform(0, min(5.0, self.args.duration / 4)))
+        if time.monotonic() >= self.deadline:
+            return
+        socket = self.target.websocket(path, params)
+        started = time.perf_counter()
+        try:
+            await socket.connect()
+        except Exception as e:
+            self.recorder.record(operation, started, type(e).__name__, False)
+            return
+        self.recorder.record(operation, started, 101, True)
+        self.recorder.ws_open[user_type] += 1
+
+        async def receiver():
+            while True:
+                await socket.recv()
+                self.recorder.ws_messages[user_type] += 1
+
+        receiving = asyncio.create_task(receiver())
+        try:
+            while time.monotonic() < self.deadline and not receiving.done():
+                await socket.send(json.dumps({"type": "ping", "timestamp": int(time.time() * 1000)}))
+                await self._sleep(self.args.ws_ping_interval)
+        finally:
+            receiving.cancel()
+            await socket.close()
+
+    async def run(self) -> Dict[str, Any]:
+        await self.setup()
+        pollers = int(len(self.link_ids) * self.args.poll_ratio)
+
+        load_started = time.monotonic()
+        self.deadline = load_started + self.args.duration
+        tasks = []
+        for device_id in self.device_ids:
+            tasks.append(self.heartbeat_loop(device_id))
+            tasks.append(self.upload_loop(device_id))
+        for link_id in self.link_ids[:pollers]:
+            tasks.append(self.poll_loop(link_id))
+        for link_id in self.link_ids[pollers:]:
+            tasks.append(self.websocket_loop("ws_customer_connect", "customer", f"/api/ws/customer/{link_id}"))
+        for _ in range(self.args.admins):
+            tasks.append(self.websocket_loop("ws_admin_connect", "admin", "/api/ws/admin", {"token": self.admin_token}))
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - load_started
+        # 吞吐量按发出请求的负载窗口计算, 不含截止后等待在途请求和关闭连接的时间
+        load_window = min(elapsed, self.args.duration)
+
+        return {
+            "run_id": self.run_id,
+            "target": self.args.target,
+            "database": self.args.database_url or os.environ.get("DATABASE_URL", ""),
+            "config": {
+                "devices": self.args.devices,
+                "customers": len(self.link_ids),
+                "pollers": pollers,
+                "customer_websockets": len(self.link_ids) - pollers,
+                "admins": self.args.admins,
+                "duration_s": self.args.duration,
+                "heartbeat_interval_s": self.args.heartbeat_interval,
+                "upload_interval_s": self.args.upload_interval,
+                "batch_size": self.args.batch_size,
+                "poll_interval_s": self.args.poll_interval,
+            },
+            "elapsed_s": round(elapsed, 2),
+            "load_window_s": round(load_window, 2),
+            **self.recorder.report(load_window),
+        }
+
+
+# ----------------------------------------------------------------------
+# 入口
+# ----------------------------------------------------------------------
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="设备群模拟与端到端压测")
+    parser.add_argument("--target", default="inprocess", help="inprocess (默认) 或服务地址, 如 http://127.0.0.1:8000")
+    parser.add_argument("--database-url", help="进程内运行时使用的数据库 (如 sqlite:///./fleet.db)")
+    parser.add_argument("--admin-token", help="管理员令牌 (默认用本地 SECRET_KEY 为 admin 签发)")
+    parser.add_argument("--devices", type=int, default=20, help="模拟设备数")
+    parser.add_argument("--customers", type=int, default=50, help="模拟客户页面数 (每个对应一个链接)")
+    parser.add_argument("--accounts", type=int, default=10, help="客户链接分布到的账号数")
+    parser.add_argument("--admins", type=int, default=1, help="管理后台 WebSocket 连接数")
+    parser.add_argument("--poll-ratio", type=float, default=0.5, help="客户页面中使用轮询的比例, 其余保持 WebSocket 连接")
+    parser.add_argument("--duration", type=float, default=30.0, help="压测时长 (秒)")
+    parser.add_argument("--heartbeat-interval", type=float, default=10.0, help="设备心跳间隔 (秒)")
+    parser.add_argument("--upload-interval", type=float, default=15.0, help="设备上传短信间隔 (秒)")
+    parser.add_argument("--batch-size", type=int, default=5, help="每次上传的短信条数")
+    parser.add_argument("--poll-interval", type=float, default=3.0, help="客户页面轮询验证码间隔 (秒)")
+    parser.add_argument("--ws-ping-interval", type=float, default=30.0, help="WebSocket ping 间隔 (秒)")
+    parser.add_argument("--no-rate-limit", action="store_true", help="进程内运行时关闭公开接口限流")
+    parser.add_argument("--output", help="结果 JSON 文件路径 (默认输出到标准输出)")
+    return parser.parse_args()
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    inprocess = args.target == "inprocess"
+    if inprocess:
+        # 应用在导入时读取配置
+        if args.database_url:
+            os.environ["DATABASE_URL"] = args.database_url
+        if args.no_rate_limit:
+            os.environ["RATE_LIMIT_ENABLED"] = "false"
+
+    from app.api.auth import create_access_token
+    admin_token = args.admin_token or create_access_token({"sub": "admin"})
+
+    if not inprocess:
+        target = Target(args.target.rstrip("/"))
+        try:
+            return await FleetSimulator(target, args, admin_token).run()
+        finally:
+            await target.http.aclose()
+
+    from app.main import app
+    target = Target(None, app=app)
+    # 进程内运行时执行应用的启动/关闭流程 (初始化数据库、后台任务)
+    async with app.router.lifespan_context(app):
+        try:
+            return await FleetSimulator(target, args, admin_token).run()
+        finally:
+            await target.http.aclose()
+
+
+def main():
+    args = parse_args()
+    result = asyncio.run(run(args))
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(output, encoding="utf-8")
+        print(f"结果已保存: {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Alembic 迁移环境
+Alembic migration environment
+
+数据库地址和引擎取自应用配置; 应用启动时由 app.database.init_database 调用,
+命令行使用时在 backend 目录下运行 alembic upgrade head
+"""
+
+import re
+from logging.config import fileConfig
+
+from alembic import context
+
+from app.config import settings
+from app.database import Base, engine
+import app.models  # noqa: F401  注册所有模型
+import app.models.settings  # noqa: F401  系统设置表 (未在 app.models 中导出)
+
+config = context.config
+
+# 仅命令行使用 alembic.ini 的日志配置, 应用内调用时沿用应用的日志配置
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+# 短信按月分区 (sms_p2026_10、sms_forward_logs_default 等) 由 partition_manager 维护, 不纳入迁移
+PARTITION_TABLE = re.compile(r"^(sms|sms_forward_logs)_(p\d{4}_\d{2}|default)$")
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    """自动生成迁移时忽略短信分区表及其索引"""
+    if type_ == "table":
+        return not (reflected and PARTITION_TABLE.match(name))
+    if type_ == "index":
+        return not PARTITION_TABLE.match(obj.table.name)
+    return True
+
+
+def run_migrations_offline():
+    """生成迁移 SQL 而不连接数据库 (alembic upgrade head --sql)"""
+    context.configure(
+        url=settings.database_url,
+        target_metadata=target_metadata,
+        include_object=include_object,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    """在数据库连接上执行迁移"""
+    with engine.connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata, include_object=include_object)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,392 @@
+"""
+基线版本: 引入 Alembic 时的全部表、列和索引
+Baseline schema
+
+表结构在此固定, 不随模型变化; 之后的结构变更使用新的迁移版本 (alembic revision --autogenerate)。
+启用短信分区 (SMS_PARTITIONING_ENABLED) 时 sms 和 sms_forward_logs 建为按月分区表, 与模型一致。
+
+引入 Alembic 之前由 create_all 创建的数据库不执行本版本的 upgrade,
+由 app.database.adopt_legacy_schema 按这里的定义补建缺失的表、列和索引后标记为本版本。
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+
+import logging
+from typing import Any, Dict, List, Tuple
+
+import sqlalchemy as sa
+from alembic import op
+from alembic.operations import Operations
+from alembic.runtime.migration import MigrationContext
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _sms_partitioned() -> bool:
+    from app.database import is_sms_partitioning_enabled
+
+    return is_sms_partitioning_enabled()
+
+
+def _timestamps() -> List[sa.Column]:
+    return [
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True, comment="创建时间"),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True, comment="更新时间"),
+    ]
+
+
+def _tables(partitioned: bool) -> List[Tuple[str, List[Any], Dict[str, Any]]]:
+    """各表的列和约束: (表名, 列和约束, create_table 参数), 按外键依赖顺序排列"""
+    sms_partition = {"postgresql_partition_by": "RANGE (sms_timestamp)"} if partitioned else {}
+    forward_log_partition = {"postgresql_partition_by": "RANGE (created_at)"} if partitioned else {}
+    return [
+        ("devices", [
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("device_id", sa.String(length=255), nullable=False, comment="设备唯一标识符"),
+            sa.Column("serial_number", sa.String(length=255), nullable=True, comment="设备序列号 (与ADB一致)"),
+            sa.Column("brand", sa.String(length=100), nullable=True, comment="手机品牌"),
+            sa.Column("model", sa.String(length=100), nullable=True, comment="手机型号"),
+            sa.Column("os_version", sa.String(length=50), nullable=True, comment="操作系统版本"),
+            sa.Column("network_type", sa.String(length=50), nullable=True, comment="网络类型 (Wi-Fi/蜂窝数据)"),
+            sa.Column("ip_address", sa.String(length=45), nullable=True, comment="IP地址"),
+            sa.Column("phone_number", sa.String(length=20), nullable=True, comment="本机电话号码"),
+            sa.Column("is_online", sa.Boolean(), nullable=True, comment="是否在线"),
+            sa.Column("is_active", sa.Boolean(), nullable=True, comment="是否活跃"),
+            sa.Column("last_heartbeat", sa.DateTime(timezone=True), nullable=True, comment="最后心跳时间"),
+            sa.Column("last_sms_time", sa.DateTime(timezone=True), nullable=True, comment="最后短信时间"),
+            sa.Column("api_token", sa.String(length=255), nullable=True, comment="API访问令牌"),
+            sa.Column("extra_info", sa.JSON(), nullable=True, comment="扩展设备信息"),
+            *_timestamps(),
+            sa.PrimaryKeyConstraint("id"),
+        ], {}),
+        ("service_types", [
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("name", sa.String(length=100), nullable=False, comment="服务类型名称"),
+            sa.Column("description", sa.Text(), nullable=True, comment="服务类型描述"),
+            sa.Column("icon", sa.String(length=50), nullable=True, comment="图标名称"),
+            sa.Column("color", sa.String(length=20), nullable=True, comment="颜色代码"),
+            sa.Column("is_active", sa.Boolean(), nullable=True, comment="是否启用"),
+            sa.Column("sort_order", sa.Integer(), nullable=True, comment="排序顺序"),
+            *_timestamps(),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("name"),
+        ], {}),
+        ("sms_retention_policies", [
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("scope", sa.String(length=20), nullable=False, comment="作用范围 (account/device)"),
+            sa.Column("target_id", sa.Integer(), nullable=False, comment="账号ID或设备ID"),
+            sa.Column("retention_days", sa.Integer(), nullable=False, comment="保留天数, 超期短信归档后删除"),
+            sa.Column("is_active", sa.Boolean(), nullable=True, comment="是否启用"),
+            *_timestamps(),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("scope", "target_id", name="uq_sms_retention_scope_target"),
+        ], {}),
+        ("stored_images", [
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("content_hash", sa.String(length=64), nullable=False, comment="文件内容SHA-256"),
+            sa.Column("filename", sa.String(length=100), nullable=False, comment="存储文件名 ({sha256}.ext)"),
+            sa.Column("size", sa.BigInteger(), nullable=False, comment="文件大小 (字节)"),
+            sa.Column("mime_type", sa.String(length=50), nullable=True, comment="MIME类型"),
+            sa.Column("width", sa.Integer(), nullable=True, comment="图片宽度 (像素)"),
+            sa.Column("height", sa.Integer(), nullable=True, comment="图片高度 (像素)"),
+            sa.Column("ref_count", sa.Integer(), nullable=False, comment="引用计数"),
+            *_timestamps(),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("filename"),
+        ], {}),
+        ("system_settings", [
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("setting_key", sa.String(length=100), nullable=False),
+            sa.Column("setting_value", sa.Text(), nullable=False),
+            sa.Column("setting_type", sa.String(length=20), nullable=True),
+            sa.Column("description", sa.String(length=500), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.Column("updated_at", sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint("id"),
+        ], {}),
+        ("users", [
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("username", sa.String(length=50), nullable=False, comment="用户名"),
+            sa.Column("email", sa.String(length=100), nullable=True, comment="邮箱"),
+            sa.Column("hashed_password", sa.String(length=500), nullable=False, comment="加密密码"),
+            sa.Column("is_active", sa.Boolean(), nullable=True, comment="是否激活"),
+            sa.Column("is_superuser", sa.Boolean(), nullable=True, comment="是否超级用户"),
+            sa.Column("full_name", sa.String(length=100), nullable=True, comment="全名"),
+            sa.Column("phone", sa.String(length=20), nullable=True, comment="电话号码"),
+            sa.Column("last_login", sa.DateTime(timezone=True), nullable=True, comment="最后登录时间"),
+            sa.Column("login_count", sa.Integer(), nullable=True, comment="登录次数"),
+            sa.Column("failed_login_attempts", sa.Integer(), nullable=True, comment="登录失败次数"),
+            sa.Column("last_failed_login", sa.DateTime(timezone=True), nullable=True, comment="最后失败登录时间"),
+            sa.Column("locked_until", sa.DateTime(timezone=True), nullable=True, comment="锁定到期时间"),
+            *_timestamps(),
+            sa.PrimaryKeyConstraint("id"),
+        ], {}),
+        ("accounts", [
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("account_name", sa.String(length=255), nullable=False, comment="账号名称"),
+            sa.Column("username", sa.String(length=100), nullable=True, comment="用户名"),
+            sa.Column("password", sa.String(length=255), nullable=True, comment="密码"),
+            sa.Column("type", sa.String(length=100), nullable=True, comment="服务类型"),
+            sa.Column("image_url", sa.Text(), nullable=True, comment="账号图片URL或Base64数据"),
+            sa.Column("description", sa.Text(), nullable=True, comment="账号描述"),
+            sa.Column("status", sa.String(length=20), nullable=True, comment="账号状态 (active/inactive/suspended)"),
+            sa.Column("primary_device_id", sa.Integer(), nullable=True, comment="主设备ID"),
+            *_timestamps(),
+            sa.ForeignKeyConstraint(["primary_device_id"], ["devices.id"], ondelete="SET NULL"),
+            sa.PrimaryKeyConstraint("id"),
+        ], {}),
+        ("sms", [
+            sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column("device_id", sa.Integer(), nullable=False, comment="关联设备ID"),
+            sa.Column("sender", sa.String(length=50), nullable=True, comment="发送方号码"),
+            sa.Column("sender_normalized", sa.String(length=50), nullable=True, comment="规范化的发送方号码 (用于规则匹配)"),
+            sa.Column("content", sa.Text(), nullable=True, comment="短信内容"),
+            sa.Column(
+                "sms_timestamp", sa.DateTime(timezone=True),
+                server_default=sa.func.now() if partitioned else None, nullable=not partitioned,
+                comment="短信时间戳 (分区模式下为分区键)"
+            ),
+            sa.Column("sms_type", sa.String(length=20), nullable=True, comment="短信类型 (received/sent)"),
+            sa.Column("is_read", sa.String(length=10), nullable=True, comment="是否已读 (read/unread)"),
+            sa.Column("category", sa.String(length=50), nullable=True, comment="短信分类 (verification/promotion/normal)"),
+            sa.Column("raw_data", sa.Text(), nullable=True, comment="原始短信数据"),
+            *_timestamps(),
+            sa.ForeignKeyConstraint(["device_id"], ["devices.id"]),
+            sa.PrimaryKeyConstraint("id", "sms_timestamp") if partitioned else sa.PrimaryKeyConstraint("id"),
+        ], sms_partition),
+        ("account_links", [
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("account_id", sa.Integer(), nullable=False, comment="关联账号ID"),
+            sa.Column("device_id", sa.Integer(), nullable=False, comment="绑定设备ID"),
+            sa.Column("link_id", sa.String(length=255), nullable=False, comment="唯一链接标识符"),
+            sa.Column("link_url", sa.String(length=500), nullable=True, comment="完整链接URL"),
+            sa.Column("status", sa.String(length=20), nullable=True, comment="链接状态 (unused/used/expired)"),
+            sa.Column("is_active", sa.Boolean(), nullable=True, comment="是否激活"),
+            sa.Column("max_access_count", sa.Integer(), nullable=True, comment="最大访问次数 (0为不限制)"),
+            sa.Column("max_verification_count", sa.Integer(), nullable=True, comment="最大验证码获取次数 (0为不限制)"),
+            sa.Column("verification_interval", sa.Integer(), nullable=True, comment="验证码间隔时间 (秒)"),
+            sa.Column("access_session_interval", sa.Integer(), nullable=True, comment="访问会话间隔 (分钟)"),
+            sa.Column("verification_wait_time", sa.Integer(), nullable=True, comment="验证码等待时间 (秒)"),
+            sa.Column("access_count", sa.Integer(), nullable=True, comment="访问次数"),
+            sa.Column("verification_count", sa.Integer(), nullable=True, comment="验证码获取次数"),
+            sa.Column("last_access_time", sa.DateTime(timezone=True), nullable=True, comment="最后访问时间"),
+            sa.Column("last_verification_time", sa.DateTime(timezone=True), nullable=True, comment="最后获取验证码时间"),
+            sa.Column("last_ip", sa.String(length=45), nullable=True, comment="最后访问IP"),
+            sa.Column("last_user_agent", sa.String(length=500), nullable=True, comment="最后访问用户代理"),
+            sa.Column("expires_at", sa.DateTime(timezone=True), nullable=True, comment="过期时间 (过期清理任务按此索引扫描)"),
+            *_timestamps(),
+            sa.ForeignKeyConstraint(["account_id"], ["accounts.id"]),
+            sa.ForeignKeyConstraint(["device_id"], ["devices.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        ], {}),
+        ("image_references", [
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("image_id", sa.Integer(), nullable=False, comment="图片ID"),
+            sa.Column("account_id", sa.Integer(), nullable=False, comment="账号ID"),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True, comment="创建时间"),
+            sa.ForeignKeyConstraint(["account_id"], ["accounts.id"], ondelete="CASCADE"),
+            sa.ForeignKeyConstraint(["image_id"], ["stored_images.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("image_id", "account_id", name="uq_image_reference_image_account"),
+        ], {}),
+        ("sms_rules", [
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("account_id", sa.Integer(), nullable=False, comment="绑定账号ID"),
+            sa.Column("rule_name", sa.String(length=100), nullable=False, comment="规则名称"),
+            sa.Column("description", sa.Text(), nullable=True, comment="规则描述"),
+            sa.Column("sender_pattern", sa.String(length=255), nullable=True, comment="发件人号码匹配模式"),
+            sa.Column("sender_match_type", sa.String(length=20), nullable=True, comment="发送方匹配类型 (exact/fuzzy/regex)"),
+            sa.Column("content_pattern", sa.Text(), nullable=True, comment="短信内容匹配模式"),
+            sa.Column("content_match_type", sa.String(length=20), nullable=True, comment="内容匹配类型 (exact/fuzzy/regex)"),
+            sa.Column("is_active", sa.Boolean(), nullable=True, comment="是否启用"),
+            sa.Column("priority", sa.Integer(), nullable=True, comment="优先级 (数字越大优先级越高)"),
+            sa.Column("display_count", sa.Integer(), nullable=True, comment="客户端显示条数"),
+            sa.Column("action_type", sa.String(length=50), nullable=True, comment="动作类型 (forward/store/ignore)"),
+            sa.Column("action_config", sa.Text(), nullable=True, comment="动作配置 (JSON格式)"),
+            sa.Column("forward_target_type", sa.String(length=20), nullable=False, comment="转发目标类型 (link/webhook/email)"),
+            sa.Column("forward_target_id", sa.Integer(), nullable=True, comment="转发目标ID"),
+            sa.Column("forward_config", sa.JSON(), nullable=False, comment="转发配置 (JSON格式)"),
+            sa.Column("match_count", sa.Integer(), nullable=True, comment="匹配次数"),
+            sa.Column("last_match_time", sa.DateTime(timezone=True), nullable=True, comment="最后匹配时间"),
+            *_timestamps(),
+            sa.ForeignKeyConstraint(["account_id"], ["accounts.id"]),
+            sa.ForeignKeyConstraint(["forward_target_id"], ["account_links.id"], ondelete="SET NULL"),
+            sa.PrimaryKeyConstraint("id"),
+        ], {}),
+        ("sms_forward_logs", [
+            sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column("sms_id", sa.Integer(), nullable=False, comment="短信ID"),
+            sa.Column("rule_id", sa.Integer(), nullable=False, comment="规则ID"),
+            sa.Column("target_type", sa.String(length=20), nullable=False, comment="转发目标类型"),
+            sa.Column("target_id", sa.Integer(), nullable=True, comment="转发目标ID"),
+            sa.Column("status", sa.String(length=20), nullable=False, comment="转发状态 (pending/success/failed)"),
+            sa.Column("error_message", sa.Text(), nullable=True, comment="错误信息"),
+            sa.Column("forwarded_at", sa.DateTime(timezone=True), nullable=True, comment="转发时间"),
+            sa.Column(
+                "created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=not partitioned,
+                comment="创建时间"
+            ),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True, comment="更新时间"),
+            sa.ForeignKeyConstraint(["rule_id"], ["sms_rules.id"], ondelete="CASCADE"),
+            # 分区表无法引用 sms.id (非唯一), 分区模式下不建外键
+            *([] if partitioned else [sa.ForeignKeyConstraint(["sms_id"], ["sms.id"], ondelete="CASCADE")]),
+            sa.PrimaryKeyConstraint("id", "created_at") if partitioned else sa.PrimaryKeyConstraint("id"),
+        ], forward_log_partition),
+    ]
+
+
+def _indexes(partitioned: bool) -> List[Tuple[str, str, List[str], Dict[str, Any]]]:
+    """索引: (索引名, 表名, 列, create_index 参数)"""
+    indexes = [
+        ("ix_devices_api_token", "devices", ["api_token"], {"unique": True}),
+        ("ix_devices_device_id", "devices", ["device_id"], {"unique": True}),
+        ("ix_devices_id", "devices", ["id"], {}),
+        ("ix_service_types_id", "service_types", ["id"], {}),
+        ("ix_sms_retention_policies_id", "sms_retention_policies", ["id"], {}),
+        ("ix_stored_images_content_hash", "stored_images", ["content_hash"], {"unique": True}),
+        ("ix_stored_images_created_at", "stored_images", ["created_at"], {}),
+        ("ix_stored_images_id", "stored_images", ["id"], {}),
+        ("ix_stored_images_size", "stored_images", ["size"], {}),
+        ("ix_system_settings_id", "system_settings", ["id"], {}),
+        ("ix_system_settings_setting_key", "system_settings", ["setting_key"], {"unique": True}),
+        ("ix_users_email", "users", ["email"], {"unique": True}),
+        ("ix_users_id", "users", ["id"], {}),
+        ("ix_users_username", "users", ["username"], {"unique": True}),
+        ("ix_accounts_id", "accounts", ["id"], {}),
+        # 规则的精确/前缀发送方条件按此索引查询 (pattern_ops 使 LIKE 'x%' 在任意排序规则下可用索引)
+        ("ix_sms_device_sender_normalized", "sms", ["device_id", "sender_normalized"],
+         {"postgresql_ops": {"sender_normalized": "varchar_pattern_ops"}}),
+        ("ix_sms_device_timestamp", "sms", ["device_id", "sms_timestamp"], {}),
+        ("ix_sms_id", "sms", ["id"], {}),
+        ("ix_account_links_expires_at", "account_links", ["expires_at"], {}),
+        ("ix_account_links_id", "account_links", ["id"], {}),
+        ("ix_account_links_link_id", "account_links", ["link_id"], {"unique": True}),
+        ("ix_account_links_status", "account_links", ["status"], {}),
+        ("ix_image_references_account_id", "image_references", ["account_id"], {}),
+        ("ix_image_references_id", "image_references", ["id"], {}),
+        ("ix_sms_rules_id", "sms_rules", ["id"], {}),
+        ("ix_sms_forward_logs_id", "sms_forward_logs", ["id"], {}),
+    ]
+    if partitioned:
+        indexes.append(("ix_sms_forward_logs_sms_id", "sms_forward_logs", ["sms_id"], {}))
+    return indexes
+
+
+def _create_trigram_index(connection: sa.engine.Connection):
+    """
+    PostgreSQL 上为短信内容创建 pg_trgm 三元组索引 (规则的包含条件使用 ILIKE '%x%')
+
+    扩展不可用时跳过 (在保存点内执行, 失败不影响迁移事务), 包含条件仍按设备索引过滤后执行
+    """
+    if connection.dialect.name != "postgresql":
+        return
+    try:
+        with connection.begin_nested():
+            connection.execute(sa.text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            connection.execute(sa.text(
+                "CREATE INDEX IF NOT EXISTS ix_sms_content_trgm ON sms USING gin (content gin_trgm_ops)"
+            ))
+    except Exception as e:
+        logger.warning(f"pg_trgm 扩展不可用, 跳过短信内容三元组索引: {getattr(e, 'orig', e)}")
+
+
+def _backfill_sender_normalized(connection: sa.engine.Connection):
+    """
+    填充已有短信的规范化发送方 (与 models.sms.normalize_sender 规则一致)
+
+    PostgreSQL 上用一条 UPDATE 完成 (去掉电话号码中的分隔符, 国际前缀 00 替换为 +);
+    其他数据库按不同的发送方逐个更新
+    """
+    if connection.dialect.name == "postgresql":
+        result = connection.execute(sa.text(r"""
+            UPDATE sms SET sender_normalized = CASE
+                WHEN sender ~ '^\+?[\d\s().-]+$'
+                    THEN regexp_replace(regexp_replace(sender, '[\s().-]', '', 'g'), '^00', '+')
+                ELSE sender
+            END
+            WHERE sender IS NOT NULL
+        """))
+        logger.info(f"已填充短信规范化发送方: {result.rowcount} 条短信")
+        return
+
+    from app.models.sms import normalize_sender
+
+    connection.execute(sa.text("UPDATE sms SET sender_normalized = sender WHERE sender IS NOT NULL"))
+    senders = connection.execute(sa.text("SELECT DISTINCT sender FROM sms WHERE sender IS NOT NULL")).scalars().all()
+    for sender in senders:
+        normalized = normalize_sender(sender)
+        if normalized != sender:
+            connection.execute(
+                sa.text("UPDATE sms SET sender_normalized = :normalized WHERE sender = :sender"),
+                {"normalized": normalized, "sender": sender}
+            )
+    logger.info(f"已填充短信规范化发送方: {len(senders)} 个发送方")
+
+
+def adopt_existing_schema(connection: sa.engine.Connection):
+    """
+    接管引入 Alembic 之前由 create_all 创建的数据库: 按本版本的定义补建缺失的表、可空列和索引
+
+    只做新增, 不修改已有的列; 调用方随后将数据库标记为本版本
+    """
+    operations = Operations(MigrationContext.configure(connection))
+    inspector = sa.inspect(connection)
+    partitioned = _sms_partitioned()
+
+    added_columns = []
+    for name, elements, kwargs in _tables(partitioned):
+        if not inspector.has_table(name):
+            operations.create_table(name, *elements, **kwargs)
+            logger.info(f"已创建表 {name}")
+            continue
+        existing = {column["name"] for column in inspector.get_columns(name)}
+        for column in elements:
+            if not isinstance(column, sa.Column) or column.name in existing:
+                continue
+            if not column.nullable and column.server_default is None:
+                logger.warning(f"无法自动添加非空列 {name}.{column.name}, 请手动迁移")
+                continue
+            operations.add_column(name, column)
+            added_columns.append(f"{name}.{column.name}")
+            logger.info(f"已添加列 {name}.{column.name}")
+
+    if "sms.sender_normalized" in added_columns:
+        _backfill_sender_normalized(connection)
+
+    inspector = sa.inspect(connection)
+    existing_indexes = {}
+    for name, table, columns, kwargs in _indexes(partitioned):
+        if table not in existing_indexes:
+            existing_indexes[table] = {index["name"] for index in inspector.get_indexes(table)}
+        if name not in existing_indexes[table]:
+            operations.create_index(name, table, columns, **kwargs)
+            logger.info(f"已创建索引 {name}")
+    _create_trigram_index(connection)
+
+
+def upgrade():
+    bind = op.get_bind()
+    if sa.inspect(bind).has_table("devices"):
+        raise RuntimeError(
+            "数据库由引入 Alembic 之前的版本创建, 不能直接执行基线迁移; "
+            "请启动一次应用 (SCHEMA_AUTO_MIGRATE=true) 或调用 app.database.adopt_legacy_schema() 完成接管"
+        )
+
+    partitioned = _sms_partitioned()
+    for name, elements, kwargs in _tables(partitioned):
+        op.create_table(name, *elements, **kwargs)
+    for name, table, columns, kwargs in _indexes(partitioned):
+        op.create_index(name, table, columns, **kwargs)
+    _create_trigram_index(bind)
+
+
+def downgrade():
+    for name, _, _ in reversed(_tables(_sms_partitioned())):
+        op.drop_table(name)
@@ -265,6 +265,12 @@ const SmsRules: React.FC<SmsRulesProps> = ({ selectedAccount }) => {
         // 显示转发详情
         const { data } = response;
         
+        // 转发在后台任务中执行, 进度通过 WebSocket job_progress 推送
+        if (data?.job_id) {
+          message.info(`转发任务已启动，共 ${data.total} 条短信待匹配，转发到 ${data.forwarded_links_count} 个客户链接`);
+          return;
+        }
+        
         // 获取当前账号信息用于显示
         const currentAccount = selectedAccount;
         
@@ -20,5 +20,8 @@ echo "🚀 启动FastAPI应用..."
 echo "监听端口: 8000 (强制)"
 echo "主机: 0.0.0.0"
 
+# Railway 由平台入口代理请求并追加 X-Forwarded-For, 未配置时按入口追加的地址识别客户端 (限流按IP计数)
+export RATE_LIMIT_TRUSTED_PROXIES="${RATE_LIMIT_TRUSTED_PROXIES:-*}"
+
 # 直接指定端口8000，不依赖环境变量
 exec uvicorn app.main:app --host 0.0.0.0 --port 8000 --log-level info